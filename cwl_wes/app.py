@@ -1,11 +1,19 @@
 """cwl-WES application entry point."""
 
+import logging
 from pathlib import Path
 
 from connexion import App
+from flask import Flask
 from foca import Foca
 
 from cwl_wes.ga4gh.wes.endpoints.service_info import ServiceInfo
+from cwl_wes.utils.metrics import init_app_metrics, RunCollector
+from cwl_wes.utils.profiling import init_app_profiling
+from cwl_wes.utils.tracing import init_app_tracing
+from cwl_wes.worker import celery_app
+
+logger = logging.getLogger(__name__)
 
 
 def init_app() -> App:
@@ -22,9 +30,88 @@ def init_app() -> App:
     with app.app.app_context():
         service_info = ServiceInfo()
         service_info.init_service_info_from_config()
+    init_metrics(app=app.app)
+    init_tracing(app=app.app)
+    init_profiling(app=app.app)
+    check_dispatcher(app=app.app)
     return app
 
 
+def init_metrics(app: Flask) -> None:
+    """Expose metrics endpoint, if enabled.
+
+    Args:
+        app: Flask application.
+    """
+    foca_config = app.config.foca
+    metrics_config = foca_config.custom.metrics
+    if not metrics_config.enabled:
+        return
+    routing_config = foca_config.custom.celery.routing
+    local_executor_config = foca_config.custom.controller.local_executor
+    init_app_metrics(
+        app=app,
+        path=metrics_config.path,
+        collectors=[
+            RunCollector(
+                collection=(
+                    foca_config.db.dbs["cwl-wes-db"].collections["runs"].client
+                ),
+                celery_app=celery_app,
+                queues=[
+                    routing_config.run_queue,
+                    routing_config.control_queue,
+                ]
+                + (
+                    [local_executor_config.queue]
+                    if local_executor_config.enabled
+                    else []
+                ),
+            )
+        ],
+    )
+
+
+def init_tracing(app: Flask) -> None:
+    """Record traces of requests, if enabled.
+
+    Args:
+        app: Flask application.
+    """
+    tracing_config = app.config.foca.custom.tracing
+    if tracing_config.enabled:
+        init_app_tracing(app=app, config=tracing_config)
+
+
+def init_profiling(app: Flask) -> None:
+    """Profile selected requests, if enabled.
+
+    Args:
+        app: Flask application.
+    """
+    profiling_config = app.config.foca.custom.profiling
+    if profiling_config.enabled:
+        init_app_profiling(app=app, config=profiling_config)
+
+
+def check_dispatcher(app: Flask) -> None:
+    """Warn if runs are not held for dispatch despite dispatcher enabled.
+
+    Args:
+        app: Flask application.
+    """
+    foca_config = app.config.foca
+    if (
+        foca_config.custom.controller.dispatcher.enabled
+        and foca_config.security.auth.required
+    ):
+        logger.warning(
+            "Dispatcher is enabled, but runs are not held for dispatch, as"
+            " authorization is required. Only the maximum number of running"
+            " runs per user is enforced, at submission."
+        )
+
+
 def run_app(app: App) -> None:
     """Run FOCA application."""
     app.run(port=app.port)
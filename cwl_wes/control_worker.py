@@ -0,0 +1,11 @@
+"""Celery worker entry point for control tasks."""
+
+from kombu import Queue
+
+from cwl_wes.worker import celery_app
+
+routing_config = celery_app.conf.foca.custom.celery.routing
+celery_app.conf.task_queues = [Queue(routing_config.control_queue)]
+celery_app.conf.worker_prefetch_multiplier = (
+    routing_config.control_prefetch_multiplier
+)
@@ -6,7 +6,145 @@ from typing import Dict, List, Optional
 
 from foca.models.config import FOCABaseConfig
 
-# pragma pylint: disable=too-few-public-methods
+# pragma pylint: disable=too-few-public-methods,too-many-lines
+
+
+class StepCacheConfig(FOCABaseConfig):
+    """Model for shared workflow step cache configuration.
+
+    Args:
+        enabled: Reuse results of workflow steps across runs via the
+            workflow engine's `--cachedir` option.
+        cache_dir: Step cache directory; must be shared by all workers.
+        max_size: Maximum size of the step cache in bytes; least recently
+            used entries are evicted beyond that.
+        eviction_interval: Interval in seconds between periodic evictions.
+
+    Attributes:
+        enabled: Reuse results of workflow steps across runs via the
+            workflow engine's `--cachedir` option.
+        cache_dir: Step cache directory; must be shared by all workers.
+        max_size: Maximum size of the step cache in bytes; least recently
+            used entries are evicted beyond that.
+        eviction_interval: Interval in seconds between periodic evictions.
+
+    Example:
+        >>> StepCacheConfig(
+        ...     enabled=True,
+        ...     cache_dir='/data/cache',
+        ... )
+        StepCacheConfig(enabled=True, cache_dir=PosixPath('/data/cache'), max
+        _size=107374182400, eviction_interval=3600)
+    """
+
+    enabled: bool = False
+    cache_dir: Path = Path("/data/cache")
+    max_size: int = 107374182400
+    eviction_interval: float = 3600
+
+
+class InputCacheConfig(FOCABaseConfig):
+    """Model for remote input staging cache configuration.
+
+    Args:
+        enabled: Fetch remote input files of workflow runs once into a
+            content-addressed cache and point workflow parameters at the
+            cached copies.
+        cache_dir: Input cache directory; must be shared by all workers.
+        max_size: Maximum size of the input cache in bytes; least recently
+            used entries are evicted beyond that.
+        grace_period: Time in seconds since their last use during which
+            entries are never evicted; entries staged for unfinished runs
+            are kept regardless.
+        eviction_interval: Interval in seconds between periodic evictions.
+        timeout: Timeout in seconds for connecting to and reading from
+            remote hosts.
+        protocols: URL schemes of input files that are staged.
+        base_url: URL under which the input cache directory is served to
+            TES executors; if not set, runs executed on TES refer to cached
+            copies by local path.
+
+    Attributes:
+        enabled: Fetch remote input files of workflow runs once into a
+            content-addressed cache and point workflow parameters at the
+            cached copies.
+        cache_dir: Input cache directory; must be shared by all workers.
+        max_size: Maximum size of the input cache in bytes; least recently
+            used entries are evicted beyond that.
+        grace_period: Time in seconds since their last use during which
+            entries are never evicted; entries staged for unfinished runs
+            are kept regardless.
+        eviction_interval: Interval in seconds between periodic evictions.
+        timeout: Timeout in seconds for connecting to and reading from
+            remote hosts.
+        protocols: URL schemes of input files that are staged.
+        base_url: URL under which the input cache directory is served to
+            TES executors; if not set, runs executed on TES refer to cached
+            copies by local path.
+
+    Example:
+        >>> InputCacheConfig(
+        ...     enabled=True,
+        ...     cache_dir='/data/inputs',
+        ... )
+        InputCacheConfig(enabled=True, cache_dir=PosixPath('/data/inputs'),
+        max_size=536870912000, grace_period=86400, eviction_interval=3600, t
+        imeout=30, protocols=['ftp', 'http', 'https'], base_url=None)
+    """
+
+    enabled: bool = False
+    cache_dir: Path = Path("/data/inputs")
+    max_size: int = 536870912000
+    grace_period: float = 86400
+    eviction_interval: float = 3600
+    timeout: float = 30
+    protocols: List[str] = ["ftp", "http", "https"]
+    base_url: Optional[str] = None
+
+
+class RetentionConfig(FOCABaseConfig):
+    """Model for run directory retention configuration.
+
+    Args:
+        enabled: Periodically record disk usage of run directories and
+            delete directories of finished runs.
+        interval: Interval in seconds between retention passes.
+        ttls: Time in seconds after which directories of runs that finished
+            in the given state are deleted; directories of runs in states
+            not listed are only deleted to meet `max_size`.
+        max_size: Maximum total size in bytes of the directories of all
+            runs; directories of the oldest finished runs are deleted beyond
+            that. No limit if not set.
+
+    Attributes:
+        enabled: Periodically record disk usage of run directories and
+            delete directories of finished runs.
+        interval: Interval in seconds between retention passes.
+        ttls: Time in seconds after which directories of runs that finished
+            in the given state are deleted; directories of runs in states
+            not listed are only deleted to meet `max_size`.
+        max_size: Maximum total size in bytes of the directories of all
+            runs; directories of the oldest finished runs are deleted beyond
+            that. No limit if not set.
+
+    Example:
+        >>> RetentionConfig(
+        ...     enabled=True,
+        ...     ttls={'COMPLETE': 604800},
+        ... )
+        RetentionConfig(enabled=True, interval=3600, ttls={'COMPLETE': 604800
+        }, max_size=None)
+    """
+
+    enabled: bool = False
+    interval: float = 3600
+    ttls: Dict[str, int] = {
+        "COMPLETE": 2592000,
+        "CANCELED": 604800,
+        "EXECUTOR_ERROR": 1209600,
+        "SYSTEM_ERROR": 1209600,
+    }
+    max_size: Optional[int] = None
 
 
 class StorageConfig(FOCABaseConfig):
@@ -16,25 +154,187 @@ class StorageConfig(FOCABaseConfig):
         tmp_dir: Temporary run directory path
         permanent_dir: Permanent working directory path
         remote_storage_url: Remote file storage FTP endpoint
+        log_tail_lines: Number of most recent workflow engine log lines kept
+            in memory and stored with the run; the full log is written to
+            the run directory
+        shard_levels: Number of levels of directories named after prefixes
+            of the SHA-256 digest of the run identifier that run
+            directories are nested in; 0 places run directories directly in
+            `tmp_dir` and `permanent_dir`
+        shard_width: Number of hex digits of the digest per level
+        step_cache: Shared workflow step cache config parameters
+        input_cache: Remote input staging cache config parameters
+        retention: Run directory retention config parameters
 
     Attributes:
         tmp_dir: Temporary run directory path
         permanent_dir: Permanent working directory path
         remote_storage_url: Remote file storage FTP endpoint
+        log_tail_lines: Number of most recent workflow engine log lines kept
+            in memory and stored with the run; the full log is written to
+            the run directory
+        shard_levels: Number of levels of directories named after prefixes
+            of the SHA-256 digest of the run identifier that run
+            directories are nested in; 0 places run directories directly in
+            `tmp_dir` and `permanent_dir`
+        shard_width: Number of hex digits of the digest per level
+        step_cache: Shared workflow step cache config parameters
+        input_cache: Remote input staging cache config parameters
+        retention: Run directory retention config parameters
 
     Example:
         >>> StorageConfig(
         ...     tmp_dir='/data/tmp',
         ...     permanent_dir='/data/output',
-        ...     remote_storage_url='ftp://ftp.private/upload'
+        ...     remote_storage_url='ftp://ftp.private/upload',
+        ...     log_tail_lines=1000,
         ... )
-        StorageConfig(tmp_dir='/data/tmp', permanent_dir='/data/output', remote
-        orage_url='ftp://ftp.private/upload')
+        StorageConfig(tmp_dir='/data/tmp', permanent_dir='/data/output', rem
+        ote_storage_url='ftp://ftp.private/upload', log_tail_lines=1000, sha
+        rd_levels=0, shard_width=2, step_cache=StepCacheConfig(enabled=False
+        , cache_dir=PosixPath('/data/cache'), max_size=107374182400, evictio
+        n_interval=3600), input_cache=InputCacheConfig(enabled=False, cache_
+        dir=PosixPath('/data/inputs'), max_size=536870912000, grace_period=8
+        6400, eviction_interval=3600, timeout=30, protocols=['ftp', 'http',
+        'https'], base_url=None), retention=RetentionConfig(enabled=False, i
+        nterval=3600, ttls={'COMPLETE': 2592000, 'CANCELED': 604800, 'EXECUT
+        OR_ERROR': 1209600, 'SYSTEM_ERROR': 1209600}, max_size=None))
     """
 
     permanent_dir: Path = Path("/data/output")
     tmp_dir: Path = Path("/data/tmp")
     remote_storage_url: str = "ftp://ftp-private.ebi.ac.uk/upload/foivos"
+    log_tail_lines: int = 1000
+    shard_levels: int = 0
+    shard_width: int = 2
+    step_cache: StepCacheConfig = StepCacheConfig()
+    input_cache: InputCacheConfig = InputCacheConfig()
+    retention: RetentionConfig = RetentionConfig()
+
+
+class RunSupervisorConfig(FOCABaseConfig):
+    """Model for asynchronous workflow run supervisor configuration.
+
+    Args:
+        enabled: Supervise workflow runs with an asyncio event loop, so that
+            a single worker process can drive many runs concurrently, instead
+            of blocking a worker slot for the lifetime of each run.
+        max_concurrent_runs: Maximum number of runs supervised concurrently
+            by a single worker process.
+        io_threads: Number of threads for blocking database and TES calls
+            issued by the supervisor of a single worker process.
+        shutdown_timeout: Time in seconds a worker process that shuts down
+            waits for supervised runs to finish before killing their
+            workflow engines. Interrupted runs are re-attached by the
+            reconciler, if enabled, or set to `SYSTEM_ERROR` otherwise.
+
+    Attributes:
+        enabled: Supervise workflow runs with an asyncio event loop, so that
+            a single worker process can drive many runs concurrently, instead
+            of blocking a worker slot for the lifetime of each run.
+        max_concurrent_runs: Maximum number of runs supervised concurrently
+            by a single worker process.
+        io_threads: Number of threads for blocking database and TES calls
+            issued by the supervisor of a single worker process.
+        shutdown_timeout: Time in seconds a worker process that shuts down
+            waits for supervised runs to finish before killing their
+            workflow engines. Interrupted runs are re-attached by the
+            reconciler, if enabled, or set to `SYSTEM_ERROR` otherwise.
+
+    Example:
+        >>> RunSupervisorConfig(
+        ...     enabled=True,
+        ...     max_concurrent_runs=100,
+        ...     io_threads=16
+        ... )
+        RunSupervisorConfig(enabled=True, max_concurrent_runs=100, io_threads=
+        16, shutdown_timeout=30)
+    """
+
+    enabled: bool = False
+    max_concurrent_runs: int = 100
+    io_threads: int = 16
+    shutdown_timeout: float = 30
+
+
+class EnginePoolConfig(FOCABaseConfig):
+    """Model for workflow engine pool configuration.
+
+    Args:
+        enabled: Run the workflow engine as a library in a pool of
+            pre-initialized processes instead of starting a new interpreter
+            for every run; only applies to runs not handled by the
+            asynchronous run supervisor.
+        processes: Number of pool processes per worker process.
+        max_runs_per_process: Number of runs after which a pool process is
+            replaced by a fresh one.
+
+    Attributes:
+        enabled: Run the workflow engine as a library in a pool of
+            pre-initialized processes instead of starting a new interpreter
+            for every run; only applies to runs not handled by the
+            asynchronous run supervisor.
+        processes: Number of pool processes per worker process.
+        max_runs_per_process: Number of runs after which a pool process is
+            replaced by a fresh one.
+
+    Example:
+        >>> EnginePoolConfig(
+        ...     enabled=True,
+        ...     processes=4,
+        ...     max_runs_per_process=25
+        ... )
+        EnginePoolConfig(enabled=True, processes=4, max_runs_per_process=25)
+    """
+
+    enabled: bool = False
+    processes: int = 4
+    max_runs_per_process: int = 25
+
+
+class TaskRoutingConfig(FOCABaseConfig):
+    """Model for Celery task routing configuration.
+
+    Args:
+        run_queue: Queue for workflow run tasks.
+        control_queue: Queue for control tasks, e.g., run cancellation.
+        run_acks_late: Whether workflow run tasks are acknowledged only
+            after they have finished. Note that brokers may redeliver tasks
+            that are not acknowledged in time, e.g., RabbitMQ after its
+            `consumer_timeout`; redelivered tasks of runs that were already
+            started are not executed again, but left to the reconciler.
+        run_prefetch_multiplier: Number of tasks reserved per worker process
+            by workers consuming the run queue.
+        control_prefetch_multiplier: Number of tasks reserved per worker
+            process by workers consuming the control queue.
+
+    Attributes:
+        run_queue: Queue for workflow run tasks.
+        control_queue: Queue for control tasks, e.g., run cancellation.
+        run_acks_late: Whether workflow run tasks are acknowledged only
+            after they have finished. Note that brokers may redeliver tasks
+            that are not acknowledged in time, e.g., RabbitMQ after its
+            `consumer_timeout`; redelivered tasks of runs that were already
+            started are not executed again, but left to the reconciler.
+        run_prefetch_multiplier: Number of tasks reserved per worker process
+            by workers consuming the run queue.
+        control_prefetch_multiplier: Number of tasks reserved per worker
+            process by workers consuming the control queue.
+
+    Example:
+        >>> TaskRoutingConfig(
+        ...     run_queue='runs',
+        ...     control_queue='control',
+        ... )
+        TaskRoutingConfig(run_queue='runs', control_queue='control', run_acks_
+        late=False, run_prefetch_multiplier=1, control_prefetch_multiplier=4)
+    """
+
+    run_queue: str = "runs"
+    control_queue: str = "control"
+    run_acks_late: bool = False
+    run_prefetch_multiplier: int = 1
+    control_prefetch_multiplier: int = 4
 
 
 class CeleryConfig(FOCABaseConfig):
@@ -43,21 +343,37 @@ class CeleryConfig(FOCABaseConfig):
     Args:
         timeout: Celery task timeout.
         message_maxsize: Celery message max size.
+        run_supervisor: Asynchronous workflow run supervisor config
+            parameters.
+        engine_pool: Workflow engine pool config parameters.
+        routing: Task routing config parameters.
 
     Attributes:
         timeout: Celery task timeout.
         message_maxsize: Celery message max size.
+        run_supervisor: Asynchronous workflow run supervisor config
+            parameters.
+        engine_pool: Workflow engine pool config parameters.
+        routing: Task routing config parameters.
 
     Example:
         >>> CeleryConfig(
         ...     timeout=15,
         ...     message_maxsize=1024
         ... )
-        CeleryConfig(timeout=15, message_maxsize=1024)
+        CeleryConfig(timeout=15, message_maxsize=1024, run_supervisor=RunSupe
+        rvisorConfig(enabled=False, max_concurrent_runs=100, io_threads=16), e
+        ngine_pool=EnginePoolConfig(enabled=False, processes=4, max_runs_per_p
+        rocess=25), routing=TaskRoutingConfig(run_queue='runs', control_queue=
+        'control', run_acks_late=False, run_prefetch_multiplier=1, control_pre
+        fetch_multiplier=4))
     """
 
     timeout: float = 0.1
     message_maxsize: int = 16777216
+    run_supervisor: RunSupervisorConfig = RunSupervisorConfig()
+    engine_pool: EnginePoolConfig = EnginePoolConfig()
+    routing: TaskRoutingConfig = TaskRoutingConfig()
 
 
 class WorkflowTypeVersionConfig(FOCABaseConfig):
@@ -205,18 +521,139 @@ class ServiceInfoConfig(FOCABaseConfig):
     tags: TagsConfig
 
 
+class TESMonitorConfig(FOCABaseConfig):
+    """Model for TES task monitor configuration.
+
+    Args:
+        enabled: Track TES task states with periodic `ListTasks` calls
+            instead of scraping cwl-tes logs.
+        poll_interval: Interval in seconds between `ListTasks` calls.
+        page_size: Number of tasks to request per `ListTasks` page.
+        name_prefix: Only list tasks whose name starts with this prefix;
+            set to `null` to list all tasks.
+        max_pages: Maximum number of `ListTasks` pages requested per poll;
+            states of tasks not found on these pages are requested
+            individually with `GetTask`.
+
+    Attributes:
+        enabled: Track TES task states with periodic `ListTasks` calls
+            instead of scraping cwl-tes logs.
+        poll_interval: Interval in seconds between `ListTasks` calls.
+        page_size: Number of tasks to request per `ListTasks` page.
+        name_prefix: Only list tasks whose name starts with this prefix;
+            set to `null` to list all tasks.
+        max_pages: Maximum number of `ListTasks` pages requested per poll;
+            states of tasks not found on these pages are requested
+            individually with `GetTask`.
+
+    Example:
+        >>> TESMonitorConfig(
+        ...     enabled=True,
+        ...     poll_interval=10,
+        ...     page_size=256,
+        ...     name_prefix=None
+        ... )
+        TESMonitorConfig(enabled=True, poll_interval=10, page_size=256, name_p
+        refix=None, max_pages=4)
+    """
+
+    enabled: bool = False
+    poll_interval: float = 10
+    page_size: int = 256
+    name_prefix: Optional[str] = None
+    max_pages: int = 4
+
+
+class TESBackendConfig(FOCABaseConfig):
+    """Model for a TES backend that workflow runs can be routed to.
+
+    Args:
+        url: TES Endpoint URL.
+        weight: Relative share of workflow runs routed to the backend.
+        max_running_runs: Maximum number of unfinished runs routed to the
+            backend; `None` for no limit.
+
+    Attributes:
+        url: TES Endpoint URL.
+        weight: Relative share of workflow runs routed to the backend.
+        max_running_runs: Maximum number of unfinished runs routed to the
+            backend; `None` for no limit.
+
+    Example:
+        >>> TESBackendConfig(
+        ...     url='https://tes.endpoint',
+        ...     weight=2,
+        ... )
+        TESBackendConfig(url='https://tes.endpoint', weight=2.0, max_running_r
+        uns=None)
+    """
+
+    url: str
+    weight: float = 1
+    max_running_runs: Optional[int] = None
+
+
+class TESBalancerConfig(FOCABaseConfig):
+    """Model for TES backend health probing configuration.
+
+    Args:
+        probe_interval: Time in seconds between health probes.
+        probe_timeout: Timeout in seconds of a health probe.
+        max_latency: Smoothed probe latency in seconds above which a backend
+            is taken out of rotation.
+        latency_smoothing: Weight of the latest probe in the exponentially
+            smoothed latency.
+        failure_threshold: Number of consecutive failed probes after which a
+            backend is taken out of rotation.
+        recovery_threshold: Number of consecutive successful probes after
+            which a backend is put back into rotation.
+
+    Attributes:
+        probe_interval: Time in seconds between health probes.
+        probe_timeout: Timeout in seconds of a health probe.
+        max_latency: Smoothed probe latency in seconds above which a backend
+            is taken out of rotation.
+        latency_smoothing: Weight of the latest probe in the exponentially
+            smoothed latency.
+        failure_threshold: Number of consecutive failed probes after which a
+            backend is taken out of rotation.
+        recovery_threshold: Number of consecutive successful probes after
+            which a backend is put back into rotation.
+
+    Example:
+        >>> TESBalancerConfig(
+        ...     probe_interval=10,
+        ... )
+        TESBalancerConfig(probe_interval=10, probe_timeout=5, max_latency=2.0,
+        latency_smoothing=0.3, failure_threshold=3, recovery_threshold=2)
+    """
+
+    probe_interval: int = 30
+    probe_timeout: int = 5
+    max_latency: float = 2
+    latency_smoothing: float = 0.3
+    failure_threshold: int = 3
+    recovery_threshold: int = 2
+
+
 class TESServerConfig(FOCABaseConfig):
     """Model for TES server configuration.
 
     Args:
-        url: TES Endpoint URL.
+        url: TES Endpoint URL; used if no `backends` are configured.
         timeout: Request time out.
         status_query_params: Request query parameters.
+        monitor: TES task monitor config parameters.
+        backends: TES backends that workflow runs are balanced across.
+        balancer: TES backend health probing config parameters.
 
     Attributes:
-        url: TES Endpoint URL.
+        url: TES Endpoint URL; used if no `backends` are configured.
         timeout: Request time out.
         status_query_params: Request query parameters.
+        monitor: TES task monitor config parameters.
+        backends: TES backends that workflow runs are balanced across.
+        balancer: TES backend health probing config parameters.
 
     Example:
         >>> TesServerConfig(
@@ -225,12 +662,18 @@ class TESServerConfig(FOCABaseConfig):
         ...     status_query_params='FULL'
         ... )
         TesServerConfig(url='https://tes.endpoint', timeout=5, status_query_par
-        ams='FULL')
+        ams='FULL', monitor=TESMonitorConfig(enabled=False, poll_interval=10.0,
+         page_size=256, name_prefix=None, max_pages=4), backends=[], balancer=T
+        ESBalancerConfig(probe_interval=30, probe_timeout=5, max_latency=2.0, l
+        atency_smoothing=0.3, failure_threshold=3, recovery_threshold=2))
     """
 
     url: str
     timeout: int = 5
     status_query_params: str = "FULL"
+    monitor: TESMonitorConfig = TESMonitorConfig()
+    backends: List[TESBackendConfig] = []
+    balancer: TESBalancerConfig = TESBalancerConfig()
 
 
 class DRSServerConfig(FOCABaseConfig):
@@ -296,24 +739,439 @@ class IdConfig(FOCABaseConfig):
     charset: str = string.ascii_uppercase + string.digits
 
 
+class DispatcherConfig(FOCABaseConfig):
+    """Model for fair-share run dispatcher configuration.
+
+    Args:
+        enabled: Hold submitted runs in the database and release them to the
+            task queue only when capacity is available. If authorization is
+            required, runs are not held and only `max_running_runs_per_user`
+            is enforced, at submission.
+        interval: Interval in seconds between periodic dispatch passes.
+        max_running_runs: Maximum number of released, unfinished runs.
+        max_running_runs_per_user: Maximum number of released, unfinished
+            runs per user.
+        priority_classes: Fair-share weights, by priority class name.
+        default_priority_class: Priority class of users not listed in
+            `user_priority_classes`.
+        user_priority_classes: Priority class names, by user identifier.
+
+    Attributes:
+        enabled: Hold submitted runs in the database and release them to the
+            task queue only when capacity is available. If authorization is
+            required, runs are not held and only `max_running_runs_per_user`
+            is enforced, at submission.
+        interval: Interval in seconds between periodic dispatch passes.
+        max_running_runs: Maximum number of released, unfinished runs.
+        max_running_runs_per_user: Maximum number of released, unfinished
+            runs per user.
+        priority_classes: Fair-share weights, by priority class name.
+        default_priority_class: Priority class of users not listed in
+            `user_priority_classes`.
+        user_priority_classes: Priority class names, by user identifier.
+
+    Example:
+        >>> DispatcherConfig(
+        ...     enabled=True,
+        ...     max_running_runs=50,
+        ... )
+        DispatcherConfig(enabled=True, interval=10, max_running_runs=50, max_r
+        unning_runs_per_user=10, priority_classes={'high': 4, 'normal': 2, 'lo
+        w': 1}, default_priority_class='normal', user_priority_classes={})
+    """
+
+    enabled: bool = False
+    interval: float = 10
+    max_running_runs: int = 100
+    max_running_runs_per_user: int = 10
+    priority_classes: Dict[str, float] = {"high": 4, "normal": 2, "low": 1}
+    default_priority_class: str = "normal"
+    user_priority_classes: Dict[str, str] = {}
+
+
+class AdmissionConfig(FOCABaseConfig):
+    """Model for workflow run admission control configuration.
+
+    Args:
+        enabled: Reject new runs with HTTP 429 if a threshold is reached.
+        max_outstanding_runs: Maximum number of runs in any of the
+            `outstanding_states`; `None` for no limit.
+        outstanding_states: Run states of runs that were not started yet.
+        max_queue_length: Maximum number of messages in the broker queue
+            for workflow runs; `None` for no limit.
+        cache_ttl: Time in seconds for which load metrics are reused.
+        rate_window: Time window in seconds over which the rate of started
+            runs is measured to compute `Retry-After`.
+        min_retry_after: Minimum `Retry-After` in seconds.
+        max_retry_after: Maximum `Retry-After` in seconds.
+
+    Attributes:
+        enabled: Reject new runs with HTTP 429 if a threshold is reached.
+        max_outstanding_runs: Maximum number of runs in any of the
+            `outstanding_states`; `None` for no limit.
+        outstanding_states: Run states of runs that were not started yet.
+        max_queue_length: Maximum number of messages in the broker queue
+            for workflow runs; `None` for no limit.
+        cache_ttl: Time in seconds for which load metrics are reused.
+        rate_window: Time window in seconds over which the rate of started
+            runs is measured to compute `Retry-After`.
+        min_retry_after: Minimum `Retry-After` in seconds.
+        max_retry_after: Maximum `Retry-After` in seconds.
+
+    Example:
+        >>> AdmissionConfig(
+        ...     enabled=True,
+        ...     max_outstanding_runs=500,
+        ... )
+        AdmissionConfig(enabled=True, max_outstanding_runs=500, outstanding_st
+        ates=['UNKNOWN', 'QUEUED', 'INITIALIZING'], max_queue_length=None, cac
+        he_ttl=2, rate_window=300, min_retry_after=1, max_retry_after=600)
+    """
+
+    enabled: bool = False
+    max_outstanding_runs: Optional[int] = 1000
+    outstanding_states: List[str] = ["UNKNOWN", "QUEUED", "INITIALIZING"]
+    max_queue_length: Optional[int] = None
+    cache_ttl: float = 2
+    rate_window: int = 300
+    min_retry_after: int = 1
+    max_retry_after: int = 600
+
+
+class ResultCacheConfig(FOCABaseConfig):
+    """Model for run-level result cache configuration.
+
+    Args:
+        enabled: Satisfy runs that are identical to a previously completed
+            run with the outputs of that run.
+        share_across_users: Reuse results of runs of other users.
+        timeout: Timeout in seconds for requesting fingerprints (e.g.,
+            ETags) of remote input files.
+        max_hash_bytes: Maximum total size in bytes of workflow files and
+            local inputs hashed per run; larger runs are not cached.
+
+    Attributes:
+        enabled: Satisfy runs that are identical to a previously completed
+            run with the outputs of that run.
+        share_across_users: Reuse results of runs of other users.
+        timeout: Timeout in seconds for requesting fingerprints (e.g.,
+            ETags) of remote input files.
+        max_hash_bytes: Maximum total size in bytes of workflow files and
+            local inputs hashed per run; larger runs are not cached.
+
+    Example:
+        >>> ResultCacheConfig(
+        ...     enabled=True,
+        ... )
+        ResultCacheConfig(enabled=True, share_across_users=False, timeout=5, m
+        ax_hash_bytes=268435456)
+    """
+
+    enabled: bool = False
+    share_across_users: bool = False
+    timeout: float = 5
+    max_hash_bytes: int = 268435456
+
+
+class ReconcilerConfig(FOCABaseConfig):
+    """Model for orphaned run reconciler configuration.
+
+    Args:
+        enabled: Record heartbeats of supervised runs and re-attach runs
+            whose worker stopped sending heartbeats to the TES tasks they
+            created.
+        heartbeat_interval: Time in seconds between heartbeats.
+        orphan_timeout: Time in seconds without heartbeat after which a run
+            is considered orphaned.
+        enqueued_timeout: Time in seconds after which a re-attached run
+            whose task was not started yet, e.g., because the run queue is
+            backlogged, is considered orphaned.
+        interval: Time in seconds between periodic reconciliation passes.
+        max_reattach_attempts: Number of times a run is re-attached before
+            it is set to `SYSTEM_ERROR`. Credentials of runs are not
+            stored, so if authorization is required, orphaned runs are set
+            to `SYSTEM_ERROR` right away.
+
+    Attributes:
+        enabled: Record heartbeats of supervised runs and re-attach runs
+            whose worker stopped sending heartbeats to the TES tasks they
+            created.
+        heartbeat_interval: Time in seconds between heartbeats.
+        orphan_timeout: Time in seconds without heartbeat after which a run
+            is considered orphaned.
+        enqueued_timeout: Time in seconds after which a re-attached run
+            whose task was not started yet, e.g., because the run queue is
+            backlogged, is considered orphaned.
+        interval: Time in seconds between periodic reconciliation passes.
+        max_reattach_attempts: Number of times a run is re-attached before
+            it is set to `SYSTEM_ERROR`. Credentials of runs are not
+            stored, so if authorization is required, orphaned runs are set
+            to `SYSTEM_ERROR` right away.
+
+    Example:
+        >>> ReconcilerConfig(
+        ...     enabled=True,
+        ... )
+        ReconcilerConfig(enabled=True, heartbeat_interval=30, orphan_timeout=3
+        00, enqueued_timeout=86400, interval=60, max_reattach_attempts=3)
+    """
+
+    enabled: bool = False
+    heartbeat_interval: float = 30
+    orphan_timeout: int = 300
+    enqueued_timeout: int = 86400
+    interval: int = 60
+    max_reattach_attempts: int = 3
+
+
+class OutboundConfig(FOCABaseConfig):
+    """Model for configuration of outbound calls to TES and DRS services.
+
+    Limits apply per remote host and per process.
+
+    Args:
+        enabled: Rate limit, retry and circuit-break outbound calls.
+        rate_limit: Sustained number of calls per second.
+        burst: Maximum number of calls in a burst.
+        max_retries: Number of retries of failed calls.
+        backoff_base: Base delay in seconds of the exponential backoff
+            between retries; delays are drawn at random up to the backoff.
+        backoff_max: Maximum backoff in seconds.
+        failure_threshold: Number of consecutive failed calls after which
+            the circuit is opened and calls are rejected right away.
+        reset_timeout: Time in seconds after which a trial call is let
+            through an open circuit.
+
+    Attributes:
+        enabled: Rate limit, retry and circuit-break outbound calls.
+        rate_limit: Sustained number of calls per second.
+        burst: Maximum number of calls in a burst.
+        max_retries: Number of retries of failed calls.
+        backoff_base: Base delay in seconds of the exponential backoff
+            between retries; delays are drawn at random up to the backoff.
+        backoff_max: Maximum backoff in seconds.
+        failure_threshold: Number of consecutive failed calls after which
+            the circuit is opened and calls are rejected right away.
+        reset_timeout: Time in seconds after which a trial call is let
+            through an open circuit.
+
+    Example:
+        >>> OutboundConfig(
+        ...     enabled=True,
+        ...     rate_limit=5,
+        ... )
+        OutboundConfig(enabled=True, rate_limit=5.0, burst=40, max_retries=3,
+        backoff_base=0.5, backoff_max=10.0, failure_threshold=5, reset_timeou
+        t=30.0)
+    """
+
+    enabled: bool = False
+    rate_limit: float = 20
+    burst: int = 40
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 10
+    failure_threshold: int = 5
+    reset_timeout: float = 30
+
+
+class EngineParameterConfig(FOCABaseConfig):
+    """Model for a workflow engine parameter accepted in run requests.
+
+    Args:
+        name: Parameter name in `workflow_engine_parameters`.
+        flag: Workflow engine command line flag.
+        type: Parameter type; one of `bool`, `int`, `float` and `str`.
+            Boolean parameters add the flag if set; other parameters add the
+            flag followed by the value.
+        default_value: Stringified default value; `None` to omit the flag
+            unless the parameter is requested.
+        min_value: Minimum value of numeric parameters.
+        max_value: Maximum value of numeric parameters.
+        choices: Allowed values of string parameters.
+
+    Attributes:
+        name: Parameter name in `workflow_engine_parameters`.
+        flag: Workflow engine command line flag.
+        type: Parameter type; one of `bool`, `int`, `float` and `str`.
+            Boolean parameters add the flag if set; other parameters add the
+            flag followed by the value.
+        default_value: Stringified default value; `None` to omit the flag
+            unless the parameter is requested.
+        min_value: Minimum value of numeric parameters.
+        max_value: Maximum value of numeric parameters.
+        choices: Allowed values of string parameters.
+
+    Example:
+        >>> EngineParameterConfig(
+        ...     name='parallel',
+        ...     flag='--parallel',
+        ...     type='bool',
+        ...     default_value='False',
+        ... )
+        EngineParameterConfig(name='parallel', flag='--parallel', type='bool',
+        default_value='False', min_value=None, max_value=None, choices=None)
+    """
+
+    name: str
+    flag: str
+    type: str = "str"
+    default_value: Optional[str] = None
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+    choices: Optional[List[str]] = None
+
+
+class LocalExecutorConfig(FOCABaseConfig):
+    """Model for local workflow executor configuration.
+
+    Eligible small workflows are run with `cwltool` directly on a worker
+    consuming `queue`, instead of submitting their steps to TES.
+
+    Args:
+        enabled: Run eligible workflows locally.
+        queue: Name of the queue for locally executed runs.
+        concurrency: Number of runs executed concurrently per local worker.
+        tag_key: Run request tag selecting the executor; values `local`
+            and `tes` request either executor.
+        require_tag: Only run workflows locally if requested via tag.
+        max_steps: Maximum number of tool invocations of eligible
+            workflows; workflows with scattered steps are not eligible.
+        max_cores: Maximum number of cores declared by any eligible tool.
+        max_ram: Maximum RAM in MiB declared by any eligible tool.
+        use_container: Run tools in software containers.
+
+    Attributes:
+        enabled: Run eligible workflows locally.
+        queue: Name of the queue for locally executed runs.
+        concurrency: Number of runs executed concurrently per local worker.
+        tag_key: Run request tag selecting the executor; values `local`
+            and `tes` request either executor.
+        require_tag: Only run workflows locally if requested via tag.
+        max_steps: Maximum number of tool invocations of eligible
+            workflows; workflows with scattered steps are not eligible.
+        max_cores: Maximum number of cores declared by any eligible tool.
+        max_ram: Maximum RAM in MiB declared by any eligible tool.
+        use_container: Run tools in software containers.
+
+    Example:
+        >>> LocalExecutorConfig(
+        ...     enabled=True,
+        ...     max_steps=3,
+        ... )
+        LocalExecutorConfig(enabled=True, queue='local', concurrency=4, tag_ke
+        y='executor', require_tag=False, max_steps=3, max_cores=1.0, max_ram=
+        1024, use_container=True)
+    """
+
+    enabled: bool = False
+    queue: str = "local"
+    concurrency: int = 4
+    tag_key: str = "executor"
+    require_tag: bool = False
+    max_steps: int = 1
+    max_cores: float = 1
+    max_ram: int = 1024
+    use_container: bool = True
+
+
+class ArchiveConfig(FOCABaseConfig):
+    """Model for run archival configuration.
+
+    Args:
+        enabled: Periodically move finished runs into the archive
+            collection; read endpoints fall back to the archive.
+        min_age: Time in seconds since they finished after which runs are
+            archived.
+        interval: Interval in seconds between archival passes.
+        batch_size: Maximum number of runs archived per pass.
+        compressed_fields: Fields of run documents, in dot notation, that
+            are stored compressed in the archive.
+        compression_level: zlib compression level.
+
+    Attributes:
+        enabled: Periodically move finished runs into the archive
+            collection; read endpoints fall back to the archive.
+        min_age: Time in seconds since they finished after which runs are
+            archived.
+        interval: Interval in seconds between archival passes.
+        batch_size: Maximum number of runs archived per pass.
+        compressed_fields: Fields of run documents, in dot notation, that
+            are stored compressed in the archive.
+        compression_level: zlib compression level.
+
+    Example:
+        >>> ArchiveConfig(
+        ...     enabled=True,
+        ...     min_age=604800,
+        ... )
+        ArchiveConfig(enabled=True, min_age=604800, interval=3600, batch_size
+        =1000, compressed_fields=['api.request', 'api.run_log', 'api.task_log
+        s', 'api.outputs', 'internal.traceback', 'internal.orphaned_task_logs
+        '], compression_level=6)
+    """
+
+    enabled: bool = False
+    min_age: int = 2592000
+    interval: float = 3600
+    batch_size: int = 1000
+    compressed_fields: List[str] = [
+        "api.request",
+        "api.run_log",
+        "api.task_logs",
+        "api.outputs",
+        "internal.traceback",
+        "internal.orphaned_task_logs",
+    ]
+    compression_level: int = 6
+
+
 class ControllerConfig(FOCABaseConfig):
     """Model for controller configurations.
 
     Args:
         default_page_size: Pagination page size.
+        task_logs_page_size: Maximum number of TES task logs returned per
+            `GetRunLog` response.
         timeout_cancel_run: Timeout for `cancel_run` workflow.
         timeout_run_workflow: Timeout for `run_workflow` workflow.
         tes_server: TES Server config parameters.
         drs_server: DRS Server config parameters.
         runs_id: Identifier config parameters.
+        engine_events: Obtain TES task and output events from structured
+            events emitted by the workflow engine instead of scraping its
+            debug logs.
+        dispatcher: Fair-share run dispatcher config parameters.
+        admission: Run admission control config parameters.
+        result_cache: Run-level result cache config parameters.
+        reconciler: Orphaned run reconciler config parameters.
+        outbound: Outbound TES and DRS call config parameters.
+        engine_parameters: Workflow engine parameters accepted in run
+            requests.
+        local_executor: Local workflow executor config parameters.
+        archive: Run archival config parameters.
 
     Attributes:
         default_page_size: Pagination page size.
+        task_logs_page_size: Maximum number of TES task logs returned per
+            `GetRunLog` response.
         timeout_cancel_run: Timeout for `cancel_run` workflow.
         timeout_run_workflow: Timeout for `run_workflow` workflow.
         tes_server: TES Server config parameters.
         drs_server: DRS Server config parameters.
         runs_id: Identifier config parameters.
+        engine_events: Obtain TES task and output events from structured
+            events emitted by the workflow engine instead of scraping its
+            debug logs.
+        dispatcher: Fair-share run dispatcher config parameters.
+        admission: Run admission control config parameters.
+        result_cache: Run-level result cache config parameters.
+        reconciler: Orphaned run reconciler config parameters.
+        outbound: Outbound TES and DRS call config parameters.
+        engine_parameters: Workflow engine parameters accepted in run
+            requests.
+        local_executor: Local workflow executor config parameters.
+        archive: Run archival config parameters.
 
     Example:
         >>> ControllerConfig(
@@ -326,11 +1184,162 @@ class ControllerConfig(FOCABaseConfig):
     """
 
     default_page_size: int = 5
+    task_logs_page_size: int = 100
     timeout_cancel_run: int = 60
     timeout_run_workflow: Optional[int] = None
     tes_server: TESServerConfig
     drs_server: DRSServerConfig = DRSServerConfig()
     runs_id: IdConfig = IdConfig()
+    engine_events: bool = False
+    dispatcher: DispatcherConfig = DispatcherConfig()
+    admission: AdmissionConfig = AdmissionConfig()
+    result_cache: ResultCacheConfig = ResultCacheConfig()
+    reconciler: ReconcilerConfig = ReconcilerConfig()
+    outbound: OutboundConfig = OutboundConfig()
+    engine_parameters: List[EngineParameterConfig] = []
+    local_executor: LocalExecutorConfig = LocalExecutorConfig()
+    archive: ArchiveConfig = ArchiveConfig()
+
+
+class MetricsConfig(FOCABaseConfig):
+    """Model for configuration of Prometheus metrics.
+
+    Metrics of processes forked by Gunicorn or Celery are only aggregated
+    if the environment variable `PROMETHEUS_MULTIPROC_DIR` points to a
+    directory writable by all processes of the API or worker, and not shared
+    with other APIs or workers.
+
+    Args:
+        enabled: Expose metrics of the API and of the workers.
+        path: Path of the metrics endpoint of the API.
+        worker_port: Port of the metrics exporter of each Celery worker;
+            overridden by the environment variable `METRICS_PORT`.
+
+    Attributes:
+        enabled: Expose metrics of the API and of the workers.
+        path: Path of the metrics endpoint of the API.
+        worker_port: Port of the metrics exporter of each Celery worker;
+            overridden by the environment variable `METRICS_PORT`.
+
+    Example:
+        >>> MetricsConfig(
+        ...     enabled=True,
+        ...     worker_port=9808,
+        ... )
+        MetricsConfig(enabled=True, path='/metrics', worker_port=9808)
+    """
+
+    enabled: bool = False
+    path: str = "/metrics"
+    worker_port: int = 9808
+
+
+class TracingConfig(FOCABaseConfig):
+    """Model for configuration of distributed tracing.
+
+    Args:
+        enabled: Record traces of requests, Celery tasks and workflow runs.
+        service_name: Prefix of the service names of the API (`-api`) and of
+            the workers (`-worker`).
+        exporter: Span exporter; one of `file` and `otlp`.
+        file_path: File that spans are appended to as JSON lines by the
+            `file` exporter.
+        otlp_endpoint: URL of the OTLP/HTTP traces endpoint of a collector,
+            for the `otlp` exporter.
+        sample_ratio: Fraction of traces recorded; spans continuing a trace
+            follow the sampling decision of their parent.
+
+    Attributes:
+        enabled: Record traces of requests, Celery tasks and workflow runs.
+        service_name: Prefix of the service names of the API (`-api`) and of
+            the workers (`-worker`).
+        exporter: Span exporter; one of `file` and `otlp`.
+        file_path: File that spans are appended to as JSON lines by the
+            `file` exporter.
+        otlp_endpoint: URL of the OTLP/HTTP traces endpoint of a collector,
+            for the `otlp` exporter.
+        sample_ratio: Fraction of traces recorded; spans continuing a trace
+            follow the sampling decision of their parent.
+
+    Example:
+        >>> TracingConfig(
+        ...     enabled=True,
+        ...     exporter='otlp',
+        ... )
+        TracingConfig(enabled=True, service_name='cwl-wes', exporter='otlp',
+        file_path=PosixPath('/data/traces.jsonl'),
+        otlp_endpoint='http://localhost:4318/v1/traces', sample_ratio=1.0)
+    """
+
+    enabled: bool = False
+    service_name: str = "cwl-wes"
+    exporter: str = "file"
+    file_path: Path = Path("/data/traces.jsonl")
+    otlp_endpoint: str = "http://localhost:4318/v1/traces"
+    sample_ratio: float = 1.0
+
+
+class ProfilingConfig(FOCABaseConfig):
+    """Model for configuration of on-demand profiling.
+
+    Profiles are written in `pstats` format and can be inspected with,
+    e.g., `python -m pstats <file>` or `snakeviz`.
+
+    Args:
+        enabled: Profile selected API requests and Celery tasks.
+        sample_ratio: Fraction of requests and tasks profiled in addition to
+            those selected explicitly.
+        header: Request header selecting a request for profiling if set to
+            a true value, e.g., `1`, or, if `secret` is set, to the secret.
+            Tasks are selected by the Celery message header `profile`,
+            which is set for tasks sent while a profiled request or task is
+            processed.
+        secret: Value the request header needs to be set to for a request
+            to be profiled; if not set, any true value selects a request.
+        max_requested_per_minute: Maximum number of requests profiled per
+            minute and API process because they were selected by header;
+            further requests are not profiled. `0` disables selection by
+            header.
+        output_dir: Directory that profiles are written to.
+        max_files: Maximum number of profiles kept in the output directory;
+            the oldest profiles are deleted when it is exceeded.
+
+    Attributes:
+        enabled: Profile selected API requests and Celery tasks.
+        sample_ratio: Fraction of requests and tasks profiled in addition to
+            those selected explicitly.
+        header: Request header selecting a request for profiling if set to
+            a true value, e.g., `1`, or, if `secret` is set, to the secret.
+            Tasks are selected by the Celery message header `profile`,
+            which is set for tasks sent while a profiled request or task is
+            processed.
+        secret: Value the request header needs to be set to for a request
+            to be profiled; if not set, any true value selects a request.
+        max_requested_per_minute: Maximum number of requests profiled per
+            minute and API process because they were selected by header;
+            further requests are not profiled. `0` disables selection by
+            header.
+        output_dir: Directory that profiles are written to.
+        max_files: Maximum number of profiles kept in the output directory;
+            the oldest profiles are deleted when it is exceeded.
+
+    Example:
+        >>> ProfilingConfig(
+        ...     enabled=True,
+        ...     sample_ratio=0.01,
+        ... )
+        ProfilingConfig(enabled=True, sample_ratio=0.01, header='X-Profile', s
+        ecret=None, max_requested_per_minute=6, output_dir=PosixPath('/data/pr
+        ofiles'), max_files=100)
+    """
+
+    enabled: bool = False
+    sample_ratio: float = 0.0
+    header: str = "X-Profile"
+    secret: Optional[str] = None
+    max_requested_per_minute: int = 6
+    output_dir: Path = Path("/data/profiles")
+    max_files: int = 100
 
 
 class CustomConfig(FOCABaseConfig):
@@ -341,15 +1350,24 @@ class CustomConfig(FOCABaseConfig):
         celery: Celery config parameters.
         controller: Controller config parameters.
         service_info: Service Info config parameters.
+        metrics: Prometheus metrics config parameters.
+        tracing: Distributed tracing config parameters.
+        profiling: Profiling config parameters.
 
     Attributes:
         storage: Storage config parameters.
         celery: Celery config parameters.
         controller: Controller config parameters.
         service_info: Service Info config parameters.
+        metrics: Prometheus metrics config parameters.
+        tracing: Distributed tracing config parameters.
+        profiling: Profiling config parameters.
     """
 
     storage: StorageConfig = StorageConfig()
     celery: CeleryConfig = CeleryConfig()
     controller: ControllerConfig
     service_info: ServiceInfoConfig
+    metrics: MetricsConfig = MetricsConfig()
+    tracing: TracingConfig = TracingConfig()
+    profiling: ProfilingConfig = ProfilingConfig()
@@ -8,13 +8,24 @@ from connexion.exceptions import (
     ProblemException,
 )
 from pydantic import ValidationError
-from werkzeug.exceptions import BadRequest, InternalServerError, NotFound
+from werkzeug.exceptions import (
+    BadRequest,
+    InternalServerError,
+    NotFound,
+    TooManyRequests,
+)
 
 
 class WorkflowNotFound(ProblemException, NotFound):
     """WorkflowNotFound(404) error compatible with Connexion."""
 
 
+class TooManyRuns(  # pylint: disable=too-many-ancestors
+    ProblemException, TooManyRequests
+):
+    """TooManyRuns(429) error compatible with Connexion."""
+
+
 exceptions = {
     Exception: {
         "message": "An unexpected error occurred.",
@@ -56,4 +67,8 @@ exceptions = {
         "message": "The requested workflow run wasn't found.",
         "code": "404",
     },
+    TooManyRuns: {
+        "message": "Too many workflow runs are pending. Try again later.",
+        "code": "429",
+    },
 }
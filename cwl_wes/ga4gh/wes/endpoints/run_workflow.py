@@ -1,31 +1,45 @@
 """Utility functions for POST /runs endpoint."""
 
+from datetime import datetime
 from json import decoder, loads
 import logging
 from pathlib import Path
 import re
 import shutil
 import subprocess
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 
 from celery import uuid
 from flask import Config, request
 from foca.utils.misc import generate_id
-from pymongo.collection import Collection
+from pymongo.collection import Collection, ReturnDocument
 from pymongo.errors import DuplicateKeyError, PyMongoError
 from yaml import dump
 from werkzeug.datastructures import ImmutableMultiDict
 from werkzeug.utils import secure_filename
 
+from cwl_wes.custom_config import EngineParameterConfig
 from cwl_wes.exceptions import BadRequest
+from cwl_wes.tasks.dispatch_runs import task__dispatch_runs
 from cwl_wes.tasks.run_workflow import task__run_workflow
+from cwl_wes.utils.admission import check_admission, check_user_limit
+from cwl_wes.utils.archive import restore_run
+from cwl_wes.utils.result_cache import compute_cache_key, find_cached_run
+from cwl_wes.utils.tes_routing import select_tes_url
 from cwl_wes.utils.drs import translate_drs_uris
+from cwl_wes.utils.executor_policy import select_executor
+from cwl_wes.utils.run_events import record_run_event
+from cwl_wes.utils.run_storage import get_run_dir
+from cwl_wes.utils import tracing
 
-# pragma pylint: disable=unused-argument
+# pragma pylint: disable=unused-argument,too-many-lines
 
 # Get logger instance
 logger = logging.getLogger(__name__)
 
+# States of runs that can be resumed
+RESUMABLE_STATES = ["EXECUTOR_ERROR", "SYSTEM_ERROR", "CANCELED"]
+
 
 # Utility function for endpoint POST /runs
 def run_workflow(
@@ -42,16 +56,38 @@ def run_workflow(
     Returns:
         Unique run id.
     """
+    # Reject run early if service is overloaded
+    check_admission(config=config)
+    check_user_limit(config=config, user_id=kwargs.get("user_id"))
+    submitted = datetime.utcnow()
+
     # Validate data and prepare run environment
     form_data_dict = __immutable_multi_dict_to_nested_dict(
         multi_dict=form_data
     )
     __validate_run_workflow_request(data=form_data_dict)
     __check_service_info_compatibility(data=form_data_dict)
+    __parse_engine_parameters(
+        config=config,
+        requested=form_data_dict.get("workflow_engine_parameters", {}),
+    )
     document = __init_run_document(data=form_data_dict)
+    document["internal"]["task_received"] = submitted
     document = __create_run_environment(
         config=config, document=document, **kwargs
     )
+    __record_event(
+        config=config,
+        document=document,
+        event="submitted",
+        timestamp=submitted,
+        state="UNKNOWN",
+    )
+    __record_event(config=config, document=document, event="prepared")
+
+    # Reuse results of identical run, if available
+    if __complete_from_cache(config=config, document=document):
+        return {"run_id": document["run_id"]}
 
     # Start workflow run in background
     __run_workflow(config=config, document=document, **kwargs)
@@ -60,6 +96,97 @@ def run_workflow(
     return response
 
 
+# Utility function for endpoint POST /runs/<run_id>/resume
+def resume_run(config: Config, run_id: str, *args, **kwargs) -> Dict:
+    """Restart unsuccessful workflow run, reusing cached workflow steps.
+
+    The run keeps its identifier, workflow files and run directories but is
+    executed as a new task. Archived runs are restored first.
+
+    Args:
+        config: Flask configuration object.
+        run_id: Workflow run identifier.
+        *args: Variable length argument list.
+        **kwargs: Arbitrary keyword arguments.
+
+    Returns:
+        Run identifier object.
+
+    Raises:
+        BadRequest: If the run is not in a resumable state.
+    """
+    check_admission(config=config)
+    check_user_limit(config=config, user_id=kwargs.get("user_id"))
+    submitted = datetime.utcnow()
+    collections = config.foca.db.dbs["cwl-wes-db"].collections
+    collection_runs: Collection = collections["runs"].client
+    restore_run(
+        collection=collection_runs,
+        collection_archive=collections["runs_archive"].client,
+        run_id=run_id,
+    )
+    previous = collection_runs.find_one(
+        {"run_id": run_id},
+        projection={"task_id": True, "_id": False},
+    )
+    document = collection_runs.find_one_and_update(
+        {
+            "run_id": run_id,
+            "api.state": {"$in": RESUMABLE_STATES},
+            "internal.purged": {"$exists": False},
+        },
+        {
+            "$set": {
+                "task_id": uuid(),
+                "api.state": "UNKNOWN",
+                "api.run_log": {},
+                "api.task_logs": [],
+                "api.outputs": {},
+                "internal.task_received": submitted,
+            },
+            "$unset": {
+                f"internal.{field}": ""
+                for field in [
+                    "task_started",
+                    "task_finished",
+                    "traceback",
+                    "cancel_requested",
+                    "cancel_latency",
+                    "engine_pgid",
+                    "worker_hostname",
+                    "dispatch",
+                    "heartbeat",
+                    "reattach_count",
+                    "orphaned_task_logs",
+                    "orphaned_task_ids",
+                    "disk_usage",
+                ]
+            },
+            "$push": {"internal.resumed_task_ids": previous["task_id"]},
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+    if document is None:
+        logger.error(
+            f"Run '{run_id}' cannot be resumed. Only runs in states"
+            f" {RESUMABLE_STATES} whose directories were not deleted can be"
+            " resumed."
+        )
+        raise BadRequest
+    __record_event(
+        config=config,
+        document=document,
+        event="submitted",
+        timestamp=submitted,
+        state="UNKNOWN",
+        resumed_task_id=previous["task_id"],
+    )
+    __record_event(config=config, document=document, event="prepared")
+
+    __run_workflow(config=config, document=document, **kwargs)
+    return {"run_id": run_id}
+
+
 def __secure_join(basedir: Path, fname: str) -> Path:
     """Generate a secure path for a file.
 
@@ -198,6 +325,7 @@ def __init_run_document(data: Dict) -> Dict:
     document["api"]["run_log"] = {}
     document["api"]["task_logs"] = []
     document["api"]["outputs"] = {}
+    document["internal"]["trace_context"] = tracing.inject_context()
     return document
 
 
@@ -234,8 +362,16 @@ def __create_run_environment(config: Config, document: Dict, **kwargs) -> Dict:
         task_id = uuid()
 
         # Set temporary and output directories
-        current_tmp_dir = storage_conf.tmp_dir.resolve() / run_id
-        current_out_dir = storage_conf.permanent_dir.resolve() / run_id
+        current_tmp_dir = get_run_dir(
+            base_dir=storage_conf.tmp_dir.resolve(),
+            run_id=run_id,
+            config=storage_conf,
+        )
+        current_out_dir = get_run_dir(
+            base_dir=storage_conf.permanent_dir.resolve(),
+            run_id=run_id,
+            config=storage_conf,
+        )
 
         # Try to create workflow run directory (temporary)
         try:
@@ -259,6 +395,16 @@ def __create_run_environment(config: Config, document: Dict, **kwargs) -> Dict:
         # Process worflow attachments
         document = __process_workflow_attachments(document)
 
+        # Fingerprint run before DRS URIs are translated
+        if controller_conf.result_cache.enabled:
+            cache_key = compute_cache_key(
+                document=document,
+                timeout=controller_conf.result_cache.timeout,
+                max_bytes=controller_conf.result_cache.max_hash_bytes,
+            )
+            if cache_key is not None:
+                document["internal"]["cache_key"] = cache_key
+
         # Try to insert document into database
         try:
             collection_runs.insert(document)
@@ -295,6 +441,71 @@ def __create_run_environment(config: Config, document: Dict, **kwargs) -> Dict:
     return document
 
 
+def __complete_from_cache(config: Config, document: Dict) -> bool:
+    """Complete workflow run with outputs of identical previous run.
+
+    Args:
+        config: Flask configuration object.
+        document: Workflow run document.
+
+    Returns:
+        `True` if the run was completed from cache, `False` otherwise.
+    """
+    if "cache_key" not in document["internal"]:
+        return False
+    collection_runs: Collection = (
+        config.foca.db.dbs["cwl-wes-db"].collections["runs"].client
+    )
+    cached = find_cached_run(
+        collection=collection_runs,
+        cache_key=document["internal"]["cache_key"],
+        user_id=document["user_id"],
+        share_across_users=(
+            config.foca.custom.controller.result_cache.share_across_users
+        ),
+        collection_archive=(
+            config.foca.db.dbs["cwl-wes-db"].collections["runs_archive"].client
+        ),
+    )
+    if cached is None:
+        return False
+
+    timestamp = datetime.utcnow()
+    collection_runs.update_one(
+        {"task_id": document["task_id"]},
+        {
+            "$set": {
+                "api.state": "COMPLETE",
+                "api.outputs": cached["api"]["outputs"],
+                "api.run_log.cache_hit": {"run_id": cached["run_id"]},
+                "api.run_log.task_started": timestamp.strftime(
+                    "%Y-%m-%d %H:%M:%S.%f"
+                ),
+                "api.run_log.task_finished": timestamp.strftime(
+                    "%Y-%m-%d %H:%M:%S.%f"
+                ),
+                "api.run_log.return_code": 0,
+                "internal.cache_hit": cached["run_id"],
+                "internal.task_started": timestamp,
+                "internal.task_finished": timestamp,
+            }
+        },
+    )
+    __record_event(
+        config=config,
+        document=document,
+        event="finished",
+        timestamp=timestamp,
+        state="COMPLETE",
+        cache_hit=cached["run_id"],
+    )
+    logger.info(
+        f"Run '{document['run_id']}' completed with cached results of run"
+        f" '{cached['run_id']}'."
+    )
+    return True
+
+
 def __process_workflow_attachments(  # pylint: disable=too-many-branches
     data: Dict,
 ) -> Dict:
@@ -352,40 +563,45 @@ def __process_workflow_attachments(  # pylint: disable=too-many-branches
     # Get workflow from Git repo if regex matches
     if match:
 
-        # Try to clone repo
-        if not subprocess.run(
-            [
-                "git",
-                "clone",
-                match.group("repo_url") + ".git",
-                str(workflow_dir / "repo"),
-            ],
-            check=True,
+        with tracing.child_span(
+            "git.checkout",
+            repository=match.group("repo_url"),
+            revision=match.group("branch_commit"),
         ):
-            logger.error(
-                "Could not clone Git repository. Check value of "
-                "'workflow_url' in run request."
-            )
-            raise BadRequest
-
-        # Try to checkout branch/commit
-        if not subprocess.run(
-            [
-                "git",
-                "--git-dir",
-                str(workflow_dir / "repo" / ".git"),
-                "--work-tree",
-                str(workflow_dir / "repo"),
-                "checkout",
-                match.group("branch_commit"),
-            ],
-            check=True,
-        ):
-            logger.error(
-                "Could not checkout repository commit/branch. Check value "
-                "of 'workflow_url' in run request."
-            )
-            raise BadRequest
+            # Try to clone repo
+            if not subprocess.run(
+                [
+                    "git",
+                    "clone",
+                    match.group("repo_url") + ".git",
+                    str(workflow_dir / "repo"),
+                ],
+                check=True,
+            ):
+                logger.error(
+                    "Could not clone Git repository. Check value of "
+                    "'workflow_url' in run request."
+                )
+                raise BadRequest
+
+            # Try to checkout branch/commit
+            if not subprocess.run(
+                [
+                    "git",
+                    "--git-dir",
+                    str(workflow_dir / "repo" / ".git"),
+                    "--work-tree",
+                    str(workflow_dir / "repo"),
+                    "checkout",
+                    match.group("branch_commit"),
+                ],
+                check=True,
+            ):
+                logger.error(
+                    "Could not checkout repository commit/branch. Check value "
+                    "of 'workflow_url' in run request."
+                )
+                raise BadRequest
 
         # Set CWL path
         data["internal"]["cwl_path"] = str(
@@ -484,30 +700,63 @@ def __run_workflow(config: Config, document: Dict, **kwargs) -> None:
     Raises:
         BadRequest: If workflow run fails.
     """
-    tes_url = config.foca.custom.controller.tes_server.url
-    remote_storage_url = config.foca.custom.storage.remote_storage_url
     run_id = document["run_id"]
     task_id = document["task_id"]
     tmp_dir = document["internal"]["tmp_dir"]
-    cwl_path = document["internal"]["cwl_path"]
-    param_file_path = document["internal"]["param_file_path"]
 
-    # Build command
-    command_list = [
-        "cwl-tes",
-        "--debug",
-        "--leave-outputs",
-        "--remote-storage-url",
-        remote_storage_url,
-        "--tes",
-        tes_url,
-        cwl_path,
-        param_file_path,
-    ]
+    # Build command for selected executor
+    executor = select_executor(config=config, document=document)
+    command_list, tes_url = __build_command(
+        config=config,
+        document=document,
+        executor=executor,
+    )
+
+    # Record executor, TES backend and command without credentials
+    __record_command(
+        config=config,
+        task_id=task_id,
+        executor=executor,
+        tes_url=tes_url,
+        command_list=command_list,
+    )
+
+    # Get timeout duration
+    timeout_duration = config.foca.custom.controller.timeout_run_workflow
+
+    # Locally executed runs are routed to local workers
+    queue = None
+    if executor == "local":
+        queue = config.foca.custom.controller.local_executor.queue
+
+    # Hold run until it is released by the dispatcher; credentials are not
+    # persisted and may expire while the run is held, so runs are only held
+    # if authorization is not required; otherwise, only the per-user limit
+    # is enforced, at submission
+    dispatcher_conf = config.foca.custom.controller.dispatcher
+    if dispatcher_conf.enabled:
+        if not config.foca.security.auth.required:
+            __hold_run(
+                config=config,
+                document=document,
+                task_kwargs={
+                    "command_list": command_list,
+                    "tmp_dir": tmp_dir,
+                    "token": None,
+                },
+                soft_time_limit=timeout_duration,
+                queue=queue,
+            )
+            return
+        logger.info(
+            f"Run '{run_id}' is not held for dispatch, as authorization is"
+            " required."
+        )
 
     # Add authorization parameters
     if (
-        "jwt" in kwargs
+        executor == "tes"
+        and "jwt" in kwargs
         and "claims" in kwargs
         and "public_key" in kwargs["claims"]
     ):
@@ -517,7 +766,7 @@ def __run_workflow(config: Config, document: Dict, **kwargs) -> None:
             "--token",
             kwargs["jwt"],
         ]
-        command_list[2:2] = auth_params
+        command_list[1:1] = auth_params
 
     # TEST CASE FOR SYSTEM ERROR
     # command_list = [
@@ -533,21 +782,298 @@ def __run_workflow(config: Config, document: Dict, **kwargs) -> None:
     #     '30',
     # ]
 
-    # Get timeout duration
-    timeout_duration = config.foca.custom.controller.timeout_run_workflow
+    task_kwargs = {
+        "command_list": command_list,
+        "tmp_dir": tmp_dir,
+        "token": kwargs.get("jwt"),
+    }
 
     # Execute command as background task
     logger.info(
-        f"Starting execution of run '{run_id}' as task '{task_id}' in: "
-        f"{tmp_dir}"
+        f"Starting execution of run '{run_id}' as task '{task_id}' with"
+        f" executor '{executor}' in: {tmp_dir}"
     )
     task__run_workflow.apply_async(
         None,
-        {
-            "command_list": command_list,
-            "tmp_dir": tmp_dir,
-            "token": kwargs.get("jwt"),
-        },
+        task_kwargs,
         task_id=task_id,
         soft_time_limit=timeout_duration,
+        queue=queue,
+    )
+    __record_event(config=config, document=document, event="enqueued")
+
+
+def __build_command(
+    config: Config,
+    document: Dict,
+    executor: str,
+) -> Tuple[List[str], Optional[str]]:
+    """Build workflow engine command, without credentials.
+
+    Args:
+        config: Flask configuration object.
+        document: Workflow run document.
+        executor: `local` to run the workflow with `cwltool` on a local
+            worker, `tes` to submit its steps to TES.
+
+    Returns:
+        Command list and URL of the TES backend the run is routed to; the
+        latter is `None` for local runs.
+    """
+    cwl_path = document["internal"]["cwl_path"]
+    param_file_path = document["internal"]["param_file_path"]
+    tes_url = None
+    if executor == "local":
+        command_list = [
+            "cwltool",
+            "--outdir",
+            str(Path(document["internal"]["out_dir"]) / "outputs"),
+            cwl_path,
+            param_file_path,
+        ]
+        if not config.foca.custom.controller.local_executor.use_container:
+            command_list.insert(1, "--no-container")
+    else:
+        tes_url = select_tes_url(config=config.foca)
+        command_list = [
+            "cwl-tes",
+            "--leave-outputs",
+            "--remote-storage-url",
+            config.foca.custom.storage.remote_storage_url,
+            "--tes",
+            tes_url,
+            cwl_path,
+            param_file_path,
+        ]
+
+    # Add workflow engine options
+    command_list[1:1] = __get_engine_options(
+        config=config,
+        requested=document["api"]["request"].get(
+            "workflow_engine_parameters", {}
+        ),
+    )
+    return command_list, tes_url
+
+
+def __get_engine_options(config: Config, requested: Dict) -> List[str]:
+    """Get workflow engine options.
+
+    Args:
+        config: Flask configuration object.
+        requested: Workflow engine parameters of run request.
+
+    Returns:
+        Command line options.
+    """
+    options = []
+
+    # Translate allow-listed workflow engine parameters
+    parameters = __parse_engine_parameters(config=config, requested=requested)
+    for param in config.foca.custom.controller.engine_parameters:
+        if param.name not in parameters:
+            continue
+        value = parameters[param.name]
+        if param.type == "bool":
+            if value:
+                options.append(param.flag)
+        else:
+            options.extend([param.flag, str(value)])
+
+    # Reuse results of workflow steps across runs
+    step_cache_conf = config.foca.custom.storage.step_cache
+    if step_cache_conf.enabled:
+        options.extend(["--cachedir", str(step_cache_conf.cache_dir)])
+
+    return options
+
+
+def __parse_engine_parameters(config: Config, requested: Dict) -> Dict:
+    """Validate workflow engine parameters and apply defaults.
+
+    Args:
+        config: Flask configuration object.
+        requested: Workflow engine parameters of run request.
+
+    Returns:
+        Parsed parameter values, by parameter name.
+
+    Raises:
+        BadRequest: If a parameter is not allowed or its value is invalid.
+    """
+    allowed = {
+        param.name: param
+        for param in config.foca.custom.controller.engine_parameters
+    }
+    unknown = set(requested) - set(allowed)
+    if unknown:
+        logger.error(
+            f"Workflow engine parameters not supported: {sorted(unknown)}."
+        )
+        raise BadRequest
+    parameters = {}
+    for name, param in allowed.items():
+        value = requested.get(name, param.default_value)
+        if value is None:
+            continue
+        try:
+            parameters[name] = __parse_engine_parameter(
+                param=param,
+                value=value,
+            )
+        except ValueError as exc:
+            logger.error(
+                f"Invalid value for workflow engine parameter '{name}':"
+                f" {exc}"
+            )
+            raise BadRequest from exc
+    return parameters
+
+
+def __parse_engine_parameter(param: EngineParameterConfig, value):
+    """Parse and check value of workflow engine parameter.
+
+    Args:
+        param: Workflow engine parameter configuration.
+        value: Requested or default value; may be stringified.
+
+    Returns:
+        Parsed value.
+
+    Raises:
+        ValueError: If the value is of the wrong type or out of limits.
+    """
+    if param.type == "bool":
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() in ["true", "1", "yes"]:
+            return True
+        if str(value).lower() in ["false", "0", "no"]:
+            return False
+        raise ValueError(f"'{value}' is not a boolean")
+    if param.type in ["int", "float"]:
+        if isinstance(value, bool):
+            raise ValueError(f"'{value}' is not a number")
+        parsed = int(value) if param.type == "int" else float(value)
+        if param.min_value is not None and parsed < param.min_value:
+            raise ValueError(f"{parsed} is less than {param.min_value}")
+        if param.max_value is not None and parsed > param.max_value:
+            raise ValueError(f"{parsed} is greater than {param.max_value}")
+        return parsed
+    parsed = str(value)
+    if param.choices is not None and parsed not in param.choices:
+        raise ValueError(f"'{parsed}' is not one of {param.choices}")
+    return parsed
+
+
+def __hold_run(
+    config: Config,
+    document: Dict,
+    task_kwargs: Dict,
+    soft_time_limit: Optional[int] = None,
+    queue: Optional[str] = None,
+) -> None:
+    """Hold workflow run in database for dispatch by fair share.
+
+    Args:
+        config: Flask configuration object.
+        document: Workflow run document.
+        task_kwargs: Keyword arguments to workflow run task; must not
+            contain credentials, as they are stored in the database.
+        soft_time_limit: Soft time limit of workflow run task.
+        queue: Queue to send workflow run task to; `None` for the default
+            run queue.
+    """
+    collection_runs: Collection = (
+        config.foca.db.dbs["cwl-wes-db"].collections["runs"].client
+    )
+    dispatcher_conf = config.foca.custom.controller.dispatcher
+    priority_class = dispatcher_conf.user_priority_classes.get(
+        document["user_id"],
+        dispatcher_conf.default_priority_class,
+    )
+    collection_runs.update_one(
+        {"task_id": document["task_id"]},
+        {
+            "$set": {
+                "api.state": "QUEUED",
+                "internal.dispatch": {
+                    "state": "held",
+                    "queued": datetime.utcnow(),
+                    "priority_class": priority_class,
+                    "kwargs": task_kwargs,
+                    "soft_time_limit": soft_time_limit,
+                    "queue": queue,
+                    "trace_context": tracing.inject_context(),
+                },
+            }
+        },
+    )
+    __record_event(
+        config=config,
+        document=document,
+        event="held",
+        state="QUEUED",
+        priority_class=priority_class,
+    )
+    logger.info(
+        f"Run '{document['run_id']}' queued for dispatch with priority class"
+        f" '{priority_class}'."
+    )
+    task__dispatch_runs.apply_async()
+
+
+def __record_command(  # pylint: disable=too-many-arguments
+    config: Config,
+    task_id: str,
+    executor: str,
+    tes_url: Optional[str],
+    command_list: List[str],
+) -> None:
+    """Record executor, TES backend and workflow engine command of run.
+
+    The executor is reported in the run log. The command is only recorded if
+    it is needed for re-attaching orphaned runs.
+
+    Args:
+        config: Flask configuration object.
+        task_id: Task identifier of workflow run.
+        executor: Executor of workflow run.
+        tes_url: URL of TES backend the run is routed to; `None` for runs
+            that are executed locally. Runs held for dispatch are routed
+            again when they are released.
+        command_list: Workflow engine command, without credentials.
+    """
+    collection_runs: Collection = (
+        config.foca.db.dbs["cwl-wes-db"].collections["runs"].client
+    )
+    internal = {
+        "internal.executor": executor,
+        "api.run_log.executor": executor,
+    }
+    if tes_url is not None:
+        internal["internal.tes_url"] = tes_url
+    if config.foca.custom.controller.reconciler.enabled:
+        internal["internal.command_list"] = command_list
+    collection_runs.update_one({"task_id": task_id}, {"$set": internal})
+
+
+def __record_event(config: Config, document: Dict, event: str, **kwargs):
+    """Append event to the lifecycle event log of workflow run.
+
+    Args:
+        config: Flask configuration object.
+        document: Workflow run document.
+        event: Name of the event.
+        **kwargs: Additional keyword arguments to
+            :py:func:`cwl_wes.utils.run_events.record_run_event`.
+    """
+    record_run_event(
+        collection=(
+            config.foca.db.dbs["cwl-wes-db"].collections["run_events"].client
+        ),
+        run_id=document["run_id"],
+        task_id=document["task_id"],
+        event=event,
+        **kwargs,
     )
@@ -75,6 +75,21 @@ class ServiceInfo:
         Set service info only if it does not yet exist.
         """
         service_info_conf = current_app.config.foca.custom.service_info.dict()
+
+        # Advertise workflow engine parameters accepted in run requests
+        defaults = service_info_conf["default_workflow_engine_parameters"]
+        advertised = {param["name"] for param in defaults}
+        controller_conf = current_app.config.foca.custom.controller
+        for param in controller_conf.engine_parameters:
+            if param.name not in advertised:
+                defaults.append(
+                    {
+                        "name": param.name,
+                        "type": param.type,
+                        "default_value": param.default_value,
+                    }
+                )
+
         try:
             service_info_db = self.get_service_info(get_counts=False)
         except NotFound:
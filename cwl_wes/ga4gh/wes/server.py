@@ -7,15 +7,19 @@ from bson.objectid import ObjectId
 from celery import uuid
 from connexion import request
 from flask import current_app
-from pymongo.collection import Collection
 
 from foca.utils.logging import log_traffic
 
-from cwl_wes.ga4gh.wes.endpoints.run_workflow import run_workflow
+from cwl_wes.exceptions import BadRequest, TooManyRuns, exceptions
+from cwl_wes.ga4gh.wes.endpoints.run_workflow import resume_run, run_workflow
 from cwl_wes.ga4gh.wes.endpoints.service_info import ServiceInfo
 from cwl_wes.ga4gh.wes.states import States
 from cwl_wes.tasks.cancel_run import task__cancel_run
+import cwl_wes.utils.db as db_utils
 from cwl_wes.utils.controllers import get_document_if_allowed
+from cwl_wes.utils.input_cache import get_stats
+from cwl_wes.utils.run_events import find_run_events
+from cwl_wes.utils.run_storage import purge_run
 
 # pragma pylint: disable=invalid-name,unused-argument
 
@@ -28,6 +32,9 @@ logger = logging.getLogger(__name__)
 def GetRunLog(run_id, *args, **kwargs) -> Dict:
     """Get detailed run info.
 
+    TES task logs are paginated; runs recorded by earlier versions and
+    archived runs return all task logs at once.
+
     Returns:
         Run info object.
     """
@@ -36,15 +43,62 @@ def GetRunLog(run_id, *args, **kwargs) -> Dict:
         run_id=run_id,
         projection={
             "user_id": True,
+            "task_id": True,
             "api": True,
             "_id": False,
         },
         user_id=kwargs.get("user_id"),
     )
     assert "api" in document, "'api' key not in document"
+    task_logs, next_page_token = db_utils.find_tes_task_logs(
+        collection=current_app.config.foca.db.dbs["cwl-wes-db"]
+        .collections["task_logs"]
+        .client,
+        run_id=run_id,
+        task_ids=[document.get("task_id")],
+        page_size=kwargs.get(
+            "task_logs_page_size",
+            current_app.config.foca.custom.controller.task_logs_page_size,
+        ),
+        page_token=kwargs.get("task_logs_page_token", ""),
+    )
+    if task_logs or kwargs.get("task_logs_page_token"):
+        document["api"]["task_logs"] = task_logs
+    document["api"]["next_task_logs_page_token"] = next_page_token
     return document["api"]
 
 
+# GET /runs/<run_id>/events
+@log_traffic
+def GetRunEvents(run_id, *args, **kwargs) -> Dict:
+    """Get lifecycle events of all attempts of workflow run.
+
+    Returns:
+        Run events object.
+    """
+    get_document_if_allowed(
+        config=current_app.config,
+        run_id=run_id,
+        projection={
+            "user_id": True,
+            "_id": False,
+        },
+        user_id=kwargs.get("user_id"),
+    )
+    events = find_run_events(
+        collection=current_app.config.foca.db.dbs["cwl-wes-db"]
+        .collections["run_events"]
+        .client,
+        run_id=run_id,
+    )
+    for event in events:
+        del event["run_id"]
+        event["timestamp"] = event["timestamp"].strftime(
+            "%Y-%m-%d %H:%M:%S.%f"
+        )
+    return {"run_id": run_id, "events": events}
+
+
 # POST /runs/<run_id>/cancel
 @log_traffic
 def CancelRun(run_id, *args, **kwargs) -> Dict:
@@ -87,6 +141,124 @@ def CancelRun(run_id, *args, **kwargs) -> Dict:
     return {"run_id": run_id}
 
 
+# DELETE /runs/<run_id>/cache
+@log_traffic
+def InvalidateRunCache(run_id, *args, **kwargs) -> Dict:
+    """Stop reusing results of workflow run and all identical runs.
+
+    Returns:
+        Run identifier object.
+    """
+    document = get_document_if_allowed(
+        config=current_app.config,
+        run_id=run_id,
+        projection={
+            "user_id": True,
+            "internal.cache_key": True,
+            "_id": False,
+        },
+        user_id=kwargs.get("user_id"),
+    )
+    cache_config = current_app.config.foca.custom.controller.result_cache
+    cache_key = document.get("internal", {}).get("cache_key")
+    if cache_key is not None:
+        query = {"internal.cache_key": cache_key}
+        if not cache_config.share_across_users:
+            query["user_id"] = document["user_id"]
+        collections = current_app.config.foca.db.dbs["cwl-wes-db"].collections
+        modified_count = 0
+        for name in ["runs", "runs_archive"]:
+            result = collections[name].client.update_many(
+                query,
+                {"$set": {"internal.cache_invalidated": True}},
+            )
+            modified_count += result.modified_count
+        logger.info(
+            f"Invalidated cached results of {modified_count} runs"
+            f" identical to run '{run_id}'."
+        )
+
+    return {"run_id": run_id}
+
+
+# DELETE /runs/<run_id>/storage
+@log_traffic
+def PurgeRunStorage(run_id, *args, **kwargs) -> Dict:
+    """Delete directories of finished workflow run.
+
+    Returns:
+        Run identifier object.
+
+    Raises:
+        BadRequest: If the run is not finished.
+    """
+    document = get_document_if_allowed(
+        config=current_app.config,
+        run_id=run_id,
+        projection={
+            "user_id": True,
+            "api.state": True,
+            "internal.purged": True,
+            "_id": False,
+        },
+        user_id=kwargs.get("user_id"),
+    )
+    if "purged" in document.get("internal", {}):
+        return {"run_id": run_id}
+    if document["api"]["state"] not in States.FINISHED:
+        logger.error(
+            f"Directories of run '{run_id}' cannot be deleted. Only"
+            f" directories of runs in states {States.FINISHED} can be"
+            " deleted."
+        )
+        raise BadRequest
+    collections = current_app.config.foca.db.dbs["cwl-wes-db"].collections
+    run_collections = [
+        collections[name].client for name in ["runs", "runs_archive"]
+    ]
+    for collection in run_collections:
+        if (
+            purge_run(
+                collection=collection,
+                run_id=run_id,
+                run_collections=run_collections,
+            )
+            is not None
+        ):
+            break
+    return {"run_id": run_id}
+
+
+# POST /runs/<run_id>/resume
+@log_traffic
+def ResumeRun(run_id, *args, **kwargs) -> Dict:
+    """Restart unsuccessful workflow run from its cached workflow steps.
+
+    Returns:
+        Run identifier object.
+    """
+    get_document_if_allowed(
+        config=current_app.config,
+        run_id=run_id,
+        projection={
+            "user_id": True,
+            "_id": False,
+        },
+        user_id=kwargs.get("user_id"),
+    )
+    try:
+        response = resume_run(
+            config=current_app.config,
+            run_id=run_id,
+            *args,
+            **kwargs,
+        )
+    # Problem handler does not set headers; return `Retry-After` directly
+    except TooManyRuns as exc:
+        return exceptions[TooManyRuns], 429, exc.headers
+    return response
+
+
 # GET /runs/<run_id>/status
 @log_traffic
 def GetRunStatus(run_id, *args, **kwargs) -> Dict:
@@ -122,6 +294,21 @@ def GetServiceInfo(*args, **kwargs) -> Optional[Dict]:
     return service_info.get_service_info()
 
 
+# GET /input-cache
+@log_traffic
+def GetInputCacheStats(*args, **kwargs) -> Dict:
+    """Get usage statistics of input staging cache.
+
+    Returns:
+        Input cache statistics object.
+    """
+    collections = current_app.config.foca.db.dbs["cwl-wes-db"].collections
+    return get_stats(
+        entries=collections["input_cache"].client,
+        stats=collections["input_cache_stats"].client,
+    )
+
+
 # GET /runs
 @log_traffic
 def ListRuns(*args, **kwargs) -> Dict:
@@ -130,9 +317,7 @@ def ListRuns(*args, **kwargs) -> Dict:
     Returns:
         Run list object.
     """
-    collection_runs: Collection = (
-        current_app.config.foca.db.dbs["cwl-wes-db"].collections["runs"].client
-    )
+    collections = current_app.config.foca.db.dbs["cwl-wes-db"].collections
     page_size = kwargs.get(
         "page_size",
         current_app.config.foca.custom.controller.default_page_size,
@@ -144,18 +329,24 @@ def ListRuns(*args, **kwargs) -> Dict:
         filter_dict["user_id"] = kwargs["user_id"]
     if page_token != "":
         filter_dict["_id"] = {"$lt": ObjectId(page_token)}
-    cursor = (
-        collection_runs.find(
-            filter=filter_dict,
-            projection={
-                "run_id": True,
-                "api.state": True,
-            },
+    # Page through active and archived runs
+    runs_list = []
+    for name in ["runs", "runs_archive"]:
+        cursor = (
+            collections[name]
+            .client.find(
+                filter=filter_dict,
+                projection={
+                    "run_id": True,
+                    "api.state": True,
+                },
+            )
+            .sort("_id", -1)
+            .limit(page_size)
         )
-        .sort("_id", -1)
-        .limit(page_size)
-    )
-    runs_list = list(cursor)
+        runs_list.extend(cursor)
+    runs_list.sort(key=lambda run: run["_id"], reverse=True)
+    del runs_list[page_size:]
 
     if runs_list:
         next_page_token = str(runs_list[-1]["_id"])
@@ -178,10 +369,14 @@ def RunWorkflow(*args, **kwargs) -> Dict:
     Returns:
         Run identifier object.
     """
-    response = run_workflow(
-        config=current_app.config,
-        form_data=request.form,
-        *args,
-        **kwargs,
-    )
+    try:
+        response = run_workflow(
+            config=current_app.config,
+            form_data=request.form,
+            *args,
+            **kwargs,
+        )
+    # Problem handler does not set headers; return `Retry-After` directly
+    except TooManyRuns as exc:
+        return exceptions[TooManyRuns], 429, exc.headers
     return response
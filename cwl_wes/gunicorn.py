@@ -2,7 +2,10 @@
 
 import os
 
+from prometheus_client import multiprocess
+
 from cwl_wes.app import init_app
+from cwl_wes.utils.metrics import is_multiprocess, remove_stale_metrics
 
 # Source application configuration
 app = init_app().app
@@ -29,3 +32,14 @@ raw_env = [
     f"MONGO_USERNAME={os.environ.get('MONGO_USERNAME', '')}",
     f"MONGO_PASSWORD={os.environ.get('MONGO_PASSWORD', '')}",
 ]
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Discard live metrics of exited Gunicorn worker."""
+    if is_multiprocess():
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """Discard metrics of earlier Gunicorn workers."""
+    remove_stale_metrics()
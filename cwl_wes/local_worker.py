@@ -0,0 +1,10 @@
+"""Celery worker entry point for locally executed workflow run tasks."""
+
+from kombu import Queue
+
+from cwl_wes.worker import celery_app
+
+local_executor_config = celery_app.conf.foca.custom.controller.local_executor
+celery_app.conf.task_queues = [Queue(local_executor_config.queue)]
+celery_app.conf.worker_concurrency = local_executor_config.concurrency
+celery_app.conf.worker_prefetch_multiplier = 1
@@ -0,0 +1,105 @@
+"""Move run directories of finished runs to the configured layout.
+
+Run directories are moved within `storage.tmp_dir` and
+`storage.permanent_dir` to the sharded layout configured via
+`storage.shard_levels` and `storage.shard_width`, and the paths recorded in
+the run documents are updated, e.g.:
+
+    python -m cwl_wes.migrate_run_dirs --dry-run
+
+Active and archived runs are migrated, and the outputs of runs completed
+from cached results of a migrated run are updated, too. Directories are
+moved before run documents are updated; runs whose migration was
+interrupted are completed by running the tool again.
+
+Directories of unfinished runs are left in place; as their paths are
+recorded with the run, they remain valid. Runs can be migrated once they
+have finished by running the tool again.
+"""
+
+import argparse
+import logging
+import sys
+from typing import List, Optional
+
+from pymongo.errors import PyMongoError
+
+from cwl_wes.ga4gh.wes.states import States
+from cwl_wes.utils.run_storage import get_run_dir, migrate_run_dirs
+from cwl_wes.worker import celery_app
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    """Migrate run directories of finished runs.
+
+    Args:
+        args: Command line arguments; defaults to `sys.argv[1:]`.
+
+    Returns:
+        Exit code; 1 if any run could not be migrated.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only report runs whose directories would be moved",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=0,
+        help="maximum number of runs to migrate; 0 for no limit",
+    )
+    parsed = parser.parse_args(args)
+    foca_config = celery_app.conf.foca
+    storage_config = foca_config.custom.storage
+    collections = foca_config.db.dbs["cwl-wes-db"].collections
+    run_collections = [
+        collections[name].client for name in ["runs", "runs_archive"]
+    ]
+
+    migrated = failed = 0
+    for collection in run_collections:
+        for document in collection.find(
+            {
+                "api.state": {"$in": States.FINISHED},
+                "internal.purged": {"$exists": False},
+            },
+        ):
+            if parsed.limit and migrated >= parsed.limit:
+                break
+            if parsed.dry_run:
+                target = get_run_dir(
+                    base_dir=storage_config.tmp_dir.resolve(),
+                    run_id=document["run_id"],
+                    config=storage_config,
+                )
+                if document["internal"].get("tmp_dir") != str(target):
+                    logger.info(f"Would migrate run '{document['run_id']}'.")
+                    migrated += 1
+                continue
+            try:
+                if migrate_run_dirs(
+                    collection=collection,
+                    document=document,
+                    config=storage_config,
+                    archive_config=foca_config.custom.controller.archive,
+                    run_collections=run_collections,
+                ):
+                    migrated += 1
+            except (OSError, PyMongoError) as exc:
+                logger.error(
+                    "Could not migrate directories of run"
+                    f" '{document['run_id']}'. Original error message:"
+                    f" {type(exc).__name__}: {exc}"
+                )
+                failed += 1
+    logger.info(f"Migrated {migrated} runs; {failed} runs failed.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+"""Celery worker entry point for workflow run tasks."""
+
+from kombu import Queue
+
+from cwl_wes.worker import celery_app
+
+routing_config = celery_app.conf.foca.custom.celery.routing
+celery_app.conf.task_queues = [Queue(routing_config.run_queue)]
+celery_app.conf.worker_prefetch_multiplier = (
+    routing_config.run_prefetch_multiplier
+)
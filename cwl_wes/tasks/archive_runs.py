@@ -0,0 +1,138 @@
+"""Celery background task to move finished runs into the archive."""
+
+from datetime import datetime, timedelta
+import logging
+from typing import Dict, List
+
+from bson.objectid import ObjectId
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from cwl_wes.custom_config import ArchiveConfig
+from cwl_wes.ga4gh.wes.states import States
+import cwl_wes.utils.db as db_utils
+from cwl_wes.utils.archive import archive_run
+from cwl_wes.worker import celery_app
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+# Name of the lock serializing archival passes
+ARCHIVE_LOCK = "archive_runs"
+
+
+@celery_app.task(
+    name="tasks.archive_runs",
+    ignore_result=True,
+)
+def task__archive_runs() -> None:
+    """Move runs that finished long enough ago into the archive.
+
+    Only one archival pass is executed at a time; passes triggered while
+    another one is in progress are skipped.
+    """
+    foca_config = celery_app.conf.foca
+    archive_config = foca_config.custom.controller.archive
+    collections = foca_config.db.dbs["cwl-wes-db"].collections
+    locks = collections["locks"].client
+    owner = db_utils.acquire_lock(
+        collection=locks,
+        name=ARCHIVE_LOCK,
+        ttl=archive_config.interval,
+    )
+    if owner is None:
+        return
+    try:
+        archive_runs(
+            collection=collections["runs"].client,
+            collection_archive=collections["runs_archive"].client,
+            collection_task_logs=collections["task_logs"].client,
+            config=archive_config,
+        )
+    except PyMongoError as exc:
+        logger.exception(
+            "Database error. Could not archive runs. Original error message:"
+            f" {type(exc).__name__}: {exc}"
+        )
+    finally:
+        db_utils.release_lock(collection=locks, name=ARCHIVE_LOCK, owner=owner)
+
+
+def archive_runs(
+    collection: Collection,
+    collection_archive: Collection,
+    collection_task_logs: Collection,
+    config: ArchiveConfig,
+) -> int:
+    """Move runs that finished longer ago than the minimum age to archive.
+
+    Runs without finishing time are considered finished at submission.
+    TES task logs are archived with the run document and removed from their
+    collection.
+
+    Args:
+        collection: MongoDB collection of runs.
+        collection_archive: MongoDB collection of archived runs.
+        collection_task_logs: MongoDB collection of TES task logs.
+        config: Run archival configuration.
+
+    Returns:
+        Number of archived runs.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=config.min_age)
+    archived = 0
+    for document in collection.find(
+        {
+            "api.state": {"$in": States.FINISHED},
+            "$or": [
+                {"internal.task_finished": {"$lt": cutoff}},
+                {
+                    "internal.task_finished": {"$exists": False},
+                    "_id": {"$lt": ObjectId.from_datetime(cutoff)},
+                },
+            ],
+        },
+        limit=config.batch_size,
+    ):
+        _embed_task_logs(collection=collection_task_logs, document=document)
+        if archive_run(
+            collection=collection,
+            collection_archive=collection_archive,
+            document=document,
+            fields=config.compressed_fields,
+            level=config.compression_level,
+        ):
+            collection_task_logs.delete_many({"run_id": document["run_id"]})
+            archived += 1
+    logger.info(f"Archived {archived} finished runs.")
+    return archived
+
+
+def _embed_task_logs(collection: Collection, document: Dict) -> None:
+    """Add TES task logs of run to run document.
+
+    Task logs of the current attempt of the run are added to the API
+    fields, those of interrupted attempts to the orphaned task logs.
+
+    Args:
+        collection: MongoDB collection of TES task logs.
+        document: Run document; updated in place.
+    """
+    task_logs: List = []
+    orphaned_task_logs: List = []
+    for task_log in collection.find(
+        {"run_id": document["run_id"]},
+        projection={"task_id": True, "log": True},
+        sort=[("_id", 1)],
+    ):
+        if task_log["task_id"] == document.get("task_id"):
+            task_logs.append(task_log["log"])
+        else:
+            orphaned_task_logs.append(task_log["log"])
+    api = document.setdefault("api", {})
+    api["task_logs"] = api.get("task_logs", []) + task_logs
+    if orphaned_task_logs:
+        internal = document.setdefault("internal", {})
+        internal["orphaned_task_logs"] = (
+            internal.get("orphaned_task_logs", []) + orphaned_task_logs
+        )
@@ -1,36 +1,90 @@
 """Celery background task to cancel workflow run and related TES tasks."""
 
+from datetime import datetime
 import logging
 import time
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from celery.exceptions import SoftTimeLimitExceeded
+from celery.worker.control import control_command
 from flask import current_app
 from foca.database.register_mongodb import _create_mongo_client
 from pymongo import collection as Collection
-from requests import HTTPError
-import tes
+from pymongo.errors import PyMongoError
 
 from cwl_wes.ga4gh.wes.states import States
+from cwl_wes.tasks.workflow_run_manager import terminate_process_group
 import cwl_wes.utils.db as db_utils
+from cwl_wes.utils.run_events import record_run_event
+from cwl_wes.utils.tes_cancel import cancel_tes_tasks
 from cwl_wes.worker import celery_app
 
 # Get logger instance
 logger = logging.getLogger(__name__)
 
+# Seconds between checks whether the worker has processed the exit of a
+# killed workflow engine
+SETTLE_INTERVAL = 1
+
+
+@control_command(
+    args=[("pgid", int), ("run_id", str)],
+    signature="<pgid> [run_id]",
+)
+def terminate_workflow_engine(
+    state,  # pylint: disable=unused-argument
+    pgid: int,
+    run_id: Optional[str] = None,
+) -> Dict:
+    """Kill workflow engine process group running on this worker.
+
+    Executed by the worker's main process upon remote control broadcast.
+    If a run identifier is given, the process group is only killed while
+    the run is unfinished, as process group identifiers are reused once
+    the workflow engine has exited.
+    """
+    if run_id is not None:
+        collection = (
+            celery_app.conf.foca.db.dbs["cwl-wes-db"]
+            .collections["runs"]
+            .client
+        )
+        try:
+            unfinished = collection.count_documents(
+                {"run_id": run_id, "api.state": {"$in": States.UNFINISHED}},
+                limit=1,
+            )
+        except PyMongoError as exc:
+            return {
+                "error": f"could not look up run '{run_id}':"
+                f" {type(exc).__name__}: {exc}"
+            }
+        if not unfinished:
+            return {"error": f"run '{run_id}' has finished"}
+    if terminate_process_group(pgid=pgid):
+        return {"ok": f"workflow engine process group {pgid} killed"}
+    return {"error": f"no such process group: {pgid}"}
+
 
 @celery_app.task(
     name="tasks.cancel_run",
     ignore_result=True,
     bind=True,
 )
-def task__cancel_run(
+def task__cancel_run(  # pylint: disable=too-many-locals
     self,  # pylint: disable=unused-argument
     run_id: str,
     task_id: str,
     token: Optional[str] = None,
 ) -> None:
-    """Revokes worfklow task and tries to cancel all running TES tasks."""
+    """Stop workflow engine and cancel all outstanding TES tasks.
+
+    The workflow task is revoked so that it is not started if it is still
+    queued. If the workflow engine is already running, its process group is
+    killed by the worker supervising it. All TES tasks of the run are then
+    canceled concurrently.
+    """
+    cancel_requested = time.time()
     foca_config = current_app.config.foca
     # Create MongoDB client
     mongo = _create_mongo_client(
@@ -40,6 +94,7 @@ def task__cancel_run(
         db="cwl-wes-db",
     )
     collection = mongo.db["runs"]
+    collection_events = mongo.db["run_events"]
     # Set run state to 'CANCELING'
     db_utils.set_run_state(
         collection=collection,
@@ -47,16 +102,47 @@ def task__cancel_run(
         task_id=task_id,
         state="CANCELING",
     )
+    record_run_event(
+        collection=collection_events,
+        run_id=run_id,
+        task_id=task_id,
+        event="cancel_requested",
+        timestamp=datetime.utcfromtimestamp(cancel_requested),
+        state="CANCELING",
+    )
+    document = db_utils.upsert_fields_in_root_object(
+        collection=collection,
+        task_id=task_id,
+        root="internal",
+        cancel_requested=datetime.utcfromtimestamp(cancel_requested),
+    )
 
+    tes_server_config = foca_config.custom.controller.tes_server
+    tes_url = tes_server_config.url
+    # TES tasks of the current attempt and of interrupted attempts it
+    # re-attached to; tasks of resumed attempts have finished
+    task_ids = [task_id]
+    if document:
+        tes_url = document.get("internal", {}).get("tes_url", tes_url)
+        task_ids += document["internal"].get("orphaned_task_ids", [])
     try:
+        # Stop workflow engine
+        celery_app.control.revoke(task_id)
+        engine_stopped = __terminate_workflow_engine(
+            document=document,
+            timeout=tes_server_config.timeout,
+        )
+
         # Cancel individual TES tasks
-        tes_server_config = foca_config.custom.controller.tes_server
         __cancel_tes_tasks(
             collection=collection,
+            collection_task_logs=mongo.db["task_logs"],
             run_id=run_id,
-            url=tes_server_config.url,
+            task_ids=task_ids,
+            url=tes_url,
             timeout=tes_server_config.timeout,
             token=token,
+            wait=not engine_stopped,
         )
     except SoftTimeLimitExceeded as exc:
         db_utils.set_run_state(
@@ -65,48 +151,165 @@ def task__cancel_run(
             task_id=task_id,
             state="SYSTEM_ERROR",
         )
+        record_run_event(
+            collection=collection_events,
+            run_id=run_id,
+            task_id=task_id,
+            event="finished",
+            state="SYSTEM_ERROR",
+        )
         logger.warning(
             f"Canceling workflow run '{run_id}' timed out. Run state was set "
             "to 'SYSTEM_ERROR'. Original error message: "
             f"{type(exc).__name__}: {exc}"
         )
+        return
+
+    if engine_stopped:
+        db_utils.set_run_state(
+            collection=collection,
+            run_id=run_id,
+            task_id=task_id,
+            state="CANCELED",
+        )
+        record_run_event(
+            collection=collection_events,
+            run_id=run_id,
+            task_id=task_id,
+            event="finished",
+            state="CANCELED",
+        )
+    cancel_latency = time.time() - cancel_requested
+    db_utils.upsert_fields_in_root_object(
+        collection=collection,
+        task_id=task_id,
+        root="internal",
+        cancel_latency=cancel_latency,
+    )
+    logger.info(
+        f"Workflow run '{run_id}' canceled {cancel_latency:.3f} seconds after"
+        " cancellation was requested."
+    )
+
+
+def __terminate_workflow_engine(
+    document: Optional[Dict],
+    timeout: int = 5,
+) -> bool:
+    """Kill workflow engine via the worker that supervises it.
+
+    Args:
+        document: Run document.
+        timeout: Seconds to wait for the worker to reply.
+
+    Returns:
+        `True` if the workflow engine is known to be stopped or was never
+        started, `False` if the run has to be waited for.
+    """
+    if not document:
+        return False
+    internal = document.get("internal", {})
+    if "engine_pgid" not in internal:
+        # Revoked runs that were not picked up yet will never be started
+        return "task_started" not in internal
+    if kill_workflow_engine(
+        hostname=internal["worker_hostname"],
+        pgid=internal["engine_pgid"],
+        run_id=document["run_id"],
+        timeout=timeout,
+    ):
+        return True
+    logger.warning(
+        f"Could not kill workflow engine process group"
+        f" {internal['engine_pgid']} on worker"
+        f" '{internal['worker_hostname']}'."
+    )
+    return False
+
 
+def kill_workflow_engine(
+    hostname: str,
+    pgid: int,
+    run_id: str,
+    timeout: float = 5,
+) -> Optional[bool]:
+    """Kill workflow engine process group via the worker running it.
+
+    Args:
+        hostname: Name of the worker running the workflow engine.
+        pgid: Process group identifier of the workflow engine.
+        run_id: Identifier of the workflow run; the process group is not
+            killed if the run has finished.
+        timeout: Seconds to wait for the worker to reply.
 
-def __cancel_tes_tasks(
+    Returns:
+        `True` if the process group was killed, `False` if the worker
+        replied that it does not exist (anymore) or that the run has
+        finished, `None` if the worker did not reply.
+    """
+    replies = celery_app.control.broadcast(
+        "terminate_workflow_engine",
+        arguments={"pgid": pgid, "run_id": run_id},
+        destination=[hostname],
+        reply=True,
+        timeout=timeout,
+    )
+    answers = [answer for reply in replies for answer in reply.values()]
+    if not answers:
+        return None
+    return any("ok" in answer for answer in answers)
+
+
+def __cancel_tes_tasks(  # pylint: disable=too-many-arguments
     collection: Collection,
+    collection_task_logs: Collection,
     run_id: str,
+    task_ids: List[str],
     url: str,
     timeout: int = 5,
     token: Optional[str] = None,
+    wait: bool = True,
 ):
-    """Cancel individual TES tasks."""
-    tes_client = tes.HTTPClient(
-        url=url,
-        timeout=timeout,
-        token=token,
-    )
+    """Cancel individual TES tasks concurrently.
+
+    If `wait` is set, TES tasks created afterwards are canceled as well until
+    the run has finished. Otherwise, the workflow engine was killed; TES
+    tasks it created before it was killed may still be recorded by the
+    worker, so they are canceled in a final pass once the worker has
+    processed the exit of the workflow engine, or after `timeout` seconds.
+    """
     canceled: List = []
+    settled = False
+    settle_deadline = time.monotonic() + timeout
     while True:
-        task_ids = db_utils.find_tes_task_ids(
-            collection=collection,
+        tes_ids = db_utils.find_tes_task_ids(
+            collection=collection_task_logs,
             run_id=run_id,
+            task_ids=task_ids,
+        )
+        cancel = [item for item in tes_ids if item not in canceled]
+        cancel_tes_tasks(
+            url=url,
+            tes_ids=cancel,
+            timeout=timeout,
+            token=token,
         )
-        cancel = [item for item in task_ids if item not in canceled]
-        for task_id in cancel:
-            try:
-                tes_client.cancel_task(task_id)
-            except HTTPError:
-                # TODO: handle more robustly: only 400/Bad Request is okay;
-                # TODO: other errors (e.g. 500) should be dealt with
-                pass
         canceled = canceled + cancel
-        time.sleep(timeout)
+        if settled:
+            break
+        time.sleep(timeout if wait else SETTLE_INTERVAL)
         document = collection.find_one(
             filter={"run_id": run_id},
             projection={
                 "api.state": True,
+                "internal.task_finished": True,
                 "_id": False,
             },
         )
-        if document["api"]["state"] in States.FINISHED:
-            break
+        if wait:
+            settled = document["api"]["state"] in States.FINISHED
+        else:
+            settled = (
+                "task_finished" in document.get("internal", {})
+                or time.monotonic() >= settle_deadline
+            )
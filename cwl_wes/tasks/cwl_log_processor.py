@@ -1,102 +1,299 @@
 """cwl-tes log parser executed on worker."""
 
 from ast import literal_eval
+from collections import deque
+from datetime import datetime
 import logging
 import os
 import re
-from typing import Dict, List, Optional, Tuple
+from typing import Deque, Dict, List, Optional, Tuple, TYPE_CHECKING
 
 from _io import TextIOWrapper
 from pymongo.errors import PyMongoError
 import tes
 
 import cwl_wes.utils.db as db_utils
-from cwl_wes.worker import celery_app
+from cwl_wes.utils import metrics, outbound
+
+if TYPE_CHECKING:
+    from cwl_wes.tasks.tes_monitor import TESTaskMonitor
 
 # Get logger instance
 logger = logging.getLogger(__name__)
 
 
-class CWLLogProcessor:
+class CWLLogProcessor:  # pylint: disable=too-many-instance-attributes
     """cwl-tes log parser executed on worker.
 
+    Log lines can be fed to the parser either by passing a stream to
+    `process_cwl_logs()` or one by one via `process_line()`. If the workflow
+    engine emits structured events (cf. `cwl_wes.tasks.engine_events`), these
+    are passed to `process_engine_event()` and log lines are not scraped.
+
+    To keep memory usage constant regardless of log size, processed log lines
+    are spooled to a file and only the most recent lines are kept in memory.
+    Call `close()` once processing is done.
+
     Args:
         tes_config: TES configuration.
-        collection: MongoDB collection.
+        collection: MongoDB collection of TES task logs.
+        run_id: Run identifier.
+        task_id: Task identifier of workflow run.
+        monitor: TES task monitor; if set, TES task states are tracked by the
+            monitor rather than extracted from the logs.
+        structured: Whether TES task and output events are obtained from
+            structured engine events rather than from the logs.
+        log_path: Path to file the processed log is spooled to; if not set,
+            only the most recent lines are kept.
+        tail_lines: Number of most recent log lines kept in memory.
+        cache_dir: Step cache directory; entries reported as used by the
+            workflow engine are marked as recently used.
 
     Attributes:
         tes_config: TES configuration.
-        collection: MongoDB collection.
+        collection: MongoDB collection of TES task logs.
+        run_id: Run identifier.
+        task_id: Task identifier of workflow run.
+        monitor: TES task monitor; if set, TES task states are tracked by the
+            monitor rather than extracted from the logs.
+        structured: Whether TES task and output events are obtained from
+            structured engine events rather than from the logs.
+        log_path: Path to file the processed log is spooled to; if not set,
+            only the most recent lines are kept.
+        log_tail: Most recent processed log lines.
+        cache_dir: Step cache directory; entries reported as used by the
+            workflow engine are marked as recently used.
+        tes_states: Last known TES task states, by TES task identifier.
+        first_tes_update: Time the first TES task was reported, if any.
+        last_tes_update: Time the most recent TES task creation or state
+            change was reported, if any.
+        outputs: Workflow outputs reported by structured engine events, if
+            any.
     """
 
-    def __init__(self, tes_config, collection) -> None:
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        tes_config,
+        collection,
+        run_id: str,
+        task_id: str,
+        monitor: Optional["TESTaskMonitor"] = None,
+        structured: bool = False,
+        log_path: Optional[str] = None,
+        tail_lines: int = 1000,
+        cache_dir: Optional[str] = None,
+    ) -> None:
         """Construct class instance."""
         self.tes_config = tes_config
         self.collection = collection
+        self.run_id = run_id
+        self.task_id = task_id
+        self.monitor = monitor
+        self.structured = structured
+        self.log_path = log_path
+        self.log_tail: Deque[str] = deque(maxlen=tail_lines)
+        self.cache_dir = cache_dir
+        self._log_file = (
+            open(  # pylint: disable=consider-using-with
+                log_path, mode="a", encoding="utf-8"
+            )
+            if log_path is not None
+            else None
+        )
+        self.tes_states: Dict = {}
+        self.first_tes_update: Optional[datetime] = None
+        self.last_tes_update: Optional[datetime] = None
+        self.outputs: Optional[Dict] = None
 
     def process_cwl_logs(
         self,
-        task: celery_app.Task,
         stream: TextIOWrapper,
         token: Optional[str] = None,
     ) -> Tuple[List, List]:
         """Parse cwl-tes logs.
 
         Args:
-            task: Celery task instance.
             stream: Combined STDOUT/STDERR stream.
             token: OAuth2 token.
 
         Returns:
             Tuple of lists containing the following:
-                - List of log lines.
+                - List of most recent log lines.
                 - List of TES task IDs.
         """
-        stream_container: List = []
-        tes_states: Dict = {}
-
         # Iterate over STDOUT/STDERR stream
         for line in iter(stream.readline, ""):
+            self.process_line(line=line, token=token)
+
+        return (list(self.log_tail), list(self.tes_states.keys()))
+
+    def close(self) -> None:
+        """Close log spool file."""
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+    def get_outputs(self) -> Dict:
+        """Get workflow outputs.
+
+        Outputs reported via structured engine events take precedence.
+        Otherwise, outputs are parsed from the most recent log lines or, if
+        they are not fully contained therein, from the log spool file.
+
+        Returns:
+            Outputs dictionary.
+        """
+        if self.outputs is not None:
+            return self.outputs
+        log = list(self.log_tail)
+        if (
+            self.log_path is not None
+            and len(log) == self.log_tail.maxlen
+            and not any(line.rstrip() == "{" for line in log)
+        ):
+            self.close()
+            return CWLTesProcessor.cwl_tes_outputs_parser_file(
+                path=self.log_path
+            )
+        return CWLTesProcessor.cwl_tes_outputs_parser_list(log=log)
+
+    def _append(self, line: str) -> None:
+        """Add processed line to log.
+
+        Args:
+            line: Log line.
+        """
+        self.log_tail.append(line)
+        if self._log_file is not None:
+            self._log_file.write(line + "\n")
 
-            line = line.rstrip()
-
-            # Replace single quote characters to avoid `literal_eval()` errors
-            line = line.replace("'", '"')
-
-            # Handle special cases
-            lines = self.process_tes_log(line)
-            for processed_line in lines:
-                stream_container.append(processed_line)
-                logger.info(f"[{task}] {processed_line}")
-                continue
-
-            # Detect TES task state changes
-            (tes_id, tes_state) = self.extract_tes_state(line)
-            if tes_id:
-
-                # Handle new task
-                if tes_id not in tes_states:
-                    tes_states[tes_id] = tes_state
-                    self.capture_tes_task_update(
-                        task,
-                        tes_id=tes_id,
-                        token=token,
-                    )
-                # Handle state change
-                elif tes_states[tes_id] != tes_state:
-                    tes_states[tes_id] = tes_state
-                    self.capture_tes_task_update(
-                        task,
-                        tes_id=tes_id,
-                        tes_state=tes_state,
-                    )
-                logger.info(line)
-                continue
-
-            stream_container.append(line)
+    def process_line(self, line: str, token: Optional[str] = None) -> None:
+        """Parse single cwl-tes log line.
+
+        Args:
+            line: Log line.
+            token: OAuth2 token.
+        """
+        metrics.LOG_LINES.inc()
+        line = line.rstrip()
+        if self.cache_dir is not None:
+            self.touch_cached_step(line)
+
+        # Keep log as is if events are obtained from structured events
+        if self.structured:
+            self._append(line)
+            logger.info(line)
+            return
+
+        # Replace single quote characters to avoid `literal_eval()` errors
+        line = line.replace("'", '"')
+
+        # Handle special cases
+        lines = self.process_tes_log(line)
+        for processed_line in lines:
+            self._append(processed_line)
+            logger.info(f"[{self.task_id}] {processed_line}")
+
+        # Detect TES task state changes
+        (tes_id, tes_state) = self.extract_tes_state(line)
+        if tes_id:
+            self.process_tes_task_event(
+                tes_id=tes_id,
+                tes_state=tes_state,
+                token=token,
+            )
             logger.info(line)
+            return
+
+        self._append(line)
+        logger.info(line)
+
+    def touch_cached_step(self, line: str) -> None:
+        """Mark step cache entry reused by the workflow engine as recent.
 
-        return (stream_container, list(tes_states.keys()))
+        Args:
+            line: Log line.
+        """
+        re_cached_output = re.compile(r"Using cached output in (\S+)")
+        match = re_cached_output.search(line)
+        if not match:
+            return
+        path = os.path.realpath(match.group(1))
+        if os.path.dirname(path) != os.path.realpath(str(self.cache_dir)):
+            return
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def process_engine_event(
+        self,
+        event: Dict,
+        token: Optional[str] = None,
+    ) -> None:
+        """Process structured event emitted by the workflow engine.
+
+        Args:
+            event: Engine event.
+            token: OAuth2 token.
+        """
+        metrics.ENGINE_EVENTS.inc()
+        kind = event.get("event")
+        if kind == "task_created":
+            self.process_tes_task_event(tes_id=event["tes_id"], token=token)
+        elif kind == "task_state":
+            self.process_tes_task_event(
+                tes_id=event["tes_id"],
+                tes_state=event["state"],
+                token=token,
+            )
+        elif kind == "outputs":
+            self.outputs = event["outputs"]
+        else:
+            logger.debug(f"Ignoring unknown engine event: {event}")
+
+    def process_tes_task_event(
+        self,
+        tes_id: str,
+        tes_state: Optional[str] = None,
+        token: Optional[str] = None,
+    ) -> None:
+        """Handle creation or state change of TES task.
+
+        Args:
+            tes_id: TES task ID.
+            tes_state: TES task state; `None` for newly created tasks.
+            token: OAuth2 token.
+        """
+        # Hand new tasks over to monitor, if available
+        if self.monitor is not None:
+            if tes_id not in self.tes_states:
+                self._record_tes_update()
+                self.tes_states[tes_id] = tes_state
+                self.monitor.add_task(tes_id=tes_id)
+
+        # Handle new task
+        elif tes_id not in self.tes_states:
+            self._record_tes_update()
+            self.tes_states[tes_id] = tes_state
+            self.capture_tes_task_update(
+                tes_id=tes_id,
+                token=token,
+            )
+        # Handle state change
+        elif self.tes_states[tes_id] != tes_state and tes_state is not None:
+            self._record_tes_update()
+            self.tes_states[tes_id] = tes_state
+            self.capture_tes_task_update(
+                tes_id=tes_id,
+                tes_state=tes_state,
+            )
+
+    def _record_tes_update(self) -> None:
+        """Record time of TES task creation or state change."""
+        self.last_tes_update = datetime.utcnow()
+        if self.first_tes_update is None:
+            self.first_tes_update = self.last_tes_update
 
     def process_tes_log(self, line: str) -> List[str]:
         """Handle irregularities arising from log parsing.
@@ -153,7 +350,6 @@ class CWLLogProcessor:
 
     def capture_tes_task_update(
         self,
-        task: celery_app.Task,
         tes_id: str,
         tes_state: Optional[str] = None,
         token: Optional[str] = None,
@@ -161,7 +357,6 @@ class CWLLogProcessor:
         """Handle TES task state change events.
 
         Args:
-            task: Celery task instance.
             tes_id: TES task ID.
             tes_state: TES task state.
             token: OAuth2 token.
@@ -178,13 +373,15 @@ class CWLLogProcessor:
             try:
                 db_utils.append_to_tes_task_logs(
                     collection=self.collection,
-                    task_id=task.task_id,
+                    run_id=self.run_id,
+                    task_id=self.task_id,
+                    tes_id=tes_id,
                     tes_log=tes_log,
                 )
             except PyMongoError as exc:
                 logger.exception(
                     "Database error. Could not update log information for"
-                    f" task '{task.task_id}'. Original error message:"
+                    f" task '{self.task_id}'. Original error message:"
                     f" {type(exc).__name__}: {exc}"
                 )
 
@@ -193,18 +390,19 @@ class CWLLogProcessor:
             try:
                 db_utils.update_tes_task_state(
                     collection=self.collection,
-                    task_id=task.task_id,
+                    run_id=self.run_id,
+                    task_id=self.task_id,
                     tes_id=tes_id,
                     state=tes_state,
                 )
                 logger.info(
                     f"State of TES task '{tes_id}' of run with task ID "
-                    f"'{task.task_id}' changed to '{tes_state}'."
+                    f"'{self.task_id}' changed to '{tes_state}'."
                 )
             except PyMongoError as exc:
                 logger.exception(
                     "Database error. Could not update log information for"
-                    f" task '{task.task_id}'. Original error message:"
+                    f" task '{self.task_id}'. Original error message:"
                     f" {type(exc).__name__}: {exc}"
                 )
 
@@ -295,6 +493,47 @@ class CWLTesProcessor:
             )
             return {}
 
+    @staticmethod
+    def cwl_tes_outputs_parser_file(path: str) -> Dict:
+        """Parse outputs from cwl-tes log file.
+
+        The file is scanned once for the last top-level JSON object, so that
+        only the outputs themselves are read into memory.
+
+        Args:
+            path: Path to cwl-tes log file.
+
+        Returns:
+            Outputs dictionary.
+        """
+        start = -1
+        end = -1
+        offset = 0
+        with open(path, mode="rb") as _file:
+            for line in _file:
+                stripped = line.rstrip()
+                if stripped == b"{}":
+                    start = end = -1
+                elif stripped == b"{":
+                    start = offset
+                    end = -1
+                elif stripped == b"}" and start != -1:
+                    end = offset + len(line)
+                offset += len(line)
+            if start == -1 or end == -1:
+                return {}
+            _file.seek(start)
+            json = _file.read(end - start).decode("utf-8", errors="replace")
+
+        try:
+            return literal_eval(json)
+        except (SyntaxError, ValueError) as exc:
+            logger.exception(
+                f"{type(exc).__name__} when evaluating JSON from log file"
+                f" '{path}'. Original error message: {exc}"
+            )
+            return {}
+
     def get_tes_task_logs(
         self,
         tes_ids: List,
@@ -342,7 +581,9 @@ class CWLTesProcessor:
         task_log = {}
 
         try:
-            task_log = tes_client.get_task(
+            task_log = outbound.call(
+                self.tes_config["url"],
+                tes_client.get_task,
                 task_id=tes_id,
                 view=self.tes_config["query_params"],
             ).as_dict()
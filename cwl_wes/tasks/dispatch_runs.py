@@ -0,0 +1,287 @@
+"""Celery background task to release held workflow runs by fair share."""
+
+from collections import defaultdict
+from datetime import datetime
+import heapq
+import logging
+from typing import Any, Dict, List
+
+from pymongo import UpdateOne
+from pymongo import collection as Collection
+from pymongo.errors import PyMongoError
+
+from cwl_wes.custom_config import DispatcherConfig
+from cwl_wes.ga4gh.wes.states import States
+import cwl_wes.utils.db as db_utils
+from cwl_wes.utils.run_events import record_run_event
+from cwl_wes.utils.tes_routing import route_command
+from cwl_wes.worker import celery_app
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+# Name of the lock serializing dispatch passes
+DISPATCH_LOCK = "dispatch_runs"
+
+
+@celery_app.task(
+    name="tasks.dispatch_runs",
+    ignore_result=True,
+)
+def task__dispatch_runs() -> None:
+    """Release held workflow runs to the task queue as capacity allows.
+
+    Only one dispatch pass is executed at a time; passes triggered while
+    another one is in progress are skipped.
+    """
+    foca_config = celery_app.conf.foca
+    dispatcher_config = foca_config.custom.controller.dispatcher
+    collections = foca_config.db.dbs["cwl-wes-db"].collections
+    locks = collections["locks"].client
+    owner = db_utils.acquire_lock(
+        collection=locks,
+        name=DISPATCH_LOCK,
+        ttl=max(dispatcher_config.interval, 60),
+    )
+    if owner is None:
+        return
+    try:
+        dispatch_runs(
+            collection=collections["runs"].client,
+            collection_events=collections["run_events"].client,
+            config=dispatcher_config,
+        )
+    except PyMongoError as exc:
+        logger.exception(
+            "Database error. Could not dispatch held runs. Original error"
+            f" message: {type(exc).__name__}: {exc}"
+        )
+    finally:
+        db_utils.release_lock(
+            collection=locks, name=DISPATCH_LOCK, owner=owner
+        )
+
+
+def dispatch_runs(
+    collection: Collection,
+    collection_events: Collection,
+    config: DispatcherConfig,
+) -> None:
+    """Release held runs and update queue positions of remaining runs.
+
+    Args:
+        collection: MongoDB collection of runs.
+        collection_events: MongoDB collection of run events.
+        config: Dispatcher configuration.
+    """
+    running: Dict[Any, int] = defaultdict(int)
+    for group in collection.aggregate(
+        [
+            {
+                "$match": {
+                    "internal.dispatch.state": "released",
+                    "api.state": {"$in": States.UNFINISHED},
+                }
+            },
+            {"$group": {"_id": "$user_id", "count": {"$sum": 1}}},
+        ]
+    ):
+        running[group["_id"]] = group["count"]
+    held = list(
+        collection.find(
+            {"internal.dispatch.state": "held", "api.state": "QUEUED"},
+            projection={
+                "task_id": True,
+                "user_id": True,
+                "internal.dispatch.priority_class": True,
+                "internal.dispatch.queued": True,
+                "api.run_log.queue_position": True,
+                "_id": False,
+            },
+        )
+    )
+
+    capacity = config.max_running_runs - sum(running.values())
+    waiting = []
+    for document in fair_share_order(
+        runs=held,
+        running=running,
+        weights=config.priority_classes,
+    ):
+        if (
+            capacity > 0
+            and running[document["user_id"]] < config.max_running_runs_per_user
+            and release_run(
+                collection=collection,
+                collection_events=collection_events,
+                task_id=document["task_id"],
+            )
+        ):
+            running[document["user_id"]] += 1
+            capacity -= 1
+        else:
+            waiting.append(document)
+
+    updates = [
+        UpdateOne(
+            {"task_id": document["task_id"]},
+            {"$set": {"api.run_log.queue_position": position}},
+        )
+        for position, document in enumerate(waiting, start=1)
+        if document.get("api", {}).get("run_log", {}).get("queue_position")
+        != position
+    ]
+    if updates:
+        collection.bulk_write(updates, ordered=False)
+    logger.info(
+        f"Dispatched {len(held) - len(waiting)} held runs;"
+        f" {len(waiting)} runs remain queued."
+    )
+
+
+def fair_share_order(
+    runs: List[Dict],
+    running: Dict[Any, int],
+    weights: Dict[str, float],
+) -> List[Dict]:
+    """Order held runs by weighted per-user fair share.
+
+    The next run is always taken from the user with the lowest number of
+    running runs relative to the weight of the priority class of that user's
+    next run. Per user, runs are taken by priority class, then in order of
+    submission.
+
+    Args:
+        runs: Held run documents.
+        running: Number of running runs, by user identifier.
+        weights: Fair-share weights, by priority class name.
+
+    Returns:
+        Held run documents in dispatch order.
+    """
+
+    def _weight(document: Dict) -> float:
+        return weights.get(
+            document["internal"]["dispatch"]["priority_class"], 1
+        )
+
+    def _queued(document: Dict) -> datetime:
+        return document["internal"]["dispatch"]["queued"]
+
+    per_user: Dict[Any, List[Dict]] = defaultdict(list)
+    for document in runs:
+        per_user[document["user_id"]].append(document)
+    counts = dict(running)
+    heap = []
+    for index, (user_id, user_runs) in enumerate(per_user.items()):
+        # Next run of user is last element
+        user_runs.sort(
+            key=lambda doc: (_weight(doc), -_queued(doc).timestamp())
+        )
+        counts.setdefault(user_id, 0)
+        heap.append(
+            (
+                counts[user_id] / _weight(user_runs[-1]),
+                _queued(user_runs[-1]),
+                index,
+                user_id,
+            )
+        )
+    heapq.heapify(heap)
+
+    order = []
+    while heap:
+        _, _, index, user_id = heapq.heappop(heap)
+        user_runs = per_user[user_id]
+        order.append(user_runs.pop())
+        counts[user_id] += 1
+        if user_runs:
+            heapq.heappush(
+                heap,
+                (
+                    counts[user_id] / _weight(user_runs[-1]),
+                    _queued(user_runs[-1]),
+                    index,
+                    user_id,
+                ),
+            )
+    return order
+
+
+def release_run(
+    collection: Collection,
+    collection_events: Collection,
+    task_id: str,
+) -> bool:
+    """Send held workflow run to the task queue.
+
+    Runs submitting to TES are routed to a backend at this point, so that
+    the backend load at release is taken into account.
+
+    Args:
+        collection: MongoDB collection of runs.
+        collection_events: MongoDB collection of run events.
+        task_id: Task identifier of workflow run.
+
+    Returns:
+        `True` if the run was released, `False` if it was not held (anymore).
+    """
+    query = {
+        "task_id": task_id,
+        "internal.dispatch.state": "held",
+        "api.state": "QUEUED",
+    }
+    document = collection.find_one(
+        query,
+        projection={
+            "run_id": True,
+            "internal.dispatch": True,
+            "internal.command_list": True,
+            "_id": False,
+        },
+    )
+    if document is None:
+        return False
+    dispatch = document["internal"]["dispatch"]
+    update = {
+        "internal.dispatch.state": "released",
+        "internal.dispatch.released": datetime.utcnow(),
+    }
+    command_list = dispatch["kwargs"]["command_list"]
+    tes_url = route_command(
+        config=celery_app.conf.foca,
+        command_list=command_list,
+    )
+    if tes_url is not None:
+        update["internal.tes_url"] = tes_url
+        update["internal.dispatch.kwargs.command_list"] = command_list
+        if "command_list" in document["internal"]:
+            update["internal.command_list"] = command_list
+    result = collection.update_one(
+        query,
+        {
+            "$set": update,
+            "$unset": {
+                "api.run_log.queue_position": "",
+                "internal.dispatch.kwargs.token": "",
+            },
+        },
+    )
+    if result.modified_count == 0:
+        return False
+    celery_app.send_task(
+        "tasks.run_workflow",
+        kwargs=dispatch["kwargs"],
+        task_id=task_id,
+        soft_time_limit=dispatch["soft_time_limit"],
+        queue=dispatch.get("queue"),
+        headers=dispatch.get("trace_context"),
+    )
+    record_run_event(
+        collection=collection_events,
+        run_id=document["run_id"],
+        task_id=task_id,
+        event="enqueued",
+    )
+    logger.info(f"Released held run with task ID '{task_id}'.")
+    return True
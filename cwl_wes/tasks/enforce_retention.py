@@ -0,0 +1,238 @@
+"""Celery background task to enforce retention of run directories."""
+
+from datetime import datetime, timedelta
+import logging
+from typing import Dict, Optional, Sequence
+
+from bson.objectid import ObjectId
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from cwl_wes.ga4gh.wes.states import States
+import cwl_wes.utils.db as db_utils
+from cwl_wes.utils.run_storage import RUN_DIRS, purge_run, record_disk_usage
+from cwl_wes.worker import celery_app
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+# Name of the lock serializing retention passes
+RETENTION_LOCK = "enforce_retention"
+
+# Projection of run documents required for measuring and purging
+RUN_PROJECTION = {
+    "run_id": True,
+    "api.state": True,
+    **{f"internal.{field}": True for field in RUN_DIRS},
+    "_id": False,
+}
+
+
+@celery_app.task(
+    name="tasks.enforce_retention",
+    ignore_result=True,
+)
+def task__enforce_retention() -> None:
+    """Record disk usage of run directories and delete expired ones.
+
+    Active and archived runs are considered. Only one retention pass is
+    executed at a time; passes triggered while another one is in progress
+    are skipped.
+    """
+    foca_config = celery_app.conf.foca
+    retention_config = foca_config.custom.storage.retention
+    collections = foca_config.db.dbs["cwl-wes-db"].collections
+    locks = collections["locks"].client
+    owner = db_utils.acquire_lock(
+        collection=locks,
+        name=RETENTION_LOCK,
+        ttl=retention_config.interval,
+    )
+    if owner is None:
+        return
+    # Archived runs are older, so they are considered first for the quota
+    run_collections = [
+        collections[name].client for name in ["runs_archive", "runs"]
+    ]
+    try:
+        total_size = 0
+        for collection in run_collections:
+            total_size += update_disk_usage(collection=collection)
+            total_size -= purge_expired_runs(
+                collection=collection,
+                ttls=retention_config.ttls,
+                run_collections=run_collections,
+            )
+        max_size = retention_config.max_size
+        if max_size is not None:
+            for collection in run_collections:
+                total_size = enforce_quota(
+                    collection=collection,
+                    total_size=total_size,
+                    max_size=max_size,
+                    run_collections=run_collections,
+                )
+            if total_size > max_size:
+                logger.warning(
+                    f"Run directories hold {total_size} bytes, exceeding the"
+                    f" quota of {max_size} bytes, but all remaining"
+                    " directories belong to unfinished runs."
+                )
+        logger.info(
+            f"Retention pass finished; run directories hold {total_size}"
+            " bytes."
+        )
+    except PyMongoError as exc:
+        logger.exception(
+            "Database error. Could not enforce retention of run directories."
+            f" Original error message: {type(exc).__name__}: {exc}"
+        )
+    finally:
+        db_utils.release_lock(
+            collection=locks, name=RETENTION_LOCK, owner=owner
+        )
+
+
+def update_disk_usage(collection: Collection) -> int:
+    """Measure disk usage of run directories that may have changed.
+
+    Directories of unfinished runs are measured in every pass, those of
+    finished runs once after the run has finished.
+
+    Args:
+        collection: MongoDB collection of runs.
+
+    Returns:
+        Total size in bytes of the directories of all runs in the
+        collection that were not purged.
+    """
+    for document in collection.find(
+        {
+            "internal.purged": {"$exists": False},
+            "internal.disk_usage.final": {"$ne": True},
+        },
+        projection=RUN_PROJECTION,
+    ):
+        record_disk_usage(collection=collection, document=document)
+    usage = list(
+        collection.aggregate(
+            [
+                {"$match": {"internal.purged": {"$exists": False}}},
+                {
+                    "$group": {
+                        "_id": None,
+                        "total": {"$sum": "$internal.disk_usage.total"},
+                    }
+                },
+            ]
+        )
+    )
+    return usage[0]["total"] if usage else 0
+
+
+def purge_expired_runs(
+    collection: Collection,
+    ttls: Dict[str, int],
+    run_collections: Sequence[Collection],
+) -> int:
+    """Delete directories of runs that finished longer ago than their TTL.
+
+    Runs without finishing time are considered finished at submission.
+
+    Args:
+        collection: MongoDB collection of runs.
+        ttls: Time to live in seconds of run directories, by run state.
+        run_collections: MongoDB collections of active and archived runs.
+
+    Returns:
+        Number of bytes freed.
+    """
+    freed = 0
+    for state, ttl in ttls.items():
+        if state not in States.FINISHED:
+            logger.warning(
+                f"Ignoring retention TTL for state '{state}'; directories of"
+                " unfinished runs are never deleted."
+            )
+            continue
+        cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+        for document in collection.find(
+            {
+                "api.state": state,
+                "internal.purged": {"$exists": False},
+                "$or": [
+                    {"internal.task_finished": {"$lt": cutoff}},
+                    {
+                        "internal.task_finished": {"$exists": False},
+                        "_id": {"$lt": ObjectId.from_datetime(cutoff)},
+                    },
+                ],
+            },
+            projection={"run_id": True, "_id": False},
+        ):
+            freed += _purge(
+                collection=collection,
+                run_id=document["run_id"],
+                run_collections=run_collections,
+            )
+    return freed
+
+
+def enforce_quota(
+    collection: Collection,
+    total_size: int,
+    max_size: int,
+    run_collections: Sequence[Collection],
+) -> int:
+    """Delete directories of oldest finished runs until quota is met.
+
+    Args:
+        collection: MongoDB collection of runs.
+        total_size: Total size in bytes of the directories of all runs.
+        max_size: Maximum total size in bytes.
+        run_collections: MongoDB collections of active and archived runs.
+
+    Returns:
+        Total size in bytes of the remaining run directories.
+    """
+    if total_size <= max_size:
+        return total_size
+    for document in collection.find(
+        {
+            "api.state": {"$in": States.FINISHED},
+            "internal.purged": {"$exists": False},
+        },
+        projection={"run_id": True, "_id": False},
+        sort=[("_id", 1)],
+    ):
+        total_size -= _purge(
+            collection=collection,
+            run_id=document["run_id"],
+            run_collections=run_collections,
+        )
+        if total_size <= max_size:
+            break
+    return total_size
+
+
+def _purge(
+    collection: Collection,
+    run_id: str,
+    run_collections: Sequence[Collection],
+) -> int:
+    """Delete directories of finished run.
+
+    Args:
+        collection: MongoDB collection of runs.
+        run_id: Workflow run identifier.
+        run_collections: MongoDB collections of active and archived runs.
+
+    Returns:
+        Number of bytes freed.
+    """
+    freed: Optional[int] = purge_run(
+        collection=collection,
+        run_id=run_id,
+        run_collections=run_collections,
+    )
+    return freed or 0
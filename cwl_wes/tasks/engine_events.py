@@ -0,0 +1,253 @@
+"""Structured events emitted from within the workflow engine process.
+
+This module is imported by the workflow engine process, so it must not
+depend on the service configuration or the Celery app.
+"""
+
+from contextlib import redirect_stdout
+from functools import wraps
+from importlib import import_module
+import io
+import json
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import tes
+
+# Module providing the workflow engine entry point
+ENGINE_MODULE = "cwl_tes.main"
+
+# TES task states after which recorded tasks are not adopted
+UNADOPTABLE_STATES = [
+    "EXECUTOR_ERROR",
+    "SYSTEM_ERROR",
+    "CANCELED",
+    "PREEMPTED",
+]
+
+# Fields of TES task executors, inputs and outputs that equivalent tasks
+# share
+KEY_EXECUTOR_FIELDS = ["image", "command", "workdir", "env"]
+KEY_INPUT_FIELDS = ["url", "path", "type", "content"]
+KEY_OUTPUT_FIELDS = ["url", "path", "type"]
+
+# Emitter of the run currently executed in this process
+_EMITTER: Optional["EngineEventEmitter"] = None
+_HOOKS_INSTALLED = False
+
+# Identifiers of recorded TES tasks that the current run may adopt, by key
+_ADOPTABLE: Dict[str, List[str]] = {}
+
+
+class EngineEventEmitter:
+    """Emit TES task and output events of a workflow engine run.
+
+    Args:
+        write: Callable that delivers a single event.
+
+    Attributes:
+        write: Callable that delivers a single event.
+    """
+
+    def __init__(self, write: Callable[[Dict], None]) -> None:
+        """Construct class instance."""
+        self.write = write
+        self._states: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, **fields) -> None:
+        """Emit event.
+
+        Args:
+            event: Event type.
+            **fields: Event fields.
+        """
+        with self._lock:
+            self.write({"event": event, "time": time.time(), **fields})
+
+    def task_created(self, tes_id: str) -> None:
+        """Emit event for newly created TES task.
+
+        Args:
+            tes_id: TES task identifier.
+        """
+        self._states[tes_id] = None
+        self.emit("task_created", tes_id=tes_id)
+
+    def task_state(self, tes_id: str, state: Optional[str]) -> None:
+        """Emit event for TES task state, if changed.
+
+        Args:
+            tes_id: TES task identifier.
+            state: TES task state.
+        """
+        if state is None or self._states.get(tes_id) == state:
+            return
+        self._states[tes_id] = state
+        self.emit("task_state", tes_id=tes_id, state=state)
+
+    def outputs(self, outputs: Dict) -> None:
+        """Emit event for final workflow outputs.
+
+        Args:
+            outputs: Workflow outputs.
+        """
+        self.emit("outputs", outputs=outputs)
+
+
+def install_tes_hooks() -> None:
+    """Report TES task creation and state changes of the TES client.
+
+    Events are sent to the emitter of the current run. Hooks are installed
+    only once per process.
+    """
+    global _HOOKS_INSTALLED  # pylint: disable=global-statement
+    if _HOOKS_INSTALLED:
+        return
+    create_task = tes.HTTPClient.create_task
+    get_task = tes.HTTPClient.get_task
+
+    @wraps(create_task)
+    def _create_task(self, task, *args, **kwargs):
+        tes_id = _adopt_task(task=task)
+        if tes_id is None:
+            tes_id = create_task(self, task, *args, **kwargs)
+        if _EMITTER is not None:
+            _EMITTER.task_created(tes_id=tes_id)
+        return tes_id
+
+    @wraps(get_task)
+    def _get_task(self, *args, **kwargs):
+        task = get_task(self, *args, **kwargs)
+        if _EMITTER is not None and task is not None and task.id:
+            _EMITTER.task_state(tes_id=task.id, state=task.state)
+        return task
+
+    tes.HTTPClient.create_task = _create_task
+    tes.HTTPClient.get_task = _get_task
+    _HOOKS_INSTALLED = True
+
+
+def task_key(task: Dict) -> str:
+    """Get key identifying equivalent TES tasks.
+
+    Inputs and outputs are part of the key, so that tasks are only adopted
+    if they read from and write to the same locations.
+
+    Args:
+        task: TES task, e.g., as returned by the `FULL` view.
+
+    Returns:
+        Key derived from task name, executors, inputs and outputs.
+    """
+    executors = [
+        {field: executor.get(field) or None for field in KEY_EXECUTOR_FIELDS}
+        for executor in task.get("executors") or []
+    ]
+    inputs = sorted(
+        (
+            {field: item.get(field) or None for field in KEY_INPUT_FIELDS}
+            for item in task.get("inputs") or []
+        ),
+        key=lambda item: json.dumps(item, sort_keys=True),
+    )
+    outputs = sorted(
+        (
+            {field: item.get(field) or None for field in KEY_OUTPUT_FIELDS}
+            for item in task.get("outputs") or []
+        ),
+        key=lambda item: json.dumps(item, sort_keys=True),
+    )
+    return json.dumps(
+        {
+            "name": task.get("name"),
+            "executors": executors,
+            "inputs": inputs,
+            "outputs": outputs,
+        },
+        sort_keys=True,
+    )
+
+
+def _adopt_task(task: tes.Task) -> Optional[str]:
+    """Get identifier of recorded TES task equivalent to new task.
+
+    Args:
+        task: TES task to be created.
+
+    Returns:
+        Identifier of recorded task, or `None` if there is none to adopt.
+    """
+    tes_ids = _ADOPTABLE.get(task_key(task.as_dict()))
+    if not tes_ids:
+        return None
+    return tes_ids.pop(0)
+
+
+def run_engine(
+    args: List[str],
+    emitter: EngineEventEmitter,
+    adoptable_tasks: Optional[List[Dict]] = None,
+) -> int:
+    """Run workflow engine and emit its final outputs.
+
+    The engine writes the final outputs JSON (and nothing else) to STDOUT.
+    STDOUT is captured to emit the outputs and then passed through.
+
+    If TES tasks recorded for an earlier, interrupted attempt of the run are
+    passed, tasks the engine creates are mapped onto equivalent recorded
+    tasks that are still running or have completed, instead of being
+    submitted again.
+
+    Args:
+        args: Command line arguments to the workflow engine.
+        emitter: Event emitter.
+        adoptable_tasks: Recorded TES tasks (`FULL` view) that may be
+            adopted.
+
+    Returns:
+        Return code of the workflow engine.
+    """
+    global _EMITTER  # pylint: disable=global-statement
+    install_tes_hooks()
+    _ADOPTABLE.clear()
+    for task in adoptable_tasks or []:
+        if task.get("id") and task.get("state") not in UNADOPTABLE_STATES:
+            _ADOPTABLE.setdefault(task_key(task), []).append(task["id"])
+    _EMITTER = emitter
+    stdout = io.StringIO()
+    try:
+        with redirect_stdout(stdout):
+            returncode = import_module(ENGINE_MODULE).main(args)
+    except SystemExit as exc:
+        returncode = exit_code(exc)
+    finally:
+        _EMITTER = None
+        _ADOPTABLE.clear()
+        sys.stdout.write(stdout.getvalue())
+        sys.stdout.flush()
+    try:
+        outputs = json.loads(stdout.getvalue())
+    except ValueError:
+        outputs = None
+    if isinstance(outputs, dict):
+        emitter.outputs(outputs=outputs)
+    return returncode or 0
+
+
+def exit_code(exc: SystemExit) -> int:
+    """Get process return code from `SystemExit` exception.
+
+    Args:
+        exc: Raised exception.
+
+    Returns:
+        Return code.
+    """
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    return 1
@@ -0,0 +1,70 @@
+"""Workflow engine launcher emitting structured events.
+
+Runs the workflow engine in the current process and writes TES task and
+output events as JSON lines to a dedicated file descriptor, e.g.:
+
+    python -m cwl_wes.tasks.engine_launcher --event-fd 3 -- [ENGINE ARGS]
+
+TES tasks recorded for an interrupted attempt of the run can be passed as a
+JSON file via `--adopt-tasks`, so that they are re-attached to rather than
+submitted again.
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import List, Optional
+
+from cwl_wes.tasks.engine_events import EngineEventEmitter, run_engine
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    """Run workflow engine and emit events.
+
+    Args:
+        args: Command line arguments; defaults to `sys.argv[1:]`.
+
+    Returns:
+        Return code of the workflow engine.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--event-fd",
+        type=int,
+        required=True,
+        help="file descriptor to write JSON line events to",
+    )
+    parser.add_argument(
+        "--adopt-tasks",
+        default=None,
+        help="JSON file with recorded TES tasks that may be adopted",
+    )
+    parser.add_argument(
+        "engine_args",
+        nargs=argparse.REMAINDER,
+        help="arguments passed on to the workflow engine",
+    )
+    parsed = parser.parse_args(args)
+    engine_args = parsed.engine_args
+    if engine_args and engine_args[0] == "--":
+        engine_args = engine_args[1:]
+    adoptable_tasks = None
+    if parsed.adopt_tasks is not None:
+        with open(parsed.adopt_tasks, encoding="utf-8") as _file:
+            adoptable_tasks = json.load(_file)
+
+    with os.fdopen(parsed.event_fd, "w", buffering=1) as events:
+
+        def _write(event):
+            events.write(json.dumps(event, default=str) + "\n")
+
+        return run_engine(
+            args=engine_args,
+            emitter=EngineEventEmitter(write=_write),
+            adoptable_tasks=adoptable_tasks,
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
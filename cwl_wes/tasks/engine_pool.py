@@ -0,0 +1,357 @@
+"""Pool of pre-initialized workflow engine processes executed on worker."""
+
+from importlib import import_module
+from importlib.util import find_spec
+import logging
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional
+import uuid
+
+import billiard
+
+from cwl_wes.tasks.engine_events import (
+    ENGINE_MODULE,
+    EngineEventEmitter,
+    exit_code,
+    run_engine,
+)
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+# Pool instance of the current worker process
+_POOL: Optional["EnginePool"] = None
+_POOL_LOCK = threading.Lock()
+
+# Globals of engine pool processes
+_EVENTS = None
+_JOB_ID: Optional[str] = None
+
+
+class EnginePool:  # pylint: disable=too-few-public-methods
+    """Run the workflow engine as a library in pre-forked worker processes.
+
+    The engine is imported once per pool process, so that runs do not pay
+    for interpreter startup and imports. Log output and engine events (cf.
+    `cwl_wes.tasks.engine_events`) are sent back to the calling process via
+    a queue shared by all pool processes and routed to the run they belong
+    to.
+
+    Each pool process is the leader of its own process group, which is
+    reported to the caller when a run starts, so that the run can be
+    canceled by killing the group; the pool replaces killed processes.
+
+    Args:
+        processes: Number of pool processes.
+        max_runs_per_process: Number of runs after which a pool process is
+            replaced by a fresh one.
+
+    Attributes:
+        processes: Number of pool processes.
+        max_runs_per_process: Number of runs after which a pool process is
+            replaced by a fresh one.
+    """
+
+    def __init__(
+        self,
+        processes: int = 4,
+        max_runs_per_process: int = 25,
+    ) -> None:
+        """Construct class instance and start pool processes."""
+        self.processes = processes
+        self.max_runs_per_process = max_runs_per_process
+        context = billiard.get_context("fork")  # pylint: disable=no-member
+        self._events = context.Queue()
+        self._consumers: Dict[str, queue.Queue] = {}
+        self._lock = threading.Lock()
+        self._pool = context.Pool(
+            processes=processes,
+            initializer=_init_process,
+            initargs=(self._events,),
+            maxtasksperchild=max_runs_per_process,
+        )
+        self._router = threading.Thread(
+            target=self._route_events,
+            name="engine-pool-router",
+            daemon=True,
+        )
+        self._router.start()
+
+    def run(  # pylint: disable=too-many-arguments
+        self,
+        args: List[str],
+        cwd: str,
+        on_event: Callable[[Dict], None],
+        env: Optional[Dict[str, str]] = None,
+        on_start: Optional[Callable[[int], None]] = None,
+        timeout: Optional[float] = None,
+    ) -> int:
+        """Run workflow engine in pool and wait for it to finish.
+
+        If waiting is interrupted, e.g., by the soft time limit of the
+        calling task, the process group running the engine is killed.
+
+        Args:
+            args: Command line arguments to the workflow engine.
+            cwd: Working directory of the run.
+            on_event: Callback for log (`type` `log`) and engine (`type`
+                `engine`) events emitted by the engine.
+            env: Environment variables set while the engine runs.
+            on_start: Callback receiving the process group identifier of
+                the pool process once it started running the engine.
+            timeout: Maximum duration of the run in seconds; `None` for no
+                limit.
+
+        Returns:
+            Return code of the workflow engine.
+
+        Raises:
+            subprocess.TimeoutExpired: If the run timed out; the process
+                group running the engine is killed.
+        """
+        job_id = uuid.uuid4().hex
+        events: queue.Queue = queue.Queue()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pgid: Optional[int] = None
+        with self._lock:
+            self._consumers[job_id] = events
+        try:
+            result = self._pool.apply_async(_run_job, (job_id, args, cwd, env))
+            while True:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise subprocess.TimeoutExpired(cmd=args, timeout=timeout)
+                try:
+                    event = events.get(timeout=1)
+                except queue.Empty:
+                    if result.ready() and not result.successful():
+                        logger.error(
+                            f"Engine pool process running job '{job_id}'"
+                            " was lost."
+                        )
+                        return 1
+                    continue
+                if event["type"] == "exit":
+                    pgid = None
+                    return event["returncode"]
+                if event["type"] == "started":
+                    pgid = event["pgid"]
+                    if on_start is not None:
+                        on_start(pgid)
+                    continue
+                on_event(event)
+        except BaseException:
+            if pgid is not None:
+                _kill_process_group(pgid=pgid)
+            raise
+        finally:
+            with self._lock:
+                del self._consumers[job_id]
+
+    def _route_events(self) -> None:
+        """Dispatch events from pool processes to the runs they belong to."""
+        while True:
+            event = self._events.get()
+            with self._lock:
+                consumer = self._consumers.get(event["job_id"])
+            if consumer is not None:
+                consumer.put(event)
+
+
+class _EventWriter:
+    """File-like object that sends each written line as a log event.
+
+    Args:
+        stream: Name of the replaced stream.
+
+    Attributes:
+        stream: Name of the replaced stream.
+    """
+
+    def __init__(self, stream: str) -> None:
+        """Construct class instance."""
+        self.stream = stream
+        self._buffer = ""
+
+    def write(self, text: str) -> int:
+        """Buffer text and send complete lines.
+
+        Args:
+            text: Text to write.
+
+        Returns:
+            Number of characters written.
+        """
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            _emit(type="log", stream=self.stream, line=line)
+        return len(text)
+
+    def flush(self) -> None:
+        """Send incomplete line, if any."""
+        if self._buffer:
+            _emit(type="log", stream=self.stream, line=self._buffer)
+            self._buffer = ""
+
+    def isatty(self) -> bool:
+        """Report that stream is not interactive."""
+        return False
+
+
+class _EventLogHandler(logging.Handler):
+    """Logging handler that sends log records as structured log events."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Send log record.
+
+        Args:
+            record: Log record.
+        """
+        try:
+            _emit(
+                type="log",
+                stream="log",
+                level=record.levelname,
+                logger=record.name,
+                message=record.getMessage(),
+                line=self.format(record),
+            )
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+
+def _emit(**event) -> None:
+    """Send event of current job to calling process.
+
+    Args:
+        **event: Event fields.
+    """
+    if _EVENTS is not None and _JOB_ID is not None:
+        _EVENTS.put({"job_id": _JOB_ID, **event})
+
+
+def _kill_process_group(pgid: int) -> None:
+    """Kill pool process running the workflow engine and its children.
+
+    Args:
+        pgid: Process group identifier of pool process.
+    """
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except ProcessLookupError:
+        return
+    logger.info(f"Engine pool process group {pgid} killed.")
+
+
+def _init_process(events) -> None:
+    """Initialize pool process and import workflow engine.
+
+    Args:
+        events: Queue for sending events to the calling process.
+    """
+    global _EVENTS  # pylint: disable=global-statement
+    _EVENTS = events
+    sys.stdout = _EventWriter(stream="stdout")
+    sys.stderr = _EventWriter(stream="stderr")
+    import_module(ENGINE_MODULE)
+
+    # Replace stream handlers set up by the engine by structured handlers
+    for _logger in [logging.getLogger()] + [
+        logging.getLogger(name) for name in logging.Logger.manager.loggerDict
+    ]:
+        for handler in list(getattr(_logger, "handlers", [])):
+            if isinstance(handler, logging.StreamHandler):
+                event_handler = _EventLogHandler(level=handler.level)
+                event_handler.setFormatter(handler.formatter)
+                _logger.removeHandler(handler)
+                _logger.addHandler(event_handler)
+
+
+def _run_job(
+    job_id: str,
+    args: List[str],
+    cwd: str,
+    env: Optional[Dict[str, str]] = None,
+) -> None:
+    """Run workflow engine in pool process.
+
+    The pool process becomes the leader of a new session and process group,
+    which is reported to the calling process with a `started` event.
+
+    Args:
+        job_id: Identifier used to route events of the job.
+        args: Command line arguments to the workflow engine.
+        cwd: Working directory of the run.
+        env: Environment variables set while the engine runs.
+    """
+    global _JOB_ID  # pylint: disable=global-statement
+    _JOB_ID = job_id
+    if os.getsid(0) != os.getpid():
+        os.setsid()
+    _emit(type="started", pgid=os.getpgid(0))
+    previous_cwd = os.getcwd()
+    previous_env = {key: os.environ.get(key) for key in env or {}}
+    returncode = 1
+    try:
+        os.chdir(cwd)
+        os.environ.update(env or {})
+        returncode = run_engine(
+            args=args,
+            emitter=EngineEventEmitter(
+                write=lambda event: _emit(type="engine", event=event),
+            ),
+        )
+    except SystemExit as exc:
+        returncode = exit_code(exc)
+    except Exception:  # pylint: disable=broad-except
+        for line in traceback.format_exc().splitlines():
+            _emit(type="log", stream="stderr", line=line)
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.chdir(previous_cwd)
+        for key, value in previous_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        _emit(type="exit", returncode=returncode)
+        _JOB_ID = None
+
+
+def get_engine_pool(
+    processes: int = 4,
+    max_runs_per_process: int = 25,
+) -> Optional[EnginePool]:
+    """Get engine pool of current worker process; create if necessary.
+
+    Args:
+        processes: Number of pool processes.
+        max_runs_per_process: Number of runs after which a pool process is
+            replaced by a fresh one.
+
+    Returns:
+        Engine pool instance, or `None` if the workflow engine cannot be
+        imported.
+    """
+    global _POOL  # pylint: disable=global-statement
+    with _POOL_LOCK:
+        if _POOL is None:
+            if find_spec(ENGINE_MODULE.split(".", maxsplit=1)[0]) is None:
+                logger.warning(
+                    f"Module '{ENGINE_MODULE}' not available. Engine pool"
+                    " disabled; starting workflow engine as subprocess."
+                )
+                return None
+            _POOL = EnginePool(
+                processes=processes,
+                max_runs_per_process=max_runs_per_process,
+            )
+        return _POOL
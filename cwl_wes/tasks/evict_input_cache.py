@@ -0,0 +1,153 @@
+"""Celery background task to keep the input staging cache within its limit."""
+
+from datetime import datetime, timedelta
+import logging
+from pathlib import Path
+import shutil
+import time
+from typing import Set
+
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from cwl_wes.ga4gh.wes.states import States
+from cwl_wes.worker import celery_app
+import cwl_wes.utils.db as db_utils
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+# Name of the lock serializing evictions
+INPUT_CACHE_LOCK = "evict_input_cache"
+
+
+@celery_app.task(
+    name="tasks.evict_input_cache",
+    ignore_result=True,
+)
+def task__evict_input_cache() -> None:
+    """Evict least recently used input cache entries beyond size limit."""
+    foca_config = celery_app.conf.foca
+    input_cache_config = foca_config.custom.storage.input_cache
+    collections = foca_config.db.dbs["cwl-wes-db"].collections
+    locks = collections["locks"].client
+    owner = db_utils.acquire_lock(
+        collection=locks,
+        name=INPUT_CACHE_LOCK,
+        ttl=input_cache_config.eviction_interval,
+    )
+    if owner is None:
+        return
+    try:
+        evict_input_cache(
+            collection=collections["input_cache"].client,
+            runs=collections["runs"].client,
+            cache_dir=input_cache_config.cache_dir,
+            max_size=input_cache_config.max_size,
+            grace_period=input_cache_config.grace_period,
+        )
+    except PyMongoError as exc:
+        logger.exception(
+            "Database error. Could not evict input cache entries."
+            f" Original error message: {type(exc).__name__}: {exc}"
+        )
+    finally:
+        db_utils.release_lock(
+            collection=locks, name=INPUT_CACHE_LOCK, owner=owner
+        )
+
+
+def evict_input_cache(
+    collection: Collection,
+    runs: Collection,
+    cache_dir: Path,
+    max_size: int,
+    grace_period: float,
+) -> None:
+    """Delete least recently used cached files until size limit is met.
+
+    Cached files are evicted together with all entries referring to them.
+    Files staged for unfinished workflow runs or used within the grace
+    period are kept, as are incomplete downloads younger than it.
+
+    Args:
+        collection: MongoDB collection of input cache entries.
+        runs: MongoDB collection of workflow runs.
+        cache_dir: Input cache directory.
+        max_size: Maximum size of the input cache in bytes.
+        grace_period: Time in seconds since their last use during which
+            cached files are kept.
+    """
+    if not cache_dir.is_dir():
+        return
+    _remove_stale_downloads(cache_dir=cache_dir, grace_period=grace_period)
+    contents = list(
+        collection.aggregate(
+            [
+                {
+                    "$group": {
+                        "_id": "$digest",
+                        "size": {"$max": "$size"},
+                        "last_used": {"$max": "$last_used"},
+                    }
+                },
+                {"$sort": {"last_used": 1}},
+            ]
+        )
+    )
+    total_size = sum(content["size"] or 0 for content in contents)
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_period)
+    in_use = get_digests_in_use(runs=runs)
+    evicted = 0
+    for content in contents:
+        if total_size <= max_size or content["last_used"] >= cutoff:
+            break
+        digest = content["_id"]
+        if digest in in_use:
+            continue
+        collection.delete_many({"digest": digest})
+        if digest:
+            shutil.rmtree(cache_dir / digest[:2] / digest, ignore_errors=True)
+        total_size -= content["size"] or 0
+        evicted += 1
+    logger.info(
+        f"Evicted {evicted} input cache entries; {total_size} bytes remain"
+        f" in '{cache_dir}'."
+    )
+
+
+def get_digests_in_use(runs: Collection) -> Set[str]:
+    """Get digests of cached files staged for unfinished workflow runs.
+
+    Args:
+        runs: MongoDB collection of workflow runs.
+
+    Returns:
+        Content digests of cached files.
+    """
+    return set(
+        runs.distinct(
+            "internal.input_digests",
+            {"api.state": {"$in": States.UNFINISHED}},
+        )
+    )
+
+
+def _remove_stale_downloads(cache_dir: Path, grace_period: float) -> None:
+    """Delete incomplete downloads older than the grace period.
+
+    Args:
+        cache_dir: Input cache directory.
+        grace_period: Time in seconds after which incomplete downloads are
+            considered abandoned.
+    """
+    tmp_dir = cache_dir / ".tmp"
+    if not tmp_dir.is_dir():
+        return
+    cutoff = time.time() - grace_period
+    for path in tmp_dir.iterdir():
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            continue
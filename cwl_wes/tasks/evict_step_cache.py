@@ -0,0 +1,128 @@
+"""Celery background task to keep the shared step cache within its limit."""
+
+import fcntl
+import logging
+import os
+from pathlib import Path
+import shutil
+from typing import List, Tuple
+
+from cwl_wes.worker import celery_app
+import cwl_wes.utils.db as db_utils
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+# Name of the lock serializing evictions
+STEP_CACHE_LOCK = "evict_step_cache"
+
+# Suffixes of files the workflow engine keeps next to a cache entry
+ENTRY_SUFFIXES = [".status", ".lock"]
+
+
+@celery_app.task(
+    name="tasks.evict_step_cache",
+    ignore_result=True,
+)
+def task__evict_step_cache() -> None:
+    """Evict least recently used step cache entries beyond size limit."""
+    foca_config = celery_app.conf.foca
+    step_cache_config = foca_config.custom.storage.step_cache
+    locks = foca_config.db.dbs["cwl-wes-db"].collections["locks"].client
+    owner = db_utils.acquire_lock(
+        collection=locks,
+        name=STEP_CACHE_LOCK,
+        ttl=step_cache_config.eviction_interval,
+    )
+    if owner is None:
+        return
+    try:
+        evict_step_cache(
+            cache_dir=step_cache_config.cache_dir,
+            max_size=step_cache_config.max_size,
+        )
+    finally:
+        db_utils.release_lock(
+            collection=locks, name=STEP_CACHE_LOCK, owner=owner
+        )
+
+
+def evict_step_cache(cache_dir: Path, max_size: int) -> None:
+    """Delete least recently used cache entries until size limit is met.
+
+    Entries that are locked by a running workflow engine are kept.
+
+    Args:
+        cache_dir: Step cache directory.
+        max_size: Maximum size of the step cache in bytes.
+    """
+    if not cache_dir.is_dir():
+        return
+    entries = _get_entries(cache_dir=cache_dir)
+    total_size = sum(size for _, _, size in entries)
+    evicted = 0
+    for entry, _, size in sorted(entries, key=lambda item: item[1]):
+        if total_size <= max_size:
+            break
+        if _is_locked(entry=entry):
+            continue
+        for suffix in ENTRY_SUFFIXES:
+            try:
+                Path(f"{entry}{suffix}").unlink()
+            except FileNotFoundError:
+                pass
+        shutil.rmtree(entry, ignore_errors=True)
+        total_size -= size
+        evicted += 1
+    logger.info(
+        f"Evicted {evicted} step cache entries; {total_size} bytes remain"
+        f" in '{cache_dir}'."
+    )
+
+
+def _get_entries(cache_dir: Path) -> List[Tuple[Path, float, int]]:
+    """Get step cache entries with time of last use and size.
+
+    Args:
+        cache_dir: Step cache directory.
+
+    Returns:
+        Entry path, time of last use and size in bytes of each entry.
+    """
+    entries = []
+    for path in cache_dir.iterdir():
+        if not path.is_dir():
+            continue
+        last_used = path.stat().st_mtime
+        size = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                size += stat.st_size
+                last_used = max(last_used, stat.st_mtime)
+        entries.append((path, last_used, size))
+    return entries
+
+
+def _is_locked(entry: Path) -> bool:
+    """Check whether cache entry is locked by a workflow engine.
+
+    Args:
+        entry: Cache entry path.
+
+    Returns:
+        `True` if the entry is in use, `False` otherwise.
+    """
+    lock_path = Path(f"{entry}.lock")
+    if not lock_path.exists():
+        return False
+    with open(lock_path, mode="a", encoding="utf-8") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return False
@@ -0,0 +1,124 @@
+"""Heartbeats of workflow runs supervised by a worker process."""
+
+from datetime import datetime
+import logging
+import threading
+import time
+from typing import Optional, Set
+
+from pymongo import collection as Collection
+from pymongo.errors import PyMongoError
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+# Heartbeat instance of the current worker process
+_HEARTBEAT: Optional["RunHeartbeat"] = None
+_HEARTBEAT_LOCK = threading.Lock()
+
+
+class RunHeartbeat:
+    """Periodically record that workflow runs are still being supervised.
+
+    A single background thread per worker process updates the heartbeat of
+    all runs supervised by that process with one database operation. Runs
+    whose heartbeat is not renewed are considered orphaned (cf.
+    `cwl_wes.tasks.reconcile_runs`).
+
+    Args:
+        collection: MongoDB collection of runs.
+        interval: Time in seconds between heartbeats.
+
+    Attributes:
+        collection: MongoDB collection of runs.
+        interval: Time in seconds between heartbeats.
+    """
+
+    def __init__(
+        self,
+        collection: Collection,
+        interval: float = 30,
+    ) -> None:
+        """Construct class instance and start heartbeat thread."""
+        self.collection = collection
+        self.interval = interval
+        self._task_ids: Set[str] = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="run-heartbeat",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def register(self, task_id: str) -> None:
+        """Start recording heartbeats for workflow run.
+
+        Args:
+            task_id: Task identifier of workflow run.
+        """
+        with self._lock:
+            self._task_ids.add(task_id)
+        self.beat(task_ids={task_id})
+
+    def unregister(self, task_id: str) -> None:
+        """Stop recording heartbeats for workflow run.
+
+        Args:
+            task_id: Task identifier of workflow run.
+        """
+        with self._lock:
+            self._task_ids.discard(task_id)
+
+    def beat(self, task_ids: Optional[Set[str]] = None) -> None:
+        """Record heartbeat of workflow runs.
+
+        Args:
+            task_ids: Task identifiers of workflow runs; all registered runs
+                if not provided.
+        """
+        if task_ids is None:
+            with self._lock:
+                task_ids = set(self._task_ids)
+        if not task_ids:
+            return
+        try:
+            self.collection.update_many(
+                {"task_id": {"$in": list(task_ids)}},
+                {"$set": {"internal.heartbeat": datetime.utcnow()}},
+            )
+        except PyMongoError as exc:
+            logger.warning(
+                "Database error. Could not record heartbeat of"
+                f" {len(task_ids)} runs. Original error message:"
+                f" {type(exc).__name__}: {exc}"
+            )
+
+    def _run(self) -> None:
+        """Record heartbeats of registered runs forever."""
+        while True:
+            time.sleep(self.interval)
+            self.beat()
+
+
+def get_heartbeat(
+    collection: Collection,
+    interval: float = 30,
+) -> RunHeartbeat:
+    """Get heartbeat of current worker process; create if necessary.
+
+    Args:
+        collection: MongoDB collection of runs.
+        interval: Time in seconds between heartbeats.
+
+    Returns:
+        Heartbeat instance.
+    """
+    global _HEARTBEAT  # pylint: disable=global-statement
+    with _HEARTBEAT_LOCK:
+        if _HEARTBEAT is None:
+            _HEARTBEAT = RunHeartbeat(
+                collection=collection,
+                interval=interval,
+            )
+        return _HEARTBEAT
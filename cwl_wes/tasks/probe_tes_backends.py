@@ -0,0 +1,171 @@
+"""Celery background task to probe health and latency of TES backends."""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from pymongo import collection as Collection
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+import tes
+
+from cwl_wes.custom_config import TESBalancerConfig
+import cwl_wes.utils.db as db_utils
+from cwl_wes.worker import celery_app
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+# Name of the lock serializing probe passes
+PROBE_LOCK = "probe_tes_backends"
+
+
+@celery_app.task(
+    name="tasks.probe_tes_backends",
+    ignore_result=True,
+)
+def task__probe_tes_backends() -> None:
+    """Probe configured TES backends and record their health.
+
+    Only one probe pass is executed at a time; passes triggered while
+    another one is in progress are skipped.
+    """
+    foca_config = celery_app.conf.foca
+    tes_server_config = foca_config.custom.controller.tes_server
+    collections = foca_config.db.dbs["cwl-wes-db"].collections
+    locks = collections["locks"].client
+    if not tes_server_config.backends:
+        return
+    owner = db_utils.acquire_lock(
+        collection=locks,
+        name=PROBE_LOCK,
+        ttl=max(tes_server_config.balancer.probe_interval, 60),
+    )
+    if owner is None:
+        return
+    try:
+        urls = [backend.url for backend in tes_server_config.backends]
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            results = list(
+                executor.map(
+                    lambda url: probe_tes_backend(
+                        url=url,
+                        timeout=tes_server_config.balancer.probe_timeout,
+                    ),
+                    urls,
+                )
+            )
+        for url, (latency, error) in zip(urls, results):
+            record_probe(
+                collection=collections["tes_backends"].client,
+                url=url,
+                latency=latency,
+                error=error,
+                config=tes_server_config.balancer,
+            )
+    except PyMongoError as exc:
+        logger.exception(
+            "Database error. Could not record health of TES backends."
+            f" Original error message: {type(exc).__name__}: {exc}"
+        )
+    finally:
+        db_utils.release_lock(collection=locks, name=PROBE_LOCK, owner=owner)
+
+
+def probe_tes_backend(
+    url: str,
+    timeout: int = 5,
+) -> Tuple[float, Optional[str]]:
+    """Request service info of TES backend and measure latency.
+
+    Args:
+        url: TES endpoint URL.
+        timeout: Timeout of the request in seconds.
+
+    Returns:
+        Latency in seconds and error message; the latter is `None` if the
+        probe succeeded.
+    """
+    tes_client = tes.HTTPClient(url=url, timeout=timeout)
+    start = time.monotonic()
+    try:
+        tes_client.get_service_info()
+    except Exception as exc:  # pylint: disable=broad-except
+        return time.monotonic() - start, f"{type(exc).__name__}: {exc}"
+    return time.monotonic() - start, None
+
+
+def record_probe(  # pylint: disable=too-many-arguments
+    collection: Collection,
+    url: str,
+    latency: float,
+    error: Optional[str],
+    config: TESBalancerConfig,
+) -> Dict:
+    """Record probe result and update health of TES backend.
+
+    Latency is smoothed exponentially over successful probes. A backend is
+    taken out of rotation after `failure_threshold` consecutive failed
+    probes or if its smoothed latency exceeds `max_latency`; it is put back
+    into rotation after `recovery_threshold` consecutive successful probes
+    within the latency limit.
+
+    Args:
+        collection: MongoDB collection of TES backend health.
+        url: TES endpoint URL.
+        latency: Latency of probe in seconds.
+        error: Error message of failed probe; `None` if the probe succeeded.
+        config: TES backend health probing configuration.
+
+    Returns:
+        Updated TES backend health document.
+    """
+    document = collection.find_one({"url": url}) or {
+        "healthy": True,
+        "latency": None,
+        "failures": 0,
+        "successes": 0,
+    }
+    healthy = document["healthy"]
+    smoothed = document["latency"]
+    if error is None:
+        smoothed = (
+            latency
+            if smoothed is None
+            else config.latency_smoothing * latency
+            + (1 - config.latency_smoothing) * smoothed
+        )
+        failures = 0
+        successes = document["successes"] + 1
+        if smoothed > config.max_latency:
+            healthy = False
+        elif successes >= config.recovery_threshold:
+            healthy = True
+    else:
+        failures = document["failures"] + 1
+        successes = 0
+        if failures >= config.failure_threshold:
+            healthy = False
+    if healthy != document["healthy"]:
+        change = "put back into" if healthy else "taken out of"
+        logger.warning(
+            f"TES backend '{url}' {change} rotation. Smoothed latency:"
+            f" {smoothed}; last error: {error}"
+        )
+    return collection.find_one_and_update(
+        {"url": url},
+        {
+            "$set": {
+                "healthy": healthy,
+                "latency": smoothed,
+                "failures": failures,
+                "successes": successes,
+                "last_error": error,
+                "last_probe": datetime.utcnow(),
+            }
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
@@ -0,0 +1,361 @@
+"""Celery background task to re-attach runs orphaned by worker failures."""
+
+from datetime import datetime, timedelta
+import logging
+from typing import Dict, Optional
+
+from celery import uuid
+from pymongo import collection as Collection
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from cwl_wes.custom_config import ReconcilerConfig
+from cwl_wes.tasks.cancel_run import kill_workflow_engine
+import cwl_wes.utils.db as db_utils
+from cwl_wes.utils.run_events import record_run_event
+from cwl_wes.worker import celery_app
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+# Name of the lock serializing reconciliation passes
+RECONCILE_LOCK = "reconcile_runs"
+
+# Run states in which a run is supervised by a worker
+SUPERVISED_STATES = ["INITIALIZING", "RUNNING"]
+
+# Seconds to wait for the worker of an orphaned run to reply
+CONTROL_TIMEOUT = 5
+
+
+@celery_app.task(
+    name="tasks.reconcile_runs",
+    ignore_result=True,
+)
+def task__reconcile_runs() -> None:
+    """Re-attach or fail workflow runs whose worker stopped heartbeating.
+
+    Only one reconciliation pass is executed at a time; passes triggered
+    while another one is in progress are skipped.
+    """
+    foca_config = celery_app.conf.foca
+    reconciler_config = foca_config.custom.controller.reconciler
+    collections = foca_config.db.dbs["cwl-wes-db"].collections
+    locks = collections["locks"].client
+    owner = db_utils.acquire_lock(
+        collection=locks,
+        name=RECONCILE_LOCK,
+        ttl=max(reconciler_config.interval, 60),
+    )
+    if owner is None:
+        return
+    try:
+        reconcile_runs(
+            collection=collections["runs"].client,
+            collection_events=collections["run_events"].client,
+            config=reconciler_config,
+            soft_time_limit=foca_config.custom.controller.timeout_run_workflow,
+            auth_required=foca_config.security.auth.required,
+        )
+    except PyMongoError as exc:
+        logger.exception(
+            "Database error. Could not reconcile orphaned runs. Original"
+            f" error message: {type(exc).__name__}: {exc}"
+        )
+    finally:
+        db_utils.release_lock(
+            collection=locks, name=RECONCILE_LOCK, owner=owner
+        )
+
+
+def reconcile_runs(
+    collection: Collection,
+    collection_events: Collection,
+    config: ReconcilerConfig,
+    soft_time_limit: Optional[int] = None,
+    auth_required: bool = False,
+) -> None:
+    """Find orphaned runs and re-attach them to their TES tasks.
+
+    A run is orphaned if it is in a supervised state and its heartbeat is
+    older than the orphan timeout or, for re-attached runs whose task was
+    not started yet, older than the enqueued timeout. Runs that were
+    re-attached too often, or
+    that lack the information required to restart the workflow engine, are
+    set to `SYSTEM_ERROR`. As credentials of runs are not stored, orphaned
+    runs are never re-attached if authorization is required.
+
+    Args:
+        collection: MongoDB collection of runs.
+        collection_events: MongoDB collection of run events.
+        config: Reconciler configuration.
+        soft_time_limit: Soft time limit of workflow run task.
+        auth_required: Whether authorization is required.
+    """
+    orphan_filter = get_orphan_filter(config=config)
+    orphans = list(
+        collection.find(
+            orphan_filter,
+            projection={
+                "run_id": True,
+                "task_id": True,
+                "internal.command_list": True,
+                "internal.tmp_dir": True,
+                "internal.reattach_count": True,
+                "internal.executor": True,
+                "internal.trace_context": True,
+                "internal.worker_hostname": True,
+                "internal.engine_pgid": True,
+                "_id": False,
+            },
+        )
+    )
+    if auth_required and orphans:
+        logger.warning(
+            "Authorization is required, but credentials of runs are not"
+            " stored. Orphaned runs are not re-attached."
+        )
+    reattached = 0
+    for document in orphans:
+        internal = document["internal"]
+        if (
+            auth_required
+            or internal.get("reattach_count", 0)
+            >= config.max_reattach_attempts
+            or "command_list" not in internal
+        ):
+            # Engines are only killed while their run is unfinished
+            stop_orphaned_engine(document=document)
+            fail_run(
+                collection=collection,
+                collection_events=collection_events,
+                task_id=document["task_id"],
+            )
+        elif reattach_run(
+            collection=collection,
+            collection_events=collection_events,
+            document=document,
+            orphan_filter=orphan_filter,
+            soft_time_limit=soft_time_limit,
+        ):
+            reattached += 1
+    logger.info(
+        f"Found {len(orphans)} orphaned runs; re-attached {reattached} runs."
+    )
+
+
+def get_orphan_filter(config: ReconcilerConfig) -> Dict:
+    """Get query for orphaned runs.
+
+    Runs whose task was started are orphaned once their heartbeat is older
+    than the orphan timeout. Re-attached runs whose task was not started
+    yet have no heartbeat other than that of their claim, so that they are
+    only considered orphaned after the enqueued timeout; otherwise, runs
+    waiting in a backlogged queue would be claimed over and over again.
+
+    Args:
+        config: Reconciler configuration.
+
+    Returns:
+        Query filter.
+    """
+    now = datetime.utcnow()
+    return {
+        "api.state": {"$in": SUPERVISED_STATES},
+        "$or": [
+            {
+                "internal.task_started": {"$exists": True},
+                "internal.heartbeat": {
+                    "$lt": now - timedelta(seconds=config.orphan_timeout)
+                },
+            },
+            {
+                "internal.task_started": {"$exists": False},
+                "internal.heartbeat": {
+                    "$lt": now - timedelta(seconds=config.enqueued_timeout)
+                },
+            },
+        ],
+    }
+
+
+def reattach_run(
+    collection: Collection,
+    collection_events: Collection,
+    document: Dict,
+    orphan_filter: Dict,
+    soft_time_limit: Optional[int] = None,
+) -> bool:
+    """Restart workflow engine of orphaned run, adopting its TES tasks.
+
+    The run is claimed by atomically assigning a new task identifier, so
+    that a worker that resumes sending heartbeats for the old task
+    identifier cannot interfere with the re-attached run. The workflow
+    engine of the orphaned attempt is then killed, in case its worker is
+    alive but failed to record heartbeats, e.g., during a database outage;
+    workers that do not reply are considered gone. The run stays in a
+    supervised state, so that it is reconciled again if the new task is
+    never started.
+
+    Args:
+        collection: MongoDB collection of runs.
+        collection_events: MongoDB collection of run events.
+        document: Orphaned run document.
+        orphan_filter: Query for orphaned runs.
+        soft_time_limit: Soft time limit of workflow run task.
+
+    Returns:
+        `True` if the run was re-attached, `False` if it is no longer
+        orphaned.
+    """
+    task_id = uuid()
+    claimed = collection.find_one_and_update(
+        {"task_id": document["task_id"], **orphan_filter},
+        [
+            {
+                "$set": {
+                    "task_id": task_id,
+                    "api.state": "INITIALIZING",
+                    "api.task_logs": [],
+                    "internal.orphaned_task_logs": {
+                        "$concatArrays": [
+                            {"$ifNull": ["$internal.orphaned_task_logs", []]},
+                            {"$ifNull": ["$api.task_logs", []]},
+                        ]
+                    },
+                    "internal.orphaned_task_ids": {
+                        "$concatArrays": [
+                            {"$ifNull": ["$internal.orphaned_task_ids", []]},
+                            ["$task_id"],
+                        ]
+                    },
+                    "internal.heartbeat": datetime.utcnow(),
+                    "internal.reattach_count": {
+                        "$add": [
+                            {"$ifNull": ["$internal.reattach_count", 0]},
+                            1,
+                        ]
+                    },
+                }
+            },
+            {
+                "$unset": [
+                    "internal.task_started",
+                    "internal.worker_hostname",
+                    "internal.engine_pgid",
+                ]
+            },
+        ],
+        projection={"run_id": True, "_id": False},
+        return_document=ReturnDocument.AFTER,
+    )
+    if claimed is None:
+        return False
+    stop_orphaned_engine(document=document)
+    # Preparation is not repeated for re-attached runs
+    for event, state in [("submitted", "INITIALIZING"), ("prepared", None)]:
+        record_run_event(
+            collection=collection_events,
+            run_id=claimed["run_id"],
+            task_id=task_id,
+            event=event,
+            state=state,
+            orphaned_task_id=document["task_id"],
+        )
+    queue = None
+    if document["internal"].get("executor") == "local":
+        queue = celery_app.conf.foca.custom.controller.local_executor.queue
+    celery_app.send_task(
+        "tasks.run_workflow",
+        kwargs={
+            "command_list": document["internal"]["command_list"],
+            "tmp_dir": document["internal"]["tmp_dir"],
+            "token": None,
+            "reattach": True,
+        },
+        task_id=task_id,
+        soft_time_limit=soft_time_limit,
+        queue=queue,
+        headers=document["internal"].get("trace_context"),
+    )
+    record_run_event(
+        collection=collection_events,
+        run_id=claimed["run_id"],
+        task_id=task_id,
+        event="enqueued",
+    )
+    logger.info(
+        f"Run '{claimed['run_id']}' orphaned by task ID"
+        f" '{document['task_id']}' re-attached with task ID '{task_id}'."
+    )
+    return True
+
+
+def stop_orphaned_engine(document: Dict) -> None:
+    """Kill workflow engine of orphaned attempt, if it is still running.
+
+    Args:
+        document: Orphaned run document.
+    """
+    internal = document["internal"]
+    if "engine_pgid" not in internal or "worker_hostname" not in internal:
+        return
+    killed = kill_workflow_engine(
+        hostname=internal["worker_hostname"],
+        pgid=internal["engine_pgid"],
+        run_id=document["run_id"],
+        timeout=CONTROL_TIMEOUT,
+    )
+    if killed is None:
+        logger.info(
+            f"Worker '{internal['worker_hostname']}' of run"
+            f" '{document['run_id']}' did not reply; considering it gone."
+        )
+    elif killed:
+        logger.warning(
+            f"Workflow engine of run '{document['run_id']}' was still running"
+            f" on worker '{internal['worker_hostname']}' and was killed."
+        )
+
+
+def fail_run(
+    collection: Collection,
+    collection_events: Collection,
+    task_id: str,
+) -> None:
+    """Set orphaned run that cannot be re-attached to `SYSTEM_ERROR`.
+
+    Args:
+        collection: MongoDB collection of runs.
+        collection_events: MongoDB collection of run events.
+        task_id: Task identifier of orphaned run.
+    """
+    task_finished = datetime.utcnow()
+    document = collection.find_one_and_update(
+        {"task_id": task_id, "api.state": {"$in": SUPERVISED_STATES}},
+        {
+            "$set": {
+                "api.state": "SYSTEM_ERROR",
+                "internal.task_finished": task_finished,
+            },
+            "$unset": {
+                "internal.engine_pgid": "",
+                "internal.worker_hostname": "",
+            },
+        },
+        projection={"run_id": True, "_id": False},
+    )
+    if document is not None:
+        record_run_event(
+            collection=collection_events,
+            run_id=document["run_id"],
+            task_id=task_id,
+            event="finished",
+            timestamp=task_finished,
+            state="SYSTEM_ERROR",
+            orphaned=True,
+        )
+        logger.warning(
+            f"Run '{document['run_id']}' orphaned by task ID '{task_id}'"
+            " could not be re-attached. State set to 'SYSTEM_ERROR'."
+        )
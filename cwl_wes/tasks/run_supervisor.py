@@ -0,0 +1,440 @@
+"""Asynchronous workflow run supervisor executed on worker."""
+
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from celery.signals import worker_process_shutdown, worker_shutting_down
+
+from cwl_wes.tasks.cwl_log_processor import CWLLogProcessor
+from cwl_wes.tasks.workflow_run_manager import (
+    terminate_process_group,
+    WorkflowRunManager,
+)
+from cwl_wes.utils import tracing
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+# Maximum length of a single log line read from the workflow engine
+LINE_LIMIT = 2**24
+
+# Supervisor instance of the current worker process
+_SUPERVISOR: Optional["RunSupervisor"] = None
+_SUPERVISOR_LOCK = threading.Lock()
+
+
+# pylint: disable-next=too-few-public-methods,too-many-instance-attributes
+class RunSupervisor:
+    """Drive many workflow engine processes from a single event loop.
+
+    The event loop runs in a background thread of the worker process. Engine
+    output is read via non-blocking pipes, while blocking database and TES
+    calls are offloaded to a thread pool. Submitting a run blocks only while
+    the maximum number of concurrently supervised runs is reached.
+
+    Supervised runs do not occupy the worker slot of their task, so Celery
+    does not wait for them when the worker process shuts down. Instead, the
+    supervisor waits for them up to the shutdown timeout and then kills
+    their workflow engines and records the interruption (cf.
+    `shutdown()`).
+
+    Args:
+        max_concurrent_runs: Maximum number of runs supervised concurrently.
+        io_threads: Number of threads for blocking database and TES calls.
+        timeout: Maximum duration of a run in seconds; `None` for no limit.
+        shutdown_timeout: Time in seconds to wait for supervised runs to
+            finish when the worker process shuts down.
+        recoverable: Whether runs interrupted by shutdown are re-attached by
+            the reconciler.
+
+    Attributes:
+        max_concurrent_runs: Maximum number of runs supervised concurrently.
+        io_threads: Number of threads for blocking database and TES calls.
+        timeout: Maximum duration of a run in seconds; `None` for no limit.
+        shutdown_timeout: Time in seconds to wait for supervised runs to
+            finish when the worker process shuts down.
+        recoverable: Whether runs interrupted by shutdown are re-attached by
+            the reconciler.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        max_concurrent_runs: int = 100,
+        io_threads: int = 16,
+        timeout: Optional[int] = None,
+        shutdown_timeout: float = 30,
+        recoverable: bool = False,
+    ) -> None:
+        """Construct class instance and start event loop."""
+        self.max_concurrent_runs = max_concurrent_runs
+        self.io_threads = io_threads
+        self.timeout = timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.recoverable = recoverable
+        # Supervised runs and process groups of their engines, by task ID
+        self._runs: Dict[str, Tuple[WorkflowRunManager, Optional[int]]] = {}
+        self._interrupted: Set[str] = set()
+        self._runs_lock = threading.Lock()
+        self._closed = False
+        self._slots = threading.BoundedSemaphore(max_concurrent_runs)
+        self._executor = ThreadPoolExecutor(
+            max_workers=io_threads,
+            thread_name_prefix="run-supervisor-io",
+        )
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run_loop,
+            name="run-supervisor",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def submit(self, manager: WorkflowRunManager) -> None:
+        """Hand workflow run over to supervisor.
+
+        Blocks until a supervision slot is available.
+
+        Args:
+            manager: Workflow run manager of the run to supervise.
+        """
+        self._slots.acquire()  # pylint: disable=consider-using-with
+        future = asyncio.run_coroutine_threadsafe(
+            self._supervise_traced(manager=manager),
+            self._loop,
+        )
+        future.add_done_callback(self._release_slot)
+        logger.info(
+            f"Run with task ID '{manager.task_id}' handed over to supervisor."
+        )
+
+    def shutdown(self) -> None:
+        """Wait for supervised runs to finish; interrupt the others.
+
+        Called when the worker process shuts down. Workflow engines of runs
+        that do not finish within the shutdown timeout are killed, and their
+        interruption is recorded (cf.
+        `WorkflowRunManager.handle_worker_shutdown()`).
+        """
+        with self._runs_lock:
+            if self._closed:
+                return
+            self._closed = True
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self._runs and time.monotonic() < deadline:
+            time.sleep(min(1, self.shutdown_timeout))
+        with self._runs_lock:
+            runs = list(self._runs.values())
+            self._interrupted.update(self._runs)
+        if not runs:
+            return
+        logger.warning(
+            f"Worker process shutting down. Interrupting {len(runs)}"
+            " supervised runs."
+        )
+        for manager, pgid in runs:
+            if pgid is not None:
+                terminate_process_group(pgid=pgid)
+            try:
+                manager.handle_worker_shutdown(recoverable=self.recoverable)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.error(
+                    "Could not record interruption of run with task ID"
+                    f" '{manager.task_id}'. Original error message:"
+                    f" {type(exc).__name__}: {exc}"
+                )
+
+    def _run_loop(self) -> None:
+        """Run event loop forever."""
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def _release_slot(self, future: Future) -> None:
+        """Release supervision slot and log unexpected errors.
+
+        Args:
+            future: Future of finished supervision coroutine.
+        """
+        self._slots.release()
+        exc = future.exception()
+        if exc is not None:
+            logger.error(
+                "Supervision of workflow run failed. Original error message:"
+                f" {type(exc).__name__}: {exc}"
+            )
+
+    async def _call(self, func, *args, **kwargs):
+        """Run blocking callable in I/O thread pool.
+
+        The callable continues the trace of the calling coroutine.
+
+        Args:
+            func: Callable to run.
+            *args: Positional arguments to callable.
+            **kwargs: Keyword arguments to callable.
+
+        Returns:
+            Return value of callable.
+        """
+        return await self._loop.run_in_executor(
+            self._executor,
+            partial(
+                tracing.call_in_context,
+                tracing.get_context(),
+                func,
+                *args,
+                **kwargs,
+            ),
+        )
+
+    async def _supervise_traced(self, manager: WorkflowRunManager) -> None:
+        """Supervise single workflow run within its trace.
+
+        Args:
+            manager: Workflow run manager of the run to supervise.
+        """
+        with manager.trace_run():
+            await self._supervise(manager=manager)
+
+    async def _supervise(self, manager: WorkflowRunManager) -> None:
+        """Supervise single workflow run.
+
+        Args:
+            manager: Workflow run manager of the run to supervise.
+        """
+        if not await self._call(manager.trigger_task_start_events):
+            return
+        with self._runs_lock:
+            closed = self._closed
+            if not closed:
+                self._runs[manager.task_id] = (manager, None)
+        if closed:
+            await self._call(
+                manager.handle_worker_shutdown,
+                recoverable=self.recoverable,
+            )
+            return
+        try:
+            await self._supervise_engine(manager=manager)
+        finally:
+            with self._runs_lock:
+                self._runs.pop(manager.task_id, None)
+
+    async def _supervise_engine(self, manager: WorkflowRunManager) -> None:
+        """Start and supervise workflow engine of started run.
+
+        Args:
+            manager: Workflow run manager of the run to supervise.
+        """
+        monitor = manager.get_tes_monitor()
+        if monitor is not None:
+            monitor.start()
+        cwl_log_processor = manager.get_log_processor(monitor=monitor)
+        command_list = manager.command_list
+        pass_fds: Tuple[int, ...] = ()
+        read_fd = None
+        if cwl_log_processor.structured:
+            read_fd, write_fd = os.pipe()
+            command_list = manager.get_engine_command(event_fd=write_fd)
+            pass_fds = (write_fd,)
+        try:
+            proc = subprocess.Popen(  # pylint: disable=consider-using-with
+                command_list,
+                cwd=manager.tmp_dir,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                pass_fds=pass_fds,
+                start_new_session=True,
+                env={**os.environ, **tracing.get_env_vars()},
+            )
+        except OSError as exc:
+            logger.error(
+                f"Could not start workflow engine for run with task ID"
+                f" '{manager.task_id}'. Original error message:"
+                f" {type(exc).__name__}: {exc}"
+            )
+            if read_fd is not None:
+                os.close(read_fd)
+            cwl_log_processor.close()
+            manager.stop_heartbeat()
+            if monitor is not None:
+                await self._call(monitor.stop)
+            await self._call(
+                manager.trigger_task_failure_events,
+                task_end_ts=time.time(),
+            )
+            return
+        finally:
+            for _fd in pass_fds:
+                os.close(_fd)
+        self._track_engine(manager=manager, pgid=proc.pid)
+        await self._call(manager.register_engine_process, pgid=proc.pid)
+
+        readers = [
+            self._process_logs(
+                proc=proc,
+                cwl_log_processor=cwl_log_processor,
+                token=manager.token,
+            )
+        ]
+        if read_fd is not None:
+            readers.append(
+                self._process_events(
+                    event_fd=read_fd,
+                    cwl_log_processor=cwl_log_processor,
+                    token=manager.token,
+                )
+            )
+        timed_out = False
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*readers),
+                timeout=self.timeout,
+            )
+        except asyncio.TimeoutError:
+            timed_out = True
+            logger.warning(
+                f"Run with task ID '{manager.task_id}' timed out after"
+                f" {self.timeout} seconds. Terminating workflow engine and"
+                " canceling its TES tasks."
+            )
+            terminate_process_group(pgid=proc.pid)
+
+        returncode = await self._call(proc.wait)
+        if manager.task_id in self._interrupted:
+            # Interruption is recorded by `shutdown()`
+            return
+        if timed_out:
+            await self._call(manager.cancel_tes_tasks)
+        await self._call(
+            manager.finalize_workflow_run,
+            returncode=returncode,
+            cwl_log_processor=cwl_log_processor,
+            monitor=monitor,
+        )
+
+    def _track_engine(self, manager: WorkflowRunManager, pgid: int) -> None:
+        """Record process group of workflow engine for shutdown.
+
+        The engine is killed right away if the run was interrupted while
+        the engine was started.
+
+        Args:
+            manager: Workflow run manager of the run.
+            pgid: Process group identifier of workflow engine.
+        """
+        with self._runs_lock:
+            self._runs[manager.task_id] = (manager, pgid)
+            if manager.task_id in self._interrupted:
+                terminate_process_group(pgid=pgid)
+
+    async def _process_logs(
+        self,
+        proc: subprocess.Popen,
+        cwl_log_processor: CWLLogProcessor,
+        token: Optional[str] = None,
+    ) -> None:
+        """Read and process workflow engine output until end of stream.
+
+        Args:
+            proc: Workflow engine process.
+            cwl_log_processor: Log processor of workflow run.
+            token: OAuth2 token.
+        """
+        reader = asyncio.StreamReader(limit=LINE_LIMIT)
+        await self._loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader),
+            proc.stdout,
+        )
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            await self._call(
+                cwl_log_processor.process_line,
+                line=line.decode("utf-8", errors="replace"),
+                token=token,
+            )
+
+    async def _process_events(
+        self,
+        event_fd: int,
+        cwl_log_processor: CWLLogProcessor,
+        token: Optional[str] = None,
+    ) -> None:
+        """Read and process JSON line engine events until end of stream.
+
+        Args:
+            event_fd: File descriptor to read events from.
+            cwl_log_processor: Log processor of workflow run.
+            token: OAuth2 token.
+        """
+        reader = asyncio.StreamReader(limit=LINE_LIMIT)
+        await self._loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader),
+            os.fdopen(event_fd, "rb"),
+        )
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                event = json.loads(line)
+            except ValueError:
+                logger.warning(f"Ignoring malformed engine event: {line!r}")
+                continue
+            await self._call(
+                cwl_log_processor.process_engine_event,
+                event=event,
+                token=token,
+            )
+
+
+def get_run_supervisor(
+    max_concurrent_runs: int = 100,
+    io_threads: int = 16,
+    timeout: Optional[int] = None,
+    shutdown_timeout: float = 30,
+    recoverable: bool = False,
+) -> RunSupervisor:
+    """Get run supervisor of current worker process; create if necessary.
+
+    Args:
+        max_concurrent_runs: Maximum number of runs supervised concurrently.
+        io_threads: Number of threads for blocking database and TES calls.
+        timeout: Maximum duration of a run in seconds; `None` for no limit.
+        shutdown_timeout: Time in seconds to wait for supervised runs to
+            finish when the worker process shuts down.
+        recoverable: Whether runs interrupted by shutdown are re-attached by
+            the reconciler.
+
+    Returns:
+        Run supervisor instance.
+    """
+    global _SUPERVISOR  # pylint: disable=global-statement
+    with _SUPERVISOR_LOCK:
+        if _SUPERVISOR is None:
+            _SUPERVISOR = RunSupervisor(
+                max_concurrent_runs=max_concurrent_runs,
+                io_threads=io_threads,
+                timeout=timeout,
+                shutdown_timeout=shutdown_timeout,
+                recoverable=recoverable,
+            )
+            # Pool processes and solo workers, respectively
+            worker_process_shutdown.connect(_shutdown_supervisor, weak=False)
+            worker_shutting_down.connect(_shutdown_supervisor, weak=False)
+        return _SUPERVISOR
+
+
+def _shutdown_supervisor(**_kwargs) -> None:
+    """Shut down run supervisor of current worker process, if any."""
+    if _SUPERVISOR is not None:
+        _SUPERVISOR.shutdown()
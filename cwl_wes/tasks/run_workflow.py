@@ -4,6 +4,7 @@ import logging
 from typing import List, Optional
 
 from cwl_wes.worker import celery_app
+from cwl_wes.tasks.run_supervisor import get_run_supervisor
 from cwl_wes.tasks.workflow_run_manager import WorkflowRunManager
 
 
@@ -22,10 +23,87 @@ def task__run_workflow(
     command_list: List,
     tmp_dir: str,
     token: Optional[str] = None,
+    reattach: bool = False,
 ) -> None:
-    """Add workflow run to task queue."""
+    """Add workflow run to task queue.
+
+    If the asynchronous run supervisor is enabled, the run is handed over to
+    the supervisor of the worker process and the task returns right away;
+    runs still supervised when the worker process shuts down are left to the
+    reconciler or failed. Otherwise the task blocks until the run has
+    finished. Runs executed with
+    `cwltool` on a local worker always block, so that the number of
+    concurrent local runs is limited by the worker's concurrency.
+
+    If `reattach` is set, the run resumes an attempt that was interrupted
+    by a worker crash, adopting the TES tasks recorded for that attempt.
+
+    Tasks redelivered by the broker, e.g., after a worker crash or a
+    consumer timeout, are not executed again if the run was already started,
+    as the engine would resubmit all TES tasks; such runs are left to the
+    reconciler.
+    """
+    if is_started_redelivery(task=self):
+        return
+
     # Execute task in background
     workflow_run_manager = WorkflowRunManager(
-        task=self, command_list=command_list, tmp_dir=tmp_dir, token=token
+        task=self,
+        command_list=command_list,
+        tmp_dir=tmp_dir,
+        token=token,
+        reattach=reattach,
+    )
+    supervisor_config = celery_app.conf.foca.custom.celery.run_supervisor
+    if supervisor_config.enabled and command_list[0] != "cwltool":
+        supervisor = get_run_supervisor(
+            max_concurrent_runs=supervisor_config.max_concurrent_runs,
+            io_threads=supervisor_config.io_threads,
+            timeout=(
+                celery_app.conf.foca.custom.controller.timeout_run_workflow
+            ),
+            shutdown_timeout=supervisor_config.shutdown_timeout,
+            recoverable=(
+                celery_app.conf.foca.custom.controller.reconciler.enabled
+            ),
+        )
+        supervisor.submit(manager=workflow_run_manager)
+    else:
+        with workflow_run_manager.trace_run():
+            workflow_run_manager.run_workflow()
+
+
+def is_started_redelivery(task: celery_app.Task) -> bool:
+    """Check whether task is a redelivery of an already started run.
+
+    Args:
+        task: Celery task instance of the workflow run.
+
+    Returns:
+        `True` if the task was redelivered by the broker and the run was
+        started by a worker before, `False` otherwise.
+    """
+    delivery_info = task.request.delivery_info or {}
+    if not delivery_info.get("redelivered"):
+        return False
+    foca_config = celery_app.conf.foca
+    collection = foca_config.db.dbs["cwl-wes-db"].collections["runs"].client
+    document = collection.find_one(
+        {"task_id": task.request.id},
+        projection={"run_id": True, "internal.task_started": True},
     )
-    workflow_run_manager.run_workflow()
+    if document is None or "task_started" not in document.get("internal", {}):
+        return False
+    if foca_config.custom.controller.reconciler.enabled:
+        logger.warning(
+            f"Task '{task.request.id}' of run '{document['run_id']}' was"
+            " redelivered after the run was started. Leaving run to the"
+            " reconciler."
+        )
+    else:
+        logger.error(
+            f"Task '{task.request.id}' of run '{document['run_id']}' was"
+            " redelivered after the run was started. The run is not executed"
+            " again; enable the reconciler to recover runs of lost workers."
+        )
+    return True
@@ -0,0 +1,317 @@
+"""TES task monitor executed on worker."""
+
+from datetime import datetime
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from pymongo import collection as Collection
+from pymongo.errors import PyMongoError
+import requests
+from tes.models import ListTasksResponse
+from tes.utils import unmarshal
+
+from cwl_wes.tasks.cwl_log_processor import CWLTesProcessor
+import cwl_wes.utils.db as db_utils
+from cwl_wes.utils import outbound
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+# TES task states after which a task will not change anymore
+TES_TERMINAL_STATES = [
+    "COMPLETE",
+    "EXECUTOR_ERROR",
+    "SYSTEM_ERROR",
+    "CANCELED",
+    "PREEMPTED",
+]
+
+
+class TESTaskMonitor:  # pylint: disable=too-many-instance-attributes
+    """Track the TES tasks of a workflow run via periodic `ListTasks` calls.
+
+    Task states are obtained with the `MINIMAL` view for all tracked tasks
+    at once; the `FULL` view of a task is only requested once it reaches a
+    terminal state. As TES instances may hold many more tasks than those of
+    the run, at most `max_pages` pages are listed per poll; states of
+    tracked tasks not found on these pages are requested individually.
+
+    Args:
+        tes_config: TES configuration.
+        collection: MongoDB collection of TES task logs.
+        run_id: Run identifier.
+        task_id: Task identifier of workflow run.
+        token: OAuth2 token.
+        poll_interval: Interval in seconds between `ListTasks` calls.
+        page_size: Number of tasks to request per `ListTasks` page.
+        name_prefix: Only list tasks whose name starts with this prefix.
+        max_pages: Maximum number of `ListTasks` pages requested per poll.
+
+    Attributes:
+        tes_config: TES configuration.
+        collection: MongoDB collection of TES task logs.
+        run_id: Run identifier.
+        task_id: Task identifier of workflow run.
+        token: OAuth2 token.
+        poll_interval: Interval in seconds between `ListTasks` calls.
+        page_size: Number of tasks to request per `ListTasks` page.
+        name_prefix: Only list tasks whose name starts with this prefix.
+        max_pages: Maximum number of `ListTasks` pages requested per poll.
+        task_logs: Latest known task logs, by TES task identifier.
+        last_tes_update: Time the most recent TES task state change was
+            observed, if any.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        tes_config: Dict,
+        collection: Collection,
+        run_id: str,
+        task_id: str,
+        token: Optional[str] = None,
+        poll_interval: float = 10,
+        page_size: int = 256,
+        name_prefix: Optional[str] = None,
+        max_pages: int = 4,
+    ) -> None:
+        """Construct class instance."""
+        self.tes_config = tes_config
+        self.collection = collection
+        self.run_id = run_id
+        self.task_id = task_id
+        self.token = token
+        self.poll_interval = poll_interval
+        self.page_size = page_size
+        self.name_prefix = name_prefix
+        self.max_pages = max_pages
+        self.task_logs: Dict[str, Dict] = {}
+        self.last_tes_update: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_task(self, tes_id: str) -> None:
+        """Start tracking TES task.
+
+        Args:
+            tes_id: TES task identifier.
+        """
+        with self._lock:
+            if tes_id in self.task_logs:
+                return
+            self.task_logs[tes_id] = {"id": tes_id, "state": "UNKNOWN"}
+            tes_log = dict(self.task_logs[tes_id])
+        self._write(
+            db_utils.append_to_tes_task_logs,
+            tes_id=tes_id,
+            tes_log=tes_log,
+        )
+
+    def get_task_logs(self) -> List[Dict]:
+        """Get latest known logs of all tracked TES tasks.
+
+        Returns:
+            Task logs.
+        """
+        with self._lock:
+            return list(self.task_logs.values())
+
+    def start(self) -> None:
+        """Start polling TES in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"tes-monitor-{self.task_id}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop polling and capture final states of all tracked tasks."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._poll_safely()
+
+    def poll(self) -> None:
+        """Update states of all unfinished tracked tasks."""
+        with self._lock:
+            pending = {
+                tes_id: log["state"]
+                for tes_id, log in self.task_logs.items()
+                if log["state"] not in TES_TERMINAL_STATES
+            }
+        if not pending:
+            return
+
+        states = self._list_task_states(tes_ids=set(pending))
+        for tes_id, state in states.items():
+            if state == pending[tes_id]:
+                continue
+            self.last_tes_update = datetime.utcnow()
+            if state in TES_TERMINAL_STATES:
+                self._capture_final_log(tes_id=tes_id, state=state)
+            else:
+                self._capture_state(tes_id=tes_id, state=state)
+
+    def _run(self) -> None:
+        """Poll TES until stopped."""
+        while not self._stop.wait(self.poll_interval):
+            self._poll_safely()
+
+    def _poll_safely(self) -> None:
+        """Update task states; log rather than raise errors."""
+        try:
+            self.poll()
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning(
+                "Could not poll TES task states. Original error message:"
+                f" {type(exc).__name__}: {exc}"
+            )
+
+    def _list_task_states(self, tes_ids: set) -> Dict[str, str]:
+        """Get states of TES tasks via `ListTasks` with the `MINIMAL` view.
+
+        Paging stops as soon as all requested tasks were found, or after
+        `max_pages` pages; states of tasks that were not found are then
+        requested via `GetTask`.
+
+        Args:
+            tes_ids: TES task identifiers.
+
+        Returns:
+            Task states, by TES task identifier.
+        """
+        states: Dict[str, str] = {}
+        page_token: Optional[str] = None
+        for _ in range(self.max_pages):
+            params = {"view": "MINIMAL", "page_size": self.page_size}
+            if self.name_prefix:
+                params["name_prefix"] = self.name_prefix
+            if page_token:
+                params["page_token"] = page_token
+            page = unmarshal(
+                self._get(path="/v1/tasks", params=params),
+                ListTasksResponse,
+            )
+            for task in page.tasks or []:
+                if task.id in tes_ids:
+                    states[task.id] = task.state
+            page_token = page.next_page_token
+            if not page_token or len(states) == len(tes_ids):
+                return states
+        for tes_id in tes_ids - set(states):
+            try:
+                task = self._get(
+                    path=f"/v1/tasks/{tes_id}",
+                    params={"view": "MINIMAL"},
+                )
+            except requests.HTTPError as exc:
+                logger.warning(
+                    f"Could not get state of TES task '{tes_id}'. Original"
+                    f" error message: {type(exc).__name__}: {exc}"
+                )
+                continue
+            if "state" in task:
+                states[tes_id] = task["state"]
+        return states
+
+    def _get(self, path: str, params: Dict) -> Dict:
+        """Send GET request to TES.
+
+        Args:
+            path: Path relative to the TES URL, e.g., `/v1/tasks`.
+            params: Query parameters.
+
+        Returns:
+            JSON response body.
+        """
+        headers = {"Content-type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        response = outbound.call(
+            self.tes_config["url"],
+            requests.get,
+            f"{self.tes_config['url'].rstrip('/')}{path}",
+            params=params,
+            headers=headers,
+            timeout=self.tes_config["timeout"],
+            failed=outbound.is_server_error,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def _capture_state(self, tes_id: str, state: str) -> None:
+        """Record state change of TES task.
+
+        Args:
+            tes_id: TES task identifier.
+            state: TES task state.
+        """
+        with self._lock:
+            self.task_logs[tes_id]["state"] = state
+        if self._write(
+            db_utils.update_tes_task_state,
+            tes_id=tes_id,
+            state=state,
+        ):
+            logger.info(
+                f"State of TES task '{tes_id}' of run with task ID "
+                f"'{self.task_id}' changed to '{state}'."
+            )
+
+    def _capture_final_log(self, tes_id: str, state: str) -> None:
+        """Record `FULL` view of TES task that reached a terminal state.
+
+        Args:
+            tes_id: TES task identifier.
+            state: TES task state.
+        """
+        cwl_tes_processor = CWLTesProcessor(tes_config=self.tes_config)
+        tes_log = cwl_tes_processor.get_tes_task_log(
+            tes_id=tes_id,
+            token=self.token,
+        )
+        if not tes_log:
+            self._capture_state(tes_id=tes_id, state=state)
+            return
+
+        with self._lock:
+            self.task_logs[tes_id] = tes_log
+        if self._write(
+            db_utils.replace_tes_task_log,
+            tes_id=tes_id,
+            tes_log=tes_log,
+        ):
+            logger.info(
+                f"TES task '{tes_id}' of run with task ID '{self.task_id}'"
+                f" finished with state '{state}'."
+            )
+
+    def _write(self, func, **kwargs) -> bool:
+        """Apply database update to the TES task logs of the workflow run.
+
+        Args:
+            func: Database utility function to call.
+            **kwargs: Additional keyword arguments to `func`.
+
+        Returns:
+            `True` if the update succeeded, `False` otherwise.
+        """
+        try:
+            func(
+                collection=self.collection,
+                run_id=self.run_id,
+                task_id=self.task_id,
+                **kwargs,
+            )
+        except PyMongoError as exc:
+            logger.exception(
+                f"Database error. Could not record TES task update for task"
+                f" '{self.task_id}'. Original error message:"
+                f" {type(exc).__name__}: {exc}"
+            )
+            return False
+        return True
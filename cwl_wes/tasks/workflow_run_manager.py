@@ -1,32 +1,61 @@
 """Workflow run manager executed on worker."""
 
 from datetime import datetime
+from functools import partial
+import json
 import logging
 import os
+import signal
 import subprocess
+import sys
+import threading
 import time
 from typing import Dict, List, Optional
 
 from foca.models.config import Config
 from pymongo.errors import PyMongoError
 
+from cwl_wes.ga4gh.wes.states import States
 from cwl_wes.tasks.cwl_log_processor import CWLLogProcessor, CWLTesProcessor
+from cwl_wes.tasks.engine_pool import EnginePool, get_engine_pool
+from cwl_wes.tasks.heartbeat import get_heartbeat
+from cwl_wes.tasks.tes_monitor import TESTaskMonitor
 import cwl_wes.utils.db as db_utils
+from cwl_wes.utils import metrics, tracing
+from cwl_wes.utils.input_cache import stage_inputs
+from cwl_wes.utils.run_events import (
+    find_run_events,
+    get_durations,
+    record_run_event,
+)
+from cwl_wes.utils.tes_cancel import cancel_tes_tasks
 from cwl_wes.worker import celery_app
 
+# pragma pylint: disable=too-many-lines
+
 # Get logger instance
 logger = logging.getLogger(__name__)
 
+# Name of the file in the run directory that workflow engine logs are
+# written to
+ENGINE_LOG_FILE = "workflow_engine.log"
+
+# Name of the file in the run directory that TES tasks recorded for an
+# interrupted attempt of the run are written to
+ADOPTABLE_TASKS_FILE = "adoptable_tasks.json"
+
 
-class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
+# pylint: disable-next=too-many-instance-attributes,too-many-public-methods
+class WorkflowRunManager:
     """Workflow run manager."""
 
-    def __init__(
+    def __init__(  # pylint: disable=too-many-arguments
         self,
         command_list: List,
         task: celery_app.Task,
         tmp_dir: str,
         token: Optional[str] = None,
+        reattach: bool = False,
     ) -> None:
         """Initiate workflow run manager instance.
 
@@ -38,48 +67,71 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
             tmp_dir: Current working directory to be passed for child process
                 execution context.
             token: JSON Web Token (JWT).
+            reattach: Whether the run is re-attached to the TES tasks of an
+                interrupted attempt.
             foca_config: :py:class:`foca.models.config.Config` instance
                 describing configurations registered with `celery_app`.
             custom_config: :py:class:`cwl_wes.custom_config.CustomConfig`
                 instance describing custom configuration model for cwl-WES
                 specific configurations.
             collection: Collection client for saving task run progress.
+            collection_task_logs: Collection client for saving TES task
+                logs.
+            collection_events: Collection client for saving run lifecycle
+                events.
+            run_id: Identifier of workflow run.
             tes_config: TES (Task Execution Service) endpoint configurations.
             authorization: Boolean to define the security auth configuration
                 for the app.
             string_format: String time format for task timestamps.
+            trace_context: Context of the Celery task span, which spans of
+                the run are recorded under.
 
         Attributes:
             task: Celery task instance for initiating workflow run.
             task_id: Unique identifier for workflow run task.
+            worker_hostname: Name of the Celery worker executing the run.
             command_list: List of commands to be executed as a part of workflow
                 run.
             tmp_dir: Current working directory to be passed for child process
                 execution context.
             token: JSON Web Token (JWT).
+            reattach: Whether the run is re-attached to the TES tasks of an
+                interrupted attempt.
             foca_config: :py:class:`foca.models.config.Config` instance
                 describing configurations registered with `celery_app`.
             custom_config: :py:class:`cwl_wes.custom_config.CustomConfig`
                 instance describing custom configuration model for cwl-WES
                 specific configurations.
             collection: Collection client for saving task run progress.
+            collection_task_logs: Collection client for saving TES task
+                logs.
+            collection_events: Collection client for saving run lifecycle
+                events.
+            run_id: Identifier of workflow run.
             tes_config: TES (Task Execution Service) endpoint configurations.
             authorization: Boolean to define the security auth configuration
                 for the app.
             string_format: String time format for task timestamps.
+            trace_context: Context of the Celery task span, which spans of
+                the run are recorded under.
         """
         self.task = task
         self.task_id = self.task.request.id
+        self.worker_hostname = self.task.request.hostname
         self.command_list = command_list
         self.tmp_dir = tmp_dir
         self.token = token
+        self.reattach = reattach
         self.foca_config: Config = celery_app.conf.foca
         self.controller_config = self.foca_config.custom.controller
-        self.collection = (
-            self.foca_config.db.dbs["cwl-wes-db"].collections["runs"].client
-        )
+        collections = self.foca_config.db.dbs["cwl-wes-db"].collections
+        self.collection = collections["runs"].client
+        self.collection_task_logs = collections["task_logs"].client
+        self.collection_events = collections["run_events"].client
+        self.run_id = self.get_run_id()
         self.tes_config = {
-            "url": self.controller_config.tes_server.url,
+            "url": self.get_tes_url(),
             "query_params": (
                 self.controller_config.tes_server.status_query_params
             ),
@@ -87,18 +139,80 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
         }
         self.authorization = self.foca_config.security.auth.required
         self.string_format: str = "%Y-%m-%d %H:%M:%S.%f"
+        self.trace_context = tracing.get_context()
+        self.command_list = self.get_command_list()
 
-    def trigger_task_start_events(self) -> None:
-        """Trigger task start events."""
-        if not self.collection.find_one({"task_id": self.task.request.id}):
-            return
+    def get_run_id(self) -> Optional[str]:
+        """Get identifier of the workflow run.
+
+        Returns:
+            Run identifier, or `None` if the run document was not found.
+        """
+        document = self.collection.find_one(
+            filter={"task_id": self.task_id},
+            projection={"run_id": True, "_id": False},
+        )
+        return document["run_id"] if document else None
+
+    def get_tes_url(self) -> str:
+        """Get URL of TES backend the workflow run was routed to.
+
+        Returns:
+            TES endpoint URL.
+        """
+        document = self.collection.find_one(
+            filter={"task_id": self.task_id},
+            projection={"internal.tes_url": True, "_id": False},
+        )
+        if document is None:
+            return self.controller_config.tes_server.url
+        return document.get("internal", {}).get(
+            "tes_url",
+            self.controller_config.tes_server.url,
+        )
+
+    @tracing.traced("run")
+    def trigger_task_start_events(self) -> bool:
+        """Trigger task start events.
+
+        If enabled, heartbeats of the run are recorded from now on and
+        remote input files are staged. For runs that are re-attached, the
+        TES tasks of the interrupted attempt are prepared for adoption by
+        the workflow engine.
+
+        The run is only set to state `RUNNING` if it can still be canceled;
+        runs whose cancellation was requested in the meantime are set to
+        `CANCELED` instead.
+
+        Returns:
+            `True` if the run was started, `False` if no run is associated
+            with the task (anymore), e.g., because the run was re-attached
+            with a new task identifier, or if the run is being canceled; the
+            workflow engine must not be started then.
+        """
+        if not self.collection.find_one({"task_id": self.task_id}):
+            logger.warning(
+                f"No run is associated with task ID '{self.task_id}'. Not"
+                " starting workflow engine."
+            )
+            return False
+        if self.reattach:
+            self.prepare_reattachment()
         internal = {}
         current_ts = time.time()
         internal["task_started"] = datetime.utcfromtimestamp(current_ts)
+        self.record_event(
+            event="worker_started",
+            timestamp=internal["task_started"],
+            state="RUNNING",
+            worker_hostname=self.worker_hostname,
+            reattach=self.reattach,
+        )
         # Update run document in database
         try:
-            self.update_run_document(
+            document = self.update_run_document(
                 state="RUNNING",
+                current_states=States.CANCELABLE,
                 internal=internal,
                 task_started=datetime.utcfromtimestamp(current_ts).strftime(
                     self.string_format
@@ -111,6 +225,104 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
                 f" {type(exc).__name__}: {exc}"
             )
             raise
+        if document is None:
+            self.complete_cancellation()
+            return False
+        reconciler_config = self.controller_config.reconciler
+        if reconciler_config.enabled:
+            get_heartbeat(
+                collection=self.collection,
+                interval=reconciler_config.heartbeat_interval,
+            ).register(task_id=self.task_id)
+        if self.foca_config.custom.storage.input_cache.enabled:
+            self.stage_inputs()
+        return True
+
+    def complete_cancellation(self) -> None:
+        """Cancel run whose cancellation was requested before it started."""
+        document = db_utils.update_run_state(
+            collection=self.collection,
+            task_id=self.task_id,
+            state="CANCELED",
+            current_states=["CANCELING"],
+        )
+        if document is None:
+            logger.warning(
+                f"Run '{self.run_id}' (task id: '{self.task_id}') cannot be"
+                " started from its current state. Not starting workflow"
+                " engine."
+            )
+            return
+        task_finished = datetime.utcnow()
+        db_utils.upsert_fields_in_root_object(
+            collection=self.collection,
+            task_id=self.task_id,
+            root="internal",
+            task_finished=task_finished,
+        )
+        self.record_event(
+            event="finished",
+            timestamp=task_finished,
+            state="CANCELED",
+        )
+        logger.info(
+            f"Run '{self.run_id}' (task id: '{self.task_id}') was canceled"
+            " before its workflow engine was started."
+        )
+
+    @tracing.traced("run")
+    def stage_inputs(self) -> None:
+        """Stage remote input files via the input cache.
+
+        Workflow parameters are rewritten to point at the cached copies;
+        cache hits, misses and bytes saved are recorded with the run, as are
+        the digests of the cached copies, which keeps them from being
+        evicted while the run is unfinished.
+        """
+        document = self.collection.find_one(
+            filter={"task_id": self.task_id},
+            projection={
+                "internal.param_file_path": True,
+                "internal.executor": True,
+                "_id": False,
+            },
+        )
+        internal = document.get("internal", {})
+        if "param_file_path" not in internal:
+            return
+        input_cache_config = self.foca_config.custom.storage.input_cache
+        collections = self.foca_config.db.dbs["cwl-wes-db"].collections
+        counts, digests = stage_inputs(
+            param_file_path=internal["param_file_path"],
+            config=input_cache_config,
+            entries=collections["input_cache"].client,
+            stats=collections["input_cache_stats"].client,
+            base_url=(
+                None
+                if internal.get("executor") == "local"
+                else input_cache_config.base_url
+            ),
+        )
+        self.record_event(event="inputs_staged", **counts)
+        logger.info(
+            f"Staged inputs of task '{self.task_id}': {counts['hits']} cache"
+            f" hits, {counts['misses']} misses, {counts['failures']}"
+            f" failures; {counts['bytes_saved']} bytes saved."
+        )
+        try:
+            db_utils.upsert_fields_in_root_object(
+                collection=self.collection,
+                task_id=self.task_id,
+                root="internal",
+                input_staging=counts,
+                input_digests=digests,
+            )
+        except PyMongoError as exc:
+            logger.exception(
+                "Database error. Could not record input staging of task"
+                f" '{self.task_id}'. Original error message:"
+                f" {type(exc).__name__}: {exc}"
+            )
 
     def trigger_task_failure_events(self, task_end_ts):
         """Trigger task failure events.
@@ -127,9 +339,19 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
         task_meta_data = celery_app.AsyncResult(id=self.task_id)
         internal["traceback"] = task_meta_data.traceback
 
+        # Runs terminated because of cancellation are not failed
+        state = "SYSTEM_ERROR"
+        if self.is_canceled():
+            state = "CANCELED"
+        self.record_event(
+            event="finished",
+            timestamp=internal["task_finished"],
+            state=state,
+        )
+
         # Update run document in databse
         self.update_run_document(
-            state="SYSTEM_ERROR",
+            state=state,
             internal=internal,
             task_finished=datetime.utcfromtimestamp(task_end_ts).strftime(
                 self.string_format
@@ -137,6 +359,190 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
             exception=task_meta_data.result,
         )
 
+    def stop_heartbeat(self) -> None:
+        """Stop recording heartbeats of the run, if enabled."""
+        reconciler_config = self.controller_config.reconciler
+        if reconciler_config.enabled:
+            get_heartbeat(
+                collection=self.collection,
+                interval=reconciler_config.heartbeat_interval,
+            ).unregister(task_id=self.task_id)
+
+    def handle_worker_shutdown(self, recoverable: bool) -> None:
+        """Record that supervision of the run ended with its worker process.
+
+        The workflow engine is expected to be killed already.
+
+        Args:
+            recoverable: Whether orphaned runs are re-attached by the
+                reconciler. If so, the run is left in its state and
+                re-attached to its TES tasks once its heartbeat is
+                missing; otherwise, its TES tasks are canceled and the run
+                is set to `SYSTEM_ERROR`.
+        """
+        self.stop_heartbeat()
+        self.unregister_engine_process()
+        self.record_event(event="worker_shutdown", recoverable=recoverable)
+        if recoverable:
+            logger.warning(
+                f"Run '{self.run_id}' (task id: '{self.task_id}') interrupted"
+                " by worker shutdown. Leaving run to the reconciler."
+            )
+            return
+        logger.error(
+            f"Run '{self.run_id}' (task id: '{self.task_id}') interrupted by"
+            " worker shutdown. Canceling its TES tasks; enable the"
+            " reconciler to recover interrupted runs."
+        )
+        self.cancel_tes_tasks()
+        self.trigger_task_failure_events(task_end_ts=time.time())
+
+    def cancel_tes_tasks(self) -> None:
+        """Cancel TES tasks of the run, e.g., after its engine was killed.
+
+        TES tasks of the current attempt and of interrupted attempts it
+        re-attached to are canceled.
+        """
+        document = self.collection.find_one(
+            filter={"task_id": self.task_id},
+            projection={"internal.orphaned_task_ids": True, "_id": False},
+        )
+        task_ids = [self.task_id]
+        if document is not None:
+            task_ids += document.get("internal", {}).get(
+                "orphaned_task_ids", []
+            )
+        cancel_tes_tasks(
+            url=self.tes_config["url"],
+            tes_ids=db_utils.find_tes_task_ids(
+                collection=self.collection_task_logs,
+                run_id=self.run_id,
+                task_ids=task_ids,
+            ),
+            timeout=self.tes_config["timeout"],
+            token=self.token,
+        )
+
+    def prepare_reattachment(self) -> None:
+        """Write TES tasks of interrupted attempt for adoption by engine.
+
+        The current `FULL` view of each recorded TES task is requested, so
+        that only tasks that are still running or have completed are
+        adopted.
+        """
+        document = self.collection.find_one(
+            filter={"task_id": self.task_id},
+            projection={
+                "internal.orphaned_task_logs": True,
+                "internal.orphaned_task_ids": True,
+                "_id": False,
+            },
+        )
+        internal = document.get("internal", {})
+        task_logs, _ = db_utils.find_tes_task_logs(
+            collection=self.collection_task_logs,
+            run_id=self.run_id,
+            task_ids=internal.get("orphaned_task_ids", []),
+        )
+        # Task logs recorded with the run document by earlier versions
+        task_logs = internal.get("orphaned_task_logs", []) + task_logs
+        cwl_tes_processor = CWLTesProcessor(
+            tes_config={**self.tes_config, "query_params": "FULL"},
+        )
+        tasks = []
+        for task_log in task_logs:
+            if "id" not in task_log:
+                continue
+            tasks.append(
+                cwl_tes_processor.get_tes_task_log(
+                    tes_id=task_log["id"],
+                    token=self.token,
+                )
+                or task_log
+            )
+        with open(
+            os.path.join(self.tmp_dir, ADOPTABLE_TASKS_FILE),
+            mode="w",
+            encoding="utf-8",
+        ) as _file:
+            json.dump(tasks, _file, default=str)
+        logger.info(
+            f"Run with task ID '{self.task_id}' re-attaching to"
+            f" {len(tasks)} recorded TES tasks."
+        )
+
+    def is_canceled(self) -> bool:
+        """Check whether cancellation of the workflow run was requested.
+
+        Returns:
+            `True` if the run is being or was canceled, `False` otherwise.
+        """
+        document = self.collection.find_one(
+            filter={"task_id": self.task_id},
+            projection={
+                "api.state": True,
+                "_id": False,
+            },
+        )
+        return bool(document) and document["api"]["state"] in [
+            "CANCELING",
+            "CANCELED",
+        ]
+
+    def register_engine_process(self, pgid: int) -> None:
+        """Record process group of workflow engine for cancellation.
+
+        If cancellation was requested before the process group could be
+        recorded, the workflow engine is terminated right away.
+
+        Args:
+            pgid: Process group identifier of workflow engine.
+        """
+        try:
+            document = db_utils.upsert_fields_in_root_object(
+                collection=self.collection,
+                task_id=self.task_id,
+                root="internal",
+                worker_hostname=self.worker_hostname,
+                engine_pgid=pgid,
+            )
+        except PyMongoError as exc:
+            logger.exception(
+                "Database error. Could not record workflow engine process"
+                f" for task '{self.task_id}'. Original error message:"
+                f" {type(exc).__name__}: {exc}"
+            )
+            return
+        if document and "cancel_requested" in document.get("internal", {}):
+            logger.info(
+                f"Run with task ID '{self.task_id}' was canceled while"
+                " starting. Terminating workflow engine."
+            )
+            terminate_process_group(pgid=pgid)
+
+    def unregister_engine_process(self) -> None:
+        """Remove process group of exited workflow engine from run document.
+
+        Process group identifiers are reused once the workflow engine has
+        exited, so they must not be killed on cancellation anymore.
+        """
+        try:
+            self.collection.update_one(
+                {"task_id": self.task_id},
+                {
+                    "$unset": {
+                        "internal.engine_pgid": "",
+                        "internal.worker_hostname": "",
+                    }
+                },
+            )
+        except PyMongoError as exc:
+            logger.exception(
+                "Database error. Could not remove workflow engine process"
+                f" for task '{self.task_id}'. Original error message:"
+                f" {type(exc).__name__}: {exc}"
+            )
+
     def trigger_task_success_events(  # pylint: disable=too-many-arguments
         self,
         returncode: int,
@@ -144,6 +550,9 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
         tes_ids: List[str],
         token: str,
         task_end_ts: float,
+        task_logs: Optional[List[Dict]] = None,
+        outputs: Optional[Dict] = None,
+        log_path: Optional[str] = None,
     ) -> None:
         """Trigger task success events.
 
@@ -153,6 +562,9 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
             tes_ids: TES task identifiers.
             token: TES token.
             task_end_ts: Task end timestamp.
+            task_logs: TES task logs; fetched from TES if not provided.
+            outputs: Workflow outputs; parsed from the log if not provided.
+            log_path: Path to file containing the full task run log.
         """
         if not self.collection.find_one({"task_id": self.task_id}):
             return
@@ -164,16 +576,11 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
         # Create dictionary for internal parameters
         internal = {}
         internal["task_finished"] = datetime.utcfromtimestamp(task_end_ts)
+        if log_path is not None:
+            internal["stdout_path"] = log_path
 
         # Set final state to be set
-        document = self.collection.find_one(
-            filter={"task_id": self.task_id},
-            projection={
-                "api.state": True,
-                "_id": False,
-            },
-        )
-        if document and document["api"]["state"] == "CANCELING":
+        if self.is_canceled():
             state = "CANCELED"
         elif returncode:
             state = "EXECUTOR_ERROR"
@@ -182,13 +589,20 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
 
         # Extract run outputs
         cwl_tes_processor = CWLTesProcessor(tes_config=self.tes_config)
-        outputs = cwl_tes_processor.cwl_tes_outputs_parser_list(log=log_list)
+        if outputs is None:
+            outputs = cwl_tes_processor.cwl_tes_outputs_parser_list(
+                log=log_list
+            )
+
+        self.record_event(event="outputs_parsed")
+        self.record_event(event="finished", state=state)
 
         # Get task logs
-        task_logs = cwl_tes_processor.get_tes_task_logs(
-            tes_ids=tes_ids,
-            token=token,
-        )
+        if task_logs is None:
+            task_logs = cwl_tes_processor.get_tes_task_logs(
+                tes_ids=tes_ids,
+                token=token,
+            )
 
         # Update run document in database
         try:
@@ -212,12 +626,15 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
             )
             raise
 
-    def trigger_task_end_events(
+    def trigger_task_end_events(  # pylint: disable=too-many-arguments
         self,
         returncode: int,
         log: str,
         tes_ids: List[str],
         token: str,
+        task_logs: Optional[List[Dict]] = None,
+        outputs: Optional[Dict] = None,
+        log_path: Optional[str] = None,
     ) -> None:
         """Trigger task completion events.
 
@@ -226,7 +643,9 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
             log: Task run log.
             tes_ids: TES task identifiers.
             token: TES token.
-            task_end_ts: Task end timestamp.
+            task_logs: TES task logs; fetched from TES if not provided.
+            outputs: Workflow outputs; parsed from the log if not provided.
+            log_path: Path to file containing the full task run log.
         """
         task_end_ts = time.time()
         if returncode == 0:
@@ -236,13 +655,18 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
                 token=token,
                 task_end_ts=task_end_ts,
                 returncode=returncode,
+                task_logs=task_logs,
+                outputs=outputs,
+                log_path=log_path,
             )
         else:
             self.trigger_task_failure_events(task_end_ts=task_end_ts)
 
-    def update_run_document(  # pylint: disable=too-many-branches
+    # pylint: disable-next=too-many-arguments,too-many-branches
+    def update_run_document(
         self,
         state: Optional[str] = None,
+        current_states: Optional[List[str]] = None,
         internal: Optional[Dict] = None,
         outputs: Optional[Dict] = None,
         task_logs: Optional[List[Dict]] = None,
@@ -255,12 +679,20 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
 
         Args:
             state: Task state.
+            current_states: States the run may be in for its state to be
+                updated; any state if not set.
             internal: Task specific internal parameters.
             outputs: Task specific output parameters.
             task_logs: Task run logs.
             **run_log_params: Run log parameters.
+
+        Returns:
+            Updated document, or `None` if the state was to be updated but
+            the run was not in one of `current_states`.
         """
         # TODO: Minimize db ops; try to compile entire object & update once
+        document = None
+
         # Update internal parameters
         if internal:
             document = db_utils.upsert_fields_in_root_object(
@@ -281,11 +713,11 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
 
         # Update task logs
         if task_logs:
-            document = db_utils.upsert_fields_in_root_object(
-                collection=self.collection,
+            db_utils.upsert_tes_task_logs(
+                collection=self.collection_task_logs,
+                run_id=self.run_id,
                 task_id=self.task_id,
-                root="api",
-                task_logs=task_logs,
+                tes_logs=task_logs,
             )
 
         # Update run log parameters
@@ -297,27 +729,18 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
                 **run_log_params,
             )
 
-        # Calculate queue, execution and run time
-        if document and document["internal"]:
-            run_log = document["internal"]
-            durations = {}
-
-            if "task_started" in run_log_params:
-                if "task_started" in run_log and "task_received" in run_log:
-                    durations["time_queue"] = (
-                        run_log["task_started"] - run_log["task_received"]
-                    ).total_seconds()
-
-            if "task_finished" in run_log_params:
-                if "task_finished" in run_log and "task_started" in run_log:
-                    durations["time_execution"] = (
-                        run_log["task_finished"] - run_log["task_started"]
-                    ).total_seconds()
-                if "task_finished" in run_log and "task_received" in run_log:
-                    durations["time_total"] = (
-                        run_log["task_finished"] - run_log["task_received"]
-                    ).total_seconds()
-
+        # Calculate durations between milestones of the run
+        if (
+            "task_started" in run_log_params
+            or "task_finished" in run_log_params
+        ):
+            durations = get_durations(
+                events=find_run_events(
+                    collection=self.collection_events,
+                    run_id=self.run_id,
+                    task_id=self.task_id,
+                )
+            )
             if durations:
                 document = db_utils.upsert_fields_in_root_object(
                     collection=self.collection,
@@ -325,6 +748,12 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
                     root="api.run_log",
                     **durations,
                 )
+            if "task_finished" in run_log_params:
+                for name, seconds in durations.items():
+                    metrics.RUN_DURATION.labels(
+                        phase=name[len("time_") :],  # noqa: E203
+                        state=state,
+                    ).observe(seconds)
 
         # Update state
         if state:
@@ -333,6 +762,7 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
                     collection=self.collection,
                     task_id=self.task_id,
                     state=state,
+                    current_states=current_states,
                 )
             except PyMongoError as exc:
                 logger.exception(
@@ -351,26 +781,397 @@ class WorkflowRunManager:  # pylint: disable=too-many-instance-attributes
 
         return document
 
-    def run_workflow(self):
-        """Initiate workflow run."""
-        self.trigger_task_start_events()
-        proc = subprocess.Popen(  # pylint: disable=consider-using-with
-            self.command_list,
-            cwd=self.tmp_dir,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
+    def get_tes_monitor(self) -> Optional[TESTaskMonitor]:
+        """Get TES task monitor for workflow run, if enabled.
+
+        Returns:
+            TES task monitor, or `None` if monitoring is disabled.
+        """
+        monitor_config = self.controller_config.tes_server.monitor
+        if not monitor_config.enabled:
+            return None
+        return TESTaskMonitor(
+            tes_config=self.tes_config,
+            collection=self.collection_task_logs,
+            run_id=self.run_id,
+            task_id=self.task_id,
+            token=self.token,
+            poll_interval=monitor_config.poll_interval,
+            page_size=monitor_config.page_size,
+            name_prefix=monitor_config.name_prefix,
+            max_pages=monitor_config.max_pages,
         )
-        # Parse output in real-time
-        cwl_log_processor = CWLLogProcessor(
-            tes_config=self.tes_config, collection=self.collection
+
+    def get_log_processor(
+        self,
+        monitor: Optional[TESTaskMonitor] = None,
+    ) -> CWLLogProcessor:
+        """Get log processor for workflow run.
+
+        Args:
+            monitor: TES task monitor for workflow run, if enabled.
+
+        Returns:
+            Log processor instance.
+        """
+        step_cache_config = self.foca_config.custom.storage.step_cache
+        return CWLLogProcessor(
+            tes_config=self.tes_config,
+            collection=self.collection_task_logs,
+            run_id=self.run_id,
+            task_id=self.task_id,
+            monitor=monitor,
+            structured=self.uses_engine_events(),
+            log_path=os.path.join(self.tmp_dir, ENGINE_LOG_FILE),
+            tail_lines=self.foca_config.custom.storage.log_tail_lines,
+            cache_dir=(
+                str(step_cache_config.cache_dir)
+                if step_cache_config.enabled
+                else None
+            ),
         )
-        log, tes_ids = cwl_log_processor.process_cwl_logs(
-            self.task,
-            stream=proc.stdout,
-            token=self.token,
+
+    def uses_engine_events(self) -> bool:
+        """Check whether structured workflow engine events are used.
+
+        Re-attached runs always use engine events, as recorded TES tasks
+        are adopted via the engine event channel.
+
+        Returns:
+            `True` if TES task and output events are obtained from
+            structured engine events, `False` if they are scraped from logs.
+        """
+        return (
+            self.controller_config.engine_events or self.reattach
+        ) and self.command_list[0] == "cwl-tes"
+
+    def get_command_list(self) -> List[str]:
+        """Get workflow engine command with the options the worker requires.
+
+        Debug logs are only required if TES task events are scraped from the
+        logs.
+
+        Returns:
+            Command list.
+        """
+        if (
+            self.command_list[0] != "cwl-tes"
+            or self.uses_engine_events()
+            or "--debug" in self.command_list
+        ):
+            return self.command_list
+        return self.command_list[:1] + ["--debug"] + self.command_list[1:]
+
+    def get_engine_command(self, event_fd: int) -> List[str]:
+        """Get command for running workflow engine with event channel.
+
+        Args:
+            event_fd: File descriptor the engine writes events to.
+
+        Returns:
+            Command list.
+        """
+        command_list = [
+            sys.executable,
+            "-m",
+            "cwl_wes.tasks.engine_launcher",
+            "--event-fd",
+            str(event_fd),
+        ]
+        if self.reattach:
+            command_list += [
+                "--adopt-tasks",
+                os.path.join(self.tmp_dir, ADOPTABLE_TASKS_FILE),
+            ]
+        return command_list + ["--"] + self.command_list[1:]
+
+    def process_engine_events(
+        self,
+        event_fd: int,
+        cwl_log_processor: CWLLogProcessor,
+    ) -> None:
+        """Read and process JSON line events until end of stream.
+
+        Args:
+            event_fd: File descriptor to read events from; closed when done.
+            cwl_log_processor: Log processor of workflow run.
+        """
+        with os.fdopen(event_fd, encoding="utf-8") as events:
+            for line in events:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring malformed engine event: {line}")
+                    continue
+                cwl_log_processor.process_engine_event(
+                    event=event,
+                    token=self.token,
+                )
+
+    @tracing.traced("run")
+    def finalize_workflow_run(
+        self,
+        returncode: int,
+        cwl_log_processor: CWLLogProcessor,
+        monitor: Optional[TESTaskMonitor] = None,
+    ) -> None:
+        """Stop monitoring and trigger task completion events.
+
+        Args:
+            returncode: Return code of workflow engine process.
+            cwl_log_processor: Log processor of workflow run.
+            monitor: TES task monitor for workflow run, if enabled.
+        """
+        self.stop_heartbeat()
+        self.unregister_engine_process()
+        task_logs = None
+        if monitor is not None:
+            monitor.stop()
+            task_logs = monitor.get_task_logs()
+        cwl_log_processor.close()
+        self.record_tes_milestones(
+            cwl_log_processor=cwl_log_processor,
+            monitor=monitor,
         )
-        returncode = proc.wait()
+        outputs = None
+        if returncode == 0:
+            outputs = cwl_log_processor.get_outputs()
         self.trigger_task_end_events(
-            token=self.token, returncode=returncode, log=log, tes_ids=tes_ids
+            token=self.token,
+            returncode=returncode,
+            log=list(cwl_log_processor.log_tail),
+            tes_ids=list(cwl_log_processor.tes_states.keys()),
+            task_logs=task_logs,
+            outputs=outputs,
+            log_path=cwl_log_processor.log_path,
+        )
+
+        # Free capacity for held runs
+        if self.controller_config.dispatcher.enabled:
+            celery_app.send_task("tasks.dispatch_runs")
+
+        # Keep step cache within size limit
+        if self.foca_config.custom.storage.step_cache.enabled:
+            celery_app.send_task("tasks.evict_step_cache")
+
+    def record_event(
+        self,
+        event: str,
+        timestamp: Optional[datetime] = None,
+        **kwargs,
+    ) -> None:
+        """Append event to the lifecycle event log of the workflow run.
+
+        Args:
+            event: Name of the event.
+            timestamp: Time of the event; defaults to the current time.
+            **kwargs: Additional keyword arguments to
+                :py:func:`cwl_wes.utils.run_events.record_run_event`.
+        """
+        if self.run_id is None:
+            return
+        record_run_event(
+            collection=self.collection_events,
+            run_id=self.run_id,
+            task_id=self.task_id,
+            event=event,
+            timestamp=timestamp,
+            **kwargs,
+        )
+
+    def record_tes_milestones(
+        self,
+        cwl_log_processor: CWLLogProcessor,
+        monitor: Optional[TESTaskMonitor] = None,
+    ) -> None:
+        """Record when the first and the last TES task were reported.
+
+        Args:
+            cwl_log_processor: Log processor of workflow run.
+            monitor: TES task monitor for workflow run, if enabled.
+        """
+        first = cwl_log_processor.first_tes_update
+        if first is None:
+            return
+        last = max(
+            update
+            for update in [
+                cwl_log_processor.last_tes_update,
+                monitor.last_tes_update if monitor is not None else None,
+            ]
+            if update is not None
+        )
+        self.record_event(
+            event="first_tes_task",
+            timestamp=first,
+            tes_tasks=len(cwl_log_processor.tes_states),
+        )
+        self.record_event(event="last_tes_task", timestamp=last)
+
+    def get_engine_pool(self) -> Optional[EnginePool]:
+        """Get workflow engine pool, if enabled and applicable.
+
+        Re-attached runs are always started as a subprocess.
+
+        Returns:
+            Engine pool instance, or `None` if the workflow engine is to be
+            started as a subprocess.
+        """
+        pool_config = self.foca_config.custom.celery.engine_pool
+        if (
+            not pool_config.enabled
+            or self.reattach
+            or self.command_list[0] != "cwl-tes"
+        ):
+            return None
+        return get_engine_pool(
+            processes=pool_config.processes,
+            max_runs_per_process=pool_config.max_runs_per_process,
+        )
+
+    def trace_run(self):
+        """Record span of workflow run under the Celery task span.
+
+        Returns:
+            Context manager making the span the current span.
+        """
+        return tracing.span(
+            "run.workflow",
+            context=self.trace_context,
+            run_id=self.run_id,
+            task_id=self.task_id,
+            reattach=self.reattach,
         )
+
+    def run_workflow(self):
+        """Initiate workflow run."""
+        if not self.trigger_task_start_events():
+            return
+        monitor = self.get_tes_monitor()
+        if monitor is not None:
+            monitor.start()
+        cwl_log_processor = self.get_log_processor(monitor=monitor)
+        pool = self.get_engine_pool()
+
+        # Run engine in pool and parse log events in real-time
+        if pool is not None:
+            timeout = self.foca_config.custom.controller.timeout_run_workflow
+            try:
+                returncode = pool.run(
+                    args=self.command_list[1:],
+                    cwd=self.tmp_dir,
+                    on_event=partial(
+                        self._process_pool_event,
+                        cwl_log_processor=cwl_log_processor,
+                    ),
+                    env=tracing.get_env_vars(),
+                    on_start=self.register_engine_process,
+                    timeout=timeout,
+                )
+            except subprocess.TimeoutExpired:
+                logger.warning(
+                    f"Run with task ID '{self.task_id}' timed out after"
+                    f" {timeout} seconds. Workflow engine terminated;"
+                    " canceling its TES tasks."
+                )
+                returncode = -signal.SIGKILL
+                self.cancel_tes_tasks()
+
+        # Or run engine as subprocess with event channel
+        elif cwl_log_processor.structured:
+            read_fd, write_fd = os.pipe()
+            proc = subprocess.Popen(  # pylint: disable=consider-using-with
+                self.get_engine_command(event_fd=write_fd),
+                cwd=self.tmp_dir,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                pass_fds=(write_fd,),
+                start_new_session=True,
+                env={**os.environ, **tracing.get_env_vars()},
+            )
+            os.close(write_fd)
+            self.register_engine_process(pgid=proc.pid)
+            event_thread = threading.Thread(
+                target=partial(
+                    tracing.call_in_context,
+                    tracing.get_context(),
+                    self.process_engine_events,
+                ),
+                kwargs={
+                    "event_fd": read_fd,
+                    "cwl_log_processor": cwl_log_processor,
+                },
+                daemon=True,
+            )
+            event_thread.start()
+            cwl_log_processor.process_cwl_logs(
+                stream=proc.stdout,
+                token=self.token,
+            )
+            returncode = proc.wait()
+            event_thread.join()
+
+        # Or run engine as subprocess and parse output in real-time
+        else:
+            proc = subprocess.Popen(  # pylint: disable=consider-using-with
+                self.command_list,
+                cwd=self.tmp_dir,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                start_new_session=True,
+                env={**os.environ, **tracing.get_env_vars()},
+            )
+            self.register_engine_process(pgid=proc.pid)
+            cwl_log_processor.process_cwl_logs(
+                stream=proc.stdout,
+                token=self.token,
+            )
+            returncode = proc.wait()
+
+        self.finalize_workflow_run(
+            returncode=returncode,
+            cwl_log_processor=cwl_log_processor,
+            monitor=monitor,
+        )
+
+    def _process_pool_event(
+        self,
+        event: Dict,
+        cwl_log_processor: CWLLogProcessor,
+    ) -> None:
+        """Process log or engine event received from engine pool.
+
+        Args:
+            event: Engine pool event.
+            cwl_log_processor: Log processor of workflow run.
+        """
+        if event["type"] != "engine":
+            cwl_log_processor.process_line(
+                line=event["line"],
+                token=self.token,
+            )
+        elif cwl_log_processor.structured:
+            cwl_log_processor.process_engine_event(
+                event=event["event"],
+                token=self.token,
+            )
+
+
+def terminate_process_group(pgid: int) -> bool:
+    """Kill workflow engine and all of its child processes.
+
+    Args:
+        pgid: Process group identifier of workflow engine.
+
+    Returns:
+        `True` if the process group was signaled, `False` if it does not
+        exist (anymore).
+    """
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except ProcessLookupError:
+        return False
+    logger.info(f"Workflow engine process group {pgid} killed.")
+    return True
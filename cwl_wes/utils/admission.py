@@ -0,0 +1,169 @@
+"""Admission control for new workflow runs."""
+
+from datetime import datetime, timedelta
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from flask import Config
+from pymongo.collection import Collection
+
+from cwl_wes.exceptions import TooManyRuns
+from cwl_wes.ga4gh.wes.states import States
+from cwl_wes.worker import celery_app
+
+logger = logging.getLogger(__name__)
+
+# Cached load metrics of the current process, by name
+_METRICS: Dict[str, Tuple[float, int]] = {}
+
+
+def check_admission(config: Config) -> None:
+    """Reject workflow run if configured load thresholds are exceeded.
+
+    Load metrics are cached for a short time, so that a burst of requests
+    does not cause a burst of database and broker queries.
+
+    Args:
+        config: Flask configuration object.
+
+    Raises:
+        TooManyRuns: If a threshold is exceeded. The `Retry-After` header is
+            set to the estimated time until enough runs were started.
+    """
+    admission_conf = config.foca.custom.controller.admission
+    if not admission_conf.enabled:
+        return
+    collection_runs: Collection = (
+        config.foca.db.dbs["cwl-wes-db"].collections["runs"].client
+    )
+
+    # Number of runs by which thresholds are reached; negative if none is
+    excess = -1
+    if admission_conf.max_outstanding_runs is not None:
+        outstanding = _get_metric(
+            name="outstanding_runs",
+            ttl=admission_conf.cache_ttl,
+            func=lambda: collection_runs.count_documents(
+                {"api.state": {"$in": admission_conf.outstanding_states}}
+            ),
+        )
+        excess = max(excess, outstanding - admission_conf.max_outstanding_runs)
+    if admission_conf.max_queue_length is not None:
+        queue_length = _get_metric(
+            name="queue_length",
+            ttl=admission_conf.cache_ttl,
+            func=lambda: get_queue_length(
+                queue=config.foca.custom.celery.routing.run_queue
+            ),
+        )
+        excess = max(excess, queue_length - admission_conf.max_queue_length)
+    if excess < 0:
+        return
+
+    # Estimate time until excess runs were started at the recent start rate
+    started = _get_metric(
+        name="started_runs",
+        ttl=admission_conf.cache_ttl,
+        func=lambda: collection_runs.count_documents(
+            {
+                "internal.task_started": {
+                    "$gte": datetime.utcnow()
+                    - timedelta(seconds=admission_conf.rate_window)
+                }
+            }
+        ),
+    )
+    if started:
+        retry_after = math.ceil(
+            (excess + 1) * admission_conf.rate_window / started
+        )
+    else:
+        retry_after = admission_conf.max_retry_after
+    retry_after = min(
+        max(retry_after, admission_conf.min_retry_after),
+        admission_conf.max_retry_after,
+    )
+    logger.warning(
+        f"Rejecting workflow run: admission threshold exceeded by"
+        f" {excess + 1}. Retry after {retry_after} seconds."
+    )
+    raise TooManyRuns(headers={"Retry-After": str(retry_after)})
+
+
+def check_user_limit(config: Config, user_id: Any) -> None:
+    """Reject workflow run if user has too many unfinished runs.
+
+    Runs are not held for dispatch if authorization is required, so that
+    the per-user limit of the dispatcher is enforced at submission instead.
+
+    Args:
+        config: Flask configuration object.
+        user_id: Identifier of submitting user.
+
+    Raises:
+        TooManyRuns: If the user has reached the maximum number of running
+            runs. The `Retry-After` header is set to the maximum configured
+            for admission control.
+    """
+    dispatcher_conf = config.foca.custom.controller.dispatcher
+    if not dispatcher_conf.enabled or not config.foca.security.auth.required:
+        return
+    collection_runs: Collection = (
+        config.foca.db.dbs["cwl-wes-db"].collections["runs"].client
+    )
+    running = collection_runs.count_documents(
+        {"user_id": user_id, "api.state": {"$in": States.UNFINISHED}}
+    )
+    if running < dispatcher_conf.max_running_runs_per_user:
+        return
+    retry_after = config.foca.custom.controller.admission.max_retry_after
+    logger.warning(
+        f"Rejecting workflow run: user '{user_id}' has {running} unfinished"
+        f" runs. Retry after {retry_after} seconds."
+    )
+    raise TooManyRuns(headers={"Retry-After": str(retry_after)})
+
+
+def get_queue_length(queue: str) -> int:
+    """Get number of messages waiting in broker queue.
+
+    Args:
+        queue: Queue name.
+
+    Returns:
+        Number of messages, or 0 if the queue cannot be inspected.
+    """
+    try:
+        with celery_app.connection_for_write() as connection:
+            return connection.default_channel.queue_declare(
+                queue=queue,
+                passive=True,
+            ).message_count
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning(
+            f"Could not get length of queue '{queue}'. Original error"
+            f" message: {type(exc).__name__}: {exc}"
+        )
+        return 0
+
+
+def _get_metric(name: str, ttl: float, func: Callable[[], int]) -> int:
+    """Get cached load metric; compute if outdated.
+
+    Args:
+        name: Metric name.
+        ttl: Time in seconds for which a computed value is reused.
+        func: Callable computing the metric.
+
+    Returns:
+        Metric value.
+    """
+    now = time.monotonic()
+    cached: Optional[Tuple[float, int]] = _METRICS.get(name)
+    if cached is not None and now - cached[0] < ttl:
+        return cached[1]
+    value = func()
+    _METRICS[name] = (now, value)
+    return value
@@ -0,0 +1,237 @@
+"""Utility functions for the archive of finished workflow runs.
+
+Archived run documents keep their identifiers, state and run directories
+in plain form, so that they can be queried like documents in the `runs`
+collection; heavy fields are stored as a single zlib-compressed BSON blob.
+"""
+
+from datetime import datetime
+import logging
+from typing import Dict, List, Mapping, Optional
+import zlib
+
+import bson
+from bson.binary import Binary
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Name of the field holding compressed fields of archived run documents
+COMPRESSED_FIELD = "compressed"
+
+
+def compress_document(
+    document: Mapping,
+    fields: List[str],
+    level: int = 6,
+) -> Dict:
+    """Compress heavy fields of run document for archival.
+
+    Args:
+        document: Run document.
+        fields: Fields to compress, in dot notation.
+        level: zlib compression level.
+
+    Returns:
+        Archived run document.
+    """
+    archived = _copy(document)
+    heavy = {}
+    for field in fields:
+        parent, key = _resolve(obj=archived, field=field)
+        if parent is not None and key in parent:
+            heavy[field] = parent.pop(key)
+    archived[COMPRESSED_FIELD] = Binary(
+        zlib.compress(bson.encode(heavy), level)
+    )
+    archived["archived_at"] = datetime.utcnow()
+    return archived
+
+
+def decompress_document(
+    document: Mapping,
+    projection: Optional[Mapping] = None,
+) -> Dict:
+    """Restore compressed fields of archived run document.
+
+    Args:
+        document: Archived run document.
+        projection: Projection of the query the document was retrieved
+            with; only requested fields are restored.
+
+    Returns:
+        Run document.
+    """
+    restored = _copy(document)
+    restored.pop("archived_at", None)
+    compressed = restored.pop(COMPRESSED_FIELD, None)
+    if compressed is None:
+        return restored
+    heavy = bson.decode(zlib.decompress(compressed))
+    for field, value in heavy.items():
+        if not _is_projected(field=field, projection=projection):
+            continue
+        obj = restored
+        *parents, key = field.split(".")
+        for parent in parents:
+            obj = obj.setdefault(parent, {})
+        obj[key] = value
+    return restored
+
+
+def find_archived_run(
+    collection: Collection,
+    filter: Mapping,  # pylint: disable=redefined-builtin
+    projection: Optional[Mapping] = None,
+    sort: Optional[List] = None,
+) -> Optional[Dict]:
+    """Find run in archive and restore its compressed fields.
+
+    Args:
+        collection: MongoDB collection of archived runs.
+        filter: Query filter; must not refer to compressed fields.
+        projection: Projection for database query.
+        sort: Sort order of matching runs; the first one is returned.
+
+    Returns:
+        Run document, or `None` if the run is not archived.
+    """
+    if projection is not None and any(projection.values()):
+        projection = {**projection, COMPRESSED_FIELD: True}
+    document = collection.find_one(
+        filter=filter,
+        projection=projection,
+        sort=sort,
+    )
+    if document is None:
+        return None
+    return decompress_document(document=document, projection=projection)
+
+
+def archive_run(
+    collection: Collection,
+    collection_archive: Collection,
+    document: Mapping,
+    fields: List[str],
+    level: int = 6,
+) -> bool:
+    """Move finished run into archive.
+
+    The run is only removed from the `runs` collection if its state did not
+    change while it was archived.
+
+    Args:
+        collection: MongoDB collection of runs.
+        collection_archive: MongoDB collection of archived runs.
+        document: Full run document.
+        fields: Fields to compress, in dot notation.
+        level: zlib compression level.
+
+    Returns:
+        `True` if the run was archived, `False` otherwise.
+    """
+    try:
+        collection_archive.insert_one(
+            compress_document(document=document, fields=fields, level=level)
+        )
+    except DuplicateKeyError:
+        logger.warning(
+            f"Run '{document['run_id']}' is already archived; replacing."
+        )
+        collection_archive.replace_one(
+            {"run_id": document["run_id"]},
+            compress_document(document=document, fields=fields, level=level),
+        )
+    result = collection.delete_one(
+        {"_id": document["_id"], "api.state": document["api"]["state"]}
+    )
+    if result.deleted_count == 0:
+        collection_archive.delete_one({"run_id": document["run_id"]})
+        return False
+    return True
+
+
+def restore_run(
+    collection: Collection,
+    collection_archive: Collection,
+    run_id: str,
+) -> bool:
+    """Move archived run back into the `runs` collection.
+
+    Args:
+        collection: MongoDB collection of runs.
+        collection_archive: MongoDB collection of archived runs.
+        run_id: Workflow run identifier.
+
+    Returns:
+        `True` if the run was restored, `False` if it is not archived.
+    """
+    document = collection_archive.find_one({"run_id": run_id})
+    if document is None:
+        return False
+    try:
+        collection.insert_one(decompress_document(document=document))
+    except DuplicateKeyError:
+        pass
+    collection_archive.delete_one({"_id": document["_id"]})
+    logger.info(f"Restored run '{run_id}' from archive.")
+    return True
+
+
+def _is_projected(field: str, projection: Optional[Mapping]) -> bool:
+    """Check whether field is requested by inclusion projection.
+
+    Args:
+        field: Field in dot notation.
+        projection: Projection for database query.
+
+    Returns:
+        `True` if the field or part of it is requested, `False` otherwise.
+    """
+    included = [
+        key
+        for key, value in (projection or {}).items()
+        if value and key != COMPRESSED_FIELD
+    ]
+    if not included:
+        return True
+    return any(
+        key == field
+        or field.startswith(f"{key}.")
+        or key.startswith(f"{field}.")
+        for key in included
+    )
+
+
+def _resolve(obj: Dict, field: str):
+    """Resolve field in dot notation to parent object and key.
+
+    Args:
+        obj: Document.
+        field: Field in dot notation.
+
+    Returns:
+        Parent object, or `None` if it does not exist, and key.
+    """
+    *parents, key = field.split(".")
+    for parent in parents:
+        obj = obj.get(parent)
+        if not isinstance(obj, dict):
+            return None, key
+    return obj, key
+
+
+def _copy(document: Mapping) -> Dict:
+    """Copy nested dictionaries of document.
+
+    Args:
+        document: Document.
+
+    Returns:
+        Copy of document; values other than dictionaries are shared.
+    """
+    return {
+        key: _copy(value) if isinstance(value, dict) else value
+        for key, value in document.items()
+    }
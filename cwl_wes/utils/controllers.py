@@ -8,6 +8,7 @@ from flask import Config
 from pymongo.collection import Collection
 
 from cwl_wes.exceptions import WorkflowNotFound
+from cwl_wes.utils.archive import find_archived_run
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +21,9 @@ def get_document_if_allowed(
 ) -> Dict:
     """Get document from database, if allowed.
 
+    Runs that are not found in the `runs` collection are looked up in the
+    archive.
+
     Args:
         config: Flask configuration object.
         run_id: Workflow run ID.
@@ -40,6 +44,16 @@ def get_document_if_allowed(
         filter={"run_id": run_id},
         projection=projection,
     )
+    if document is None:
+        document = find_archived_run(
+            collection=(
+                config.foca.db.dbs["cwl-wes-db"]
+                .collections["runs_archive"]
+                .client
+            ),
+            filter={"run_id": run_id},
+            projection=projection,
+        )
 
     if document is None:
         raise WorkflowNotFound
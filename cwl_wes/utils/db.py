@@ -1,28 +1,56 @@
 """Utility functions for database access."""
 
+from datetime import datetime, timedelta
 import logging
-from typing import Any, List, Mapping, Optional
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from uuid import uuid4
 
 from bson.objectid import ObjectId
 from pymongo import collection as Collection
+from pymongo import UpdateOne
 from pymongo.collection import ReturnDocument
-from pymongo.errors import PyMongoError
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from cwl_wes.utils.metrics import timed_db
+from cwl_wes.utils.tracing import traced
 
 # Get logger instance
 logger = logging.getLogger(__name__)
 
 
+@timed_db
+@traced("db")
 def update_run_state(
-    collection: Collection, task_id: str, state: str = "UNKNOWN"
+    collection: Collection,
+    task_id: str,
+    state: str = "UNKNOWN",
+    current_states: Optional[List[str]] = None,
 ) -> Optional[Mapping[Any, Any]]:
-    """Update state of workflow run and returns document."""
+    """Update state of workflow run and returns document.
+
+    Args:
+        collection: MongoDB collection.
+        task_id: Task identifier of workflow run.
+        state: New state of workflow run.
+        current_states: States the run may be in to be updated; any state
+            if not set.
+
+    Returns:
+        Updated document, or `None` if no run with the task identifier is
+        in one of `current_states`.
+    """
+    query: Dict[str, Any] = {"task_id": task_id}
+    if current_states is not None:
+        query["api.state"] = {"$in": current_states}
     return collection.find_one_and_update(
-        {"task_id": task_id},
+        query,
         {"$set": {"api.state": state}},
         return_document=ReturnDocument.AFTER,
     )
 
 
+@timed_db
+@traced("db")
 def upsert_fields_in_root_object(
     collection: Collection, task_id: str, root: str, **kwargs
 ) -> Optional[Mapping[Any, Any]]:
@@ -48,62 +76,187 @@ def upsert_fields_in_root_object(
     )
 
 
-def update_tes_task_state(
-    collection: Collection, task_id: str, tes_id: str, state: str
+@timed_db
+@traced("db")
+def update_tes_task_state(  # pylint: disable=too-many-arguments
+    collection: Collection,
+    run_id: str,
+    task_id: str,
+    tes_id: str,
+    state: str,
 ) -> Optional[Mapping[Any, Any]]:
     """Update field 'state' in TES task log and return updated document.
 
     Args:
-        collection: MongoDB collection.
+        collection: MongoDB collection of TES task logs.
+        run_id: Run identifier.
         task_id: Task identifier of workflow run.
         tes_id: Identifier of TES task.
         state: New state of TES task.
 
     Returns:
-        Updated document, or `None` if database operation failed.
+        Updated document, or `None` if the TES task log was not found.
     """
     return collection.find_one_and_update(
-        {"task_id": task_id, "api.task_logs": {"$elemMatch": {"id": tes_id}}},
-        {"$set": {"api.task_logs.$.state": state}},
+        {"run_id": run_id, "tes_id": tes_id, "task_id": task_id},
+        {"$set": {"log.state": state}},
         return_document=ReturnDocument.AFTER,
     )
 
 
-def append_to_tes_task_logs(
+@timed_db
+@traced("db")
+def replace_tes_task_log(  # pylint: disable=too-many-arguments
     collection: Collection,
+    run_id: str,
     task_id: str,
+    tes_id: str,
     tes_log: Mapping,
 ) -> Optional[Mapping[Any, Any]]:
-    """Append task log to TES task logs.
+    """Replace TES task log and return updated document.
 
     Args:
-        collection: MongoDB collection.
+        collection: MongoDB collection of TES task logs.
+        run_id: Run identifier.
         task_id: Task identifier of workflow run.
-        tes_log: Task log to append.
+        tes_id: Identifier of TES task.
+        tes_log: New task log.
 
     Returns:
-        Updated document, or `None` if database operation failed.
+        Updated document, or `None` if the TES task log was not found.
     """
     return collection.find_one_and_update(
-        {"task_id": task_id},
-        {"$push": {"api.task_logs": tes_log}},
+        {"run_id": run_id, "tes_id": tes_id, "task_id": task_id},
+        {"$set": {"log": tes_log}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+@timed_db
+@traced("db")
+def append_to_tes_task_logs(  # pylint: disable=too-many-arguments
+    collection: Collection,
+    run_id: str,
+    task_id: str,
+    tes_id: str,
+    tes_log: Mapping,
+) -> Optional[Mapping[Any, Any]]:
+    """Add TES task log of workflow run.
+
+    A TES task adopted from an interrupted attempt of the run keeps its
+    position among the task logs but is assigned to the current attempt.
+
+    Args:
+        collection: MongoDB collection of TES task logs.
+        run_id: Run identifier.
+        task_id: Task identifier of workflow run.
+        tes_id: Identifier of TES task.
+        tes_log: Task log to add.
+
+    Returns:
+        Inserted/updated document.
+    """
+    return collection.find_one_and_update(
+        {"run_id": run_id, "tes_id": tes_id},
+        {"$set": {"task_id": task_id, "log": tes_log}},
+        upsert=True,
         return_document=ReturnDocument.AFTER,
     )
 
 
-def find_tes_task_ids(collection: Collection, run_id: str) -> List:
+@timed_db
+@traced("db")
+def upsert_tes_task_logs(
+    collection: Collection,
+    run_id: str,
+    task_id: str,
+    tes_logs: List[Mapping],
+) -> None:
+    """Add or replace multiple TES task logs of workflow run.
+
+    Args:
+        collection: MongoDB collection of TES task logs.
+        run_id: Run identifier.
+        task_id: Task identifier of workflow run.
+        tes_logs: Task logs; logs without TES task identifier are ignored.
+    """
+    updates = [
+        UpdateOne(
+            {"run_id": run_id, "tes_id": tes_log["id"]},
+            {"$set": {"task_id": task_id, "log": tes_log}},
+            upsert=True,
+        )
+        for tes_log in tes_logs
+        if tes_log and "id" in tes_log
+    ]
+    if updates:
+        collection.bulk_write(updates, ordered=False)
+
+
+@timed_db
+@traced("db")
+def find_tes_task_logs(  # pylint: disable=too-many-arguments
+    collection: Collection,
+    run_id: str,
+    task_ids: List[str],
+    page_size: int = 0,
+    page_token: Optional[str] = None,
+) -> Tuple[List[Mapping], str]:
+    """Get page of TES task logs of workflow run.
+
+    Args:
+        collection: MongoDB collection of TES task logs.
+        run_id: Run identifier.
+        task_ids: Task identifiers of the attempts of the workflow run
+            whose TES task logs are requested.
+        page_size: Maximum number of task logs; 0 for no limit.
+        page_token: Token of the page; first page if not set.
+
+    Returns:
+        Task logs in the order the TES tasks were recorded, and the token of
+        the next page; the latter is empty if there is none.
+    """
+    query: Dict[str, Any] = {"run_id": run_id, "task_id": {"$in": task_ids}}
+    if page_token:
+        query["_id"] = {"$gt": ObjectId(page_token)}
+    documents = list(
+        collection.find(query, projection={"log": True})
+        .sort("_id", 1)
+        .limit(page_size)
+    )
+    next_page_token = ""
+    if page_size and len(documents) == page_size:
+        next_page_token = str(documents[-1]["_id"])
+    return [document["log"] for document in documents], next_page_token
+
+
+@timed_db
+@traced("db")
+def find_tes_task_ids(
+    collection: Collection,
+    run_id: str,
+    task_ids: Optional[List[str]] = None,
+) -> List:
     """Get list of TES task ids associated with a run of interest.
 
     Args:
-        collection: MongoDB collection.
+        collection: MongoDB collection of TES task logs.
         run_id: Run identifier.
+        task_ids: Task identifiers of the attempts of the run to consider,
+            e.g., of the current attempt and of interrupted attempts it
+            re-attached to; all attempts if not set.
 
     Returns:
         List of TES task ids.
     """
-    return collection.distinct("api.task_logs.id", {"run_id": run_id})
+    query: Dict[str, Any] = {"run_id": run_id}
+    if task_ids is not None:
+        query["task_id"] = {"$in": task_ids}
+    return collection.distinct("tes_id", query)
 
 
+@timed_db
+@traced("db")
 def set_run_state(
     collection: Collection,
     run_id: str,
@@ -149,6 +302,8 @@ def set_run_state(
             )
 
 
+@timed_db
+@traced("db")
 def find_one_latest(collection: Collection) -> Optional[Mapping[Any, Any]]:
     """Find newest object.
 
@@ -166,6 +321,8 @@ def find_one_latest(collection: Collection) -> Optional[Mapping[Any, Any]]:
         return None
 
 
+@timed_db
+@traced("db")
 def find_id_latest(collection: Collection) -> Optional[ObjectId]:
     """Find identifier of newest object.
 
@@ -176,3 +333,50 @@ def find_id_latest(collection: Collection) -> Optional[ObjectId]:
         return collection.find().sort([("_id", -1)]).limit(1).next()["_id"]
     except StopIteration:
         return None
+
+
+@timed_db
+@traced("db")
+def acquire_lock(
+    collection: Collection, name: str, ttl: float
+) -> Optional[str]:
+    """Acquire named lock that expires after a given time.
+
+    Args:
+        collection: MongoDB collection holding locks.
+        name: Lock name.
+        ttl: Time in seconds after which the lock expires if not released.
+
+    Returns:
+        Owner identifier required to release the lock, or `None` if the lock
+        is held elsewhere.
+    """
+    now = datetime.utcnow()
+    owner = uuid4().hex
+    try:
+        collection.find_one_and_update(
+            {"_id": name, "expires": {"$lt": now}},
+            {
+                "$set": {
+                    "expires": now + timedelta(seconds=ttl),
+                    "owner": owner,
+                }
+            },
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return None
+    return owner
+
+
+@timed_db
+@traced("db")
+def release_lock(collection: Collection, name: str, owner: str) -> None:
+    """Release named lock, unless it expired and was acquired elsewhere.
+
+    Args:
+        collection: MongoDB collection holding locks.
+        name: Lock name.
+        owner: Owner identifier returned when the lock was acquired.
+    """
+    collection.delete_one({"_id": name, "owner": owner})
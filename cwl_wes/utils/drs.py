@@ -16,12 +16,16 @@ from werkzeug.exceptions import (
     InternalServerError,
 )
 
+from cwl_wes.utils import outbound
+from cwl_wes.utils.tracing import traced
+
 # pragma pylint: disable=too-many-arguments
 
 # Get logger instance
 logger = logging.getLogger(__name__)
 
 
+@traced("drs")
 def translate_drs_uris(
     path: str,
     file_types: List[str],
@@ -191,8 +195,17 @@ def get_access_url_from_drs(
 
     # get DRS object
     try:
-        obj = client.get_object(object_id=drs_uri)
-    except (ConnectionError, InvalidResponseError) as exc:
+        obj = outbound.call(
+            drs_uri,
+            client.get_object,
+            object_id=drs_uri,
+            failed=_is_server_error,
+        )
+    except (
+        ConnectionError,
+        InvalidResponseError,
+        outbound.CircuitOpenError,
+    ) as exc:
         logger.error(f"Could not connect to DRS host for DRS URI '{drs_uri}'.")
         raise InternalServerError from exc
     if isinstance(obj, Error):
@@ -227,3 +240,17 @@ def get_access_url_from_drs(
         f"Could not find a supported access URL for DRS URI '{drs_uri}'."
     )
     raise BadRequest
+
+
+def _is_server_error(obj) -> bool:
+    """Check whether DRS response indicates a transient server failure.
+
+    Args:
+        obj: DRS object or error returned by DRS client.
+
+    Returns:
+        `True` for HTTP 429 and 5xx errors, `False` otherwise.
+    """
+    return isinstance(obj, Error) and (
+        obj.status_code == 429 or (obj.status_code or 0) >= 500
+    )
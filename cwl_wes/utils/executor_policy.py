@@ -0,0 +1,272 @@
+"""Selection of the executor of workflow runs."""
+
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from flask import Config
+import yaml
+
+from cwl_wes.custom_config import LocalExecutorConfig
+
+logger = logging.getLogger(__name__)
+
+# Process classes that are executed as a single tool invocation
+TOOL_CLASSES = ["CommandLineTool", "ExpressionTool", "Operation"]
+
+
+def select_executor(config: Config, document: Dict) -> str:
+    """Select executor of workflow run.
+
+    Args:
+        config: Flask configuration object.
+        document: Workflow run document with workflow files in place.
+
+    Returns:
+        `local` if the run is executed with `cwltool` on a local worker,
+        `tes` if its steps are submitted to TES.
+    """
+    local_conf = config.foca.custom.controller.local_executor
+    if not local_conf.enabled:
+        return "tes"
+    tags = document["api"]["request"].get("tags") or {}
+    requested = tags.get(local_conf.tag_key)
+    if requested == "tes" or (local_conf.require_tag and requested != "local"):
+        return "tes"
+    cwl_path = Path(document["internal"]["cwl_path"])
+    try:
+        steps = count_tool_invocations(
+            path=cwl_path,
+            config=local_conf,
+            base_dir=Path(document["internal"]["workflow_files"]),
+        )
+    except (
+        OSError,
+        yaml.YAMLError,
+        KeyError,
+        TypeError,
+        ValueError,
+        RecursionError,
+    ) as exc:
+        logger.info(
+            f"Workflow '{cwl_path}' not eligible for local execution."
+            f" Original error message: {type(exc).__name__}: {exc}"
+        )
+        return "tes"
+    if steps is None or steps > local_conf.max_steps:
+        return "tes"
+    return "local"
+
+
+def count_tool_invocations(
+    path: Path,
+    config: LocalExecutorConfig,
+    base_dir: Optional[Path] = None,
+) -> Optional[int]:
+    """Count tool invocations of workflow and check declared resources.
+
+    Args:
+        path: Path to CWL document.
+        config: Local executor configuration.
+        base_dir: Directory that referenced CWL documents must be located
+            in; defaults to the directory of `path`.
+
+    Returns:
+        Number of tool invocations, or `None` if the workflow scatters
+        steps or declares resources beyond the limits for local execution.
+
+    Raises:
+        ValueError: If the workflow references CWL documents outside of
+            `base_dir` or references itself.
+    """
+    base_dir = (base_dir or path.parent).resolve()
+    path = _confine(path=path, base_dir=base_dir)
+    document = _load(path=path)
+    graph = {}
+    if "$graph" in document:
+        graph = {
+            process["id"].lstrip("#"): process
+            for process in document["$graph"]
+        }
+        document = graph.get("main", document["$graph"][0])
+    return _count(
+        process=document,
+        path=path,
+        graph=graph,
+        config=config,
+        base_dir=base_dir,
+        stack=((path, ""),),
+    )
+
+
+def _count(  # pylint: disable=too-many-arguments
+    process: Dict,
+    path: Path,
+    graph: Dict[str, Dict],
+    config: LocalExecutorConfig,
+    base_dir: Path,
+    stack: Tuple[Tuple[Path, str], ...],
+) -> Optional[int]:
+    """Count tool invocations of CWL process.
+
+    Args:
+        process: CWL process object.
+        path: Path to the CWL document containing the process.
+        graph: Processes of packed CWL document, by identifier.
+        config: Local executor configuration.
+        base_dir: Directory that referenced CWL documents must be located
+            in.
+        stack: References of the processes enclosing the process.
+
+    Returns:
+        Number of tool invocations, or `None` if the process is not
+        eligible for local execution.
+    """
+    if not _within_limits(process=process, config=config):
+        return None
+    if process["class"] in TOOL_CLASSES:
+        return 1
+    steps = process["steps"]
+    if isinstance(steps, dict):
+        steps = list(steps.values())
+    total = 0
+    for step in steps:
+        if "scatter" in step:
+            return None
+        step_process, step_path, reference = _resolve(
+            run=step["run"],
+            path=path,
+            graph=graph,
+            base_dir=base_dir,
+        )
+        if reference in stack:
+            raise ValueError(f"Cyclic reference to '{step['run']}'.")
+        count = _count(
+            process=step_process,
+            path=step_path,
+            graph=graph,
+            config=config,
+            base_dir=base_dir,
+            stack=stack if reference is None else stack + (reference,),
+        )
+        if count is None:
+            return None
+        total += count
+        if total > config.max_steps:
+            return total
+    return total
+
+
+def _resolve(
+    run,
+    path: Path,
+    graph: Dict[str, Dict],
+    base_dir: Path,
+) -> Tuple[Dict, Path, Optional[Tuple[Path, str]]]:
+    """Resolve `run` field of workflow step.
+
+    Args:
+        run: Inline process, reference to packed process or path to CWL
+            document relative to `path`.
+        path: Path to the CWL document containing the step.
+        graph: Processes of packed CWL document, by identifier.
+        base_dir: Directory that referenced CWL documents must be located
+            in.
+
+    Returns:
+        CWL process object, path to the CWL document containing it and
+        the reference it was resolved from, or `None` for inline processes.
+
+    Raises:
+        ValueError: If the referenced CWL document is outside of
+            `base_dir`.
+    """
+    if isinstance(run, dict):
+        return run, path, None
+    if run.startswith("#"):
+        return graph[run.lstrip("#")], path, (path, run.lstrip("#"))
+    run_file, _, fragment = run.partition("#")
+    run_path = _confine(path=path.parent / run_file, base_dir=base_dir)
+    return _load(path=run_path), run_path, (run_path, fragment)
+
+
+def _confine(path: Path, base_dir: Path) -> Path:
+    """Resolve path and ensure it is located in base directory.
+
+    Args:
+        path: Path to CWL document.
+        base_dir: Resolved directory the CWL document must be located in.
+
+    Returns:
+        Resolved path.
+
+    Raises:
+        ValueError: If the path is outside of the base directory.
+    """
+    resolved = path.resolve()
+    if base_dir not in resolved.parents:
+        raise ValueError(
+            f"CWL document '{path}' is outside of directory '{base_dir}'."
+        )
+    return resolved
+
+
+def _within_limits(process: Dict, config: LocalExecutorConfig) -> bool:
+    """Check resources declared by CWL process.
+
+    Resources computed by expressions are not considered within limits.
+
+    Args:
+        process: CWL process object.
+        config: Local executor configuration.
+
+    Returns:
+        `True` if declared resources are within limits, `False` otherwise.
+    """
+    for requirement in _as_list(process.get("requirements")) + _as_list(
+        process.get("hints")
+    ):
+        if requirement.get("class") != "ResourceRequirement":
+            continue
+        for field, limit in [
+            ("coresMin", config.max_cores),
+            ("ramMin", config.max_ram),
+        ]:
+            value = requirement.get(field)
+            if value is None:
+                continue
+            if not isinstance(value, (int, float)) or value > limit:
+                return False
+    return True
+
+
+def _as_list(requirements) -> List[Dict]:
+    """Normalize requirements or hints to list form.
+
+    Args:
+        requirements: Requirements or hints in list or map form.
+
+    Returns:
+        List of requirement objects.
+    """
+    if requirements is None:
+        return []
+    if isinstance(requirements, dict):
+        return [
+            {"class": name, **(value or {})}
+            for name, value in requirements.items()
+        ]
+    return requirements
+
+
+def _load(path: Path) -> Dict:
+    """Load CWL document.
+
+    Args:
+        path: Path to CWL document.
+
+    Returns:
+        CWL document.
+    """
+    with open(path, encoding="utf-8") as _file:
+        return yaml.safe_load(_file)
@@ -0,0 +1,544 @@
+"""Content-addressed staging cache for remote workflow input files.
+
+Input files referenced in workflow parameters by `ftp`, `http` or `https`
+URL are fetched once into a shared cache directory, verified and stored
+under the SHA-256 digest of their content. Cache entries are indexed by URL
+and validator, i.e., the checksum given in the workflow parameters, the ETag
+or the modification time and size reported by the remote host, so that a
+changed remote file is fetched again. Workflow parameters are rewritten to
+point at the cached copies.
+"""
+
+from datetime import datetime
+import fcntl
+import ftplib
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import re
+import shutil
+import tempfile
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, unquote, urlparse
+
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+import requests
+import yaml
+
+from cwl_wes.custom_config import InputCacheConfig
+from cwl_wes.utils import outbound
+
+logger = logging.getLogger(__name__)
+
+# Size of chunks read when fetching files
+CHUNK_SIZE = 2**20
+
+# Suffix of the copy of a parameter file before inputs were staged
+ORIGINAL_SUFFIX = ".unstaged"
+
+# Identifier of the document holding cumulative input cache counters
+STATS_ID = "totals"
+
+# Names of input cache counters
+COUNTERS = ["hits", "misses", "failures", "bytes_saved", "bytes_fetched"]
+
+# Strong ETags that are MD5 digests of the content
+MD5_ETAG = re.compile(r'^"?([0-9a-f]{32})"?$')
+
+
+class InputStagingError(Exception):
+    """Remote input file could not be staged."""
+
+
+def stage_inputs(  # pylint: disable=too-many-arguments
+    param_file_path: Path,
+    config: InputCacheConfig,
+    entries: Collection,
+    stats: Collection,
+    base_url: Optional[str] = None,
+) -> Tuple[Dict[str, int], List[str]]:
+    """Stage remote input files of workflow run and rewrite parameters.
+
+    Input files that cannot be staged keep their original location, so
+    that the workflow engine fetches them itself. The parameter file as it
+    was before staging is kept next to it and used if inputs are staged
+    again, e.g., when the run is resumed.
+
+    Args:
+        param_file_path: Path to workflow parameter file.
+        config: Input cache configuration.
+        entries: MongoDB collection of input cache entries.
+        stats: MongoDB collection of input cache counters.
+        base_url: URL under which the input cache directory is served to the
+            executor; cached copies are referred to by local path if not
+            set.
+
+    Returns:
+        Input cache counters of the run and content digests of the cached
+        copies it refers to.
+    """
+    original_path = Path(f"{param_file_path}{ORIGINAL_SUFFIX}")
+    if not original_path.exists():
+        shutil.copy2(param_file_path, original_path)
+    with open(original_path, encoding="utf-8") as _file:
+        params = yaml.safe_load(_file)
+
+    counts = dict.fromkeys(COUNTERS, 0)
+    digests = set()
+    for file_obj in _iter_remote_files(obj=params, protocols=config.protocols):
+        url = file_obj.get("location", file_obj.get("path"))
+        try:
+            path, hit = stage_input(
+                url=url,
+                checksum=file_obj.get("checksum"),
+                config=config,
+                entries=entries,
+            )
+        except (
+            InputStagingError,
+            OSError,
+            EOFError,
+            ftplib.Error,
+            requests.RequestException,
+            outbound.CircuitOpenError,
+            PyMongoError,
+        ) as exc:
+            _log_staging_failure(url=url, exc=exc)
+            counts["failures"] += 1
+            continue
+        digests.add(path.parent.name)
+        counts["hits" if hit else "misses"] += 1
+        counts[
+            "bytes_saved" if hit else "bytes_fetched"
+        ] += path.stat().st_size
+        file_obj.pop("path", None)
+        file_obj["location"] = _get_location(
+            path=path,
+            cache_dir=config.cache_dir,
+            base_url=base_url,
+        )
+
+    _write_params(path=Path(param_file_path), params=params)
+    try:
+        stats.update_one(
+            {"_id": STATS_ID},
+            {"$inc": counts},
+            upsert=True,
+        )
+    except PyMongoError as exc:
+        logger.exception(
+            "Database error. Could not update input cache counters."
+            f" Original error message: {type(exc).__name__}: {exc}"
+        )
+    return counts, sorted(digests)
+
+
+def stage_input(
+    url: str,
+    checksum: Optional[str],
+    config: InputCacheConfig,
+    entries: Collection,
+) -> Tuple[Path, bool]:
+    """Get cached copy of remote input file; fetch if necessary.
+
+    Concurrent fetches of the same URL are serialized via a lock file in the
+    input cache directory. Entries are keyed on the URL stripped of any
+    credentials it holds.
+
+    Args:
+        url: URL of input file.
+        checksum: CWL checksum of input file (`sha1$<hex digest>`), if
+            given in the workflow parameters.
+        config: Input cache configuration.
+        entries: MongoDB collection of input cache entries.
+
+    Returns:
+        Path to cached copy and whether it was found in the cache.
+
+    Raises:
+        InputStagingError: If the input file provides no validator or fails
+            verification.
+    """
+    remote = _get_remote_validator(url=url, timeout=config.timeout)
+    validator = checksum or remote["validator"]
+    if validator is None:
+        raise InputStagingError(
+            "Remote host provides neither ETag nor modification time and"
+            " size."
+        )
+    key = sanitize_url(url)
+    path = _lookup(
+        url=key,
+        validator=validator,
+        cache_dir=config.cache_dir,
+        entries=entries,
+    )
+    if path is not None:
+        return path, True
+
+    lock_dir = config.cache_dir / ".locks"
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    lock_name = hashlib.sha256(key.encode()).hexdigest()
+    with open(lock_dir / lock_name, mode="a", encoding="utf-8") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            path = _lookup(
+                url=key,
+                validator=validator,
+                cache_dir=config.cache_dir,
+                entries=entries,
+            )
+            if path is not None:
+                return path, True
+            path = _fetch_into_cache(
+                url=url,
+                checksum=checksum,
+                remote=remote,
+                config=config,
+            )
+            entries.update_one(
+                {"url": key, "validator": validator},
+                {
+                    "$set": {
+                        "digest": path.parent.name,
+                        "path": str(path.relative_to(config.cache_dir)),
+                        "size": path.stat().st_size,
+                        "last_used": datetime.utcnow(),
+                    },
+                    "$inc": {"fetches": 1},
+                },
+                upsert=True,
+            )
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    logger.info(f"Staged input file '{key}' into input cache: {path}")
+    return path, False
+
+
+def sanitize_url(url: str) -> str:
+    """Strip credentials from URL.
+
+    Args:
+        url: URL, possibly holding user name and password.
+
+    Returns:
+        URL without user information.
+    """
+    parsed = urlparse(url)
+    if "@" not in parsed.netloc:
+        return url
+    return parsed._replace(netloc=outbound.get_host(url=url)).geturl()
+
+
+def get_stats(entries: Collection, stats: Collection) -> Dict:
+    """Get input cache counters and usage.
+
+    Args:
+        entries: MongoDB collection of input cache entries.
+        stats: MongoDB collection of input cache counters.
+
+    Returns:
+        Cumulative counters, hit rate, and number and total size of cached
+        files.
+    """
+    counts = stats.find_one({"_id": STATS_ID}) or {}
+    result = {name: counts.get(name, 0) for name in COUNTERS}
+    lookups = result["hits"] + result["misses"]
+    result["hit_rate"] = result["hits"] / lookups if lookups else 0.0
+    usage = list(
+        entries.aggregate(
+            [
+                {"$group": {"_id": "$digest", "size": {"$max": "$size"}}},
+                {
+                    "$group": {
+                        "_id": None,
+                        "files": {"$sum": 1},
+                        "size": {"$sum": "$size"},
+                    }
+                },
+            ]
+        )
+    )
+    result["files"] = usage[0]["files"] if usage else 0
+    result["size"] = usage[0]["size"] if usage else 0
+    return result
+
+
+def _iter_remote_files(obj, protocols) -> Iterator[Dict]:
+    """Yield CWL `File` objects with remote location.
+
+    Args:
+        obj: Workflow parameters or part thereof.
+        protocols: URL schemes of remote locations.
+
+    Yields:
+        CWL `File` object.
+    """
+    if isinstance(obj, dict):
+        if obj.get("class") == "File":
+            location = obj.get("location", obj.get("path"))
+            if (
+                isinstance(location, str)
+                and urlparse(location).scheme in protocols
+            ):
+                yield obj
+        for value in obj.values():
+            yield from _iter_remote_files(obj=value, protocols=protocols)
+    elif isinstance(obj, list):
+        for value in obj:
+            yield from _iter_remote_files(obj=value, protocols=protocols)
+
+
+def _log_staging_failure(url: str, exc: Exception) -> None:
+    """Log failure to stage input file without its credentials.
+
+    Args:
+        url: URL of input file.
+        exc: Exception raised while staging the input file.
+    """
+    key = sanitize_url(url)
+    logger.warning(
+        f"Could not stage input file '{key}'; the workflow engine fetches it"
+        " instead. Original error message:"
+        f" {type(exc).__name__}: {str(exc).replace(url, key)}"
+    )
+
+
+def _lookup(
+    url: str,
+    validator: str,
+    cache_dir: Path,
+    entries: Collection,
+) -> Optional[Path]:
+    """Look up cached copy of input file and mark it as used.
+
+    Args:
+        url: URL of input file.
+        validator: Validator of input file.
+        cache_dir: Input cache directory.
+        entries: MongoDB collection of input cache entries.
+
+    Returns:
+        Path to cached copy, or `None` if the input file is not cached.
+    """
+    entry = entries.find_one_and_update(
+        {"url": url, "validator": validator, "path": {"$exists": True}},
+        {"$set": {"last_used": datetime.utcnow()}},
+    )
+    if entry is None:
+        return None
+    path = cache_dir / entry["path"]
+    if not path.is_file():
+        entries.delete_one({"_id": entry["_id"]})
+        return None
+    entries.update_one({"_id": entry["_id"]}, {"$inc": {"hits": 1}})
+    return path
+
+
+def _get_remote_validator(url: str, timeout: float = 30) -> Dict:
+    """Get validator and size of remote input file.
+
+    Args:
+        url: URL of input file.
+        timeout: Timeout in seconds for request.
+
+    Returns:
+        Validator (ETag or modification time and size) and size of input
+        file; either is `None` if the remote host does not report it.
+    """
+    if urlparse(url).scheme == "ftp":
+        with _ftp_connect(url=url, timeout=timeout) as ftp:
+            path = unquote(urlparse(url).path)
+            ftp.voidcmd("TYPE I")
+            size = ftp.size(path)
+            try:
+                modified = ftp.sendcmd(f"MDTM {path}").split()[-1]
+            except ftplib.error_perm:
+                modified = None
+        validator = None
+        if modified is not None and size is not None:
+            validator = f"modified:{modified},size:{size}"
+        return {"validator": validator, "size": size, "etag": None}
+
+    response = outbound.head(url=url, timeout=timeout)
+    headers = response.headers
+    size = headers.get("Content-Length")
+    size = int(size) if size is not None else None
+    validator = None
+    if "ETag" in headers:
+        validator = f"etag:{headers['ETag']}"
+    elif "Last-Modified" in headers and size is not None:
+        validator = f"modified:{headers['Last-Modified']},size:{size}"
+    return {"validator": validator, "size": size, "etag": headers.get("ETag")}
+
+
+def _fetch_into_cache(
+    url: str,
+    checksum: Optional[str],
+    remote: Dict,
+    config: InputCacheConfig,
+) -> Path:
+    """Fetch remote input file, verify it and store it by content digest.
+
+    The file is verified against the size reported by the remote host, the
+    CWL checksum given in the workflow parameters and ETags that are MD5
+    digests of the content.
+
+    Args:
+        url: URL of input file.
+        checksum: CWL checksum of input file, if given.
+        remote: Validator, size and ETag reported by the remote host.
+        config: Input cache configuration.
+
+    Returns:
+        Path to cached copy.
+
+    Raises:
+        InputStagingError: If the fetched file fails verification.
+    """
+    tmp_dir = config.cache_dir / ".tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp_file:
+        tmp_path = Path(tmp_file.name)
+    try:
+        digests = outbound.call(url, _download, url, tmp_path, config.timeout)
+        size = tmp_path.stat().st_size
+        if remote["size"] is not None and size != remote["size"]:
+            raise InputStagingError(
+                f"Size mismatch: expected {remote['size']} bytes, fetched"
+                f" {size} bytes."
+            )
+        if checksum is not None and checksum != f"sha1${digests['sha1']}":
+            raise InputStagingError(
+                f"Checksum mismatch: expected '{checksum}', fetched"
+                f" 'sha1${digests['sha1']}'."
+            )
+        match = MD5_ETAG.match(remote["etag"] or "")
+        if match and match.group(1) != digests["md5"]:
+            raise InputStagingError(
+                f"ETag mismatch: expected MD5 digest '{match.group(1)}',"
+                f" fetched '{digests['md5']}'."
+            )
+        basename = Path(unquote(urlparse(url).path)).name or "input"
+        entry_dir = (
+            config.cache_dir / digests["sha256"][:2] / digests["sha256"]
+        )
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        path = entry_dir / basename
+        if not path.exists():
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        return path
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def _download(url: str, path: Path, timeout: float = 30) -> Dict[str, str]:
+    """Download remote file and compute digests of its content.
+
+    Args:
+        url: URL of file.
+        path: Path to write file to.
+        timeout: Timeout in seconds for connecting and reading.
+
+    Returns:
+        Hex digests of file content, by algorithm.
+    """
+    hashes = {name: hashlib.new(name) for name in ["sha256", "sha1", "md5"]}
+    with open(path, mode="wb") as _file:
+
+        def write(chunk: bytes) -> None:
+            _file.write(chunk)
+            for _hash in hashes.values():
+                _hash.update(chunk)
+
+        _stream(url=url, write=write, timeout=timeout)
+    return {name: _hash.hexdigest() for name, _hash in hashes.items()}
+
+
+def _stream(url: str, write: Callable[[bytes], None], timeout: float) -> None:
+    """Stream content of remote file.
+
+    Args:
+        url: URL of file.
+        write: Callable receiving chunks of content.
+        timeout: Timeout in seconds for connecting and reading.
+    """
+    if urlparse(url).scheme == "ftp":
+        with _ftp_connect(url=url, timeout=timeout) as ftp:
+            ftp.retrbinary(
+                f"RETR {unquote(urlparse(url).path)}",
+                write,
+                blocksize=CHUNK_SIZE,
+            )
+        return
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            write(chunk)
+
+
+def _ftp_connect(url: str, timeout: float) -> ftplib.FTP:
+    """Connect and log in to FTP server.
+
+    Args:
+        url: FTP URL; anonymous login is used if it holds no credentials.
+        timeout: Timeout in seconds for connecting and reading.
+
+    Returns:
+        FTP connection.
+    """
+    parsed = urlparse(url)
+    ftp = ftplib.FTP(timeout=timeout)
+    ftp.connect(host=parsed.hostname, port=parsed.port or 21)
+    ftp.login(
+        user=unquote(parsed.username or "anonymous"),
+        passwd=unquote(parsed.password or ""),
+    )
+    return ftp
+
+
+def _get_location(
+    path: Path,
+    cache_dir: Path,
+    base_url: Optional[str] = None,
+) -> str:
+    """Get location of cached copy as seen by the executor.
+
+    Args:
+        path: Path to cached copy.
+        cache_dir: Input cache directory.
+        base_url: URL under which the input cache directory is served.
+
+    Returns:
+        URL of cached copy.
+    """
+    if base_url is None:
+        return path.resolve().as_uri()
+    relative = path.relative_to(cache_dir).as_posix()
+    return f"{base_url.rstrip('/')}/{quote(relative)}"
+
+
+def _write_params(path: Path, params: Dict) -> None:
+    """Atomically replace workflow parameter file.
+
+    Args:
+        path: Path to workflow parameter file.
+        params: Workflow parameters.
+    """
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, mode="w", encoding="utf-8") as _file:
+        if path.suffix == ".json":
+            json.dump(params, _file, indent=2)
+        else:
+            yaml.safe_dump(
+                params,
+                _file,
+                allow_unicode=True,
+                default_flow_style=False,
+            )
+    os.replace(tmp_path, path)
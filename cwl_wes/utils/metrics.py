@@ -0,0 +1,453 @@
+"""Prometheus metrics of the API and of the Celery workers.
+
+Metrics are collected in every process. If enabled, they are exposed by the
+API at the configured path and by an exporter on each Celery worker. The
+numbers of unfinished runs and of queued run tasks are only reported by the
+API, as they are obtained from the database and the broker at scrape time.
+
+Processes forked by Gunicorn or Celery only report aggregated metrics if
+the environment variable `PROMETHEUS_MULTIPROC_DIR` points to a directory
+writable by all processes of the API or worker, and not shared with other
+APIs or workers, cf.
+https://prometheus.github.io/client_python/multiprocess/
+Metrics left in the directory by processes of an earlier API or worker are
+removed when the API or worker starts.
+"""
+
+from functools import partial, wraps
+import logging
+import os
+from pathlib import Path
+import time
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
+from flask import Flask, Response, g, request
+from prometheus_client import (
+    CollectorRegistry,
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    generate_latest,
+    Histogram,
+    REGISTRY,
+    start_http_server,
+)
+from prometheus_client import multiprocess
+from prometheus_client.core import GaugeMetricFamily, Metric
+from pymongo.collection import Collection
+
+from cwl_wes.ga4gh.wes.states import States
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets in seconds for latencies of requests and calls
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+)
+
+# Histogram buckets in seconds for durations of workflow runs
+RUN_BUCKETS = (
+    1,
+    10,
+    30,
+    60,
+    300,
+    600,
+    1800,
+    3600,
+    7200,
+    14400,
+    43200,
+    86400,
+    259200,
+)
+
+REQUEST_LATENCY = Histogram(
+    "cwl_wes_request_duration_seconds",
+    "Latency of API requests, by method, endpoint and status code.",
+    ["method", "endpoint", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_LATENCY = Histogram(
+    "cwl_wes_db_operation_duration_seconds",
+    "Latency of MongoDB operations, by database utility function.",
+    ["function"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_ERRORS = Counter(
+    "cwl_wes_db_operation_errors_total",
+    "Failed MongoDB operations, by database utility function.",
+    ["function"],
+)
+OUTBOUND_LATENCY = Histogram(
+    "cwl_wes_outbound_call_duration_seconds",
+    "Latency of calls to TES and DRS services, by remote host.",
+    ["host"],
+    buckets=LATENCY_BUCKETS,
+)
+OUTBOUND_ERRORS = Counter(
+    "cwl_wes_outbound_call_errors_total",
+    "Failed calls to TES and DRS services, by remote host.",
+    ["host"],
+)
+OUTBOUND_RETRIES = Counter(
+    "cwl_wes_outbound_call_retries_total",
+    "Retried calls to TES and DRS services, by remote host.",
+    ["host"],
+)
+OUTBOUND_REJECTED = Counter(
+    "cwl_wes_outbound_calls_rejected_total",
+    "Calls to TES and DRS services rejected because the circuit of the"
+    " remote host was open, by remote host.",
+    ["host"],
+)
+OUTBOUND_THROTTLED = Counter(
+    "cwl_wes_outbound_call_throttled_seconds_total",
+    "Time calls to TES and DRS services waited for the rate limiter, by"
+    " remote host.",
+    ["host"],
+)
+CIRCUIT_OPENED = Counter(
+    "cwl_wes_outbound_circuit_opened_total",
+    "Times the circuit of a remote host was opened, by remote host.",
+    ["host"],
+)
+CIRCUIT_STATE = Gauge(
+    "cwl_wes_outbound_circuit_state",
+    "State of the circuit of a remote host (0: closed, 1: half-open, 2:"
+    " open), by remote host; the most open state across processes.",
+    ["host"],
+    multiprocess_mode="livemax",
+)
+LOG_LINES = Counter(
+    "cwl_wes_log_lines_processed_total",
+    "Workflow engine log lines processed.",
+)
+ENGINE_EVENTS = Counter(
+    "cwl_wes_engine_events_processed_total",
+    "Structured workflow engine events processed.",
+)
+RUN_DURATION = Histogram(
+    "cwl_wes_run_duration_seconds",
+    "Durations of phases of finished workflow run attempts, by phase and"
+    " final state.",
+    ["phase", "state"],
+    buckets=RUN_BUCKETS,
+)
+
+
+def timed_db(func: Callable) -> Callable:
+    """Record latency and failures of database utility function.
+
+    Args:
+        func: Database utility function.
+
+    Returns:
+        Instrumented function.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            DB_ERRORS.labels(function=func.__name__).inc()
+            raise
+        finally:
+            DB_LATENCY.labels(function=func.__name__).observe(
+                time.perf_counter() - start
+            )
+
+    return wrapper
+
+
+def timed_call(
+    func: Callable,
+    host: str,
+    failed: Optional[Callable[[Any], bool]] = None,
+) -> Callable:
+    """Record latency and failures of call to remote service.
+
+    Args:
+        func: Callable making the call.
+        host: Name of remote host.
+        failed: Predicate identifying return values of failed calls, for
+            callables that do not raise on failure.
+
+    Returns:
+        Instrumented callable.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            OUTBOUND_ERRORS.labels(host=host).inc()
+            raise
+        finally:
+            OUTBOUND_LATENCY.labels(host=host).observe(
+                time.perf_counter() - start
+            )
+        if failed is not None and failed(result):
+            OUTBOUND_ERRORS.labels(host=host).inc()
+        return result
+
+    return wrapper
+
+
+class RunCollector:  # pylint: disable=too-few-public-methods
+    """Collect numbers of unfinished runs and queued run tasks.
+
+    Args:
+        collection: MongoDB collection of runs.
+        celery_app: Celery application connected to the broker.
+        queues: Names of the queues to report.
+
+    Attributes:
+        collection: MongoDB collection of runs.
+        celery_app: Celery application connected to the broker.
+        queues: Names of the queues to report.
+    """
+
+    def __init__(
+        self,
+        collection: Collection,
+        celery_app: Celery,
+        queues: List[str],
+    ) -> None:
+        """Construct class instance."""
+        self.collection = collection
+        self.celery_app = celery_app
+        self.queues = queues
+
+    def collect(self) -> Iterator[Metric]:
+        """Query database and broker.
+
+        Yields:
+            Numbers of unfinished runs, by state, and numbers of messages
+            waiting in the queues, by queue.
+        """
+        runs = GaugeMetricFamily(
+            "cwl_wes_runs",
+            "Unfinished workflow runs, by state.",
+            labels=["state"],
+        )
+        try:
+            for group in self.collection.aggregate(
+                [
+                    {"$match": {"api.state": {"$nin": States.FINISHED}}},
+                    {"$group": {"_id": "$api.state", "count": {"$sum": 1}}},
+                ]
+            ):
+                runs.add_metric([str(group["_id"])], group["count"])
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning(
+                "Could not count unfinished runs. Original error message:"
+                f" {type(exc).__name__}: {exc}"
+            )
+        yield runs
+
+        queued = GaugeMetricFamily(
+            "cwl_wes_queue_messages",
+            "Messages waiting in Celery queues, by queue.",
+            labels=["queue"],
+        )
+        try:
+            with self.celery_app.connection_or_acquire() as connection:
+                channel = connection.default_channel
+                for queue in self.queues:
+                    result = channel.queue_declare(queue=queue, passive=True)
+                    queued.add_metric([queue], result.message_count)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning(
+                "Could not get lengths of Celery queues. Original error"
+                f" message: {type(exc).__name__}: {exc}"
+            )
+        yield queued
+
+
+class _DefaultCollector:  # pylint: disable=too-few-public-methods
+    """Collect metrics of the default registry of the current process."""
+
+    def collect(self) -> Iterable[Metric]:
+        """Collect metrics.
+
+        Returns:
+            Metrics of the default registry.
+        """
+        return REGISTRY.collect()
+
+
+def get_multiprocess_dir() -> Optional[str]:
+    """Get directory for metrics of multiple processes.
+
+    Returns:
+        Directory, or `None` if metrics of multiple processes are not
+        aggregated.
+    """
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get(
+        "prometheus_multiproc_dir"
+    )
+
+
+def is_multiprocess() -> bool:
+    """Check whether metrics of multiple processes are aggregated.
+
+    Returns:
+        `True` if a directory for metrics of multiple processes is set.
+    """
+    return bool(get_multiprocess_dir())
+
+
+def remove_stale_metrics() -> None:
+    """Remove metrics of processes other than the current one.
+
+    To be called by the process forking the processes of the API or worker
+    before it forks them, so that metrics of processes of an earlier API or
+    worker are not reported.
+    """
+    directory = get_multiprocess_dir()
+    if not directory:
+        return
+    pid = str(os.getpid())
+    removed = 0
+    for path in Path(directory).glob("*.db"):
+        # Files are named `<type>[_<mode>]_<pid>.db`
+        if path.stem.rsplit("_", 1)[-1] == pid:
+            continue
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        removed += 1
+    if removed:
+        logger.info(
+            f"Removed {removed} metrics files of earlier processes from"
+            f" '{directory}'."
+        )
+
+
+def get_registry(collectors: Iterable = ()) -> CollectorRegistry:
+    """Get registry of metrics of the API or worker.
+
+    Args:
+        collectors: Additional collectors to register.
+
+    Returns:
+        Registry with metrics of all processes, if aggregated, or of the
+        current process.
+    """
+    registry = CollectorRegistry()
+    if is_multiprocess():
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(_DefaultCollector())
+    for collector in collectors:
+        registry.register(collector)
+    return registry
+
+
+def init_app_metrics(
+    app: Flask,
+    path: str = "/metrics",
+    collectors: Iterable = (),
+) -> None:
+    """Record request latencies of app and expose metrics endpoint.
+
+    Args:
+        app: Flask application.
+        path: Path of the metrics endpoint.
+        collectors: Additional collectors queried at scrape time.
+    """
+    app.before_request(_start_request_timer)
+    app.after_request(_observe_request)
+    app.add_url_rule(
+        path,
+        endpoint="metrics",
+        view_func=partial(_metrics_view, collectors=list(collectors)),
+    )
+
+
+def init_worker_metrics(port: int) -> None:
+    """Start metrics exporter with Celery worker.
+
+    Args:
+        port: Port of the metrics exporter.
+    """
+
+    def _start_exporter(**_kwargs) -> None:
+        if is_multiprocess():
+            remove_stale_metrics()
+        else:
+            logger.warning(
+                "Environment variable 'PROMETHEUS_MULTIPROC_DIR' is not set."
+                " Metrics of the worker's pool processes are not exported."
+            )
+        start_http_server(port, registry=get_registry())
+        logger.info(f"Metrics exporter listening on port {port}.")
+
+    def _remove_process(pid: Optional[int] = None, **_kwargs) -> None:
+        if is_multiprocess():
+            multiprocess.mark_process_dead(pid or os.getpid())
+
+    worker_init.connect(_start_exporter, weak=False)
+    worker_process_shutdown.connect(_remove_process, weak=False)
+
+
+def _start_request_timer() -> None:
+    """Record start time of request."""
+    g.metrics_request_start = time.perf_counter()
+
+
+def _observe_request(response: Response) -> Response:
+    """Record latency of request.
+
+    Args:
+        response: Response to request.
+
+    Returns:
+        Unchanged response.
+    """
+    start = g.pop("metrics_request_start", None)
+    if start is not None:
+        REQUEST_LATENCY.labels(
+            method=request.method,
+            endpoint=(
+                request.url_rule.rule
+                if request.url_rule is not None
+                else "unmatched"
+            ),
+            status=str(response.status_code),
+        ).observe(time.perf_counter() - start)
+    return response
+
+
+def _metrics_view(collectors: List) -> Response:
+    """Render metrics in Prometheus text format.
+
+    Args:
+        collectors: Additional collectors queried at scrape time.
+
+    Returns:
+        Metrics response.
+    """
+    return Response(
+        generate_latest(get_registry(collectors=collectors)),
+        content_type=CONTENT_TYPE_LATEST,
+    )
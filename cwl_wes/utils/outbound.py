@@ -0,0 +1,396 @@
+"""Rate limiting, retries and circuit breaking for outbound service calls.
+
+Calls to remote TES and DRS services are routed through `call()`. Per remote
+host, calls are rate limited with a token bucket, retried with jittered
+exponential backoff if they fail transiently, and rejected right away while
+the host's circuit is open, so that a struggling service is not overwhelmed
+by retries. State is kept per process; retries, rejected calls, throttling
+and circuit state are exported as Prometheus metrics (cf.
+`cwl_wes.utils.metrics`).
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from cwl_wes.custom_config import OutboundConfig
+from cwl_wes.utils import metrics, tracing
+from cwl_wes.worker import celery_app
+
+logger = logging.getLogger(__name__)
+
+# Guards of remote hosts, by host name
+_HOSTS: Dict[str, "HostGuard"] = {}
+_HOSTS_LOCK = threading.Lock()
+
+# Values of the circuit state metric, by circuit state
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpenError(Exception):
+    """Call rejected because the circuit of the remote host is open."""
+
+
+class TokenBucket:  # pylint: disable=too-few-public-methods
+    """Thread-safe token bucket rate limiter.
+
+    Args:
+        rate: Number of tokens added per second.
+        capacity: Maximum number of tokens.
+
+    Attributes:
+        rate: Number of tokens added per second.
+        capacity: Maximum number of tokens.
+    """
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        """Construct class instance."""
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token; block until one is available.
+
+        Returns:
+            Time in seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated) * self.rate,
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """Thread-safe circuit breaker.
+
+    The circuit opens after a number of consecutive failures. While it is
+    open, calls are rejected. Once the reset timeout has passed, a single
+    trial call is let through (half-open); its outcome closes or re-opens
+    the circuit.
+
+    Args:
+        failure_threshold: Number of consecutive failures opening the
+            circuit.
+        reset_timeout: Time in seconds after which a trial call is allowed.
+
+    Attributes:
+        failure_threshold: Number of consecutive failures opening the
+            circuit.
+        reset_timeout: Time in seconds after which a trial call is allowed.
+        state: One of `closed`, `open` and `half_open`.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        """Construct class instance."""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Check whether a call may be made.
+
+        Returns:
+            `True` if the call may be made, `False` if it is rejected.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if (
+                self.state == "open"
+                and time.monotonic() - self._opened >= self.reset_timeout
+            ):
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self) -> bool:
+        """Record successful call.
+
+        Returns:
+            `True` if the circuit was closed by the call, `False` otherwise.
+        """
+        with self._lock:
+            closed = self.state != "closed"
+            self.state = "closed"
+            self._failures = 0
+            return closed
+
+    def record_failure(self) -> bool:
+        """Record failed call.
+
+        Returns:
+            `True` if the circuit was opened by the call, `False` otherwise.
+        """
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or (
+                self.state == "closed"
+                and self._failures >= self.failure_threshold
+            ):
+                self.state = "open"
+                self._opened = time.monotonic()
+                return True
+            return False
+
+
+class HostGuard:
+    """Rate limiter, circuit breaker and call metrics of a remote host.
+
+    Args:
+        host: Name of remote host.
+        config: Outbound call configuration.
+
+    Attributes:
+        host: Name of remote host.
+        bucket: Rate limiter.
+        breaker: Circuit breaker.
+    """
+
+    def __init__(self, host: str, config: OutboundConfig) -> None:
+        """Construct class instance."""
+        self.host = host
+        self.bucket = TokenBucket(
+            rate=config.rate_limit,
+            capacity=config.burst,
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=config.failure_threshold,
+            reset_timeout=config.reset_timeout,
+        )
+        self._export_state()
+
+    def allow(self) -> bool:
+        """Check whether a call may be made; count rejected calls.
+
+        Returns:
+            `True` if the call may be made, `False` if it is rejected.
+        """
+        allowed = self.breaker.allow()
+        if not allowed:
+            self.count("rejected")
+        self._export_state()
+        return allowed
+
+    def throttle(self) -> None:
+        """Wait for the rate limiter; count time spent waiting."""
+        self.count("throttled_seconds", self.bucket.acquire())
+
+    def count(self, metric: str, value: float = 1) -> None:
+        """Increment call metric.
+
+        Args:
+            metric: Name of metric; one of `retries`, `rejected`,
+                `circuit_opened` and `throttled_seconds`.
+            value: Increment.
+        """
+        if value:
+            _COUNTERS[metric].labels(host=self.host).inc(value)
+
+    def record(self, success: bool) -> None:
+        """Record outcome of call with circuit breaker.
+
+        Args:
+            success: Whether the call succeeded.
+        """
+        if success:
+            if self.breaker.record_success():
+                logger.info(f"Circuit for host '{self.host}' closed.")
+                self._export_state()
+            return
+        if self.breaker.record_failure():
+            self.count("circuit_opened")
+            self._export_state()
+            logger.warning(
+                f"Circuit for host '{self.host}' opened. Calls are rejected"
+                f" for {self.breaker.reset_timeout} seconds."
+            )
+
+    def _export_state(self) -> None:
+        """Export state of circuit breaker."""
+        metrics.CIRCUIT_STATE.labels(host=self.host).set(
+            CIRCUIT_STATES[self.breaker.state]
+        )
+
+
+# Prometheus counters of call metrics, by metric name
+_COUNTERS = {
+    "retries": metrics.OUTBOUND_RETRIES,
+    "rejected": metrics.OUTBOUND_REJECTED,
+    "circuit_opened": metrics.CIRCUIT_OPENED,
+    "throttled_seconds": metrics.OUTBOUND_THROTTLED,
+}
+
+
+def call(
+    url: str,
+    func: Callable,
+    *args,
+    failed: Optional[Callable[[Any], bool]] = None,
+    **kwargs,
+) -> Any:
+    """Call remote service with rate limiting, retries and circuit breaking.
+
+    Exceptions are retried if they indicate a transient failure (connection
+    errors, timeouts, HTTP 429 and 5xx responses); other exceptions are
+    raised right away and do not count as failures of the remote host.
+
+    Args:
+        url: URL of remote service; calls are guarded per host.
+        func: Callable making the call.
+        *args: Positional arguments to callable.
+        failed: Predicate identifying return values of failed calls, for
+            callables that do not raise on failure.
+        **kwargs: Keyword arguments to callable.
+
+    Returns:
+        Return value of callable; after the last retry, the return value of
+        the last failed call.
+
+    Raises:
+        CircuitOpenError: If the circuit of the remote host is open.
+    """
+    host = get_host(url=url)
+    func = tracing.traced_call(
+        func=metrics.timed_call(func=func, host=host, failed=failed),
+        name="outbound.call",
+        host=host,
+    )
+    config: OutboundConfig = celery_app.conf.foca.custom.controller.outbound
+    if not config.enabled:
+        return func(*args, **kwargs)
+    guard = get_host_guard(url=url, config=config)
+    attempt = 0
+    while True:
+        if not guard.allow():
+            raise CircuitOpenError(f"Circuit for host '{guard.host}' is open.")
+        guard.throttle()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as exc:  # pylint: disable=broad-except
+            if not is_transient(exc):
+                guard.record(success=True)
+                raise
+            guard.record(success=False)
+            if attempt >= config.max_retries:
+                raise
+        else:
+            if failed is None or not failed(result):
+                guard.record(success=True)
+                return result
+            guard.record(success=False)
+            if attempt >= config.max_retries:
+                return result
+        attempt += 1
+        guard.count("retries")
+        time.sleep(
+            random.uniform(
+                0,
+                min(config.backoff_max, config.backoff_base * 2**attempt),
+            )
+        )
+
+
+def head(url: str, timeout: float = 5) -> requests.Response:
+    """Request headers of remote file, following redirects.
+
+    Args:
+        url: URL of remote file.
+        timeout: Timeout in seconds for request.
+
+    Returns:
+        HTTP response.
+
+    Raises:
+        requests.HTTPError: If the request was unsuccessful.
+        CircuitOpenError: If the circuit of the remote host is open.
+    """
+    response = call(
+        url,
+        requests.head,
+        url,
+        allow_redirects=True,
+        timeout=timeout,
+        failed=is_server_error,
+    )
+    response.raise_for_status()
+    return response
+
+
+def get_host_guard(url: str, config: OutboundConfig) -> HostGuard:
+    """Get guard of remote host; create if necessary.
+
+    Args:
+        url: URL of remote service.
+        config: Outbound call configuration.
+
+    Returns:
+        Guard of remote host.
+    """
+    host = get_host(url=url)
+    with _HOSTS_LOCK:
+        if host not in _HOSTS:
+            _HOSTS[host] = HostGuard(host=host, config=config)
+        return _HOSTS[host]
+
+
+def get_host(url: str) -> str:
+    """Get host of URL without any credentials it holds.
+
+    Args:
+        url: URL of remote service.
+
+    Returns:
+        Host name and port of remote service.
+    """
+    return urlparse(url).netloc.rpartition("@")[2] or url
+
+
+def is_transient(exc: Exception) -> bool:
+    """Check whether exception indicates a transient failure.
+
+    Args:
+        exc: Raised exception.
+
+    Returns:
+        `True` if the call should be retried, `False` otherwise.
+    """
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is not None and is_server_error(exc.response)
+    return isinstance(
+        exc,
+        (requests.ConnectionError, requests.Timeout, ConnectionError),
+    )
+
+
+def is_server_error(response: requests.Response) -> bool:
+    """Check whether HTTP response indicates a transient server failure.
+
+    Args:
+        response: HTTP response.
+
+    Returns:
+        `True` for HTTP 429 and 5xx responses, `False` otherwise.
+    """
+    return response.status_code == 429 or response.status_code >= 500
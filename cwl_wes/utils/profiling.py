@@ -0,0 +1,306 @@
+"""On-demand profiling of API requests and Celery tasks.
+
+If enabled, a configurable fraction of requests and tasks is profiled with
+`cProfile`, as well as requests selected by header and tasks selected by the
+Celery message header `profile`. Tasks sent while a profiled request or task
+is processed are selected, too, so that, e.g., profiling a `POST /runs`
+request also profiles the `tasks.run_workflow` task it sends.
+
+Only the thread processing the request or task is profiled. For runs handed
+over to the run supervisor, the profile thus ends when the task returns.
+
+Requests selected by header are rate-limited per API process and, if a
+secret is configured, only selected if the header is set to the secret.
+
+Profiles are written in `pstats` format, one file per request or task, to
+the configured directory. Once the configured number of profiles is
+exceeded, the oldest profiles are deleted.
+"""
+
+from collections import deque
+from contextvars import ContextVar
+import cProfile
+from datetime import datetime
+import hmac
+import logging
+import os
+from pathlib import Path
+import random
+import re
+import threading
+import time
+from typing import Deque, Dict, Optional, Tuple
+
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from flask import Flask, g, request
+
+from cwl_wes.custom_config import ProfilingConfig
+
+logger = logging.getLogger(__name__)
+
+# Name of the Celery message header selecting a task for profiling
+TASK_HEADER = "profile"
+
+# Header values selecting a request for profiling
+TRUE_VALUES = {"1", "true", "yes", "on"}
+
+# Whether the request or task processed in the current context is profiled
+_SELECTED: ContextVar[bool] = ContextVar("profiling_selected", default=False)
+
+# Profilers and context tokens of Celery tasks in progress, by task ID
+_TASK_PROFILES: Dict[str, Tuple[cProfile.Profile, object]] = {}
+
+
+class RateLimiter:  # pylint: disable=too-few-public-methods
+    """Thread-safe sliding window rate limiter.
+
+    Args:
+        limit: Maximum number of calls per window.
+        window: Length of the window in seconds.
+
+    Attributes:
+        limit: Maximum number of calls per window.
+        window: Length of the window in seconds.
+    """
+
+    def __init__(self, limit: int, window: float = 60) -> None:
+        """Construct class instance."""
+        self.limit = limit
+        self.window = window
+        self._calls: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Record call if the limit is not exceeded.
+
+        Returns:
+            `True` if the call is allowed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            while self._calls and self._calls[0] <= now - self.window:
+                self._calls.popleft()
+            if len(self._calls) >= self.limit:
+                return False
+            self._calls.append(now)
+            return True
+
+
+def is_selected(config: ProfilingConfig, requested: bool = False) -> bool:
+    """Decide whether to profile request or task.
+
+    Args:
+        config: Profiling configuration.
+        requested: Whether profiling was requested explicitly.
+
+    Returns:
+        `True` if the request or task is to be profiled.
+    """
+    return requested or random.random() < config.sample_ratio
+
+
+def start_profiler() -> Optional[cProfile.Profile]:
+    """Start profiling the current thread.
+
+    Returns:
+        Profiler, or `None` if another profiler is active.
+    """
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as exc:
+        logger.warning(
+            "Could not start profiler. Original error message:"
+            f" {type(exc).__name__}: {exc}"
+        )
+        return None
+    return profiler
+
+
+def is_requested(
+    config: ProfilingConfig,
+    value: Optional[str],
+    limiter: RateLimiter,
+) -> bool:
+    """Decide whether request header selects request for profiling.
+
+    Args:
+        config: Profiling configuration.
+        value: Value of the request header, if set.
+        limiter: Rate limiter of requests selected by header.
+
+    Returns:
+        `True` if the header selects the request and the rate limit is not
+        exceeded.
+    """
+    if not value:
+        return False
+    value = value.strip()
+    if config.secret is not None:
+        if not hmac.compare_digest(
+            value.encode("utf-8"), config.secret.encode("utf-8")
+        ):
+            return False
+    elif value.lower() not in TRUE_VALUES:
+        return False
+    if not limiter.allow():
+        logger.warning(
+            "Profiling requested by header, but the rate limit of"
+            f" {config.max_requested_per_minute} profiles per minute is"
+            " exceeded. Request not profiled."
+        )
+        return False
+    return True
+
+
+def prune_profiles(output_dir: Path, max_files: int) -> None:
+    """Delete oldest profiles exceeding the maximum number of profiles.
+
+    Args:
+        output_dir: Directory profiles are written to.
+        max_files: Maximum number of profiles kept.
+    """
+    profiles = []
+    for path in output_dir.glob("*.prof"):
+        try:
+            profiles.append((path.stat().st_mtime, path))
+        except OSError:
+            continue
+    if len(profiles) <= max_files:
+        return
+    profiles.sort()
+    for _, path in profiles[: len(profiles) - max_files]:
+        try:
+            path.unlink()
+        except OSError as exc:
+            logger.warning(
+                f"Could not delete profile '{path}'. Original error message:"
+                f" {type(exc).__name__}: {exc}"
+            )
+
+
+def write_profile(
+    profiler: cProfile.Profile,
+    output_dir: Path,
+    name: str,
+    max_files: Optional[int] = None,
+) -> Optional[Path]:
+    """Stop profiler and write profile to file.
+
+    Args:
+        profiler: Running profiler.
+        output_dir: Directory to write profile to.
+        name: Descriptive part of the file name, e.g., the task name.
+        max_files: Maximum number of profiles kept in the directory; the
+            oldest profiles are deleted if it is exceeded. Not limited if
+            `None`.
+
+    Returns:
+        Path of the profile, or `None` if it could not be written.
+    """
+    profiler.disable()
+    timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    path = output_dir / (
+        f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_')}"
+        f"-{timestamp}-{os.getpid()}.prof"
+    )
+    try:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path)
+    except OSError as exc:
+        logger.error(
+            f"Could not write profile to '{path}'. Original error message:"
+            f" {type(exc).__name__}: {exc}"
+        )
+        return None
+    logger.info(f"Profile written to '{path}'.")
+    if max_files is not None:
+        prune_profiles(output_dir=output_dir, max_files=max_files)
+    return path
+
+
+def init_app_profiling(app: Flask, config: ProfilingConfig) -> None:
+    """Profile selected requests to app.
+
+    Args:
+        app: Flask application.
+        config: Profiling configuration.
+    """
+    limiter = RateLimiter(limit=config.max_requested_per_minute)
+
+    def _start() -> None:
+        requested = is_requested(
+            config=config,
+            value=request.headers.get(config.header),
+            limiter=limiter,
+        )
+        if not is_selected(config=config, requested=requested):
+            return
+        profiler = start_profiler()
+        if profiler is not None:
+            g.profiler = profiler
+            g.profiling_token = _SELECTED.set(True)
+
+    def _stop(_exc: Optional[BaseException] = None) -> None:
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return
+        _SELECTED.reset(g.pop("profiling_token"))
+        endpoint = (
+            request.url_rule.endpoint
+            if request.url_rule is not None
+            else "unmatched"
+        )
+        write_profile(
+            profiler=profiler,
+            output_dir=config.output_dir,
+            name=f"request-{request.method}-{endpoint}",
+            max_files=config.max_files,
+        )
+
+    app.before_request(_start)
+    app.teardown_request(_stop)
+
+
+def init_worker_profiling(config: ProfilingConfig) -> None:
+    """Profile selected Celery tasks and select tasks they send.
+
+    Args:
+        config: Profiling configuration.
+    """
+
+    def _start(task_id: Optional[str] = None, task=None, **_kwargs) -> None:
+        if task_id is None or task is None:
+            return
+        requested = bool(getattr(task.request, TASK_HEADER, False))
+        if not is_selected(config=config, requested=requested):
+            return
+        profiler = start_profiler()
+        if profiler is not None:
+            _TASK_PROFILES[task_id] = (profiler, _SELECTED.set(True))
+
+    def _stop(task_id: Optional[str] = None, task=None, **_kwargs) -> None:
+        profiler, token = _TASK_PROFILES.pop(task_id, (None, None))
+        if profiler is None:
+            return
+        _SELECTED.reset(token)
+        write_profile(
+            profiler=profiler,
+            output_dir=config.output_dir,
+            name=f"task-{getattr(task, 'name', 'unknown')}-{task_id}",
+            max_files=config.max_files,
+        )
+
+    before_task_publish.connect(_select_sent_task, weak=False)
+    task_prerun.connect(_start, weak=False)
+    task_postrun.connect(_stop, weak=False)
+
+
+def _select_sent_task(headers: Optional[Dict] = None, **_kwargs) -> None:
+    """Select Celery task sent while profiling for profiling.
+
+    Args:
+        headers: Message headers.
+    """
+    if headers is not None and _SELECTED.get():
+        headers.setdefault(TASK_HEADER, True)
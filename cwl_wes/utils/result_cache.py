@@ -0,0 +1,306 @@
+"""Utility functions for reusing results of identical workflow runs."""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterator, List, Mapping, Optional
+from urllib.parse import urlparse
+
+from pymongo.collection import Collection
+import requests
+
+from cwl_wes.utils import outbound
+from cwl_wes.utils.archive import find_archived_run
+
+logger = logging.getLogger(__name__)
+
+# Size of chunks read when hashing files
+CHUNK_SIZE = 2**20
+
+
+class HashBudget:  # pylint: disable=too-few-public-methods
+    """Limit on the total number of bytes hashed for a workflow run.
+
+    Args:
+        max_bytes: Maximum number of bytes; `None` for no limit.
+
+    Attributes:
+        remaining: Number of bytes that may still be hashed; `None` for no
+            limit.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None) -> None:
+        """Construct class instance."""
+        self.remaining = max_bytes
+
+    def consume(self, size: int) -> bool:
+        """Reserve bytes for hashing.
+
+        Args:
+            size: Number of bytes.
+
+        Returns:
+            `True` if the bytes may be hashed, `False` if the limit would be
+            exceeded.
+        """
+        if self.remaining is None:
+            return True
+        if size > self.remaining:
+            return False
+        self.remaining -= size
+        return True
+
+
+def compute_cache_key(
+    document: Dict,
+    timeout: float = 5,
+    max_bytes: Optional[int] = None,
+) -> Optional[str]:
+    """Compute canonical digest of workflow run.
+
+    The digest covers the workflow type and version, workflow engine
+    parameters, workflow parameters, the content of all workflow files and
+    fingerprints of all input files and directories referenced in the
+    workflow parameters.
+
+    Args:
+        document: Workflow run document with workflow files in place.
+        timeout: Timeout in seconds for requesting fingerprints of remote
+            input files.
+        max_bytes: Maximum total size in bytes of workflow files and local
+            inputs hashed; `None` for no limit.
+
+    Returns:
+        Hex digest, or `None` if the run cannot be fingerprinted reliably,
+        e.g., because the workflow is not contained in the workflow files
+        directory, a local input lies outside of it, an input file provides
+        neither checksum nor ETag or the files to hash are too large.
+    """
+    request = document["api"]["request"]
+    workflow_dir = Path(document["internal"]["workflow_files"]).resolve()
+    cwl_path = Path(document["internal"]["cwl_path"]).resolve()
+    if workflow_dir not in cwl_path.parents:
+        return None
+    budget = HashBudget(max_bytes=max_bytes)
+    workflow_files = _hash_path(
+        path=workflow_dir,
+        workflow_dir=workflow_dir,
+        budget=budget,
+    )
+    if workflow_files is None:
+        logger.info("Run not cacheable: workflow files too large.")
+        return None
+
+    inputs = {}
+    for location in _iter_locations(request["workflow_params"]):
+        fingerprint = _get_fingerprint(
+            location=location,
+            workflow_dir=workflow_dir,
+            budget=budget,
+            timeout=timeout,
+        )
+        if fingerprint is None:
+            logger.info(
+                f"Run not cacheable: no fingerprint for input '{location}'."
+            )
+            return None
+        inputs[location] = fingerprint
+
+    components = {
+        "workflow_type": request["workflow_type"],
+        "workflow_type_version": request["workflow_type_version"],
+        "workflow_engine_parameters": request.get(
+            "workflow_engine_parameters", {}
+        ),
+        "workflow_params": request["workflow_params"],
+        "workflow_path": str(cwl_path.relative_to(workflow_dir)),
+        "workflow_files": workflow_files,
+        "inputs": inputs,
+    }
+    return hashlib.sha256(
+        json.dumps(components, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def find_cached_run(
+    collection: Collection,
+    cache_key: str,
+    user_id: Optional[str] = None,
+    share_across_users: bool = False,
+    collection_archive: Optional[Collection] = None,
+) -> Optional[Mapping]:
+    """Find most recent completed run with same digest.
+
+    Args:
+        collection: MongoDB collection of runs.
+        cache_key: Digest of workflow run.
+        user_id: Identifier of user submitting the run.
+        share_across_users: Whether runs of other users may be reused.
+        collection_archive: MongoDB collection of archived runs; looked up
+            if no run is found in `collection`.
+
+    Returns:
+        Run document, or `None` if no valid cache entry exists.
+    """
+    query = {
+        "internal.cache_key": cache_key,
+        "api.state": "COMPLETE",
+        "internal.cache_invalidated": {"$ne": True},
+    }
+    if not share_across_users:
+        query["user_id"] = user_id
+    projection = {"run_id": True, "api.outputs": True, "_id": False}
+    document = collection.find_one(
+        query,
+        projection=projection,
+        sort=[("_id", -1)],
+    )
+    if document is None and collection_archive is not None:
+        document = find_archived_run(
+            collection=collection_archive,
+            filter=query,
+            projection=projection,
+            sort=[("_id", -1)],
+        )
+    return document
+
+
+def _iter_locations(obj) -> Iterator[str]:
+    """Yield locations of CWL `File` and `Directory` objects.
+
+    Args:
+        obj: Workflow parameters or part thereof.
+
+    Yields:
+        Location or path of each file and directory.
+    """
+    if isinstance(obj, dict):
+        if obj.get("class") in ["File", "Directory"]:
+            location = obj.get("location", obj.get("path"))
+            if location is not None:
+                yield location
+        for value in obj.values():
+            yield from _iter_locations(value)
+    elif isinstance(obj, list):
+        for value in obj:
+            yield from _iter_locations(value)
+
+
+def _get_fingerprint(
+    location: str,
+    workflow_dir: Path,
+    budget: HashBudget,
+    timeout: float = 5,
+) -> Optional[str]:
+    """Get fingerprint of input file or directory.
+
+    Args:
+        location: Location or path of input.
+        workflow_dir: Resolved directory holding workflow files; relative
+            paths are resolved against it, and local inputs outside of it
+            have no fingerprint.
+        budget: Limit on the number of bytes hashed.
+        timeout: Timeout in seconds for requesting remote fingerprints.
+
+    Returns:
+        Fingerprint, or `None` if none can be obtained.
+    """
+    url = urlparse(location)
+    # DRS objects are immutable
+    if url.scheme == "drs":
+        return location
+    if url.scheme in ["http", "https"]:
+        return _get_remote_fingerprint(url=location, timeout=timeout)
+    if url.scheme in ["", "file"]:
+        path = _confine(path=workflow_dir / url.path, base=workflow_dir)
+        if path is not None and path.exists():
+            return _hash_path(
+                path=path,
+                workflow_dir=workflow_dir,
+                budget=budget,
+            )
+    return None
+
+
+def _confine(path: Path, base: Path) -> Optional[Path]:
+    """Resolve path and check that it lies within base directory.
+
+    Args:
+        path: Path; absolute paths and `..` components may point anywhere.
+        base: Resolved base directory.
+
+    Returns:
+        Resolved path, or `None` if it lies outside of the base directory.
+    """
+    resolved = path.resolve()
+    if resolved != base and base not in resolved.parents:
+        return None
+    return resolved
+
+
+def _get_remote_fingerprint(url: str, timeout: float = 5) -> Optional[str]:
+    """Get fingerprint of input file from HTTP response headers.
+
+    Args:
+        url: URL of input file.
+        timeout: Timeout in seconds for request.
+
+    Returns:
+        ETag or modification time and size of input file, or `None` if
+        neither is available.
+    """
+    try:
+        response = outbound.head(url=url, timeout=timeout)
+    except (requests.RequestException, outbound.CircuitOpenError):
+        return None
+    if "ETag" in response.headers:
+        return f"etag:{response.headers['ETag']}"
+    if (
+        "Last-Modified" in response.headers
+        and "Content-Length" in response.headers
+    ):
+        return (
+            f"modified:{response.headers['Last-Modified']}"
+            f",size:{response.headers['Content-Length']}"
+        )
+    return None
+
+
+def _hash_path(
+    path: Path,
+    workflow_dir: Path,
+    budget: HashBudget,
+) -> Optional[str]:
+    """Get SHA-256 digest of file or directory content.
+
+    Git metadata is ignored. Symbolic links pointing outside of the
+    workflow files directory are not followed.
+
+    Args:
+        path: Resolved file or directory path.
+        workflow_dir: Resolved directory holding workflow files.
+        budget: Limit on the number of bytes hashed.
+
+    Returns:
+        Hex digest, or `None` if the content exceeds the budget or a file
+        lies outside of the workflow files directory.
+    """
+    files: List[Path] = []
+    for _file in [path] if path.is_file() else sorted(path.rglob("*")):
+        if not _file.is_file() or ".git" in _file.relative_to(path).parts:
+            continue
+        if _confine(path=_file, base=workflow_dir) is None:
+            return None
+        files.append(_file)
+    if not budget.consume(sum(_file.stat().st_size for _file in files)):
+        return None
+    digest = hashlib.sha256()
+    for _file in files:
+        digest.update(str(_file.relative_to(path)).encode())
+        with open(_file, mode="rb") as _handle:
+            chunk = _handle.read(CHUNK_SIZE)
+            while chunk:
+                digest.update(chunk)
+                chunk = _handle.read(CHUNK_SIZE)
+    return digest.hexdigest()
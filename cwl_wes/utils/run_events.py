@@ -0,0 +1,120 @@
+"""Utility functions for the lifecycle event log of workflow runs.
+
+Milestones and state transitions of each attempt of a run are appended to
+the `run_events` collection, e.g.:
+
+    submitted -> prepared -> enqueued -> worker_started -> first_tes_task
+    -> last_tes_task -> outputs_parsed -> finished
+
+Durations between milestones are reported in the run log.
+"""
+
+from datetime import datetime
+import logging
+from typing import Dict, List, Mapping, Optional
+
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Run log durations, by name, and the milestones they span
+DURATIONS = {
+    "time_preparation": ("submitted", "prepared"),
+    "time_queue": ("prepared", "worker_started"),
+    "time_tes": ("first_tes_task", "last_tes_task"),
+    "time_execution": ("worker_started", "finished"),
+    "time_total": ("submitted", "finished"),
+}
+
+
+def record_run_event(  # pylint: disable=too-many-arguments
+    collection: Collection,
+    run_id: str,
+    task_id: str,
+    event: str,
+    timestamp: Optional[datetime] = None,
+    state: Optional[str] = None,
+    **details,
+) -> bool:
+    """Append event to the lifecycle event log of workflow run.
+
+    Args:
+        collection: MongoDB collection of run events.
+        run_id: Run identifier.
+        task_id: Task identifier of the attempt of the workflow run.
+        event: Name of the event, e.g., `submitted`.
+        timestamp: Time of the event; defaults to the current time.
+        state: State the run changed to with the event, if any.
+        **details: Additional fields of the event.
+
+    Returns:
+        `True` if the event was recorded, `False` otherwise.
+    """
+    document = {
+        "run_id": run_id,
+        "task_id": task_id,
+        "event": event,
+        "timestamp": timestamp or datetime.utcnow(),
+        **details,
+    }
+    if state is not None:
+        document["state"] = state
+    try:
+        collection.insert_one(document)
+    except PyMongoError as exc:
+        logger.exception(
+            f"Database error. Could not record event '{event}' of run"
+            f" '{run_id}'. Original error message: {type(exc).__name__}:"
+            f" {exc}"
+        )
+        return False
+    return True
+
+
+def find_run_events(
+    collection: Collection,
+    run_id: str,
+    task_id: Optional[str] = None,
+) -> List[Dict]:
+    """Get lifecycle events of workflow run in chronological order.
+
+    Args:
+        collection: MongoDB collection of run events.
+        run_id: Run identifier.
+        task_id: Task identifier of the attempt of the workflow run; events
+            of all attempts are returned if not set.
+
+    Returns:
+        Run events.
+    """
+    query = {"run_id": run_id}
+    if task_id is not None:
+        query["task_id"] = task_id
+    return list(
+        collection.find(query, projection={"_id": False}).sort(
+            [("timestamp", 1), ("_id", 1)]
+        )
+    )
+
+
+def get_durations(events: List[Mapping]) -> Dict[str, float]:
+    """Compute durations between milestones of an attempt of workflow run.
+
+    The first occurrence of each milestone is considered. Durations whose
+    milestones were not reached are omitted.
+
+    Args:
+        events: Events of the attempt of the workflow run.
+
+    Returns:
+        Durations in seconds, by name.
+    """
+    milestones: Dict[str, datetime] = {}
+    for event in events:
+        milestones.setdefault(event["event"], event["timestamp"])
+    return {
+        name: (milestones[end] - milestones[start]).total_seconds()
+        for name, (start, end) in DURATIONS.items()
+        if start in milestones and end in milestones
+    }
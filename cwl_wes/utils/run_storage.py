@@ -0,0 +1,426 @@
+"""Utility functions for disk usage and deletion of run directories."""
+
+from datetime import datetime
+import hashlib
+import logging
+import os
+from pathlib import Path
+import shutil
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+from pymongo.collection import Collection
+from pymongo import ReturnDocument
+
+from cwl_wes.custom_config import ArchiveConfig, StorageConfig
+from cwl_wes.ga4gh.wes.states import States
+from cwl_wes.utils.archive import (
+    COMPRESSED_FIELD,
+    compress_document,
+    decompress_document,
+)
+
+logger = logging.getLogger(__name__)
+
+# Fields of run documents pointing at run directories
+RUN_DIRS = ["tmp_dir", "out_dir"]
+
+
+def get_run_dir(base_dir: Path, run_id: str, config: StorageConfig) -> Path:
+    """Get path of run directory in sharded layout.
+
+    Args:
+        base_dir: Temporary or permanent storage directory.
+        run_id: Workflow run identifier.
+        config: Storage configuration.
+
+    Returns:
+        Run directory path, e.g., `<base_dir>/ab/cd/<run_id>` for two
+        levels of shards of width 2.
+    """
+    digest = hashlib.sha256(run_id.encode()).hexdigest()
+    width = config.shard_width
+    shards = [
+        digest[start : start + width]  # noqa: E203
+        for start in range(0, config.shard_levels * width, width)
+    ]
+    return base_dir.joinpath(*shards, run_id)
+
+
+def migrate_run_dirs(
+    collection: Collection,
+    document: Mapping,
+    config: StorageConfig,
+    archive_config: ArchiveConfig,
+    run_collections: Sequence[Collection] = (),
+) -> bool:
+    """Move directories of finished run to current layout.
+
+    The directories are moved first. Then all paths pointing into them are
+    updated in the outputs of runs completed from cached results of the
+    run, and finally in the run document itself. Migrating a run again
+    completes an interrupted migration, as directories that were already
+    moved are skipped. The run document is only updated if the run's state
+    did not change in the meantime; otherwise, the migration is reverted.
+
+    Args:
+        collection: MongoDB collection of active or archived runs.
+        document: Full run document, as stored in `collection`.
+        config: Storage configuration.
+        archive_config: Archive configuration, to store archived run
+            documents.
+        run_collections: MongoDB collections of active and archived runs,
+            to update cache hits of the run in.
+
+    Returns:
+        `True` if the run was migrated, `False` if it already conforms to
+        the current layout or could not be migrated.
+    """
+    moves = {}
+    for field, base_dir in [
+        ("tmp_dir", config.tmp_dir),
+        ("out_dir", config.permanent_dir),
+    ]:
+        old = document["internal"].get(field)
+        if old is None:
+            continue
+        new = str(
+            get_run_dir(
+                base_dir=base_dir.resolve(),
+                run_id=document["run_id"],
+                config=config,
+            )
+        )
+        if new != old:
+            moves[old] = new
+    if not moves:
+        return False
+    if any(
+        Path(old).exists() and Path(new).exists() for old, new in moves.items()
+    ):
+        logger.error(
+            f"Cannot migrate directories of run '{document['run_id']}':"
+            " target directory exists."
+        )
+        return False
+    _move_dirs(moves=moves)
+    stored = False
+    try:
+        _migrate_cache_hits(
+            collections=run_collections,
+            run_id=document["run_id"],
+            moves=moves,
+            archive_config=archive_config,
+        )
+        stored = _store_paths(
+            collection=collection,
+            document=document,
+            moves=moves,
+            archive_config=archive_config,
+        )
+    finally:
+        if not stored:
+            _revert(
+                run_collections=run_collections,
+                run_id=document["run_id"],
+                moves=moves,
+                archive_config=archive_config,
+            )
+    return stored
+
+
+def _move_dirs(moves: Dict[str, str]) -> None:
+    """Move directories; directories that were already moved are skipped.
+
+    Args:
+        moves: New paths, by old path.
+
+    Raises:
+        OSError: If a directory could not be moved; directories moved
+            before are moved back.
+    """
+    moved: Dict[str, str] = {}
+    try:
+        for old, new in moves.items():
+            if Path(old).exists():
+                Path(new).parent.mkdir(parents=True, exist_ok=True)
+                os.rename(old, new)
+                moved[old] = new
+    except OSError:
+        for old, new in moved.items():
+            os.rename(new, old)
+        raise
+
+
+def _revert(
+    run_collections: Sequence[Collection],
+    run_id: str,
+    moves: Dict[str, str],
+    archive_config: ArchiveConfig,
+) -> None:
+    """Revert partial migration of run directories.
+
+    Args:
+        run_collections: MongoDB collections of active and archived runs.
+        run_id: Workflow run identifier.
+        moves: New paths, by old path.
+        archive_config: Archive configuration.
+    """
+    reverse = {new: old for old, new in moves.items()}
+    _migrate_cache_hits(
+        collections=run_collections,
+        run_id=run_id,
+        moves=reverse,
+        archive_config=archive_config,
+    )
+    _move_dirs(moves=reverse)
+    logger.warning(f"Reverted migration of directories of run '{run_id}'.")
+
+
+def _migrate_cache_hits(
+    collections: Sequence[Collection],
+    run_id: str,
+    moves: Dict[str, str],
+    archive_config: ArchiveConfig,
+) -> None:
+    """Update paths in runs completed from cached results of run.
+
+    Cache hits may themselves be reused, so runs completed from cache hits
+    of the run are updated, too.
+
+    Args:
+        collections: MongoDB collections of active and archived runs.
+        run_id: Workflow run identifier.
+        moves: New paths, by old path.
+        archive_config: Archive configuration.
+    """
+    run_ids: List[str] = [run_id]
+    while run_ids:
+        query = {"internal.cache_hit": {"$in": run_ids}}
+        run_ids = []
+        for collection in collections:
+            for document in collection.find(query):
+                _store_paths(
+                    collection=collection,
+                    document=document,
+                    moves=moves,
+                    archive_config=archive_config,
+                )
+                run_ids.append(document["run_id"])
+
+
+def _store_paths(
+    collection: Collection,
+    document: Mapping,
+    moves: Dict[str, str],
+    archive_config: ArchiveConfig,
+) -> bool:
+    """Replace paths in run document, unless the run's state changed.
+
+    Args:
+        collection: MongoDB collection of active or archived runs.
+        document: Full run document, as stored in `collection`.
+        moves: New paths, by old path.
+        archive_config: Archive configuration, to store archived run
+            documents.
+
+    Returns:
+        `True` if the run document was updated, `False` if the run's state
+        changed.
+    """
+    archived = COMPRESSED_FIELD in document
+    updated = decompress_document(document=document)
+    for field in ["api", "internal"]:
+        updated[field] = _replace_paths(obj=updated[field], moves=moves)
+    if archived:
+        updated = compress_document(
+            document=updated,
+            fields=archive_config.compressed_fields,
+            level=archive_config.compression_level,
+        )
+        updated["archived_at"] = document.get(
+            "archived_at",
+            updated["archived_at"],
+        )
+    result = collection.replace_one(
+        {"_id": document["_id"], "api.state": document["api"]["state"]},
+        updated,
+    )
+    return result.matched_count > 0
+
+
+def _replace_paths(obj: Any, moves: Dict[str, str]) -> Any:
+    """Replace prefixes of paths and file URIs in nested object.
+
+    Args:
+        obj: Object, e.g., part of a run document.
+        moves: New paths, by old path.
+
+    Returns:
+        Copy of object with paths replaced.
+    """
+    if isinstance(obj, dict):
+        return {
+            key: _replace_paths(obj=value, moves=moves)
+            for key, value in obj.items()
+        }
+    if isinstance(obj, list):
+        return [_replace_paths(obj=value, moves=moves) for value in obj]
+    if isinstance(obj, str):
+        for old, new in moves.items():
+            if obj == old:
+                return new
+            obj = obj.replace(f"{old}/", f"{new}/")
+    return obj
+
+
+def get_disk_usage(path: Path) -> int:
+    """Get total size of files in directory; symbolic links are not followed.
+
+    Args:
+        path: Directory path.
+
+    Returns:
+        Size in bytes; 0 if the directory does not exist.
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return size
+
+
+def record_disk_usage(collection: Collection, document: Mapping) -> int:
+    """Measure and record disk usage of run directories.
+
+    Usage of finished runs is marked as final, so that it is not measured
+    again.
+
+    Args:
+        collection: MongoDB collection of runs.
+        document: Run document with run identifier, state and run
+            directories.
+
+    Returns:
+        Total size of run directories in bytes.
+    """
+    internal = document.get("internal", {})
+    usage: Dict = {
+        field: get_disk_usage(Path(internal[field]))
+        for field in RUN_DIRS
+        if field in internal
+    }
+    usage["total"] = sum(usage.values())
+    usage["measured"] = datetime.utcnow()
+    usage["final"] = document["api"]["state"] in States.FINISHED
+    collection.update_one(
+        {"run_id": document["run_id"], "api.state": document["api"]["state"]},
+        {"$set": {"internal.disk_usage": usage}},
+    )
+    return usage["total"]
+
+
+def purge_run(
+    collection: Collection,
+    run_id: str,
+    run_collections: Optional[Sequence[Collection]] = None,
+) -> Optional[int]:
+    """Delete directories of finished workflow run.
+
+    The run is marked as purged before its directories are deleted, so that
+    it can no longer be resumed, and its results are no longer reused for
+    identical runs. Runs completed from its cached results, which point at
+    the same outputs, are no longer reused either. Directories of runs that
+    are not finished are never deleted.
+
+    Args:
+        collection: MongoDB collection of runs.
+        run_id: Workflow run identifier.
+        run_collections: MongoDB collections of active and archived runs
+            to invalidate cache hits of the run in; defaults to
+            `collection`.
+
+    Returns:
+        Number of bytes freed according to the last recorded disk usage, or
+        `None` if the run is not finished or was already purged.
+    """
+    document = collection.find_one_and_update(
+        {
+            "run_id": run_id,
+            "api.state": {"$in": States.FINISHED},
+            "internal.purged": {"$exists": False},
+        },
+        {
+            "$set": {
+                "internal.purged": datetime.utcnow(),
+                "internal.cache_invalidated": True,
+            }
+        },
+        projection={
+            f"internal.{field}": True for field in RUN_DIRS + ["disk_usage"]
+        },
+        return_document=ReturnDocument.BEFORE,
+    )
+    if document is None:
+        return None
+    invalidate_cache_hits(
+        collections=run_collections or [collection],
+        run_id=run_id,
+    )
+    internal = document.get("internal", {})
+    for field in RUN_DIRS:
+        if field in internal:
+            shutil.rmtree(internal[field], ignore_errors=True)
+    freed = internal.get("disk_usage", {}).get("total", 0)
+    logger.info(f"Deleted directories of run '{run_id}'; {freed} bytes freed.")
+    return freed
+
+
+def invalidate_cache_hits(
+    collections: Sequence[Collection],
+    run_id: str,
+) -> int:
+    """Prevent reuse of runs completed from cached results of run.
+
+    Cache hits may themselves be reused, so runs completed from cache hits
+    of the run are invalidated, too.
+
+    Args:
+        collections: MongoDB collections of active and archived runs.
+        run_id: Workflow run identifier.
+
+    Returns:
+        Number of invalidated runs.
+    """
+    invalidated = 0
+    run_ids: List[str] = [run_id]
+    while run_ids:
+        query = {
+            "internal.cache_hit": {"$in": run_ids},
+            "internal.cache_invalidated": {"$ne": True},
+        }
+        run_ids = []
+        for collection in collections:
+            hits = [
+                document["run_id"]
+                for document in collection.find(
+                    query,
+                    projection={"run_id": True, "_id": False},
+                )
+            ]
+            if not hits:
+                continue
+            collection.update_many(
+                {"run_id": {"$in": hits}},
+                {"$set": {"internal.cache_invalidated": True}},
+            )
+            run_ids.extend(hits)
+        invalidated += len(run_ids)
+    if invalidated:
+        logger.info(
+            f"Invalidated cached results of {invalidated} runs completed from"
+            f" cached results of run '{run_id}'."
+        )
+    return invalidated
@@ -0,0 +1,58 @@
+"""Cancellation of TES tasks of workflow runs."""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import logging
+from typing import List, Optional
+
+from requests import HTTPError
+import tes
+
+from cwl_wes.utils import outbound
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of TES tasks canceled concurrently
+MAX_CANCEL_THREADS = 32
+
+
+def cancel_tes_tasks(
+    url: str,
+    tes_ids: List[str],
+    timeout: int = 5,
+    token: Optional[str] = None,
+) -> None:
+    """Cancel TES tasks concurrently.
+
+    Args:
+        url: TES endpoint URL.
+        tes_ids: Identifiers of TES tasks to cancel.
+        timeout: Timeout of TES requests in seconds.
+        token: OAuth2 token.
+    """
+    if not tes_ids:
+        return
+    tes_client = tes.HTTPClient(
+        url=url,
+        timeout=timeout,
+        token=token,
+    )
+    with ThreadPoolExecutor(
+        max_workers=min(len(tes_ids), MAX_CANCEL_THREADS),
+    ) as executor:
+        list(executor.map(partial(_cancel_tes_task, tes_client), tes_ids))
+
+
+def _cancel_tes_task(tes_client: tes.HTTPClient, tes_id: str) -> None:
+    """Cancel single TES task."""
+    try:
+        outbound.call(tes_client.url, tes_client.cancel_task, tes_id)
+    except outbound.CircuitOpenError as exc:
+        logger.warning(
+            f"Could not cancel TES task '{tes_id}'. Original error message:"
+            f" {type(exc).__name__}: {exc}"
+        )
+    except HTTPError:
+        # TODO: handle more robustly: only 400/Bad Request is okay;
+        # TODO: other errors (e.g. 500) should be dealt with
+        pass
@@ -0,0 +1,135 @@
+"""Routing of workflow runs across multiple TES backends."""
+
+import logging
+from typing import Dict, List, Optional
+
+from foca.models.config import Config
+from pymongo.collection import Collection
+
+from cwl_wes.custom_config import TESBackendConfig
+from cwl_wes.ga4gh.wes.states import States
+
+logger = logging.getLogger(__name__)
+
+
+def select_tes_url(config: Config) -> str:
+    """Select TES backend for a new workflow run.
+
+    The run is routed to the healthy backend with the lowest number of
+    unfinished runs relative to its weight; backends that reached their
+    capacity are only chosen if all backends did. If no backend is healthy,
+    health is disregarded, so that runs are not rejected because of a
+    failing prober. Backend health is recorded by
+    `cwl_wes.tasks.probe_tes_backends`; backends that were not probed yet
+    are considered healthy.
+
+    Args:
+        config: FOCA configuration object.
+
+    Returns:
+        URL of selected TES backend; the default TES URL if no backends are
+        configured.
+    """
+    tes_server_conf = config.custom.controller.tes_server
+    if not tes_server_conf.backends:
+        return tes_server_conf.url
+    collections = config.db.dbs["cwl-wes-db"].collections
+    urls = [backend.url for backend in tes_server_conf.backends]
+    unhealthy = {
+        document["url"]
+        for document in collections["tes_backends"].client.find(
+            {"url": {"$in": urls}, "healthy": False},
+            projection={"url": True, "_id": False},
+        )
+    }
+    running = get_running_runs(
+        collection=collections["runs"].client,
+        urls=urls,
+    )
+    candidates = [
+        backend
+        for backend in tes_server_conf.backends
+        if backend.url not in unhealthy
+    ]
+    if not candidates:
+        logger.warning(
+            "No healthy TES backend available. Routing run regardless of"
+            " backend health."
+        )
+        candidates = tes_server_conf.backends
+    backend = min(
+        candidates,
+        key=lambda backend: (
+            _is_full(backend=backend, running=running),
+            running[backend.url] / backend.weight,
+            -backend.weight,
+        ),
+    )
+    return backend.url
+
+
+def get_running_runs(
+    collection: Collection, urls: List[str]
+) -> Dict[str, int]:
+    """Get number of unfinished workflow runs per TES backend.
+
+    Runs held for dispatch are not counted, as their backend is selected
+    when they are released.
+
+    Args:
+        collection: MongoDB collection of runs.
+        urls: URLs of TES backends.
+
+    Returns:
+        Number of unfinished runs, by TES backend URL.
+    """
+    running = dict.fromkeys(urls, 0)
+    for group in collection.aggregate(
+        [
+            {
+                "$match": {
+                    "internal.tes_url": {"$in": urls},
+                    "internal.dispatch.state": {"$ne": "held"},
+                    "api.state": {"$in": States.UNFINISHED},
+                }
+            },
+            {"$group": {"_id": "$internal.tes_url", "count": {"$sum": 1}}},
+        ]
+    ):
+        running[group["_id"]] = group["count"]
+    return running
+
+
+def route_command(config: Config, command_list: List[str]) -> Optional[str]:
+    """Select TES backend for workflow engine command.
+
+    Args:
+        config: FOCA configuration object.
+        command_list: Workflow engine command; the value of its `--tes`
+            option is replaced in place.
+
+    Returns:
+        URL of selected TES backend, or `None` if the command does not
+        submit to TES.
+    """
+    if "--tes" not in command_list:
+        return None
+    tes_url = select_tes_url(config=config)
+    command_list[command_list.index("--tes") + 1] = tes_url
+    return tes_url
+
+
+def _is_full(backend: TESBackendConfig, running: Dict[str, int]) -> bool:
+    """Check whether TES backend has reached its capacity.
+
+    Args:
+        backend: TES backend configuration.
+        running: Number of unfinished runs, by TES backend URL.
+
+    Returns:
+        `True` if the backend cannot take more runs, `False` otherwise.
+    """
+    return (
+        backend.max_running_runs is not None
+        and running[backend.url] >= backend.max_running_runs
+    )
@@ -0,0 +1,453 @@
+"""Distributed tracing of requests, Celery tasks and workflow runs.
+
+Trace context is propagated in W3C Trace Context format, cf.
+https://www.w3.org/TR/trace-context/:
+
+    HTTP request -> API -> Celery message headers -> worker
+        -> `TRACEPARENT` environment variable of the workflow engine
+
+Runs held for the dispatcher keep the trace context of their submission in
+the run document, so that their worker spans join the trace of the request
+that submitted them.
+
+Spans of database operations, outbound calls and Git operations are only
+recorded as children of a recorded span, so that periodic background
+activity does not produce a trace per operation. If tracing is not
+enabled, the no-op implementation of the OpenTelemetry API is used.
+
+Span processors do not survive forks, so tracing is initialized in each
+process forked by Gunicorn or Celery.
+"""
+
+from contextlib import contextmanager
+from functools import wraps
+import logging
+import os
+from typing import Callable, Dict, Iterator, Mapping, Optional
+
+from celery.signals import (
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_init,
+)
+from flask import Flask, g, request, Response
+from opentelemetry import context as otel_context
+from opentelemetry import propagate, trace
+from opentelemetry.context import Context
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+    OTLPSpanExporter,
+)
+from opentelemetry.propagators.textmap import Getter
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SpanExporter,
+)
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import Span, SpanKind, Status, StatusCode
+
+from cwl_wes.custom_config import TracingConfig
+
+logger = logging.getLogger(__name__)
+
+# Tracer of the current process and the process it was initialized in
+_STATE: Dict = {"pid": None, "tracer": trace.NoOpTracer()}
+
+# Spans and context tokens of Celery tasks in progress, by task ID
+_TASK_SPANS: Dict[str, tuple] = {}
+
+
+class _RequestGetter(Getter):
+    """Read trace context from attributes of Celery task request."""
+
+    def get(self, carrier, key: str):
+        """Get value of trace context field.
+
+        Args:
+            carrier: Celery task request.
+            key: Field name.
+
+        Returns:
+            Field values, or `None` if the field is not set.
+        """
+        value = getattr(carrier, key, None)
+        if value is None:
+            return None
+        return [value] if isinstance(value, str) else list(value)
+
+    def keys(self, carrier):
+        """Get field names; not used for extraction."""
+        return []
+
+
+def init_tracing(config: TracingConfig, component: str) -> None:
+    """Set up tracer of the current process.
+
+    Args:
+        config: Tracing configuration.
+        component: Name of the component, e.g., `api` or `worker`; appended
+            to the service name.
+    """
+    if _STATE["pid"] == os.getpid():
+        return
+    provider = TracerProvider(
+        resource=Resource.create(
+            {"service.name": f"{config.service_name}-{component}"}
+        ),
+        sampler=ParentBased(TraceIdRatioBased(config.sample_ratio)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(get_exporter(config)))
+    _STATE["pid"] = os.getpid()
+    _STATE["tracer"] = provider.get_tracer(__name__)
+    logger.info(
+        f"Tracing enabled for process {os.getpid()} with exporter"
+        f" '{config.exporter}'."
+    )
+
+
+def get_exporter(config: TracingConfig) -> SpanExporter:
+    """Create span exporter.
+
+    Args:
+        config: Tracing configuration.
+
+    Returns:
+        Span exporter.
+
+    Raises:
+        ValueError: If the configured exporter is not supported.
+    """
+    if config.exporter == "otlp":
+        return OTLPSpanExporter(endpoint=config.otlp_endpoint)
+    if config.exporter == "file":
+        config.file_path.parent.mkdir(parents=True, exist_ok=True)
+        return ConsoleSpanExporter(
+            # pylint: disable-next=consider-using-with
+            out=open(config.file_path, "a", buffering=1, encoding="utf-8"),
+            formatter=lambda item: item.to_json(indent=None) + os.linesep,
+        )
+    raise ValueError(f"Unsupported span exporter: '{config.exporter}'")
+
+
+def get_tracer() -> trace.Tracer:
+    """Get tracer of the current process.
+
+    Returns:
+        Tracer; a no-op tracer if tracing is not initialized.
+    """
+    return _STATE["tracer"]
+
+
+@contextmanager
+def span(
+    name: str,
+    context: Optional[Context] = None,
+    kind: SpanKind = SpanKind.INTERNAL,
+    **attributes,
+) -> Iterator[Span]:
+    """Record span and make it the current span.
+
+    Args:
+        name: Span name.
+        context: Context holding the parent span; defaults to the current
+            context.
+        kind: Span kind.
+        **attributes: Span attributes; `None` values are omitted.
+
+    Yields:
+        Span.
+    """
+    with get_tracer().start_as_current_span(
+        name,
+        context=context,
+        kind=kind,
+        attributes=_clean(attributes),
+    ) as current:
+        yield current
+
+
+@contextmanager
+def child_span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """Record span if the current span is recorded.
+
+    Args:
+        name: Span name.
+        **attributes: Span attributes; `None` values are omitted.
+
+    Yields:
+        Span, or `None` if no span is recorded.
+    """
+    if not trace.get_current_span().is_recording():
+        yield None
+        return
+    with span(name, **attributes) as current:
+        yield current
+
+
+def traced_call(func: Callable, name: str, **attributes) -> Callable:
+    """Record calls of callable as child spans.
+
+    Args:
+        func: Callable.
+        name: Span name.
+        **attributes: Span attributes; `None` values are omitted.
+
+    Returns:
+        Instrumented callable.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with child_span(name, **attributes):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def traced(prefix: str) -> Callable:
+    """Record calls of function as child spans.
+
+    Args:
+        prefix: Prefix of the span name, which is followed by the name of
+            the function, e.g., `db` for `db.update_run_state`.
+
+    Returns:
+        Decorator.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        return traced_call(func=func, name=f"{prefix}.{func.__name__}")
+
+    return decorator
+
+
+def get_context() -> Context:
+    """Get current context, to continue its trace in another thread.
+
+    Returns:
+        Current context.
+    """
+    return otel_context.get_current()
+
+
+def call_in_context(context: Context, func: Callable, *args, **kwargs):
+    """Call function with context as current context.
+
+    Args:
+        context: Context, e.g., of the thread that scheduled the call.
+        func: Callable.
+        *args: Positional arguments to callable.
+        **kwargs: Keyword arguments to callable.
+
+    Returns:
+        Return value of callable.
+    """
+    token = otel_context.attach(context)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        otel_context.detach(token)
+
+
+def inject_context(context: Optional[Context] = None) -> Dict[str, str]:
+    """Serialize trace context.
+
+    Args:
+        context: Context to serialize; defaults to the current context.
+
+    Returns:
+        Trace context fields, e.g., `traceparent`; empty if no span is
+        recorded.
+    """
+    carrier: Dict[str, str] = {}
+    propagate.inject(carrier, context=context)
+    return carrier
+
+
+def extract_context(carrier: Optional[Mapping[str, str]]) -> Context:
+    """Deserialize trace context.
+
+    Args:
+        carrier: Trace context fields, as returned by `inject_context()`.
+
+    Returns:
+        Context holding the remote parent span, if any.
+    """
+    return propagate.extract(carrier or {})
+
+
+def get_env_vars(context: Optional[Context] = None) -> Dict[str, str]:
+    """Get environment variables passing trace context to child process.
+
+    Args:
+        context: Context to pass on; defaults to the current context.
+
+    Returns:
+        Trace context fields in upper case, e.g., `TRACEPARENT`; empty if no
+        span is recorded.
+    """
+    return {
+        key.upper(): value
+        for key, value in inject_context(context=context).items()
+    }
+
+
+def init_app_tracing(app: Flask, config: TracingConfig) -> None:
+    """Record spans of requests to app.
+
+    Args:
+        app: Flask application.
+        config: Tracing configuration.
+    """
+    init_tracing(config=config, component="api")
+    app.before_request(_start_request_span)
+    app.after_request(_record_response)
+    app.teardown_request(_end_request_span)
+
+
+def init_worker_tracing(config: TracingConfig) -> None:
+    """Record spans of Celery tasks and propagate trace context in messages.
+
+    Args:
+        config: Tracing configuration.
+    """
+
+    def _init(**_kwargs) -> None:
+        init_tracing(config=config, component="worker")
+
+    worker_init.connect(_init, weak=False)
+    worker_process_init.connect(_init, weak=False)
+    before_task_publish.connect(_inject_headers, weak=False)
+    task_prerun.connect(_start_task_span, weak=False)
+    task_postrun.connect(_end_task_span, weak=False)
+
+
+def _inject_headers(headers: Optional[Dict] = None, **_kwargs) -> None:
+    """Add trace context to headers of published Celery task.
+
+    Trace context passed explicitly with the task takes precedence.
+
+    Args:
+        headers: Message headers.
+    """
+    if headers is None:
+        return
+    for key, value in inject_context().items():
+        headers.setdefault(key, value)
+
+
+def _start_task_span(
+    task_id: Optional[str] = None,
+    task=None,
+    **_kwargs,
+) -> None:
+    """Start span of Celery task, continuing the trace of its publisher.
+
+    Args:
+        task_id: Task identifier.
+        task: Task instance.
+    """
+    if task_id is None or task is None:
+        return
+    current = get_tracer().start_span(
+        f"celery.{task.name}",
+        context=propagate.extract(task.request, getter=_RequestGetter()),
+        kind=SpanKind.CONSUMER,
+        attributes={"celery.task_id": task_id},
+    )
+    token = otel_context.attach(trace.set_span_in_context(current))
+    _TASK_SPANS[task_id] = (current, token)
+
+
+def _end_task_span(
+    task_id: Optional[str] = None,
+    state: Optional[str] = None,
+    **_kwargs,
+) -> None:
+    """End span of Celery task.
+
+    Args:
+        task_id: Task identifier.
+        state: Final state of the task.
+    """
+    current, token = _TASK_SPANS.pop(task_id, (None, None))
+    if current is None:
+        return
+    if state is not None:
+        current.set_attribute("celery.state", state)
+        if state == "FAILURE":
+            current.set_status(Status(StatusCode.ERROR))
+    otel_context.detach(token)
+    current.end()
+
+
+def _start_request_span() -> None:
+    """Start span of request, continuing the trace of the client."""
+    rule = request.url_rule.rule if request.url_rule is not None else None
+    current = get_tracer().start_span(
+        f"{request.method} {rule or 'unmatched'}",
+        context=propagate.extract(request.headers),
+        kind=SpanKind.SERVER,
+        attributes=_clean(
+            {
+                "http.method": request.method,
+                "http.route": rule,
+                "http.target": request.full_path,
+            }
+        ),
+    )
+    g.tracing_span = current
+    g.tracing_token = otel_context.attach(trace.set_span_in_context(current))
+
+
+def _record_response(response: Response) -> Response:
+    """Record status code of request.
+
+    Args:
+        response: Response to request.
+
+    Returns:
+        Unchanged response.
+    """
+    current = g.get("tracing_span")
+    if current is not None:
+        current.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            current.set_status(Status(StatusCode.ERROR))
+    return response
+
+
+def _end_request_span(exc: Optional[BaseException] = None) -> None:
+    """End span of request.
+
+    Args:
+        exc: Unhandled exception raised by the request, if any.
+    """
+    current = g.pop("tracing_span", None)
+    token = g.pop("tracing_token", None)
+    if current is None:
+        return
+    if exc is not None:
+        current.record_exception(exc)
+        current.set_status(Status(StatusCode.ERROR))
+    if token is not None:
+        otel_context.detach(token)
+    current.end()
+
+
+def _clean(attributes: Mapping) -> Dict:
+    """Drop span attributes without value.
+
+    Args:
+        attributes: Span attributes.
+
+    Returns:
+        Span attributes with values other than `None`.
+    """
+    return {
+        key: value for key, value in attributes.items() if value is not None
+    }
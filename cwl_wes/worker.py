@@ -1,9 +1,95 @@
 """Celery worker entry point."""
 
+import os
+
 from foca import Foca
 
+from cwl_wes.utils.metrics import init_worker_metrics
+from cwl_wes.utils.profiling import init_worker_profiling
+from cwl_wes.utils.tracing import init_worker_tracing
+
 foca = Foca(
     config_file="config.yaml",
     custom_config_model="cwl_wes.custom_config.CustomConfig",
 )
 celery_app = foca.create_celery_app()
+
+# Route workflow run and control tasks to separate queues
+routing_config = celery_app.conf.foca.custom.celery.routing
+celery_app.conf.task_routes = {
+    "tasks.run_workflow": {"queue": routing_config.run_queue},
+    "tasks.cancel_run": {"queue": routing_config.control_queue},
+    "tasks.dispatch_runs": {"queue": routing_config.control_queue},
+    "tasks.evict_step_cache": {"queue": routing_config.control_queue},
+    "tasks.evict_input_cache": {"queue": routing_config.control_queue},
+    "tasks.enforce_retention": {"queue": routing_config.control_queue},
+    "tasks.archive_runs": {"queue": routing_config.control_queue},
+    "tasks.reconcile_runs": {"queue": routing_config.control_queue},
+    "tasks.probe_tes_backends": {"queue": routing_config.control_queue},
+}
+celery_app.conf.task_annotations = {
+    "tasks.run_workflow": {"acks_late": routing_config.run_acks_late},
+}
+
+# Expose metrics of worker processes; workers sharing a network namespace,
+# e.g., containers of a pod, need distinct ports
+metrics_config = celery_app.conf.foca.custom.metrics
+if metrics_config.enabled:
+    init_worker_metrics(
+        port=int(os.environ.get("METRICS_PORT", metrics_config.worker_port))
+    )
+
+# Record traces of tasks and propagate trace context in task messages
+tracing_config = celery_app.conf.foca.custom.tracing
+if tracing_config.enabled:
+    init_worker_tracing(config=tracing_config)
+
+# Profile selected tasks and select tasks sent by profiled requests
+profiling_config = celery_app.conf.foca.custom.profiling
+if profiling_config.enabled:
+    init_worker_profiling(config=profiling_config)
+
+# Schedule periodic maintenance tasks; requires Celery beat
+celery_app.conf.beat_schedule = {}
+dispatcher_config = celery_app.conf.foca.custom.controller.dispatcher
+if dispatcher_config.enabled:
+    celery_app.conf.beat_schedule["dispatch-runs"] = {
+        "task": "tasks.dispatch_runs",
+        "schedule": dispatcher_config.interval,
+    }
+step_cache_config = celery_app.conf.foca.custom.storage.step_cache
+if step_cache_config.enabled:
+    celery_app.conf.beat_schedule["evict-step-cache"] = {
+        "task": "tasks.evict_step_cache",
+        "schedule": step_cache_config.eviction_interval,
+    }
+input_cache_config = celery_app.conf.foca.custom.storage.input_cache
+if input_cache_config.enabled:
+    celery_app.conf.beat_schedule["evict-input-cache"] = {
+        "task": "tasks.evict_input_cache",
+        "schedule": input_cache_config.eviction_interval,
+    }
+retention_config = celery_app.conf.foca.custom.storage.retention
+if retention_config.enabled:
+    celery_app.conf.beat_schedule["enforce-retention"] = {
+        "task": "tasks.enforce_retention",
+        "schedule": retention_config.interval,
+    }
+archive_config = celery_app.conf.foca.custom.controller.archive
+if archive_config.enabled:
+    celery_app.conf.beat_schedule["archive-runs"] = {
+        "task": "tasks.archive_runs",
+        "schedule": archive_config.interval,
+    }
+reconciler_config = celery_app.conf.foca.custom.controller.reconciler
+if reconciler_config.enabled:
+    celery_app.conf.beat_schedule["reconcile-runs"] = {
+        "task": "tasks.reconcile_runs",
+        "schedule": reconciler_config.interval,
+    }
+tes_server_config = celery_app.conf.foca.custom.controller.tes_server
+if tes_server_config.backends:
+    celery_app.conf.beat_schedule["probe-tes-backends"] = {
+        "task": "tasks.probe_tes_backends",
+        "schedule": tes_server_config.balancer.probe_interval,
+    }
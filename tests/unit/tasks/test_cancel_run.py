@@ -0,0 +1,126 @@
+"""Unit tests for `cwl_wes.tasks.cancel_run`."""
+
+# pylint: disable=protected-access
+
+import subprocess
+from types import SimpleNamespace
+from unittest import mock
+
+import mongomock
+import pytest
+
+from cwl_wes.tasks import cancel_run
+from cwl_wes.tasks.cancel_run import (
+    kill_workflow_engine,
+    terminate_workflow_engine,
+)
+from cwl_wes.tasks.workflow_run_manager import WorkflowRunManager
+
+RUN_ID = "RUN123"
+TASK_ID = "task"
+
+
+@pytest.fixture(name="runs")
+def fixture_runs():
+    """Create collection holding a running workflow run."""
+    runs = mongomock.MongoClient().db.runs
+    runs.insert_one(
+        {
+            "run_id": RUN_ID,
+            "task_id": TASK_ID,
+            "api": {"state": "RUNNING"},
+            "internal": {"worker_hostname": "worker@host", "engine_pgid": 1},
+        }
+    )
+    return runs
+
+
+@pytest.fixture(name="celery_app")
+def fixture_celery_app(monkeypatch, runs):
+    """Celery application with the runs collection configured."""
+    celery_app = mock.MagicMock()
+    celery_app.conf.foca.db.dbs = {
+        "cwl-wes-db": SimpleNamespace(
+            collections={"runs": SimpleNamespace(client=runs)}
+        )
+    }
+    monkeypatch.setattr(cancel_run, "celery_app", celery_app)
+    return celery_app
+
+
+@pytest.fixture(name="engine")
+def fixture_engine():
+    """Start process in its own process group."""
+    with subprocess.Popen(["sleep", "30"], start_new_session=True) as proc:
+        yield proc
+        if proc.poll() is None:
+            proc.kill()
+
+
+@pytest.mark.usefixtures("celery_app")
+def test_terminate_workflow_engine_unfinished_run(engine):
+    """Process group of unfinished run is killed."""
+    reply = terminate_workflow_engine(None, pgid=engine.pid, run_id=RUN_ID)
+    assert "ok" in reply
+    assert engine.wait(timeout=10) < 0
+
+
+@pytest.mark.usefixtures("celery_app")
+def test_terminate_workflow_engine_finished_run(runs, engine):
+    """Process group of finished run is not killed, as it may be reused."""
+    runs.update_one({"run_id": RUN_ID}, {"$set": {"api.state": "CANCELED"}})
+    reply = terminate_workflow_engine(None, pgid=engine.pid, run_id=RUN_ID)
+    assert "error" in reply
+    assert engine.poll() is None
+
+
+@pytest.mark.parametrize(
+    "replies,expected",
+    [
+        ([{"worker@host": {"ok": "killed"}}], True),
+        ([{"worker@host": {"error": "run 'RUN123' has finished"}}], False),
+        ([], None),
+    ],
+)
+def test_kill_workflow_engine(celery_app, replies, expected):
+    """Replies of the worker are evaluated."""
+    celery_app.control.broadcast.return_value = replies
+    assert (
+        kill_workflow_engine(hostname="worker@host", pgid=1, run_id=RUN_ID)
+        is expected
+    )
+    _, kwargs = celery_app.control.broadcast.call_args
+    assert kwargs["arguments"] == {"pgid": 1, "run_id": RUN_ID}
+    assert kwargs["destination"] == ["worker@host"]
+
+
+@pytest.mark.usefixtures("celery_app")
+def test_terminate_engine_of_document(runs):
+    """Engine of run is stopped via the worker recorded with it."""
+    document = runs.find_one({"run_id": RUN_ID})
+    with mock.patch.object(
+        cancel_run, "kill_workflow_engine", return_value=True
+    ) as kill:
+        assert cancel_run.__terminate_workflow_engine(document=document)
+    kill.assert_called_once_with(
+        hostname="worker@host",
+        pgid=1,
+        run_id=RUN_ID,
+        timeout=5,
+    )
+
+
+def test_terminate_engine_not_started():
+    """Runs without engine are stopped unless their task has started."""
+    terminate = cancel_run.__terminate_workflow_engine
+    assert terminate(document={"run_id": RUN_ID, "internal": {}})
+    assert not terminate(
+        document={"run_id": RUN_ID, "internal": {"task_started": 0}}
+    )
+
+
+def test_unregister_engine_process(runs):
+    """Process group of exited engine is removed from the run document."""
+    manager = SimpleNamespace(collection=runs, task_id=TASK_ID)
+    WorkflowRunManager.unregister_engine_process(manager)
+    assert runs.find_one({"run_id": RUN_ID})["internal"] == {}
@@ -0,0 +1,134 @@
+"""Unit tests for `cwl_wes.tasks.dispatch_runs`."""
+
+from datetime import datetime, timedelta
+from unittest import mock
+
+import mongomock
+import pytest
+
+from cwl_wes.custom_config import DispatcherConfig
+from cwl_wes.tasks import dispatch_runs as dispatch_module
+from cwl_wes.tasks.dispatch_runs import dispatch_runs, fair_share_order
+
+WEIGHTS = {"high": 4, "normal": 2, "low": 1}
+
+START = datetime(2024, 1, 1)
+
+
+def _run(task_id, user_id, minutes, priority_class="normal"):
+    """Create held run document."""
+    return {
+        "run_id": f"run_{task_id}",
+        "task_id": task_id,
+        "user_id": user_id,
+        "api": {"state": "QUEUED"},
+        "internal": {
+            "dispatch": {
+                "state": "held",
+                "priority_class": priority_class,
+                "queued": START + timedelta(minutes=minutes),
+                "kwargs": {"command_list": ["cwl-tes", "main.cwl"]},
+                "soft_time_limit": None,
+            }
+        },
+    }
+
+
+def _order(runs, running=None):
+    """Get task identifiers in fair-share order."""
+    return [
+        run["task_id"]
+        for run in fair_share_order(
+            runs=runs,
+            running=running or {},
+            weights=WEIGHTS,
+        )
+    ]
+
+
+def test_fair_share_order_alternates_users():
+    """Users take turns, each in order of submission."""
+    runs = [
+        _run("a1", "alice", 0),
+        _run("a2", "alice", 1),
+        _run("a3", "alice", 2),
+        _run("b1", "bob", 3),
+    ]
+    assert _order(runs) == ["a1", "b1", "a2", "a3"]
+
+
+def test_fair_share_order_counts_running_runs():
+    """Users with more running runs come later."""
+    runs = [_run("a1", "alice", 0), _run("b1", "bob", 1)]
+    assert _order(runs, running={"alice": 2}) == ["b1", "a1"]
+
+
+def test_fair_share_order_weights_priority_classes():
+    """Users in higher priority classes get a larger share."""
+    runs = [_run(f"a{index}", "alice", index, "high") for index in range(3)]
+    runs += [_run(f"b{index}", "bob", index, "low") for index in range(2)]
+    assert _order(runs) == ["a0", "b0", "a1", "a2", "b1"]
+
+
+def test_fair_share_order_higher_class_first_per_user():
+    """Runs of a user are taken by priority class, then submission."""
+    runs = [
+        _run("low", "alice", 0, "low"),
+        _run("high", "alice", 1, "high"),
+        _run("normal", "alice", 2),
+    ]
+    assert _order(runs) == ["high", "normal", "low"]
+
+
+@pytest.fixture(name="celery_app")
+def fixture_celery_app(monkeypatch):
+    """Celery application recording sent tasks."""
+    celery_app = mock.MagicMock()
+    monkeypatch.setattr(dispatch_module, "celery_app", celery_app)
+    return celery_app
+
+
+def test_dispatch_runs(celery_app):
+    """Runs are released within limits; queue positions are updated."""
+    database = mongomock.MongoClient().db
+    running = _run("running", "alice", -1)
+    running["api"]["state"] = "RUNNING"
+    running["internal"]["dispatch"]["state"] = "released"
+    database.runs.insert_many(
+        [
+            running,
+            _run("a1", "alice", 0),
+            _run("a2", "alice", 1),
+            _run("b1", "bob", 2),
+            _run("b2", "bob", 3),
+        ]
+    )
+    dispatch_runs(
+        collection=database.runs,
+        collection_events=database.run_events,
+        config=DispatcherConfig(
+            enabled=True,
+            max_running_runs=3,
+            max_running_runs_per_user=2,
+        ),
+    )
+
+    released = [
+        call.kwargs["task_id"] for call in celery_app.send_task.mock_calls
+    ]
+    assert released == ["b1", "a1"]
+    states = {
+        run["task_id"]: (
+            run["internal"]["dispatch"]["state"],
+            run["api"].get("run_log", {}).get("queue_position"),
+        )
+        for run in database.runs.find()
+    }
+    assert states == {
+        "running": ("released", None),
+        "a1": ("released", None),
+        "b1": ("released", None),
+        "b2": ("held", 1),
+        "a2": ("held", 2),
+    }
+    assert database.run_events.count_documents({"event": "enqueued"}) == 2
@@ -0,0 +1,76 @@
+"""Unit tests for `cwl_wes.tasks.evict_input_cache`."""
+
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+
+from cwl_wes.tasks.evict_input_cache import evict_input_cache
+
+SIZE = 10
+
+
+@pytest.fixture(name="database")
+def fixture_database(tmp_path):
+    """Database with three cached files of increasing age."""
+    database = mongomock.MongoClient().db
+    now = datetime.utcnow()
+    for age, digest in enumerate(["aa01", "bb02", "cc03"]):
+        (tmp_path / digest[:2] / digest).mkdir(parents=True)
+        (tmp_path / digest[:2] / digest / "input").write_bytes(b"x" * SIZE)
+        database.input_cache.insert_one(
+            {
+                "url": f"https://example.org/{digest}",
+                "digest": digest,
+                "size": SIZE,
+                "last_used": now - timedelta(hours=age + 1),
+            }
+        )
+    return database
+
+
+def _evict(database, cache_dir, max_size):
+    """Evict input cache entries without grace period."""
+    evict_input_cache(
+        collection=database.input_cache,
+        runs=database.runs,
+        cache_dir=cache_dir,
+        max_size=max_size,
+        grace_period=0,
+    )
+    return sorted(database.input_cache.distinct("digest"))
+
+
+def test_evict_least_recently_used(database, tmp_path):
+    """Least recently used files are evicted until the limit is met."""
+    assert _evict(database, tmp_path, max_size=SIZE) == ["aa01"]
+    assert not (tmp_path / "cc" / "cc03").exists()
+    assert (tmp_path / "aa" / "aa01").exists()
+
+
+def test_evict_keeps_files_of_unfinished_runs(database, tmp_path):
+    """Files staged for unfinished runs are kept regardless of age."""
+    database.runs.insert_many(
+        [
+            {
+                "api": {"state": "RUNNING"},
+                "internal": {"input_digests": ["cc03"]},
+            },
+            {
+                "api": {"state": "COMPLETE"},
+                "internal": {"input_digests": ["bb02"]},
+            },
+        ]
+    )
+    assert _evict(database, tmp_path, max_size=SIZE) == ["cc03"]
+    assert (tmp_path / "cc" / "cc03").exists()
+    assert not (tmp_path / "aa" / "aa01").exists()
+
+
+def test_evict_within_limit(database, tmp_path):
+    """Nothing is evicted while the cache is within its limit."""
+    assert _evict(database, tmp_path, max_size=3 * SIZE) == [
+        "aa01",
+        "bb02",
+        "cc03",
+    ]
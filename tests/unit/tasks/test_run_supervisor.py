@@ -0,0 +1,171 @@
+"""Unit tests for `cwl_wes.tasks.run_supervisor`."""
+
+from contextlib import nullcontext
+import os
+import signal
+import threading
+import time
+
+from cwl_wes.tasks.run_supervisor import RunSupervisor
+
+# Seconds to wait for supervision to reach an expected point
+WAIT = 10
+
+
+class FakeLogProcessor:
+    """Log processor recording processed lines."""
+
+    structured = False
+
+    def __init__(self) -> None:
+        """Construct class instance."""
+        self.lines = []
+        self.closed = False
+
+    def process_line(self, line, token=None):
+        """Record line."""
+        self.lines.append(line)
+
+    def close(self) -> None:
+        """Record closing."""
+        self.closed = True
+
+
+class FakeManager:
+    """Workflow run manager recording calls of the supervisor."""
+
+    def __init__(self, command_list, start=True) -> None:
+        """Construct class instance."""
+        self.task_id = "task"
+        self.token = None
+        self.tmp_dir = os.getcwd()
+        self.command_list = command_list
+        self.start = start
+        self.log_processor = FakeLogProcessor()
+        self.pgid = None
+        self.returncode = None
+        self.recoverable = None
+        self.tes_tasks_canceled = False
+        self.started = threading.Event()
+        self.done = threading.Event()
+
+    def trace_run(self):
+        """Return no-op context manager."""
+        return nullcontext()
+
+    def trigger_task_start_events(self) -> bool:
+        """Report whether the run may be started."""
+        if not self.start:
+            self.done.set()
+        return self.start
+
+    def get_tes_monitor(self):
+        """Do not monitor TES tasks."""
+        return None
+
+    def get_log_processor(self, monitor=None):
+        """Return log processor."""
+        return self.log_processor
+
+    def register_engine_process(self, pgid: int) -> None:
+        """Record process group of workflow engine."""
+        self.pgid = pgid
+        self.started.set()
+
+    def cancel_tes_tasks(self) -> None:
+        """Record cancellation of TES tasks."""
+        self.tes_tasks_canceled = True
+
+    def finalize_workflow_run(self, returncode, **_kwargs) -> None:
+        """Record return code of workflow engine."""
+        self.returncode = returncode
+        self.done.set()
+
+    def handle_worker_shutdown(self, recoverable: bool) -> None:
+        """Record interruption by worker shutdown."""
+        self.recoverable = recoverable
+        self.done.set()
+
+
+def _is_gone(pgid: int) -> bool:
+    """Wait for process group to disappear."""
+    deadline = time.monotonic() + WAIT
+    while time.monotonic() < deadline:
+        try:
+            os.killpg(pgid, 0)
+        except ProcessLookupError:
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_supervise_run():
+    """Engine output is processed and the run finalized with its code."""
+    supervisor = RunSupervisor(io_threads=2)
+    manager = FakeManager(command_list=["sh", "-c", "echo hello; exit 3"])
+    supervisor.submit(manager=manager)
+    assert manager.done.wait(WAIT)
+    assert manager.returncode == 3
+    assert manager.log_processor.lines == ["hello\n"]
+    assert manager.pgid is not None
+    assert not manager.tes_tasks_canceled
+
+
+def test_supervise_run_not_started():
+    """Engine is not started if the run must not be started."""
+    supervisor = RunSupervisor(io_threads=2)
+    manager = FakeManager(command_list=["sh", "-c", "exit 0"], start=False)
+    supervisor.submit(manager=manager)
+    assert manager.done.wait(WAIT)
+    assert manager.pgid is None
+    assert manager.returncode is None
+
+
+def test_supervise_run_timeout():
+    """Engine is killed and TES tasks are canceled on timeout."""
+    supervisor = RunSupervisor(io_threads=2, timeout=1)
+    manager = FakeManager(command_list=["sleep", "60"])
+    supervisor.submit(manager=manager)
+    assert manager.done.wait(WAIT)
+    assert manager.returncode == -signal.SIGKILL
+    assert manager.tes_tasks_canceled
+
+
+def test_shutdown_waits_for_runs():
+    """Runs finishing within the shutdown timeout are finalized."""
+    supervisor = RunSupervisor(io_threads=2, shutdown_timeout=WAIT)
+    manager = FakeManager(command_list=["sh", "-c", "sleep 1; exit 0"])
+    supervisor.submit(manager=manager)
+    assert manager.started.wait(WAIT)
+    supervisor.shutdown()
+    assert manager.done.wait(WAIT)
+    assert manager.returncode == 0
+    assert manager.recoverable is None
+
+
+def test_shutdown_interrupts_runs():
+    """Engines of unfinished runs are killed and the interruption recorded."""
+    supervisor = RunSupervisor(
+        io_threads=2,
+        shutdown_timeout=0.1,
+        recoverable=True,
+    )
+    manager = FakeManager(command_list=["sleep", "60"])
+    supervisor.submit(manager=manager)
+    assert manager.started.wait(WAIT)
+    supervisor.shutdown()
+    assert manager.done.wait(WAIT)
+    assert manager.recoverable is True
+    assert manager.returncode is None
+    assert _is_gone(pgid=manager.pgid)
+
+
+def test_shutdown_before_start():
+    """Runs started after shutdown are interrupted right away."""
+    supervisor = RunSupervisor(io_threads=2, shutdown_timeout=0)
+    supervisor.shutdown()
+    manager = FakeManager(command_list=["sleep", "60"])
+    supervisor.submit(manager=manager)
+    assert manager.done.wait(WAIT)
+    assert manager.recoverable is False
+    assert manager.pgid is None
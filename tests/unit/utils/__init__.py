@@ -0,0 +1 @@
+"""Unit tests for `cwl_wes.utils`."""
@@ -0,0 +1,73 @@
+"""Unit tests for `cwl_wes.utils.admission`."""
+
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+
+from cwl_wes.custom_config import AdmissionConfig, DispatcherConfig
+from cwl_wes.exceptions import TooManyRuns
+from cwl_wes.utils.admission import check_user_limit
+
+
+def _config(runs, enabled=True, required=True):
+    """Create configuration with dispatcher limit of two runs per user."""
+    return SimpleNamespace(
+        foca=SimpleNamespace(
+            custom=SimpleNamespace(
+                controller=SimpleNamespace(
+                    dispatcher=DispatcherConfig(
+                        enabled=enabled,
+                        max_running_runs_per_user=2,
+                    ),
+                    admission=AdmissionConfig(),
+                )
+            ),
+            security=SimpleNamespace(
+                auth=SimpleNamespace(required=required),
+            ),
+            db=SimpleNamespace(
+                dbs={
+                    "cwl-wes-db": SimpleNamespace(
+                        collections={"runs": SimpleNamespace(client=runs)}
+                    )
+                }
+            ),
+        )
+    )
+
+
+@pytest.fixture(name="runs")
+def fixture_runs():
+    """Create runs, of which two of user `alice` are unfinished."""
+    runs = mongomock.MongoClient().db.runs
+    runs.insert_many(
+        [
+            {"user_id": "alice", "api": {"state": "RUNNING"}},
+            {"user_id": "alice", "api": {"state": "QUEUED"}},
+            {"user_id": "alice", "api": {"state": "COMPLETE"}},
+            {"user_id": "bob", "api": {"state": "RUNNING"}},
+        ]
+    )
+    return runs
+
+
+def test_check_user_limit_reached(runs):
+    """Runs of users at the limit are rejected if auth is required."""
+    with pytest.raises(TooManyRuns) as exc_info:
+        check_user_limit(config=_config(runs), user_id="alice")
+    assert exc_info.value.headers == {
+        "Retry-After": str(AdmissionConfig().max_retry_after)
+    }
+
+
+def test_check_user_limit_not_reached(runs):
+    """Runs of users below the limit are accepted."""
+    check_user_limit(config=_config(runs), user_id="bob")
+
+
+@pytest.mark.parametrize("enabled,required", [(False, True), (True, False)])
+def test_check_user_limit_not_enforced(runs, enabled, required):
+    """Limit is only enforced at submission if runs are not held."""
+    config = _config(runs, enabled=enabled, required=required)
+    check_user_limit(config=config, user_id="alice")
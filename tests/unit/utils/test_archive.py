@@ -0,0 +1,73 @@
+"""Unit tests for `cwl_wes.utils.archive`."""
+
+from datetime import datetime
+
+from bson.binary import Binary
+
+from cwl_wes.utils.archive import (
+    COMPRESSED_FIELD,
+    compress_document,
+    decompress_document,
+)
+
+FIELDS = ["api.request", "api.task_logs", "internal.traceback"]
+
+
+def _document():
+    """Create run document."""
+    return {
+        "_id": "document_id",
+        "run_id": "RUN123",
+        "api": {
+            "state": "COMPLETE",
+            "request": {"workflow_url": "main.cwl", "tags": {"a": "b"}},
+            "task_logs": [{"name": "step", "exit_code": 0}],
+            "run_log": {"start_time": "2023-01-01T00:00:00Z"},
+        },
+        "internal": {"out_dir": "/data/output/RUN123"},
+    }
+
+
+def test_compress_document():
+    """Heavy fields are replaced by compressed blob; others are kept."""
+    document = _document()
+    archived = compress_document(document=document, fields=FIELDS)
+    assert isinstance(archived[COMPRESSED_FIELD], Binary)
+    assert isinstance(archived["archived_at"], datetime)
+    assert archived["run_id"] == "RUN123"
+    assert archived["api"] == {
+        "state": "COMPLETE",
+        "run_log": {"start_time": "2023-01-01T00:00:00Z"},
+    }
+    assert archived["internal"] == {"out_dir": "/data/output/RUN123"}
+    assert document == _document()
+
+
+def test_compress_decompress_roundtrip():
+    """Decompressed document equals the original document."""
+    for level in (0, 9):
+        archived = compress_document(
+            document=_document(),
+            fields=FIELDS,
+            level=level,
+        )
+        assert decompress_document(document=archived) == _document()
+
+
+def test_decompress_document_projection():
+    """Only compressed fields requested by projection are restored."""
+    archived = compress_document(document=_document(), fields=FIELDS)
+    restored = decompress_document(
+        document=archived,
+        projection={"api.request.tags": True, COMPRESSED_FIELD: True},
+    )
+    assert restored["api"]["request"] == _document()["api"]["request"]
+    assert "task_logs" not in restored["api"]
+    assert "traceback" not in restored["internal"]
+    assert COMPRESSED_FIELD not in restored
+    assert "archived_at" not in restored
+
+
+def test_decompress_document_not_compressed():
+    """Documents without compressed fields are returned as they are."""
+    assert decompress_document(document=_document()) == _document()
@@ -0,0 +1,168 @@
+"""Unit tests for `cwl_wes.utils.executor_policy`."""
+
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+from cwl_wes.custom_config import LocalExecutorConfig
+from cwl_wes.utils.executor_policy import (
+    count_tool_invocations,
+    select_executor,
+)
+
+CONFIG = LocalExecutorConfig(enabled=True, max_steps=10, max_ram=1024)
+
+TOOL = {
+    "class": "CommandLineTool",
+    "baseCommand": "echo",
+    "inputs": [],
+    "outputs": [],
+}
+
+
+def _write(path, document):
+    """Write CWL document."""
+    path.write_text(yaml.safe_dump(document), encoding="utf-8")
+    return path
+
+
+def _workflow(*runs, **step_fields):
+    """Create workflow with one step per `run` value."""
+    return {
+        "class": "Workflow",
+        "inputs": [],
+        "outputs": [],
+        "steps": [
+            {"id": f"step_{index}", "run": run, **step_fields}
+            for index, run in enumerate(runs)
+        ],
+    }
+
+
+def test_count_tool(tmp_path):
+    """Tool is a single invocation."""
+    path = _write(tmp_path / "tool.cwl", TOOL)
+    assert count_tool_invocations(path=path, config=CONFIG) == 1
+
+
+def test_count_inline_and_referenced_steps(tmp_path):
+    """Inline, referenced and nested processes are counted."""
+    _write(tmp_path / "tool.cwl", TOOL)
+    _write(tmp_path / "sub.cwl", _workflow("tool.cwl", TOOL))
+    path = _write(
+        tmp_path / "main.cwl", _workflow(TOOL, "tool.cwl", "sub.cwl")
+    )
+    assert count_tool_invocations(path=path, config=CONFIG) == 4
+
+
+def test_count_steps_in_map_form(tmp_path):
+    """Steps given as a map are counted."""
+    document = _workflow()
+    document["steps"] = {"first": {"run": TOOL}, "second": {"run": TOOL}}
+    path = _write(tmp_path / "main.cwl", document)
+    assert count_tool_invocations(path=path, config=CONFIG) == 2
+
+
+def test_count_packed_workflow(tmp_path):
+    """Processes of packed documents are resolved by identifier."""
+    main = _workflow("#tool", "#tool")
+    main["id"] = "#main"
+    path = _write(
+        tmp_path / "packed.cwl",
+        {"cwlVersion": "v1.2", "$graph": [{**TOOL, "id": "#tool"}, main]},
+    )
+    assert count_tool_invocations(path=path, config=CONFIG) == 2
+
+
+def test_count_scatter(tmp_path):
+    """Workflows with scattered steps are not eligible."""
+    path = _write(tmp_path / "main.cwl", _workflow(TOOL, scatter="input"))
+    assert count_tool_invocations(path=path, config=CONFIG) is None
+
+
+def test_count_resources_beyond_limits(tmp_path):
+    """Processes declaring resources beyond the limits are not eligible."""
+    for requirement in [{"ramMin": 2048}, {"ramMin": "$(inputs.ram)"}]:
+        tool = {
+            **TOOL,
+            "hints": {"ResourceRequirement": requirement},
+        }
+        path = _write(tmp_path / "main.cwl", _workflow(tool))
+        assert count_tool_invocations(path=path, config=CONFIG) is None
+
+
+def test_count_resources_within_limits(tmp_path):
+    """Processes declaring resources within the limits are eligible."""
+    tool = {
+        **TOOL,
+        "requirements": [
+            {"class": "ResourceRequirement", "coresMin": 1, "ramMin": 512}
+        ],
+    }
+    path = _write(tmp_path / "main.cwl", _workflow(tool))
+    assert count_tool_invocations(path=path, config=CONFIG) == 1
+
+
+def test_count_stops_beyond_max_steps(tmp_path):
+    """Counting stops once the maximum number of steps is exceeded."""
+    config = LocalExecutorConfig(enabled=True, max_steps=1)
+    path = _write(tmp_path / "main.cwl", _workflow(TOOL, TOOL, "missing.cwl"))
+    assert count_tool_invocations(path=path, config=config) == 2
+
+
+@pytest.mark.parametrize(
+    "runs", [["main.cwl"], ["sub.cwl"], ["#main"], ["#sub"]]
+)
+def test_count_cyclic_references(tmp_path, runs):
+    """Workflows referencing themselves are rejected."""
+    _write(tmp_path / "sub.cwl", _workflow("main.cwl"))
+    main = _workflow(*runs)
+    main["id"] = "#main"
+    sub = _workflow("#main")
+    sub["id"] = "#sub"
+    document = main if runs[0].endswith(".cwl") else {"$graph": [main, sub]}
+    path = _write(tmp_path / "main.cwl", document)
+    with pytest.raises(ValueError):
+        count_tool_invocations(path=path, config=CONFIG)
+
+
+def test_count_repeated_references(tmp_path):
+    """Processes referenced repeatedly without cycle are counted."""
+    _write(tmp_path / "tool.cwl", TOOL)
+    _write(tmp_path / "sub.cwl", _workflow("tool.cwl", "tool.cwl"))
+    path = _write(tmp_path / "main.cwl", _workflow("sub.cwl", "sub.cwl"))
+    assert count_tool_invocations(path=path, config=CONFIG) == 4
+
+
+def test_count_references_outside_base_dir(tmp_path):
+    """CWL documents outside of the base directory are rejected."""
+    base_dir = tmp_path / "workflow_files"
+    base_dir.mkdir()
+    _write(tmp_path / "tool.cwl", TOOL)
+    (base_dir / "link.cwl").symlink_to(tmp_path / "tool.cwl")
+    for run in ["../tool.cwl", str(tmp_path / "tool.cwl"), "link.cwl"]:
+        path = _write(base_dir / "main.cwl", _workflow(run))
+        with pytest.raises(ValueError):
+            count_tool_invocations(
+                path=path,
+                config=CONFIG,
+                base_dir=base_dir,
+            )
+
+
+def test_select_executor_cyclic_workflow(tmp_path):
+    """Workflows referencing themselves are executed on TES."""
+    path = _write(tmp_path / "main.cwl", _workflow("main.cwl"))
+    config = SimpleNamespace(
+        foca=SimpleNamespace(
+            custom=SimpleNamespace(
+                controller=SimpleNamespace(local_executor=CONFIG)
+            )
+        )
+    )
+    document = {
+        "api": {"request": {"tags": {"executor": "local"}}},
+        "internal": {"cwl_path": str(path), "workflow_files": str(tmp_path)},
+    }
+    assert select_executor(config=config, document=document) == "tes"
@@ -0,0 +1,54 @@
+"""Unit tests for `cwl_wes.utils.profiling`."""
+
+import os
+
+from cwl_wes.custom_config import ProfilingConfig
+from cwl_wes.utils.profiling import is_requested, prune_profiles, RateLimiter
+
+
+def test_is_requested():
+    """True header values select requests up to the rate limit."""
+    config = ProfilingConfig(enabled=True, max_requested_per_minute=2)
+    limiter = RateLimiter(limit=config.max_requested_per_minute)
+    assert not is_requested(config=config, value=None, limiter=limiter)
+    assert not is_requested(config=config, value="0", limiter=limiter)
+    assert is_requested(config=config, value=" True ", limiter=limiter)
+    assert is_requested(config=config, value="1", limiter=limiter)
+    assert not is_requested(config=config, value="1", limiter=limiter)
+
+
+def test_is_requested_secret():
+    """Only the secret selects requests if a secret is configured."""
+    config = ProfilingConfig(enabled=True, secret="s3cr3t")
+    limiter = RateLimiter(limit=config.max_requested_per_minute)
+    assert not is_requested(config=config, value="1", limiter=limiter)
+    assert is_requested(config=config, value="s3cr3t", limiter=limiter)
+
+
+def test_rate_limiter_window(monkeypatch):
+    """Calls are allowed again once they left the window."""
+    now = [100.0]
+    monkeypatch.setattr(
+        "cwl_wes.utils.profiling.time.monotonic", lambda: now[0]
+    )
+    limiter = RateLimiter(limit=1, window=60)
+    assert limiter.allow()
+    now[0] += 59
+    assert not limiter.allow()
+    now[0] += 1
+    assert limiter.allow()
+
+
+def test_prune_profiles(tmp_path):
+    """Oldest profiles beyond the maximum number are deleted."""
+    for index in range(4):
+        path = tmp_path / f"profile-{index}.prof"
+        path.write_bytes(b"")
+        os.utime(path, (index, index))
+    (tmp_path / "other.txt").write_bytes(b"")
+    prune_profiles(output_dir=tmp_path, max_files=2)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "other.txt",
+        "profile-2.prof",
+        "profile-3.prof",
+    ]
@@ -0,0 +1,73 @@
+"""Unit tests for `cwl_wes.utils.result_cache`."""
+
+import pytest
+
+from cwl_wes.utils.result_cache import compute_cache_key
+
+
+def _document(workflow_dir, workflow_params):
+    """Create run document with workflow files in place."""
+    workflow_dir.mkdir(exist_ok=True)
+    cwl_path = workflow_dir / "main.cwl"
+    cwl_path.write_text("class: CommandLineTool\\n", encoding="utf-8")
+    return {
+        "api": {
+            "request": {
+                "workflow_type": "CWL",
+                "workflow_type_version": "v1.0",
+                "workflow_params": workflow_params,
+            }
+        },
+        "internal": {
+            "workflow_files": str(workflow_dir),
+            "cwl_path": str(cwl_path),
+        },
+    }
+
+
+def test_compute_cache_key_local_input(tmp_path):
+    """Content of local inputs is part of the digest."""
+    workflow_dir = tmp_path / "workflow"
+    params = {"input": {"class": "File", "path": "input.txt"}}
+    document = _document(workflow_dir=workflow_dir, workflow_params=params)
+    (workflow_dir / "input.txt").write_text("a", encoding="utf-8")
+    first = compute_cache_key(document=document)
+    (workflow_dir / "input.txt").write_text("b", encoding="utf-8")
+    second = compute_cache_key(document=document)
+    assert first is not None
+    assert second is not None
+    assert first != second
+
+
+@pytest.mark.parametrize(
+    "location",
+    ["file:///", "/etc/hostname", "../outside.txt", "file:///../outside.txt"],
+)
+def test_compute_cache_key_outside_workflow_dir(tmp_path, location):
+    """Local inputs outside of the workflow files directory are rejected."""
+    workflow_dir = tmp_path / "workflow"
+    params = {"input": {"class": "File", "location": location}}
+    document = _document(workflow_dir=workflow_dir, workflow_params=params)
+    (tmp_path / "outside.txt").write_text("secret", encoding="utf-8")
+    assert compute_cache_key(document=document) is None
+    document["api"]["request"]["workflow_params"] = {}
+    assert compute_cache_key(document=document) is not None
+
+
+def test_compute_cache_key_symlink_outside_workflow_dir(tmp_path):
+    """Workflow files linking outside of their directory are rejected."""
+    workflow_dir = tmp_path / "workflow"
+    document = _document(workflow_dir=workflow_dir, workflow_params={})
+    (tmp_path / "outside.txt").write_text("secret", encoding="utf-8")
+    (workflow_dir / "link.txt").symlink_to(tmp_path / "outside.txt")
+    assert compute_cache_key(document=document) is None
+
+
+def test_compute_cache_key_max_bytes(tmp_path):
+    """Runs whose files exceed the hashing limit are not cacheable."""
+    workflow_dir = tmp_path / "workflow"
+    params = {"input": {"class": "File", "path": "input.txt"}}
+    document = _document(workflow_dir=workflow_dir, workflow_params=params)
+    (workflow_dir / "input.txt").write_bytes(b"x" * 100)
+    assert compute_cache_key(document=document, max_bytes=1000) is not None
+    assert compute_cache_key(document=document, max_bytes=150) is None
@@ -0,0 +1,62 @@
+"""Unit tests for `cwl_wes.utils.run_events`."""
+
+from datetime import datetime, timedelta
+
+from cwl_wes.utils.run_events import get_durations
+
+START = datetime(2023, 1, 1)
+
+
+def _events(*milestones):
+    """Create events from milestone names and offsets in seconds."""
+    return [
+        {"event": event, "timestamp": START + timedelta(seconds=offset)}
+        for event, offset in milestones
+    ]
+
+
+def test_get_durations():
+    """Durations between all reached milestones are computed."""
+    events = _events(
+        ("submitted", 0),
+        ("prepared", 2),
+        ("enqueued", 3),
+        ("worker_started", 5.5),
+        ("first_tes_task", 10),
+        ("last_tes_task", 70),
+        ("outputs_parsed", 71),
+        ("finished", 72),
+    )
+    assert get_durations(events=events) == {
+        "time_preparation": 2,
+        "time_queue": 3.5,
+        "time_tes": 60,
+        "time_execution": 66.5,
+        "time_total": 72,
+    }
+
+
+def test_get_durations_unfinished():
+    """Durations whose milestones were not reached are omitted."""
+    events = _events(("submitted", 0), ("prepared", 1), ("enqueued", 2))
+    assert get_durations(events=events) == {"time_preparation": 1}
+
+
+def test_get_durations_first_occurrence():
+    """The first occurrence of repeated milestones is considered."""
+    events = _events(
+        ("submitted", 0),
+        ("worker_started", 5),
+        ("worker_started", 8),
+        ("finished", 20),
+        ("finished", 30),
+    )
+    assert get_durations(events=events) == {
+        "time_execution": 15,
+        "time_total": 20,
+    }
+
+
+def test_get_durations_no_events():
+    """No durations are computed without events."""
+    assert not get_durations(events=[])
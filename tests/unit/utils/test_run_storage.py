@@ -0,0 +1,102 @@
+"""Unit tests for `cwl_wes.utils.run_storage`."""
+
+# pylint: disable=protected-access
+
+import hashlib
+from pathlib import Path
+
+from cwl_wes.custom_config import StorageConfig
+from cwl_wes.utils import run_storage
+from cwl_wes.utils.run_storage import get_run_dir
+
+BASE_DIR = Path("/data/output")
+RUN_ID = "RUN123"
+
+
+def test_get_run_dir_flat():
+    """Run directories are not sharded by default."""
+    assert get_run_dir(
+        base_dir=BASE_DIR,
+        run_id=RUN_ID,
+        config=StorageConfig(),
+    ) == Path("/data/output/RUN123")
+
+
+def test_get_run_dir_sharded():
+    """Shards are consecutive slices of the hash of the run identifier."""
+    digest = hashlib.sha256(RUN_ID.encode()).hexdigest()
+    path = get_run_dir(
+        base_dir=BASE_DIR,
+        run_id=RUN_ID,
+        config=StorageConfig(shard_levels=2, shard_width=3),
+    )
+    assert path == BASE_DIR / digest[0:3] / digest[3:6] / RUN_ID
+
+
+def test_get_run_dir_stable():
+    """Run directory depends only on the run identifier."""
+    config = StorageConfig(shard_levels=1)
+    first = get_run_dir(base_dir=BASE_DIR, run_id=RUN_ID, config=config)
+    second = get_run_dir(base_dir=BASE_DIR, run_id=RUN_ID, config=config)
+    other = get_run_dir(base_dir=BASE_DIR, run_id="RUN456", config=config)
+    assert first == second
+    assert first.parent.parent == other.parent.parent == BASE_DIR
+
+
+def test_replace_paths():
+    """Paths and file URIs below moved directories are replaced."""
+    moves = {"/data/output/RUN123": "/data/output/ab/RUN123"}
+    obj = {
+        "out_dir": "/data/output/RUN123",
+        "outputs": [
+            {
+                "location": "file:///data/output/RUN123/result.txt",
+                "path": "/data/output/RUN123/result.txt",
+            },
+        ],
+        "exit_code": 0,
+    }
+    assert run_storage._replace_paths(obj=obj, moves=moves) == {
+        "out_dir": "/data/output/ab/RUN123",
+        "outputs": [
+            {
+                "location": "file:///data/output/ab/RUN123/result.txt",
+                "path": "/data/output/ab/RUN123/result.txt",
+            },
+        ],
+        "exit_code": 0,
+    }
+    assert obj["out_dir"] == "/data/output/RUN123"
+
+
+def test_replace_paths_other_directories():
+    """Paths sharing a prefix with a moved directory are not replaced."""
+    moves = {"/data/output/RUN123": "/data/output/ab/RUN123"}
+    obj = ["/data/output/RUN1234/result.txt", "/data/output/RUN12", "RUN123"]
+    assert run_storage._replace_paths(obj=obj, moves=moves) == obj
+
+
+def test_replace_paths_multiple_moves():
+    """Temporary and output directories are replaced independently."""
+    moves = {
+        "/data/tmp/RUN123": "/data/tmp/ab/RUN123",
+        "/data/output/RUN123": "/data/output/ab/RUN123",
+    }
+    obj = {
+        "tmp_dir": "/data/tmp/RUN123",
+        "command_list": [
+            "--tmpdir-prefix",
+            "/data/tmp/RUN123/tmp",
+            "--outdir",
+            "/data/output/RUN123",
+        ],
+    }
+    assert run_storage._replace_paths(obj=obj, moves=moves) == {
+        "tmp_dir": "/data/tmp/ab/RUN123",
+        "command_list": [
+            "--tmpdir-prefix",
+            "/data/tmp/ab/RUN123/tmp",
+            "--outdir",
+            "/data/output/ab/RUN123",
+        ],
+    }
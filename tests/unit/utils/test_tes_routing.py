@@ -0,0 +1,136 @@
+"""Unit tests for `cwl_wes.utils.tes_routing`."""
+
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+
+from cwl_wes.custom_config import TESBackendConfig, TESServerConfig
+from cwl_wes.utils.tes_routing import route_command, select_tes_url
+
+DEFAULT_URL = "https://tes.default"
+URL_A = "https://tes.a"
+URL_B = "https://tes.b"
+
+
+def _config(backends):
+    """Create FOCA configuration mock with in-memory collections."""
+    database = mongomock.MongoClient().db
+    collections = {
+        name: SimpleNamespace(client=database[name])
+        for name in ("runs", "tes_backends")
+    }
+    return SimpleNamespace(
+        custom=SimpleNamespace(
+            controller=SimpleNamespace(
+                tes_server=TESServerConfig(
+                    url=DEFAULT_URL,
+                    backends=backends,
+                ),
+            ),
+        ),
+        db=SimpleNamespace(
+            dbs={"cwl-wes-db": SimpleNamespace(collections=collections)}
+        ),
+    )
+
+
+def _add_runs(config, url, count, state="RUNNING", dispatch_state=None):
+    """Add runs routed to TES backend."""
+    collection = config.db.dbs["cwl-wes-db"].collections["runs"].client
+    for _ in range(count):
+        internal = {"tes_url": url}
+        if dispatch_state is not None:
+            internal["dispatch"] = {"state": dispatch_state}
+        collection.insert_one({"api": {"state": state}, "internal": internal})
+
+
+def _set_health(config, url, healthy):
+    """Record health of TES backend."""
+    collection = config.db.dbs["cwl-wes-db"].collections["tes_backends"]
+    collection.client.insert_one({"url": url, "healthy": healthy})
+
+
+def test_select_tes_url_no_backends():
+    """Default TES URL is used if no backends are configured."""
+    assert select_tes_url(config=_config(backends=[])) == DEFAULT_URL
+
+
+def test_select_tes_url_least_loaded():
+    """Backend with fewest unfinished runs is selected."""
+    config = _config(
+        backends=[TESBackendConfig(url=URL_A), TESBackendConfig(url=URL_B)]
+    )
+    _add_runs(config, URL_A, 2)
+    _add_runs(config, URL_B, 1)
+    _add_runs(config, URL_B, 3, state="COMPLETE")
+    assert select_tes_url(config=config) == URL_B
+
+
+def test_select_tes_url_weight():
+    """Load is weighted; ties go to the backend with the higher weight."""
+    config = _config(
+        backends=[
+            TESBackendConfig(url=URL_A),
+            TESBackendConfig(url=URL_B, weight=3),
+        ]
+    )
+    assert select_tes_url(config=config) == URL_B
+    _add_runs(config, URL_A, 1)
+    _add_runs(config, URL_B, 2)
+    assert select_tes_url(config=config) == URL_B
+    _add_runs(config, URL_B, 2)
+    assert select_tes_url(config=config) == URL_A
+
+
+def test_select_tes_url_held_runs_not_counted():
+    """Runs held for dispatch do not count towards backend load."""
+    config = _config(
+        backends=[TESBackendConfig(url=URL_A), TESBackendConfig(url=URL_B)]
+    )
+    _add_runs(config, URL_A, 3, state="QUEUED", dispatch_state="held")
+    _add_runs(config, URL_B, 1)
+    assert select_tes_url(config=config) == URL_A
+
+
+def test_select_tes_url_capacity():
+    """Full backends are only selected if all backends are full."""
+    config = _config(
+        backends=[
+            TESBackendConfig(url=URL_A, weight=10, max_running_runs=1),
+            TESBackendConfig(url=URL_B),
+        ]
+    )
+    _add_runs(config, URL_A, 1)
+    _add_runs(config, URL_B, 5)
+    assert select_tes_url(config=config) == URL_B
+
+
+def test_select_tes_url_unhealthy():
+    """Unhealthy backends are skipped unless no backend is healthy."""
+    config = _config(
+        backends=[TESBackendConfig(url=URL_A), TESBackendConfig(url=URL_B)]
+    )
+    _add_runs(config, URL_B, 5)
+    _set_health(config, URL_A, healthy=False)
+    assert select_tes_url(config=config) == URL_B
+    _set_health(config, URL_B, healthy=False)
+    assert select_tes_url(config=config) == URL_A
+
+
+@pytest.mark.parametrize(
+    "command_list,expected",
+    [
+        (["cwl-tes", "--tes", DEFAULT_URL, "workflow.cwl"], URL_A),
+        (["cwltool", "workflow.cwl"], None),
+    ],
+)
+def test_route_command(command_list, expected):
+    """Value of the `--tes` option is replaced with the selected backend."""
+    config = _config(backends=[TESBackendConfig(url=URL_A)])
+    original = list(command_list)
+    assert route_command(config=config, command_list=command_list) == expected
+    if expected is None:
+        assert command_list == original
+    else:
+        assert command_list[command_list.index("--tes") + 1] == URL_A